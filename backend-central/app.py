@@ -3,20 +3,22 @@ Central Backend Server - Tổng hợp data từ tất cả Edge cameras
 """
 from typing import Any, Dict, Set
 import socket
+import time
 
 from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse, PlainTextResponse
 import uvicorn
 import httpx
 import json
 import asyncio
 
 import config
-from database import CentralDatabase
+from database import CentralDatabase, encode_history_cursor
 from parking_state import ParkingStateManager
 from camera_registry import CameraRegistry
 from config_manager import ConfigManager
+import metrics
 
 # P2P Imports
 from p2p.manager import P2PManager
@@ -24,10 +26,56 @@ from p2p.event_handler import P2PEventHandler
 from p2p.parking_integration import P2PParkingBroadcaster
 from p2p.sync_manager import P2PSyncManager
 from p2p.database_extensions import patch_database_for_p2p
+from p2p import codec as wire_codec
 import p2p_api
 import p2p_api_extensions
 import edge_api
 
+# Metrics
+_registry = metrics.get_metrics()
+event_tracer = metrics.get_event_tracer()
+HTTP_SECONDS = _registry.histogram("central_http_request_seconds", "HTTP handler latency by route template",
+                                   ["method", "route"])
+HTTP_REQUESTS = _registry.counter("central_http_requests_total", "HTTP requests by route and status class",
+                                  ["method", "route", "status"])
+EDGE_EVENTS = _registry.counter("central_edge_events_total", "Events ingested from Edge, by channel and result",
+                                ["channel", "result"])
+HISTORY_BROADCAST_SECONDS = _registry.histogram("central_history_broadcast_seconds",
+                                                "broadcast_history_update fan-out time to frontend clients")
+EDGE_BROADCAST_SECONDS = _registry.histogram("central_edge_broadcast_seconds",
+                                             "broadcast_to_edges fan-out time to Edge backends")
+WS_SEND_FAILURES = _registry.counter("central_ws_send_failures_total", "WebSocket sends that dropped a client",
+                                     ["channel"])
+
+
+class HTTPMetricsMiddleware:
+    """ASGI middleware: latency handler HTTP theo route template (/api/parking/history/{history_id})"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Route template (khong phai path that) → so series khong tang theo id
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.labels(scope["method"], route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope["method"], route, f"{status[0] // 100}xx").inc()
+
+
 # FastAPI App
 app = FastAPI(title="Central Parking Management API")
 
@@ -38,6 +86,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(HTTPMetricsMiddleware)
 
 # Global Instances
 database = None
@@ -59,6 +108,8 @@ camera_websocket_clients: Set[WebSocket] = set()
 
 # WebSocket connections for Edge backends (edge_id -> WebSocket)
 edge_websocket_connections: Dict[str, WebSocket] = {}
+# Codec da thuong luong voi tung Edge (edge_id -> codec)
+edge_websocket_codecs: Dict[str, str] = {}
 
 
 def get_local_ip() -> str:
@@ -80,25 +131,31 @@ def get_local_ip() -> str:
 
 async def broadcast_history_update(event_data: dict):
     """Broadcast history update to all connected WebSocket clients (Frontend)"""
-    if not history_websocket_clients:
-        return
+    if history_websocket_clients:
+        started = time.perf_counter()
+        message = json.dumps({
+            "type": "history_update",
+            "data": event_data
+        })
 
-    message = json.dumps({
-        "type": "history_update",
-        "data": event_data
-    })
+        # Send to all clients, remove disconnected ones
+        disconnected = set()
+        for client in history_websocket_clients:
+            try:
+                await client.send_text(message)
+            except Exception:
+                disconnected.add(client)
 
-    # Send to all clients, remove disconnected ones
-    disconnected = set()
-    for client in history_websocket_clients:
-        try:
-            await client.send_text(message)
-        except Exception:
-            disconnected.add(client)
+        # Remove disconnected clients
+        for client in disconnected:
+            history_websocket_clients.discard(client)
+        WS_SEND_FAILURES.labels("history").inc(len(disconnected))
+        HISTORY_BROADCAST_SECONDS.observe(time.perf_counter() - started)
 
-    # Remove disconnected clients
-    for client in disconnected:
-        history_websocket_clients.discard(client)
+    # Trace mau: moc cuoi = frontend da nhan (hoac khong co client nao)
+    if event_tracer.is_tracing():
+        for event in event_data.get("events") or [event_data]:
+            event_tracer.mark(event.get("event_id"), "broadcast", final=True)
 
 
 async def sync_event_to_edges_and_frontend(event_data: dict):
@@ -110,6 +167,11 @@ async def sync_event_to_edges_and_frontend(event_data: dict):
     await broadcast_history_update(event_data)
 
     # Broadcast to Edge backends for DB sync
+    await sync_event_to_edges_only(event_data)
+
+
+async def sync_event_to_edges_only(event_data: dict):
+    """Convert event sang format Edge và broadcast tới Edge backends (không gửi frontend)"""
     if event_data.get("event_id"):
         # Convert to Edge-compatible format
         edge_event = {
@@ -265,7 +327,7 @@ def _enrich_camera_status(status: Dict[str, Any]) -> Dict[str, Any]:
     cameras = []
     processed_ids = set()
     
-    # Xu ly cameras tu database truoc
+    # Xu ly cameras tu registry truoc
     for camera in status.get("cameras", []):
         camera_id = camera.get("id")
         if camera_id is None:
@@ -295,22 +357,9 @@ def _enrich_camera_status(status: Dict[str, Any]) -> Dict[str, Any]:
             enriched["status"] = "offline"
             enriched["config_invalid"] = True
         else:
-            # Neu camera co config nhung khong nhan heartbeat gan day (60s) → danh dau offline
-            from datetime import datetime, timedelta, timezone
-            if camera.get("last_heartbeat"):
-                try:
-                    last_heartbeat = datetime.strptime(camera["last_heartbeat"], "%Y-%m-%d %H:%M:%S")
-                    # Database luu UTC, nen dung utcnow() thay vi now()
-                    time_since_heartbeat = (datetime.utcnow() - last_heartbeat).total_seconds()
-                    # Neu khong nhan heartbeat trong 60 giay → danh dau offline
-                    if time_since_heartbeat > 60:
-                        enriched["status"] = "offline"
-                        enriched["connection_lost"] = True
-                    else:
-                        # Nhan heartbeat gan day → online
-                        enriched["status"] = "online"
-                except Exception:
-                    pass
+            # Trang thai online / offline do CameraRegistry quyet dinh (het han heartbeat qua timer wheel)
+            if enriched.get("status") != "online" and camera.get("last_heartbeat"):
+                enriched["connection_lost"] = True
         
         cameras.append(enriched)
     
@@ -404,46 +453,30 @@ async def _proxy_webrtc_offer(camera_id: int, payload: Dict[str, Any], annotated
 
     return data
 # Startup & Shutdown
-async def camera_broadcast_loop():
-    """Background task để check và broadcast camera updates khi có thay đổi"""
-    last_status = None
-    while True:
-        try:
-            await asyncio.sleep(2)  # Check moi 2 giay de phan ung nhanh hon
-            
-            global camera_registry
-            if not camera_registry:
-                continue
-                
-            current_status = _enrich_camera_status(camera_registry.get_camera_status())
-            cameras = current_status.get("cameras", [])
-            
-            # So sanh voi status truoc de chi broadcast khi co thay doi
-            if last_status is None:
-                last_status = cameras
-                # Khong broadcast lan dau, chi set last_status
-                continue
-            
-            # Check xem co thay doi khong
-            status_changed = False
-            if len(cameras) != len(last_status):
-                status_changed = True
-            else:
-                for i, cam in enumerate(cameras):
-                    last_cam = last_status[i] if i < len(last_status) else None
-                    if not last_cam or cam.get("id") != last_cam.get("id") or cam.get("status") != last_cam.get("status"):
-                        status_changed = True
-                        break
-            
-            if status_changed:
-                last_status = cameras
-                await broadcast_camera_update()
-                
-        except Exception as e:
-            import traceback
-            print(f"Camera broadcast loop error: {e}")
-            traceback.print_exc()
-            await asyncio.sleep(5)
+camera_broadcast_pending = False
+
+
+def schedule_camera_broadcast():
+    """
+    Lên lịch broadcast cameras_update (gọi trong event loop)
+
+    Các thay đổi trạng thái trong CAMERA_BROADCAST_DEBOUNCE giây được gộp thành 1 lần broadcast
+    """
+    global camera_broadcast_pending
+    if camera_broadcast_pending:
+        return
+    camera_broadcast_pending = True
+    asyncio.create_task(_camera_broadcast_after_debounce())
+
+
+async def _camera_broadcast_after_debounce():
+    global camera_broadcast_pending
+    try:
+        await asyncio.sleep(getattr(config, "CAMERA_BROADCAST_DEBOUNCE", 0.2))
+    finally:
+        # Thay doi xay ra tu day tro di se len lich broadcast moi
+        camera_broadcast_pending = False
+    await broadcast_camera_update()
 
 
 @app.on_event("startup")
@@ -453,7 +486,11 @@ async def startup():
 
     try:
         # Initialize database
-        database = CentralDatabase(db_file=config.DB_FILE)
+        database = CentralDatabase(
+            db_file=config.DB_FILE,
+            group_commit_window=config.DB_GROUP_COMMIT_WINDOW_MS / 1000,
+            group_commit_max_ops=config.DB_GROUP_COMMIT_MAX_OPS,
+        )
 
         # Patch database with P2P methods
         patch_database_for_p2p(database)
@@ -466,11 +503,11 @@ async def startup():
             database,
             heartbeat_timeout=config.CAMERA_HEARTBEAT_TIMEOUT
         )
+        # Chi broadcast khi trang thai camera that su doi (heartbeat / het han timer wheel)
+        loop = asyncio.get_running_loop()
+        camera_registry.add_listener(lambda camera_ids: loop.call_soon_threadsafe(schedule_camera_broadcast))
         camera_registry.start()
 
-        # Tat broadcast loop dinh ky - chi broadcast khi co thay doi tu heartbeat
-        # asyncio.create_task(camera_broadcast_loop())
-
         # Initialize P2P System
         print("Initializing P2P system...")
 
@@ -528,6 +565,7 @@ async def startup():
         # Set P2P sync callbacks
         p2p_manager.on_sync_request = p2p_sync_manager.handle_sync_request
         p2p_manager.on_sync_response = p2p_sync_manager.handle_sync_response
+        p2p_manager.on_sync_digest = p2p_sync_manager.handle_sync_digest
 
         # Set peer connection callbacks
         p2p_manager.on_peer_connected = p2p_sync_manager.on_peer_connected
@@ -551,7 +589,7 @@ async def startup():
 
 @app.on_event("shutdown")
 async def shutdown():
-    global camera_registry, p2p_manager
+    global camera_registry, p2p_manager, database
 
     if camera_registry:
         camera_registry.stop()
@@ -562,10 +600,28 @@ async def shutdown():
         await p2p_manager.stop()
         print("P2P system stopped")
 
+    # Dung writer thread sau cung (commit not cac thao tac ghi dang cho)
+    if database:
+        database.close()
+
 
 
 # Edge API (nhan events tu Edge cameras)
 
+def _record_ingest(channel: str, event_id, result: dict):
+    """Đếm event Edge theo kết quả + mốc trace sau khi ghi DB (event dedupe / lỗi kết thúc trace tại đây)"""
+    if result.get("deduped"):
+        outcome = "deduped"
+    elif result.get("success"):
+        outcome = "applied"
+    else:
+        outcome = "failed"
+    EDGE_EVENTS.labels(channel, outcome).inc()
+    if outcome == "applied":
+        event_tracer.mark(event_id, "db_write")
+    else:
+        event_tracer.mark(event_id, outcome, final=True, status=outcome)
+
 @app.post("/api/edge/event")
 async def receive_edge_event(request: Request):
     """
@@ -602,19 +658,22 @@ async def receive_edge_event(request: Request):
                 event_id = p2p_broadcaster.generate_event_id(
                     data.get("plate_text", "UNKNOWN").replace(" ", "")
                 )
+        event_tracer.begin(event_id, "http")
 
-        # Dedupe: nếu đã có event_id này thì trả thành công luôn
-        if event_id and database and database.event_exists(event_id):
-            return JSONResponse({"success": True, "deduped": True, "event_id": event_id})
-        # Process event
-        result = parking_state.process_edge_event(
+        # Process event (dedupe event_id + ghi DB trong group commit, khong block event loop)
+        result = await asyncio.wrap_future(parking_state.submit_edge_event(
             event_type=event_type,
             camera_id=camera_id,
             camera_name=camera_name,
             camera_type=camera_type,
             data=data,
             event_id=event_id,
-        )
+        ))
+        _record_ingest("http", event_id, result)
+
+        # Dedupe: nếu đã có event_id này thì trả thành công luôn
+        if result.get("deduped"):
+            return JSONResponse(result)
 
         if result['success']:
             # Ensure event_id present for EXIT (must reuse existing event_id; do NOT regenerate)
@@ -684,6 +743,178 @@ async def receive_edge_event(request: Request):
         }, status_code=500)
 
 
+@app.post("/api/edge/events/batch")
+async def receive_edge_events_batch(request: Request):
+    """
+    Nhận nhiều event từ Edge trong 1 request (edge reconnect với backlog)
+
+    Body: {"events": [<event giống /api/edge/event>, ...]}  (hoặc list trực tiếp)
+
+    - Dedupe tất cả event_id bằng 1 query
+    - Apply theo đúng thứ tự trong 1 transaction
+    - Broadcast gộp: 1 history_update cho frontend, P2P + Edge gửi tuần tự trong 1 task
+
+    Response: {"success": true, "count": N, "results": [kết quả từng event theo thứ tự]}
+    """
+    global parking_state
+
+    try:
+        body = await request.json()
+        events = body if isinstance(body, list) else body.get("events", [])
+
+        if not isinstance(events, list):
+            return JSONResponse({
+                "success": False,
+                "error": "events must be a list"
+            }, status_code=400)
+
+        # Chuan hoa + gan event_id (giong /api/edge/event)
+        items = []
+        for event in events:
+            event_type = event.get('type')
+            data = event.get('data', {})
+            event_id = event.get("event_id")
+            if not event_id and event_type in ["ENTRY", "DETECTION"]:
+                if p2p_broadcaster:
+                    event_id = p2p_broadcaster.generate_event_id(
+                        data.get("plate_text", "UNKNOWN").replace(" ", "")
+                    )
+            items.append({
+                "event_type": event_type,
+                "camera_id": event.get('camera_id'),
+                "camera_name": event.get('camera_name'),
+                "camera_type": event.get('camera_type'),
+                "data": data,
+                "event_id": event_id,
+            })
+            event_tracer.begin(event_id, "http_batch")
+
+        # Dedupe nhanh 1 query (ca trong DB lan trong chinh batch) - process_edge_events_batch
+        # kiem tra lai trong transaction (event cung den qua WebSocket / retry song song)
+        existing = database.existing_event_ids(item["event_id"] for item in items) if database else set()
+        results = [None] * len(items)
+        to_apply = []
+        seen = set()
+        for index, item in enumerate(items):
+            event_id = item["event_id"]
+            if event_id and (event_id in existing or event_id in seen):
+                results[index] = {"success": True, "deduped": True, "event_id": event_id}
+                continue
+            if event_id:
+                seen.add(event_id)
+            if item["event_type"] not in ["ENTRY", "EXIT", "DETECTION"]:
+                results[index] = {
+                    "success": False,
+                    "error": f"Unsupported event type in batch: {item['event_type']}",
+                    "event_id": event_id
+                }
+                continue
+            to_apply.append(index)
+
+        # Apply trong 1 transaction (chay trong thread de khong block event loop)
+        applied = await asyncio.to_thread(
+            parking_state.process_edge_events_batch,
+            [items[index] for index in to_apply]
+        )
+
+        for index, result in enumerate(results):
+            if result is not None:  # deduped / unsupported - khong qua ghi DB
+                _record_ingest("http_batch", result.get("event_id"), result)
+
+        broadcasts = []
+        for index, result in zip(to_apply, applied):
+            item = items[index]
+            _record_ingest("http_batch", item["event_id"], result)
+            applied_ok = result['success'] and not result.get('deduped')
+            if applied_ok:
+                result['event_id'] = result.get('event_id') or item["event_id"]
+
+            clean_result = {
+                k: v for k, v in result.items()
+                if not isinstance(v, bytes) and not (k == 'plate_image' and v is not None)
+            }
+            results[index] = clean_result
+
+            if applied_ok:
+                broadcasts.append((item, clean_result))
+
+        if broadcasts:
+            asyncio.create_task(_broadcast_edge_batch(broadcasts))
+
+        return JSONResponse({
+            "success": True,
+            "count": len(results),
+            "applied": len(broadcasts),
+            "results": results
+        })
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=500)
+
+
+async def _broadcast_edge_batch(broadcasts):
+    """
+    Broadcast kết quả batch ingest
+
+    - P2P peers + Edge backends: từng event, tuần tự theo thứ tự batch
+    - Frontend: 1 history_update gộp (frontend chỉ cần reload 1 lần)
+    """
+    events = []
+    for item, result in broadcasts:
+        camera_id = item["camera_id"]
+        camera_type = item["camera_type"]
+
+        if p2p_broadcaster and result.get('history_id'):
+            try:
+                if result.get('action') == 'ENTRY':
+                    await p2p_broadcaster.broadcast_entry_pending(
+                        event_id=result.get('event_id'),
+                        plate_id=result['plate_id'],
+                        plate_view=result['plate_view'],
+                        edge_id=camera_id,
+                        camera_type=camera_type,
+                        direction='ENTRY',
+                        entry_time=result['entry_time']
+                    )
+                elif result.get('action') == 'EXIT':
+                    await p2p_broadcaster.broadcast_exit(
+                        event_id=result.get('event_id'),
+                        plate_id=result.get('plate_id'),
+                        exit_edge=camera_id,
+                        exit_time=result.get('exit_time', ''),
+                        fee=result.get('fee', 0),
+                        duration=result.get('duration', '')
+                    )
+            except Exception as e:
+                print(f"Error broadcasting P2P event: {e}")
+
+        event_data = {
+            "event_type": item["event_type"],
+            "camera_id": camera_id,
+            "camera_name": item["camera_name"],
+            "camera_type": camera_type,
+            **result
+        }
+        events.append(event_data)
+
+        # Edge backends van nhan tung event (protocol edge xu ly theo event)
+        try:
+            await sync_event_to_edges_only(event_data)
+        except Exception as e:
+            print(f"Error syncing batch event to edges: {e}")
+
+    await broadcast_history_update({
+        "event_type": "BATCH",
+        "count": len(events),
+        "events": events
+    })
+
+
 @app.post("/api/edge/heartbeat")
 async def receive_heartbeat(request: Request):
     """
@@ -710,7 +941,7 @@ async def receive_heartbeat(request: Request):
         events_sent = data.get('events_sent', 0)
         events_failed = data.get('events_failed', 0)
 
-        # Update heartbeat
+        # Update heartbeat - registry tu bao listener (→ broadcast) neu trang thai camera doi
         camera_registry.update_heartbeat(
             camera_id=camera_id,
             name=camera_name,
@@ -719,13 +950,6 @@ async def receive_heartbeat(request: Request):
             events_failed=events_failed
         )
 
-        # Broadcast camera update to WebSocket clients (ngay khi co heartbeat)
-        try:
-            asyncio.create_task(broadcast_camera_update())
-        except Exception as broadcast_err:
-            # Log but don't fail the heartbeat
-            print(f"Failed to broadcast camera update: {broadcast_err}")
-
         return JSONResponse({"success": True})
 
     except Exception as e:
@@ -771,6 +995,33 @@ async def status():
     }
 
 
+# Prometheus metrics - gauge tinh luc scrape
+_ws_clients = _registry.gauge("central_ws_clients", "Connected WebSocket clients per channel", ["channel"])
+_ws_clients.labels("history").set_function(lambda: len(history_websocket_clients))
+_ws_clients.labels("cameras").set_function(lambda: len(camera_websocket_clients))
+_ws_clients.labels("edge").set_function(lambda: len(edge_websocket_connections))
+_registry.gauge("central_db_write_queue_size", "Writes waiting for the group-commit writer").set_function(
+    lambda: database._write_queue.qsize() if database else 0)
+_p2p_queue_depth = _registry.gauge("central_p2p_queue_depth", "Messages waiting in each peer send queue", ["peer"])
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Metrics dạng Prometheus text exposition format"""
+    # Peer thay doi theo ket noi → dung lai gauge moi lan scrape
+    _p2p_queue_depth.clear()
+    if p2p_manager:
+        for peer, queue_metrics in p2p_manager.get_queue_metrics().items():
+            _p2p_queue_depth.labels(peer).set(queue_metrics["queue_depth"])
+    return PlainTextResponse(_registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/metrics/traces")
+async def metrics_traces():
+    """Trace mẫu event Edge: ingest → ghi DB → broadcast frontend (bật bằng METRICS_TRACE_SAMPLE_RATE)"""
+    return event_tracer.get_traces()
+
+
 @app.get("/api/cameras")
 async def get_cameras():
     """Get all cameras"""
@@ -788,21 +1039,79 @@ async def get_cameras():
     })
 
 
+STREAM_CHUNK_ROWS = 500
+
+
+def iter_json_rows(rows, ndjson=False):
+    """
+    Serialize từng dòng (dict) → các chunk str, gom STREAM_CHUNK_ROWS dòng / chunk
+
+    ndjson=False: các dòng cách nhau bởi dấu phẩy (phần thân của 1 JSON array)
+    ndjson=True: mỗi dòng 1 JSON object + newline
+    """
+    chunk = []
+    first = True
+    for row in rows:
+        chunk.append(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+        if len(chunk) >= STREAM_CHUNK_ROWS:
+            yield _join_json_rows(chunk, first, ndjson)
+            first = False
+            chunk = []
+    if chunk:
+        yield _join_json_rows(chunk, first, ndjson)
+
+
+def _join_json_rows(chunk, first, ndjson):
+    if ndjson:
+        return "\n".join(chunk) + "\n"
+    return ("" if first else ",") + ",".join(chunk)
+
+
+def stream_json_response(head: dict, key: str, rows, ndjson=False):
+    """
+    StreamingResponse cho rows (generator) - bộ nhớ không phụ thuộc số dòng
+
+    JSON (mặc định): {**head, key: [...]} - cùng format với JSONResponse cũ
+    NDJSON (ndjson=True): mỗi dòng 1 object, không có head
+    Generator đồng bộ → Starlette chạy trong threadpool, không chặn event loop khi đọc DB
+    """
+    if ndjson:
+        return StreamingResponse(iter_json_rows(rows, ndjson=True), media_type="application/x-ndjson")
+
+    def body():
+        # Ghi head roi mo array: {"success":true,...,"<key>":[
+        head_json = json.dumps(head or {}, ensure_ascii=False, separators=(",", ":"))[:-1]
+        yield head_json + ("," if head else "") + json.dumps(key) + ":["
+        yield from iter_json_rows(rows)
+        yield "]}"
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
 @app.get("/api/parking/state")
-async def get_parking_state():
-    """Get current parking state (vehicles IN parking)"""
+async def get_parking_state(format: str = Query(default="json")):
+    """
+    Get current parking state (vehicles IN parking)
+
+    Stream danh sách xe theo chunk (không dựng cả list trong RAM).
+    format=ndjson: mỗi dòng 1 xe (application/x-ndjson), stats lấy ở /api/stats
+    """
     global parking_state
 
     # Check if parking_state is initialized
-    if parking_state:
-        state = parking_state.get_parking_state()
-    else:
-        state = {"vehicles": [], "total": 0}
+    if not parking_state:
+        return JSONResponse({
+            "success": True,
+            "vehicles": [],
+            "total": 0
+        })
 
-    return JSONResponse({
-        "success": True,
-        **state
-    })
+    vehicles = parking_state.iter_vehicles_in_parking()
+    if format == "ndjson":
+        return stream_json_response(None, "vehicles_in_parking", vehicles, ndjson=True)
+
+    stats = await asyncio.to_thread(parking_state.db.get_stats)
+    return stream_json_response({"success": True, "stats": stats}, "vehicles_in_parking", vehicles)
 
 
 @app.get("/api/parking/occupancy")
@@ -882,9 +1191,14 @@ async def get_parking_history(
     status: str = None,
     search: str = None,
     in_parking_only: bool = False,
-    entries_only: bool = False
+    entries_only: bool = False,
+    cursor: str = None
 ):
-    """Get vehicle history with optional search by plate number"""
+    """
+    Get vehicle history with optional search by plate number
+
+    Phân trang: client cũ dùng limit/offset, client mới gửi cursor = next_cursor của trang trước
+    """
     global database
 
     # Check if database is initialized
@@ -896,22 +1210,30 @@ async def get_parking_history(
             "history": []
         })
 
-    history = database.get_history(
-        limit=limit,
-        offset=offset,
-        today_only=today_only,
-        status=status,
-        search=search,
-        in_parking_only=in_parking_only,
-        entries_only=entries_only
-    )
+    try:
+        history = database.get_history(
+            limit=limit,
+            offset=offset,
+            today_only=today_only,
+            status=status,
+            search=search,
+            in_parking_only=in_parking_only,
+            entries_only=entries_only,
+            page_cursor=cursor
+        )
+    except ValueError as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=400)
     stats = database.get_stats()
 
     return JSONResponse({
         "success": True,
         "count": len(history),
         "stats": stats,
-        "history": history
+        "history": history,
+        "next_cursor": encode_history_cursor(history[-1]) if history and len(history) == limit else None
     })
 
 
@@ -1603,13 +1925,11 @@ async def sync_edge_config(request: Request):
                 if database and camera_registry:
                     for cam_id_int, cam_config in current_edge_cameras.items():
                         try:
-                            database.upsert_camera(
+                            # Camera moi → offline (cho heartbeat), camera da co giu trang thai
+                            camera_registry.register_camera(
                                 camera_id=int(cam_id_int) if isinstance(cam_id_int, str) else cam_id_int,
                                 name=cam_config.get("name", f"Camera {cam_id_int}"),
-                                camera_type=cam_config.get("camera_type", "ENTRY"),
-                                status="offline",  # Will be updated by heartbeat
-                                events_sent=0,
-                                events_failed=0
+                                camera_type=cam_config.get("camera_type", "ENTRY")
                             )
                             print(f"[Edge Sync] Updated camera {cam_id_int} in database")
 
@@ -1882,6 +2202,25 @@ async def websocket_camera_updates(websocket: WebSocket):
         camera_websocket_clients.discard(websocket)
 
 
+async def receive_ws_message(websocket: WebSocket) -> dict:
+    """Nhận 1 message WebSocket (text JSON hoặc binary frame theo codec đã thương lượng)"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    frame = message.get("bytes")
+    if frame is None:
+        frame = message.get("text")
+    return wire_codec.decode(frame)
+
+
+async def send_ws_frame(websocket: WebSocket, frame):
+    """Gửi frame đã encode: bytes → binary frame, str → text frame"""
+    if isinstance(frame, bytes):
+        await websocket.send_bytes(frame)
+    else:
+        await websocket.send_text(frame)
+
+
 @app.websocket("/ws/p2p")
 async def websocket_p2p_connection(websocket: WebSocket):
     """
@@ -1900,16 +2239,21 @@ async def websocket_p2p_connection(websocket: WebSocket):
             await websocket.close(code=1008, reason="No peer_id provided")
             return
 
-        print(f"[P2P WebSocket] Peer '{peer_id}' connected")
+        # Peer moi gui danh sach "codecs" → chon codec va bao lai; peer cu → JSON, khong gui gi them
+        codec = wire_codec.negotiate(data.get("codecs"))
+        if data.get("codecs"):
+            await websocket.send_json({"type": "CODEC", "codec": codec})
+
+        print(f"[P2P WebSocket] Peer '{peer_id}' connected (codec={codec})")
 
         # Register this WebSocket connection with P2P manager
         if p2p_manager:
-            p2p_manager.register_websocket_connection(peer_id, websocket)
+            p2p_manager.register_websocket_connection(peer_id, websocket, codec)
 
         # Keep connection alive and handle incoming messages
         while True:
             try:
-                message = await websocket.receive_json()
+                message = await receive_ws_message(websocket)
 
                 # Forward message to P2P manager for processing
                 if p2p_manager:
@@ -1929,7 +2273,7 @@ async def websocket_p2p_connection(websocket: WebSocket):
         traceback.print_exc()
     finally:
         if peer_id and p2p_manager:
-            p2p_manager.unregister_websocket_connection(peer_id)
+            p2p_manager.unregister_websocket_connection(peer_id, websocket)
         print(f"[P2P WebSocket] Peer '{peer_id}' disconnected")
 
 
@@ -1956,28 +2300,33 @@ async def websocket_edge_connection(websocket: WebSocket):
             await websocket.close(code=1008, reason="No edge_id provided")
             return
 
-        print(f"[Edge WebSocket] Edge '{edge_id}' connected")
+        # Edge moi gui "codecs" → chon codec, bao trong ack; edge cu → JSON
+        codec = wire_codec.negotiate(data.get("codecs"))
+
+        print(f"[Edge WebSocket] Edge '{edge_id}' connected (codec={codec})")
 
         # Register this WebSocket connection
         edge_websocket_connections[str(edge_id)] = websocket
+        edge_websocket_codecs[str(edge_id)] = codec
 
         # Send acknowledgement
         await websocket.send_json({
             "type": "connected",
-            "message": f"Edge '{edge_id}' registered successfully"
+            "message": f"Edge '{edge_id}' registered successfully",
+            "codec": codec
         })
 
         # Keep connection alive and handle incoming messages
         while True:
             try:
-                message = await websocket.receive_json()
+                message = await receive_ws_message(websocket)
 
                 # Handle different message types
                 msg_type = message.get("type")
 
                 if msg_type == "ping":
                     # Respond to ping
-                    await websocket.send_json({"type": "pong"})
+                    await send_ws_frame(websocket, wire_codec.encode({"type": "pong"}, codec))
 
                 elif msg_type in ["ENTRY", "EXIT", "DETECTION", "UPDATE", "DELETE", "LOCATION_UPDATE"]:
                     # Event from Edge - process it
@@ -2003,6 +2352,7 @@ async def websocket_edge_connection(websocket: WebSocket):
     finally:
         if edge_id:
             edge_websocket_connections.pop(str(edge_id), None)
+            edge_websocket_codecs.pop(str(edge_id), None)
         print(f"[Edge WebSocket] Edge '{edge_id}' disconnected")
 
 
@@ -2293,20 +2643,22 @@ async def handle_edge_websocket_event(edge_id: str, event: dict):
                     ))
             return
 
-        # Dedupe: if event already exists, skip (for ENTRY/EXIT events)
-        if event_id and database and database.event_exists(event_id):
-            print(f"[Edge WebSocket] Event {event_id} already exists, skipping (dedupe)")
-            return
-
-        # Process parking event using existing parking_state logic
-        result = parking_state.process_edge_event(
+        # Process parking event using existing parking_state logic (dedupe trong group commit)
+        event_tracer.begin(event_id, "websocket")
+        result = await asyncio.wrap_future(parking_state.submit_edge_event(
             event_type=event_type,
             camera_id=camera_id,
             camera_name=camera_name,
             camera_type=camera_type,
             data=data,
             event_id=event_id,
-        )
+        ))
+        _record_ingest("websocket", event_id, result)
+
+        # Dedupe: if event already exists, skip (for ENTRY/EXIT events)
+        if result.get("deduped"):
+            print(f"[Edge WebSocket] Event {event_id} already exists, skipping (dedupe)")
+            return
 
         if result['success']:
             # Ensure event_id present for EXIT (for P2P sync)
@@ -2374,10 +2726,15 @@ async def broadcast_to_edges(event: dict):
 
     print(f"[Edge Broadcast] Broadcasting event to {len(edge_websocket_connections)} edge(s)")
 
+    started = time.perf_counter()
     disconnected = []
-    for edge_id, websocket in edge_websocket_connections.items():
+    frames = {}  # encode 1 lan cho moi codec, khong phai moi edge
+    for edge_id, websocket in list(edge_websocket_connections.items()):
         try:
-            await websocket.send_json(event)
+            codec = edge_websocket_codecs.get(edge_id, wire_codec.CODEC_JSON)
+            if codec not in frames:
+                frames[codec] = wire_codec.encode(event, codec)
+            await send_ws_frame(websocket, frames[codec])
             print(f"[Edge Broadcast] Sent to edge {edge_id}")
         except Exception as e:
             print(f"[Edge Broadcast] Failed to send to edge {edge_id}: {e}")
@@ -2386,6 +2743,9 @@ async def broadcast_to_edges(event: dict):
     # Remove disconnected edges
     for edge_id in disconnected:
         edge_websocket_connections.pop(edge_id, None)
+        edge_websocket_codecs.pop(edge_id, None)
+    WS_SEND_FAILURES.labels("edge").inc(len(disconnected))
+    EDGE_BROADCAST_SECONDS.observe(time.perf_counter() - started)
 
 
 # Run Server
@@ -0,0 +1,205 @@
+"""
+Benchmark: trạng thái camera với --cameras camera giả lập - poll DB / broadcast mỗi heartbeat vs event-driven
+
+Mỗi camera gửi heartbeat mỗi --interval giây (rải đều). Sau nửa thời gian chạy, --silent camera
+ngừng gửi → phải chuyển offline sau --timeout giây. 1 WebSocket client giả nhận cameras_update.
+
+- legacy: CameraRegistry cũ (đọc DB, thread quét toàn bộ mỗi 10s), mỗi heartbeat → broadcast_camera_update
+- event : CameraRegistry hiện tại (RAM + timer wheel), chỉ broadcast khi trạng thái camera đổi
+
+In ra heartbeat/s thực tế, CPU (giây, mọi thread), số lần đọc bảng cameras, số broadcast + byte,
+và độ trễ phát hiện offline (từ lúc hết hạn heartbeat tới lúc client nhận cameras_update có đủ
+camera im lặng ở trạng thái offline).
+
+Usage:
+    python benchmarks/bench_camera_status.py [--cameras 1000] [--interval 5] [--timeout 6] [--duration 20]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as central_app  # noqa: E402
+import config  # noqa: E402
+from camera_registry import CameraRegistry  # noqa: E402
+from database import CentralDatabase  # noqa: E402
+
+
+def upsert_camera(db, camera_id, name, camera_type, status, events_sent, events_failed):
+    """Ghi 1 camera và chờ commit (đường ghi mỗi heartbeat cũ)"""
+    db.submit_camera_states([{
+        "id": camera_id, "name": name, "type": camera_type, "status": status,
+        "last_heartbeat": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        "events_sent": events_sent, "events_failed": events_failed,
+    }]).result()
+
+
+class CountingDatabase(CentralDatabase):
+    """CentralDatabase + đếm số lần đọc bảng cameras"""
+
+    camera_reads = 0
+
+    def get_cameras(self):
+        self.camera_reads += 1
+        return super().get_cameras()
+
+
+class LegacyCameraRegistry:
+    """CameraRegistry cũ: trạng thái trong DB, thread quét mọi camera mỗi 10 giây"""
+
+    def __init__(self, database, heartbeat_timeout=60):
+        self.db = database
+        self.heartbeat_timeout = heartbeat_timeout
+        self.running = False
+        self.check_thread = None
+
+    def start(self):
+        self.running = True
+        self.check_thread = threading.Thread(target=self._check_offline_loop, daemon=True)
+        self.check_thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def update_heartbeat(self, camera_id, name, camera_type, events_sent, events_failed):
+        upsert_camera(self.db, camera_id=camera_id, name=name, camera_type=camera_type, status="online",
+                      events_sent=events_sent, events_failed=events_failed)
+
+    def _check_offline_loop(self):
+        while self.running:
+            self._check_offline_cameras()
+            time.sleep(10)
+
+    def _check_offline_cameras(self):
+        timeout_threshold = datetime.utcnow() - timedelta(seconds=self.heartbeat_timeout)
+        for camera in self.db.get_cameras():
+            if camera['last_heartbeat']:
+                last_heartbeat = datetime.strptime(camera['last_heartbeat'], '%Y-%m-%d %H:%M:%S')
+                if last_heartbeat < timeout_threshold and camera['status'] == 'online':
+                    upsert_camera(self.db, camera_id=camera['id'], name=camera['name'], camera_type=camera['type'],
+                                  status='offline', events_sent=camera['events_sent'],
+                                  events_failed=camera['events_failed'])
+
+    def get_camera_status(self):
+        cameras = self.db.get_cameras()
+        return {
+            "total": len(cameras),
+            "online": sum(1 for c in cameras if c['status'] == 'online'),
+            "offline": sum(1 for c in cameras if c['status'] == 'offline'),
+            "cameras": cameras
+        }
+
+
+class FakeClient:
+    """WebSocket client giả: đếm message, ghi lại lúc thấy đủ camera im lặng offline"""
+
+    def __init__(self, silent_ids):
+        self.silent_ids = silent_ids
+        self.messages = 0
+        self.bytes = 0
+        self.all_offline_at = None
+
+    async def send_text(self, text):
+        self.messages += 1
+        self.bytes += len(text)
+        if self.all_offline_at is None:
+            cameras = json.loads(text)["data"]["cameras"]
+            offline = {c["id"] for c in cameras if c["status"] == "offline"}
+            if self.silent_ids <= offline:
+                self.all_offline_at = time.monotonic()
+
+
+async def run(mode, args):
+    db = CountingDatabase(os.path.join(tempfile.mkdtemp(prefix="bench_camera_status_"), "central.db"))
+    config.EDGE_CAMERAS = {
+        i: {"name": f"Camera {i}", "camera_type": "ENTRY", "base_url": f"http://10.0.{i // 250}.{i % 250}:8000"}
+        for i in range(1, args.cameras + 1)
+    }
+    silent_ids = set(range(1, args.silent + 1))
+    client = FakeClient(silent_ids)
+    central_app.camera_websocket_clients.clear()
+    central_app.camera_websocket_clients.add(client)
+
+    loop = asyncio.get_running_loop()
+    if mode == "legacy":
+        registry = LegacyCameraRegistry(db, heartbeat_timeout=args.timeout)
+    else:
+        registry = CameraRegistry(db, heartbeat_timeout=args.timeout)
+        registry.add_listener(lambda camera_ids: loop.call_soon_threadsafe(central_app.schedule_camera_broadcast))
+    central_app.camera_registry = registry
+    registry.start()
+
+    started = time.monotonic()
+    cpu_started = time.process_time()
+    reads_started = db.camera_reads
+    stop_silent_at = started + args.duration / 2
+    last_silent_beat = started
+    beats = 0
+    next_beat = {i: started + args.interval * i / args.cameras for i in range(1, args.cameras + 1)}
+    while time.monotonic() < started + args.duration:
+        now = time.monotonic()
+        for camera_id, due in next_beat.items():
+            if due > now:
+                continue
+            next_beat[camera_id] = due + args.interval
+            if camera_id in silent_ids:
+                if now >= stop_silent_at:
+                    continue
+                last_silent_beat = max(last_silent_beat, now)
+            # Giong receive_heartbeat
+            registry.update_heartbeat(camera_id, f"Camera {camera_id}", "ENTRY", beats, 0)
+            if mode == "legacy":
+                asyncio.create_task(central_app.broadcast_camera_update())
+            beats += 1
+        await asyncio.sleep(0.02)
+
+    # Cho cac broadcast dang cho xong
+    await asyncio.sleep(0.5)
+    cpu = time.process_time() - cpu_started
+    registry.stop()
+    db.close()
+
+    expired_at = last_silent_beat + args.timeout
+    latency = client.all_offline_at - expired_at if client.all_offline_at else None
+    return {
+        "beats_per_s": beats / args.duration,
+        "cpu": cpu,
+        "reads": db.camera_reads - reads_started,
+        "broadcasts": client.messages,
+        "bytes": client.bytes,
+        "offline_latency": latency,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cameras", type=int, default=1000)
+    parser.add_argument("--interval", type=float, default=5.0, help="chu ky heartbeat moi camera (giay)")
+    parser.add_argument("--timeout", type=float, default=6.0, help="heartbeat timeout (giay)")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--silent", type=int, default=10, help="so camera ngung heartbeat giua chung")
+    args = parser.parse_args()
+
+    print(f"{args.cameras} cameras, heartbeat every {args.interval}s, timeout {args.timeout}s, "
+          f"{args.silent} go silent after {args.duration / 2:.0f}s")
+    print(f"{'mode':<7} {'beats/s':>8} {'cpu s':>7} {'db reads':>9} {'broadcasts':>11} {'MB sent':>8} "
+          f"{'offline latency s':>18}")
+    for mode in ("legacy", "event"):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = asyncio.run(run(mode, args))
+        latency = result["offline_latency"]
+        print(f"{mode:<7} {result['beats_per_s']:>8.0f} {result['cpu']:>7.1f} {result['reads']:>9} "
+              f"{result['broadcasts']:>11} {result['bytes'] / 1024 / 1024:>8.1f} "
+              f"{'never' if latency is None else f'{latency:.1f}':>18}")
+
+
+if __name__ == "__main__":
+    main()
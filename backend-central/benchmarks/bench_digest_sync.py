@@ -0,0 +1,198 @@
+"""
+Benchmark: chi phí sync khi reconnect - SYNC_REQUEST theo timestamp vs digest (anti-entropy)
+
+2 DB tạm A, B cùng --history event (rải đều --days ngày, created_at = entry_time).
+A lệch B --diffs event: nửa A thiếu hẳn, nửa A còn IN trong khi B đã OUT.
+A reconnect và sync từ B qua 1 link giả trong process: mọi message được encode bằng codec thật
+(--codec) và đếm byte cả 2 chiều, rồi chuyển cho P2PSyncManager bên kia.
+
+- legacy: request_timestamp_sync_from_peer (chưa có sync state → 7 ngày gần nhất, tối đa 5000 event)
+- digest: request_sync_from_peer (SYNC_DIGEST ngày → giờ → SYNC_REQUEST các giờ lệch)
+
+In ra số message, byte, số event được gửi, thời gian và A có khớp B sau sync không.
+
+Usage:
+    python benchmarks/bench_digest_sync.py [--history 50000] [--days 30] [--diffs 0,10,10000]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import CentralDatabase  # noqa: E402
+from p2p import codec as wire_codec  # noqa: E402
+from p2p.database_extensions import patch_database_for_p2p  # noqa: E402
+from p2p.protocol import MessageType, P2PMessage  # noqa: E402
+from p2p.sync_manager import P2PSyncManager  # noqa: E402
+
+
+class FakeLink:
+    """Thay P2PManager: encode message bằng codec thật, đếm byte, giao cho sync manager bên kia"""
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.managers = {}
+        self.tasks = set()
+        self.messages = 0
+        self.bytes = 0
+        self.events = 0
+
+    def endpoint(self, central_id):
+        link = self
+
+        class Endpoint:
+            async def send_to_peer(self, peer_id, message):
+                frame = message.to_wire(link.codec)
+                link.messages += 1
+                link.bytes += len(frame) if isinstance(frame, bytes) else len(frame.encode("utf-8"))
+                if message.type == MessageType.SYNC_RESPONSE:
+                    link.events += len(message.data["events"])
+                task = asyncio.create_task(link.deliver(peer_id, central_id, P2PMessage.from_wire(frame)))
+                link.tasks.add(task)
+                task.add_done_callback(link.tasks.discard)
+                return True
+
+        return Endpoint()
+
+    async def deliver(self, to_id, from_id, message):
+        manager = self.managers[to_id]
+        handler = {
+            MessageType.SYNC_DIGEST: manager.handle_sync_digest,
+            MessageType.SYNC_REQUEST: manager.handle_sync_request,
+            MessageType.SYNC_RESPONSE: manager.handle_sync_response,
+        }[message.type]
+        await handler(message, from_id)
+
+    async def drain(self):
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks))
+
+
+def build_history(path, count, days):
+    """Ghi count event (entry_time rai deu days ngay gan nhat, ~70% da OUT) bang SQL truc tiep"""
+    db = CentralDatabase(path)
+    patch_database_for_p2p(db)
+    db.close()
+
+    rng = random.Random(1)
+    start = datetime.now() - timedelta(days=days)
+    rows = []
+    for i in range(count):
+        entry = start + timedelta(seconds=(days * 86400) * i / count)
+        entry_time = entry.strftime('%Y-%m-%d %H:%M:%S')
+        out = rng.random() < 0.7
+        exit_time = (entry + timedelta(hours=2)).strftime('%Y-%m-%d %H:%M:%S') if out else None
+        rows.append((
+            f"central-2_{int(entry.timestamp() * 1000)}_{i}", "central-2", "edge-1", f"30A{i:05d}",
+            f"30A-{i:05d}", entry_time, 1, "Cổng vào A", 0.93, "auto",
+            exit_time, 2 if out else None, "Cổng ra A" if out else None, 0.91 if out else None,
+            "auto" if out else None, "2 giờ" if out else None, 25000 if out else 0,
+            "OUT" if out else "IN", "SYNCED", entry_time, entry_time,
+        ))
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        """
+        INSERT INTO history (
+            event_id, source_central, edge_id, plate_id, plate_view, entry_time,
+            entry_camera_id, entry_camera_name, entry_confidence, entry_source,
+            exit_time, exit_camera_id, exit_camera_name, exit_confidence, exit_source,
+            duration, fee, status, sync_status, created_at, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def diverge(path, diffs):
+    """A lech B: nua so event bi xoa, nua so event OUT bi dua ve IN"""
+    conn = sqlite3.connect(path)
+    rng = random.Random(2)
+    out_ids = [row[0] for row in conn.execute("SELECT event_id FROM history WHERE status = 'OUT'")]
+    chosen = rng.sample(out_ids, diffs)
+    missing, reopened = chosen[:diffs // 2], chosen[diffs // 2:]
+    conn.executemany("DELETE FROM history WHERE event_id = ?", [(e,) for e in missing])
+    conn.executemany(
+        """
+        UPDATE history SET status = 'IN', exit_time = NULL, exit_camera_id = NULL, exit_camera_name = NULL,
+            exit_confidence = NULL, exit_source = NULL, duration = NULL, fee = 0
+        WHERE event_id = ?
+        """,
+        [(e,) for e in reopened],
+    )
+    conn.commit()
+    conn.close()
+
+
+def open_db(path):
+    db = CentralDatabase(path)
+    patch_database_for_p2p(db)
+    return db
+
+
+async def run(mode, base_path, diffs, codec, days):
+    workdir = tempfile.mkdtemp(prefix="bench_digest_")
+    path_a, path_b = os.path.join(workdir, "a.db"), os.path.join(workdir, "b.db")
+    shutil.copy(base_path, path_a)
+    shutil.copy(base_path, path_b)
+    diverge(path_a, diffs)
+
+    db_a, db_b = open_db(path_a), open_db(path_b)
+    link = FakeLink(codec)
+    manager_a = P2PSyncManager(db_a, link.endpoint("central-1"), "central-1", digest_days=days + 1)
+    manager_b = P2PSyncManager(db_b, link.endpoint("central-2"), "central-2", digest_days=days + 1)
+    link.managers = {"central-1": manager_a, "central-2": manager_b}
+
+    started = time.perf_counter()
+    if mode == "legacy":
+        await manager_a.request_timestamp_sync_from_peer("central-2")
+    else:
+        await manager_a.request_sync_from_peer("central-2")
+    await link.drain()
+    elapsed = time.perf_counter() - started
+
+    for task in list(manager_a._pending_digests.values()):
+        task.cancel()
+    since = (datetime.now() - timedelta(days=days + 1)).strftime('%Y-%m-%d')
+    converged = db_a.get_sync_digest("day", since) == db_b.get_sync_digest("day", since)
+    db_a.close()
+    db_b.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return link, elapsed, converged
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--history", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--diffs", default="0,10,10000")
+    parser.add_argument("--codec", default=wire_codec.CODEC_JSON, choices=wire_codec.supported_codecs())
+    args = parser.parse_args()
+
+    base_path = os.path.join(tempfile.mkdtemp(prefix="bench_digest_base_"), "base.db")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        build_history(base_path, args.history, args.days)
+
+    print(f"history={args.history} events over {args.days} days, codec={args.codec}")
+    print(f"{'diffs':>6} {'mode':<7} {'messages':>9} {'bytes':>11} {'events':>7} {'time ms':>9} {'converged':>10}")
+    for diffs in [int(d) for d in args.diffs.split(",")]:
+        for mode in ("legacy", "digest"):
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                link, elapsed, converged = asyncio.run(run(mode, base_path, diffs, args.codec, args.days))
+            print(f"{diffs:>6} {mode:<7} {link.messages:>9} {link.bytes:>11} {link.events:>7} "
+                  f"{elapsed * 1000:>9.0f} {str(converged):>10}")
+
+
+if __name__ == "__main__":
+    main()
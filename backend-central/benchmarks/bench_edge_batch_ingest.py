@@ -0,0 +1,103 @@
+"""
+Benchmark: throughput ingest event từ Edge - POST từng event vs batch
+
+Chạy central app (uvicorn, tắt lifespan để không bật P2P) với DB tạm,
+rồi gửi backlog N event (ENTRY rồi EXIT) theo 2 cách:
+- single: POST /api/edge/event từng event (giống edge fallback HTTP hiện tại)
+- batch : POST /api/edge/events/batch, mỗi request --batch-size event
+
+Usage:
+    python benchmarks/bench_edge_batch_ingest.py [--events 2000] [--batch-size 200]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as central_app  # noqa: E402
+from database import CentralDatabase  # noqa: E402
+from parking_state import ParkingStateManager  # noqa: E402
+from p2p.database_extensions import patch_database_for_p2p  # noqa: E402
+
+
+def make_events(count, prefix):
+    """Backlog: count/2 xe vao roi ra"""
+    events = []
+    half = count // 2
+    for i in range(half):
+        plate = f"{prefix}{i:05d}"
+        events.append({
+            "type": "ENTRY", "camera_id": 1, "camera_name": "Gate A", "camera_type": "ENTRY",
+            "event_id": f"edge-1_{prefix}_{i}", "timestamp": time.time(),
+            "data": {"plate_text": plate, "confidence": 0.9, "source": "auto"},
+        })
+    for i in range(half):
+        plate = f"{prefix}{i:05d}"
+        events.append({
+            "type": "EXIT", "camera_id": 2, "camera_name": "Gate B", "camera_type": "EXIT",
+            "timestamp": time.time(),
+            "data": {"plate_text": plate, "confidence": 0.9, "source": "auto"},
+        })
+    return events
+
+
+def start_server(port):
+    db = CentralDatabase(os.path.join(tempfile.mkdtemp(prefix="bench_ingest_"), "central.db"))
+    patch_database_for_p2p(db)
+    central_app.database = db
+    central_app.parking_state = ParkingStateManager(db)
+
+    server = uvicorn.Server(uvicorn.Config(central_app.app, host="127.0.0.1", port=port,
+                                           lifespan="off", log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--port", type=int, default=18765)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        server = start_server(args.port)
+    base = f"http://127.0.0.1:{args.port}"
+    session = requests.Session()
+
+    events = make_events(args.events, "30A")
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for event in events:
+            session.post(f"{base}/api/edge/event", json=event, timeout=10).raise_for_status()
+    single_s = time.perf_counter() - start
+
+    events = make_events(args.events, "51G")
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(0, len(events), args.batch_size):
+            response = session.post(f"{base}/api/edge/events/batch",
+                                    json={"events": events[i:i + args.batch_size]}, timeout=60)
+            response.raise_for_status()
+            assert all(r["success"] for r in response.json()["results"])
+    batch_s = time.perf_counter() - start
+
+    print(f"events={len(events)} batch_size={args.batch_size}")
+    print(f"single: {single_s:7.2f}s  {len(events) / single_s:9.1f} events/s")
+    print(f"batch : {batch_s:7.2f}s  {len(events) / batch_s:9.1f} events/s")
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark: throughput ghi DB khi nhiều Edge gửi event cùng lúc - commit từng lệnh vs group commit
+
+--edges thread (mô phỏng edge) gửi event liên tục trong --duration giây (mỗi xe ENTRY rồi EXIT):
+- http  : POST /api/edge/event vào central app (uvicorn, tắt lifespan để không bật P2P) với DB tạm
+- direct: gọi thẳng ParkingStateManager.process_edge_event (chỉ đo đường ghi DB, bỏ overhead HTTP)
+
+So sánh 2 cấu hình writer:
+- per-op : group_commit_max_ops=1, window=0  (mỗi thao tác ghi 1 commit, như trước)
+- group  : group_commit_window=--window-ms   (gom thao tác ghi của mọi edge vào 1 commit)
+
+In ra events/s, latency p50/p99 mỗi request và số op trung bình / commit.
+
+Usage:
+    python benchmarks/bench_group_commit.py [--edges 10] [--duration 10] [--window-ms 0] [--path http|direct|both]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as central_app  # noqa: E402
+from database import CentralDatabase  # noqa: E402
+from parking_state import ParkingStateManager  # noqa: E402
+from p2p.database_extensions import patch_database_for_p2p  # noqa: E402
+
+
+class CountingDatabase(CentralDatabase):
+    """CentralDatabase + đếm số commit / số op để tính kích thước nhóm"""
+
+    def __init__(self, *args, **kwargs):
+        self.commits = 0
+        self.ops = 0
+        super().__init__(*args, **kwargs)
+
+    def _commit_group(self, group):
+        self.commits += 1
+        self.ops += len(group)
+        super()._commit_group(group)
+
+
+def make_database(window, max_ops):
+    db = CountingDatabase(
+        os.path.join(tempfile.mkdtemp(prefix="bench_group_commit_"), "central.db"),
+        group_commit_window=window,
+        group_commit_max_ops=max_ops,
+    )
+    patch_database_for_p2p(db)
+    return db
+
+
+def start_server(port, window, max_ops):
+    db = make_database(window, max_ops)
+    central_app.database = db
+    central_app.parking_state = ParkingStateManager(db)
+
+    server = uvicorn.Server(uvicorn.Config(central_app.app, host="127.0.0.1", port=port,
+                                           lifespan="off", log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, db
+
+
+def edge_events(edge_index, i):
+    """Xe thu i cua 1 edge: ENTRY roi EXIT (bien so rieng cho moi edge)"""
+    plate = f"{edge_index + 10:02d}A{i:05d}"
+    for event_type, camera_id in (("ENTRY", 1), ("EXIT", 2)):
+        payload = {
+            "type": event_type, "camera_id": camera_id, "camera_name": f"Edge {edge_index}",
+            "camera_type": event_type, "timestamp": time.time(),
+            "data": {"plate_text": plate, "confidence": 0.9, "source": "auto",
+                     "edge_id": f"edge-{edge_index}"},
+        }
+        if event_type == "ENTRY":
+            payload["event_id"] = f"edge-{edge_index}_{i}"
+        yield payload
+
+
+def http_edge_worker(edge_index, base_url, deadline, latencies, counts):
+    session = requests.Session()
+    i = 0
+    while time.monotonic() < deadline:
+        for payload in edge_events(edge_index, i):
+            started = time.perf_counter()
+            response = session.post(f"{base_url}/api/edge/event", json=payload, timeout=30)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code == 200:
+                counts[edge_index] += 1
+        i += 1
+    session.close()
+
+
+def direct_edge_worker(edge_index, parking_state, deadline, latencies, counts):
+    i = 0
+    while time.monotonic() < deadline:
+        for payload in edge_events(edge_index, i):
+            started = time.perf_counter()
+            result = parking_state.process_edge_event(
+                event_type=payload["type"], camera_id=payload["camera_id"],
+                camera_name=payload["camera_name"], camera_type=payload["camera_type"],
+                data=payload["data"], event_id=payload.get("event_id"),
+            )
+            latencies.append(time.perf_counter() - started)
+            if result.get("success"):
+                counts[edge_index] += 1
+        i += 1
+
+
+def run(path, mode, port, edges, duration, window, max_ops):
+    if path == "http":
+        server, db = start_server(port, window, max_ops)
+        target, arg = http_edge_worker, f"http://127.0.0.1:{port}"
+    else:
+        server, db = None, make_database(window, max_ops)
+        target, arg = direct_edge_worker, ParkingStateManager(db)
+
+    latencies = []
+    counts = [0] * edges
+    deadline = time.monotonic() + duration
+    workers = [
+        threading.Thread(target=target, args=(i, arg, deadline, latencies, counts))
+        for i in range(edges)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    if server:
+        server.should_exit = True
+    db.close()
+
+    latencies.sort()
+    total = sum(counts)
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    ops_per_commit = db.ops / db.commits if db.commits else 0
+    print(f"{path:<7} {mode:<8} {total / elapsed:>10.0f} {p50:>9.2f} {p99:>9.2f} {db.commits:>9} {ops_per_commit:>9.1f}")
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--edges", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--window-ms", type=float, default=0)
+    parser.add_argument("--path", choices=["http", "direct", "both"], default="both")
+    parser.add_argument("--port", type=int, default=18231)
+    args = parser.parse_args()
+
+    paths = ["direct", "http"] if args.path == "both" else [args.path]
+    print(f"{args.edges} edges x {args.duration:.0f}s, window={args.window_ms}ms")
+    print(f"{'path':<7} {'mode':<8} {'events/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'commits':>9} {'ops/commit':>9}")
+    for index, path in enumerate(paths):
+        port = args.port + index * 2
+        per_op = run(path, "per-op", port, args.edges, args.duration, 0, 1)
+        group = run(path, "group", port + 1, args.edges, args.duration, args.window_ms / 1000, 256)
+        print(f"{path:<7} speedup: {group / per_op:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
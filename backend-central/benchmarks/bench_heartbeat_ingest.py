@@ -0,0 +1,200 @@
+"""
+Benchmark: heartbeat của --edges edge - ghi DB mỗi heartbeat vs ghi gộp (liveness table trong RAM)
+
+Gọi thẳng ASGI app (httpx.ASGITransport, không qua mạng): mỗi edge POST /api/edge/heartbeat
+mỗi --interval giây (rải đều), đồng thời --event-rate event ENTRY/s vào /api/edge/event.
+
+- per-beat: mỗi heartbeat ghi 1 dòng cameras (chờ commit) như trước
+- batched : CameraRegistry hiện tại - chỉ cập nhật RAM, flush gộp mỗi --flush-interval giây
+
+In ra số thao tác ghi DB/s, số commit, latency heartbeat và event (p50 / p99).
+Kiểm tra (batched): sau registry.stop(), events_sent / events_failed trong DB đúng bằng giá trị
+heartbeat cuối cùng của từng edge.
+
+Usage:
+    python benchmarks/bench_heartbeat_ingest.py [--edges 500] [--interval 1] [--event-rate 50] [--duration 15]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as central_app  # noqa: E402
+from camera_registry import CameraRegistry  # noqa: E402
+from database import CentralDatabase  # noqa: E402
+from parking_state import ParkingStateManager  # noqa: E402
+
+
+def upsert_camera(db, camera_id, name, camera_type, status, events_sent, events_failed):
+    """Ghi 1 camera và chờ commit (đường ghi mỗi heartbeat cũ)"""
+    db.submit_camera_states([{
+        "id": camera_id, "name": name, "type": camera_type, "status": status,
+        "last_heartbeat": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        "events_sent": events_sent, "events_failed": events_failed,
+    }]).result()
+
+
+class CountingDatabase(CentralDatabase):
+    """CentralDatabase + đếm thao tác ghi / commit"""
+
+    def __init__(self, *args, **kwargs):
+        self.writes = 0
+        self.commits = 0
+        super().__init__(*args, **kwargs)
+
+    def submit_write(self, op, *args):
+        self.writes += 1
+        return super().submit_write(op, *args)
+
+    def _commit_group(self, group):
+        self.commits += 1
+        super()._commit_group(group)
+
+
+class PerBeatCameraRegistry(CameraRegistry):
+    """Hành vi cũ: mỗi heartbeat ghi DB và chờ commit"""
+
+    def update_heartbeat(self, camera_id, name, camera_type, events_sent, events_failed):
+        upsert_camera(self.db, camera_id=camera_id, name=name, camera_type=camera_type, status="online",
+                      events_sent=events_sent, events_failed=events_failed)
+        return super().update_heartbeat(camera_id, name, camera_type, events_sent, events_failed)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(mode, args):
+    db = CountingDatabase(os.path.join(tempfile.mkdtemp(prefix="bench_heartbeat_"), "central.db"))
+    registry_cls = PerBeatCameraRegistry if mode == "per-beat" else CameraRegistry
+    registry = registry_cls(db, heartbeat_timeout=args.interval * 5, flush_interval=args.flush_interval)
+    central_app.database = db
+    central_app.camera_registry = registry
+    central_app.parking_state = ParkingStateManager(db)
+    central_app.parking_state._fees_cache = {"fee_base": 0.5, "fee_per_hour": 25000}
+    central_app.parking_state._fees_cache_time = None
+    registry.start()
+
+    heartbeat_latencies = []
+    event_latencies = []
+    last_sent = {}
+    tasks = set()
+
+    async def post(client, path, body, latencies):
+        started = time.perf_counter()
+        response = await client.post(path, json=body)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+    def spawn(coro):
+        task = asyncio.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    transport = httpx.ASGITransport(app=central_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://central") as client:
+        # Warm-up: moi edge da online 1 lan (do dang ky camera moi khoi so lieu on dinh)
+        for edge in range(1, args.edges + 1):
+            await post(client, "/api/edge/heartbeat", {
+                "camera_id": edge, "camera_name": f"Edge {edge}", "camera_type": "ENTRY",
+                "status": "online", "events_sent": 0, "events_failed": 0,
+            }, [])
+        flushes_started = registry.flushes
+
+        started = time.monotonic()
+        writes_started, commits_started = db.writes, db.commits
+        next_beat = {edge: started + args.interval * edge / args.edges for edge in range(1, args.edges + 1)}
+        next_event = started
+        events = 0
+        while time.monotonic() < started + args.duration:
+            now = time.monotonic()
+            for edge, due in next_beat.items():
+                if due > now:
+                    continue
+                next_beat[edge] = due + args.interval
+                last_sent[edge] = last_sent.get(edge, 0) + 1
+                spawn(post(client, "/api/edge/heartbeat", {
+                    "camera_id": edge, "camera_name": f"Edge {edge}", "camera_type": "ENTRY",
+                    "status": "online", "events_sent": last_sent[edge], "events_failed": edge % 3,
+                }, heartbeat_latencies))
+            while next_event <= now:
+                next_event += 1.0 / args.event_rate
+                events += 1
+                spawn(post(client, "/api/edge/event", {
+                    "type": "ENTRY", "camera_id": 1, "camera_name": "Edge 1", "camera_type": "ENTRY",
+                    "event_id": f"bench_{mode}_{events}",
+                    "data": {"plate_text": f"30A{events:06d}", "confidence": 0.93, "source": "auto"},
+                }, event_latencies))
+            await asyncio.sleep(0.005)
+        elapsed = time.monotonic() - started
+        while tasks:
+            await asyncio.gather(*list(tasks))
+
+    writes = db.writes - writes_started
+    commits = db.commits - commits_started
+    registry.stop()
+    flushes = registry.flushes - flushes_started
+
+    lost = 0
+    if mode == "batched":
+        stored = {c["id"]: c for c in db.get_cameras()}
+        lost = sum(1 for edge, sent in last_sent.items()
+                   if stored[edge]["events_sent"] != sent or stored[edge]["events_failed"] != edge % 3)
+    db.close()
+    return {
+        "elapsed": elapsed,
+        "heartbeats": len(heartbeat_latencies),
+        "writes": writes,
+        "commits": commits,
+        "heartbeat": heartbeat_latencies,
+        "event": event_latencies,
+        "lost": lost,
+        "flushes": flushes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--edges", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=1.0, help="chu ky heartbeat moi edge (giay)")
+    parser.add_argument("--event-rate", type=float, default=50.0)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--flush-interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{args.edges} edges heartbeating every {args.interval}s, {args.event_rate:.0f} events/s, "
+          f"{args.duration:.0f}s, flush every {args.flush_interval}s")
+    print(f"{'mode':<9} {'beats/s':>8} {'writes/s':>9} {'commits/s':>10} {'hb p50 ms':>10} {'hb p99 ms':>10} "
+          f"{'ev p50 ms':>10} {'ev p99 ms':>10}")
+    failures = []
+    for mode in ("per-beat", "batched"):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = asyncio.run(run(mode, args))
+        elapsed = result["elapsed"]
+        print(f"{mode:<9} {result['heartbeats'] / elapsed:>8.0f} {result['writes'] / elapsed:>9.1f} "
+              f"{result['commits'] / elapsed:>10.1f} "
+              f"{percentile(result['heartbeat'], 0.5) * 1000:>10.2f} {percentile(result['heartbeat'], 0.99) * 1000:>10.2f} "
+              f"{percentile(result['event'], 0.5) * 1000:>10.2f} {percentile(result['event'], 0.99) * 1000:>10.2f}")
+        if mode == "batched":
+            print(f"  flushes={result['flushes']} edges with lost counters={result['lost']}")
+            if result["lost"]:
+                failures.append(f"{result['lost']} edges lost heartbeat counters")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
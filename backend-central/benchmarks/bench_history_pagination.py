@@ -0,0 +1,99 @@
+"""
+Benchmark: latency lấy trang thứ N của history - OFFSET vs keyset cursor
+
+Tạo bảng history synthetic lớn (mặc định 500k record), rồi đo thời gian lấy
+trang N bằng LIMIT/OFFSET (client cũ) và bằng cursor (đi theo next_cursor).
+Đo cả khi có filter status='OUT'.
+
+Usage:
+    python benchmarks/bench_history_pagination.py [--rows 500000] [--page-size 100]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import CentralDatabase, encode_history_cursor  # noqa: E402
+
+
+def build_table(db, rows):
+    conn = sqlite3.connect(db.db_file)
+    start = datetime.now() - timedelta(seconds=rows * 5)
+    batch = []
+    for i in range(rows):
+        # Nhieu record trung created_at (cung giay) de kiem tra tie-break theo id
+        created_at = (start + timedelta(seconds=(i // 3) * 15)).strftime("%Y-%m-%d %H:%M:%S")
+        status = "OUT" if random.random() < 0.8 else "IN"
+        batch.append((f"ev_{i}", f"30A{i % 99999:05d}", "30A", created_at, status, created_at, created_at))
+        if len(batch) >= 50000:
+            conn.executemany("""
+                INSERT INTO history (event_id, plate_id, plate_view, entry_time, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, batch)
+            batch = []
+    if batch:
+        conn.executemany("""
+            INSERT INTO history (event_id, plate_id, plate_view, entry_time, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, batch)
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, repeat=5):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--pages", type=int, nargs="*", default=[1, 10, 100, 1000, 4000])
+    args = parser.parse_args()
+
+    db = CentralDatabase(os.path.join(tempfile.mkdtemp(prefix="bench_hist_"), "central.db"))
+    print(f"Building {args.rows} rows ...")
+    build_table(db, args.rows)
+
+    for label, filters in (("no filter", {}), ("status=OUT", {"status": "OUT"})):
+        print(f"\n[{label}] page size {args.page_size}")
+        print(f"{'page':>6} {'offset (ms)':>12} {'cursor (ms)':>12}")
+
+        # Di theo cursor tu dau, ghi lai cursor cua tung trang can do
+        wanted = set(args.pages)
+        cursors = {1: None}
+        page_cursor = None
+        for page in range(1, max(args.pages) + 1):
+            rows = db.get_history(limit=args.page_size, page_cursor=page_cursor, **filters)
+            if len(rows) < args.page_size:
+                break
+            page_cursor = encode_history_cursor(rows[-1])
+            if page + 1 in wanted:
+                cursors[page + 1] = page_cursor
+
+        for page in args.pages:
+            if page not in cursors:
+                continue
+            offset = (page - 1) * args.page_size
+            offset_ms, offset_rows = timed(lambda: db.get_history(limit=args.page_size, offset=offset, **filters))
+            cursor_ms, cursor_rows = timed(lambda: db.get_history(limit=args.page_size,
+                                                                  page_cursor=cursors[page], **filters))
+            assert [r["id"] for r in offset_rows] == [r["id"] for r in cursor_rows], f"page {page} mismatch"
+            print(f"{page:>6} {offset_ms:12.2f} {cursor_ms:12.2f}")
+
+
+if __name__ == "__main__":
+    main()
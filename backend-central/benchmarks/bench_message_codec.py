@@ -0,0 +1,113 @@
+"""
+Benchmark: kích thước frame và thời gian encode/decode - JSON vs MessagePack vs MessagePack+zlib
+
+Dữ liệu thật lấy từ DB tạm (history do add_vehicle_entry_p2p / update_vehicle_exit_p2p ghi):
+- entry    : 1 VEHICLE_ENTRY_PENDING (message P2P thường gặp nhất)
+- exit     : 1 VEHICLE_EXIT
+- edge     : 1 event ENTRY từ Edge gửi lên /ws/edge
+- sync N   : 1 SYNC_RESPONSE chứa N dòng history (như handle_sync_request gửi)
+
+In ra byte / frame, byte / event và µs encode / decode (trung bình --repeat lần).
+
+Usage:
+    python benchmarks/bench_message_codec.py [--sync-events 1000] [--repeat 2000]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import CentralDatabase  # noqa: E402
+from p2p import codec as wire_codec  # noqa: E402
+from p2p.database_extensions import patch_database_for_p2p  # noqa: E402
+from p2p.protocol import (  # noqa: E402
+    create_entry_pending_message, create_exit_message, create_sync_response_message,
+)
+
+
+def make_history_rows(count):
+    """Ghi count xe (ENTRY + EXIT) vao DB tam roi doc lai nhu handle_sync_request"""
+    db = CentralDatabase(os.path.join(tempfile.mkdtemp(prefix="bench_codec_"), "central.db"))
+    patch_database_for_p2p(db)
+    for i in range(count):
+        event_id = f"central-2_{1700000000000 + i}_30A{i:05d}"
+        db.add_vehicle_entry_p2p(event_id, "central-2", "edge-1", f"30A{i:05d}", f"30A-{i:03d}.{i % 100:02d}",
+                                 "2024-01-01 08:00:00", 1, "Cổng vào A", 0.93, "auto")
+        if i % 2:
+            db.update_vehicle_exit_p2p(event_id, "2024-01-01 10:30:00", 2, "Cổng ra A", 0.91, "auto",
+                                       "2 giờ 30 phút", 25000)
+    rows = db.get_events_since(0, limit=count)
+    db.close()
+    return [{k: v for k, v in row.items() if v is not None} for row in rows]
+
+
+def build_messages(sync_events):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    entry = create_entry_pending_message("central-1", "central-1_1700000000000_30A12345", "30A12345",
+                                         "30A-123.45", "edge-1", "ENTRY", "ENTRY", now).to_dict()
+    exit_msg = create_exit_message("central-1", "central-1_1700000000000_30A12345", "30A12345", "central-1",
+                                   "edge-2", now, 25000, "2 giờ 30 phút").to_dict()
+    edge_event = {
+        "type": "ENTRY", "camera_id": 1, "camera_name": "Cổng vào A", "camera_type": "ENTRY",
+        "timestamp": time.time(), "event_id": "edge-1_1700000000000",
+        "data": {"plate_text": "30A12345", "plate_view": "30A-123.45", "confidence": 0.93, "source": "auto"},
+    }
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        rows = make_history_rows(sync_events)
+    sync = create_sync_response_message("central-1", rows).to_dict()
+    return [
+        ("entry", entry, 1),
+        ("exit", exit_msg, 1),
+        ("edge", edge_event, 1),
+        (f"sync {len(rows)}", sync, len(rows)),
+    ]
+
+
+def measure(obj, codec, repeat):
+    frame = wire_codec.encode(obj, codec)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        wire_codec.encode(obj, codec)
+    encode_us = (time.perf_counter() - started) / repeat * 1e6
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        wire_codec.decode(frame)
+    decode_us = (time.perf_counter() - started) / repeat * 1e6
+
+    assert wire_codec.decode(frame) == obj
+    size = len(frame.encode("utf-8")) if isinstance(frame, str) else len(frame)
+    return size, encode_us, decode_us
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sync-events", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    if wire_codec.msgpack is None:
+        print("msgpack chua cai - chi co JSON (pip install msgpack)")
+
+    codecs = [wire_codec.CODEC_JSON, wire_codec.CODEC_MSGPACK, wire_codec.CODEC_MSGPACK_ZLIB]
+    codecs = [c for c in codecs if c in wire_codec.supported_codecs()]
+
+    print(f"{'message':<10} {'codec':<13} {'bytes':>9} {'B/event':>8} {'vs json':>8} {'enc us':>9} {'dec us':>9}")
+    for name, obj, events in build_messages(args.sync_events):
+        # Message lon: giam so lan lap de chay nhanh
+        repeat = max(10, args.repeat // events)
+        baseline = None
+        for codec in codecs:
+            size, encode_us, decode_us = measure(obj, codec, repeat)
+            baseline = baseline or size
+            print(f"{name:<10} {codec:<13} {size:>9} {size / events:>8.0f} {size / baseline:>7.0%} "
+                  f"{encode_us:>9.1f} {decode_us:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Test / benchmark: broadcast P2P khi có 1 peer treo (kết nối vẫn mở nhưng không đọc)
+
+Chạy central app (uvicorn, tắt lifespan) với 1 P2PManager dùng config tạm có --peers peer.
+--peers - 1 peer khỏe đọc liên tục; 1 peer treo gửi identification rồi không đọc nữa
+(TCP buffer đầy → send tới peer này bị block). Broadcast --messages VEHICLE_ENTRY_PENDING với --rate msg/s.
+
+So sánh:
+- legacy : broadcast await send tuần tự từng peer (như trước)
+- outbox : hàng đợi + sender task riêng từng peer (PeerOutbox)
+
+Kiểm tra (outbox): peer khỏe nhận đủ message, đúng thứ tự, p99 latency thấp; peer treo bị ngắt
+khi hàng đợi tràn / send timeout. In thêm queue depth / send latency theo peer (get_queue_metrics).
+
+Usage:
+    python benchmarks/bench_p2p_stalled_peer.py [--peers 4] [--messages 60000] [--rate 3000] [--queue-size 500]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+import uvicorn
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as central_app  # noqa: E402
+from p2p import codec as wire_codec  # noqa: E402
+from p2p.manager import P2PManager  # noqa: E402
+from p2p.protocol import create_entry_pending_message  # noqa: E402
+
+
+class LegacyBroadcastManager(P2PManager):
+    """Hành vi cũ: await send tuần tự tới từng WebSocket peer"""
+
+    async def broadcast(self, message):
+        self.messages_sent += 1
+        for peer_id in list(self.websocket_connections.keys()):
+            try:
+                await self.send_websocket_message(peer_id, message)
+            except Exception as e:
+                print(f"Error broadcasting via WebSocket to {peer_id}: {e}")
+
+
+def make_config(peers):
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_p2p_"), "p2p_config.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "this_central": {"id": "central-1", "ip": "127.0.0.1", "api_port": 8000},
+            "peer_centrals": [{"id": f"peer-{i}", "ip": "127.0.0.1", "api_port": 8000} for i in range(peers)],
+        }, f)
+    return path
+
+
+async def start_server(port):
+    """uvicorn chay chung event loop voi benchmark (broadcast goi thang nhu parking_integration)"""
+    server = uvicorn.Server(uvicorn.Config(central_app.app, host="127.0.0.1", port=port,
+                                           lifespan="off", log_level="critical"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def healthy_peer(uri, peer_id, total, ready, result):
+    latencies = []
+    last = -1
+    out_of_order = 0
+    async with websockets.connect(uri, max_size=None) as ws:
+        await ws.send(json.dumps({"peer_id": peer_id, "codecs": wire_codec.supported_codecs()}))
+        ready.release()
+        try:
+            while len(latencies) < total:
+                data = wire_codec.decode(await asyncio.wait_for(ws.recv(), timeout=15))
+                if data.get("type") != "VEHICLE_ENTRY_PENDING":
+                    continue
+                latencies.append(time.perf_counter() - data["data"]["bench_sent_at"])
+                index = int(data["event_id"].rsplit("_", 1)[1])
+                if index <= last:
+                    out_of_order += 1
+                last = index
+        except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
+            pass
+    result[peer_id] = (latencies, out_of_order)
+
+
+async def stalled_peer(uri, port, ready, stop):
+    # Receive buffer / max_queue / read_limit nho: client ngung doc socket ngay → server bi backpressure
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    async with websockets.connect(uri, sock=sock, max_size=None, max_queue=1, read_limit=2 ** 12,
+                                  close_timeout=0.1) as ws:
+        await ws.send(json.dumps({"peer_id": "stalled", "codecs": wire_codec.supported_codecs()}))
+        ready.release()
+        while not stop.is_set():
+            await asyncio.sleep(0.1)
+
+
+def peers_process(port, peers, total, ready, stop, results):
+    """Process rieng cho cac peer (khong tranh CPU / event loop voi central)"""
+    async def main():
+        uri = f"ws://127.0.0.1:{port}/ws/p2p"
+        result = {}
+        healthy = [asyncio.create_task(healthy_peer(uri, f"peer-{i}", total, ready, result))
+                   for i in range(peers - 1)]
+        stalled = asyncio.create_task(stalled_peer(uri, port, ready, stop))
+        await asyncio.gather(*healthy)
+        results.put(result)
+        await stalled
+
+    asyncio.run(main())
+
+
+async def run(mode, args, port):
+    manager_cls = LegacyBroadcastManager if mode == "legacy" else P2PManager
+    manager = manager_cls(make_config(args.peers), send_queue_size=args.queue_size,
+                          send_timeout=args.send_timeout)
+    central_app.p2p_manager = manager
+    server, server_task = await start_server(port)
+
+    ready = multiprocessing.Semaphore(0)
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=peers_process,
+                                      args=(port, args.peers, args.messages, ready, stop, results))
+    process.start()
+    while len(manager.websocket_connections) < args.peers:
+        await asyncio.sleep(0.01)
+
+    interval = 1.0 / args.rate
+    started = time.perf_counter()
+    broadcast_time = 0.0
+    queue_metrics = {}
+    for i in range(args.messages):
+        message = create_entry_pending_message("central-1", f"central-1_bench_{i}", f"30A{i:05d}",
+                                               f"30A-{i:05d}", "edge-1", "ENTRY", "ENTRY",
+                                               "2024-01-01 08:00:00")
+        message.data["bench_sent_at"] = call_started = time.perf_counter()
+        await manager.broadcast(message)
+        broadcast_time = max(broadcast_time, time.perf_counter() - call_started)
+        if i % 500 == 0:
+            # Giu snapshot cuoi cung cua moi peer (outbox bi xoa khi peer bi ngat)
+            queue_metrics.update(manager.get_queue_metrics())
+        # Producer that (HTTP handler) luon nhuong event loop giua cac broadcast
+        await asyncio.sleep(max(0.0, started + (i + 1) * interval - time.perf_counter()))
+    queue_metrics.update(manager.get_queue_metrics())
+
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(None, results.get)
+    stalled_cut = "stalled" not in manager.websocket_connections
+    stop.set()
+    await manager.stop()
+    server.should_exit = True
+    await asyncio.wait([server_task], timeout=5)
+    process.join(timeout=10)
+    if process.is_alive():
+        process.kill()
+    return result, stalled_cut, broadcast_time, queue_metrics
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peers", type=int, default=4, help="tong so peer (1 peer treo)")
+    parser.add_argument("--messages", type=int, default=60000)
+    parser.add_argument("--rate", type=float, default=3000)
+    parser.add_argument("--queue-size", type=int, default=500)
+    parser.add_argument("--send-timeout", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=18421)
+    args = parser.parse_args()
+
+    print(f"{args.peers} peers (1 stalled), {args.messages} messages @ {args.rate:.0f}/s, "
+          f"queue={args.queue_size}, send_timeout={args.send_timeout}s")
+    print(f"{'mode':<7} {'delivered':>10} {'order err':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} "
+          f"{'max bcast ms':>12} {'stalled cut':>11}")
+
+    failures = []
+    for index, mode in enumerate(["legacy", "outbox"]):
+        port = args.port + index
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result, stalled_cut, broadcast_time, queue_metrics = asyncio.run(run(mode, args, port))
+
+        healthy = [lat for lat, _ in result.values()]
+        latencies = [x for lat in healthy for x in lat]
+        delivered = min((len(lat) for lat in healthy), default=0)
+        order_errors = sum(err for _, err in result.values())
+        print(f"{mode:<7} {delivered:>10} {order_errors:>9} {percentile(latencies, 0.5) * 1000:>9.1f} "
+              f"{percentile(latencies, 0.99) * 1000:>9.1f} {max(latencies, default=0) * 1000:>9.1f} "
+              f"{broadcast_time * 1000:>12.1f} {str(stalled_cut):>11}")
+
+        if mode == "outbox":
+            for peer_id, metrics in sorted(queue_metrics.items()):
+                print(f"  {peer_id:<14} depth={metrics['queue_depth']} max_depth={metrics['max_queue_depth']} "
+                      f"sent={metrics['sent']} avg={metrics['avg_send_latency_ms']}ms "
+                      f"max={metrics['max_send_latency_ms']}ms overflows={metrics['overflows']} "
+                      f"timeouts={metrics['timeouts']}")
+            if delivered != args.messages:
+                failures.append(f"healthy peers received {delivered}/{args.messages}")
+            if order_errors:
+                failures.append(f"{order_errors} out-of-order messages")
+            if not stalled_cut:
+                failures.append("stalled peer was not disconnected")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK: healthy peers unaffected by stalled peer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark: peak RSS của /api/parking/state với bãi rất lớn - dựng cả list vs stream theo chunk
+
+DB tạm có --rows xe đang IN (ghi bằng SQL trực tiếp). Mỗi mode chạy trong 1 process riêng
+và đo ru_maxrss (peak RSS) so với RSS ngay trước khi gọi endpoint:
+- legacy: fetchall → list dict → JSONResponse (như trước)
+- json  : endpoint hiện tại (StreamingResponse JSON), đọc hết body_iterator rồi bỏ
+- ndjson: endpoint hiện tại với format=ndjson
+
+Kiểm tra json / ndjson trả về đúng số xe và JSON parse được (json: parse lại toàn bộ body nếu
+--verify, nên chỉ bật với --rows nhỏ).
+
+Usage:
+    python benchmarks/bench_parking_state_memory.py [--rows 1000000] [--verify]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build(path, rows):
+    from database import CentralDatabase
+
+    db = CentralDatabase(path)
+    db.close()
+
+    start = datetime.now() - timedelta(days=30)
+
+    def generate():
+        for i in range(rows):
+            entry_time = (start + timedelta(seconds=i * 2)).strftime('%Y-%m-%d %H:%M:%S')
+            yield (
+                f"central-1_{i}", "central-1", "edge-1", f"30A{i:07d}", f"30A-{i:07d}", entry_time,
+                1, "Cổng vào A", 0.93, "auto", "IN", entry_time, entry_time,
+            )
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        """
+        INSERT INTO history (
+            event_id, source_central, edge_id, plate_id, plate_view, entry_time,
+            entry_camera_id, entry_camera_name, entry_confidence, entry_source,
+            status, created_at, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        generate(),
+    )
+    conn.commit()
+    conn.close()
+
+
+def rss_mb():
+    """RSS hien tai (MB) doc tu /proc"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def measure(mode, path, verify, results):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import app as central_app
+        from database import CentralDatabase
+        from fastapi.responses import JSONResponse
+        from parking_state import ParkingStateManager
+
+        db = CentralDatabase(path)
+        central_app.parking_state = ParkingStateManager(db)
+
+        async def call():
+            if mode == "legacy":
+                conn = sqlite3.connect(path)
+                conn.row_factory = sqlite3.Row
+                rows = conn.execute("""
+                    SELECT * FROM history WHERE status = 'IN' AND exit_time IS NULL
+                    ORDER BY entry_time DESC, created_at DESC
+                """).fetchall()
+                conn.close()
+                vehicles = [dict(row) for row in rows]
+                del rows
+                response = JSONResponse({"success": True, "vehicles_in_parking": vehicles, "stats": db.get_stats()})
+                return [response.body if verify else len(response.body)]
+
+            response = await central_app.get_parking_state(format=mode)
+            chunks = []
+            async for chunk in response.body_iterator:
+                chunks.append(chunk if verify else len(chunk))
+            return chunks
+
+        baseline = rss_mb()
+        started = time.perf_counter()
+        chunks = asyncio.run(call())
+        elapsed = time.perf_counter() - started
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        size = sum(c if isinstance(c, int) else len(c) for c in chunks)
+        count = None
+        if verify:
+            body = "".join(c.decode("utf-8") if isinstance(c, bytes) else c for c in chunks)
+            if mode == "ndjson":
+                count = sum(1 for line in body.splitlines() if json.loads(line))
+            else:
+                count = len(json.loads(body)["vehicles_in_parking"])
+        db.close()
+    results.put((mode, baseline, peak, elapsed, size, count))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--verify", action="store_true", help="parse lai body stream (ton RAM)")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_parking_state_"), "central.db")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        build(path, args.rows)
+
+    print(f"/api/parking/state with {args.rows} vehicles IN")
+    print(f"{'mode':<7} {'base MB':>8} {'peak MB':>8} {'delta MB':>9} {'seconds':>8} {'body MB':>8} {'rows':>9}")
+    failures = []
+    for mode in ("legacy", "json", "ndjson"):
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure, args=(mode, path, args.verify, results))
+        process.start()
+        mode, baseline, peak, elapsed, size, count = results.get()
+        process.join()
+        print(f"{mode:<7} {baseline:>8.0f} {peak:>8.0f} {peak - baseline:>9.0f} {elapsed:>8.1f} "
+              f"{size / 1024 / 1024:>8.0f} {count if count is not None else '-':>9}")
+        if count is not None and count != args.rows:
+            failures.append(f"{mode} returned {count}/{args.rows} vehicles")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
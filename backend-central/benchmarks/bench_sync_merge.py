@@ -0,0 +1,142 @@
+"""
+Benchmark: merge SYNC_RESPONSE - từng event (mỗi event 1 transaction) vs batch (1 transaction / trang)
+
+DB tạm có sẵn --existing event (một nửa còn IN). Peer gửi --events event:
+- event mới (70% đã OUT)
+- event đã có, mình còn IN nhưng peer đã OUT (phải áp dụng exit)
+- event đã có, trùng trạng thái (bỏ qua)
+
+Chạy P2PSyncManager.handle_sync_response với từng trang SYNC_RESPONSE_PAGE_SIZE event:
+- per-event: _merge_events_one_by_one (đường cũ)
+- batch    : merge_sync_events (existing_event_ids + executemany trong run_batch)
+
+In ra thời gian, events/s, số commit, và kiểm tra 2 cách cho cùng kết quả (digest history giống nhau).
+
+Usage:
+    python benchmarks/bench_sync_merge.py [--events 50000] [--existing 10000]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import CentralDatabase  # noqa: E402
+from p2p.database_extensions import patch_database_for_p2p  # noqa: E402
+from p2p.protocol import create_sync_response_message  # noqa: E402
+from p2p.sync_manager import P2PSyncManager, SYNC_RESPONSE_PAGE_SIZE  # noqa: E402
+
+
+class CountingDatabase(CentralDatabase):
+    """CentralDatabase + đếm số commit của writer thread"""
+
+    def __init__(self, *args, **kwargs):
+        self.commits = 0
+        super().__init__(*args, **kwargs)
+
+    def _commit_group(self, group):
+        self.commits += 1
+        super()._commit_group(group)
+
+
+class PerEventSyncManager(P2PSyncManager):
+    """Đường cũ: merge từng event"""
+
+    async def handle_sync_response(self, message, from_peer_id):
+        self._merge_events_one_by_one(message.data.get("events", []), from_peer_id)
+
+
+def make_row(i, start, out):
+    entry = start + timedelta(seconds=i * 37)
+    row = {
+        "event_id": f"central-2_{int(entry.timestamp() * 1000)}_{i}", "source_central": "central-2",
+        "edge_id": "edge-1", "plate_id": f"30A{i:06d}", "plate_view": f"30A-{i:06d}",
+        "entry_time": entry.strftime('%Y-%m-%d %H:%M:%S'), "entry_camera_id": 1,
+        "entry_camera_name": "Cổng vào A", "entry_confidence": 0.93, "entry_source": "auto",
+        "status": "IN", "fee": 0,
+    }
+    if out:
+        row.update({
+            "exit_time": (entry + timedelta(hours=2)).strftime('%Y-%m-%d %H:%M:%S'), "exit_camera_id": 2,
+            "exit_camera_name": "Cổng ra A", "exit_confidence": 0.91, "exit_source": "auto",
+            "duration": "2 giờ", "fee": 25000, "status": "OUT",
+        })
+    return row
+
+
+def build(path, existing, events):
+    """DB co san `existing` event; tra ve danh sach event peer gui"""
+    rng = random.Random(1)
+    start = datetime.now() - timedelta(days=30)
+    db = CentralDatabase(path)
+    patch_database_for_p2p(db)
+    local = [make_row(i, start, out=(i % 2 == 0)) for i in range(existing)]
+    db.merge_sync_events(local, "central-2")
+    db.close()
+
+    incoming = []
+    for i in range(existing):
+        # Event da co: dong IN (i le) → peer da OUT; dong OUT → trung
+        incoming.append(make_row(i, start, out=True))
+    for i in range(existing, existing + max(0, events - existing)):
+        incoming.append(make_row(i, start, out=rng.random() < 0.7))
+    rng.shuffle(incoming)
+    return incoming[:events]
+
+
+def run(mode, base_path, incoming):
+    path = base_path + f".{mode}"
+    shutil.copy(base_path, path)
+    db = CountingDatabase(path)
+    patch_database_for_p2p(db)
+    manager_cls = PerEventSyncManager if mode == "per-event" else P2PSyncManager
+    manager = manager_cls(db, None, "central-1")
+    manager.update_last_sync_timestamp = lambda peer_id, ts: None
+
+    async def merge():
+        for start in range(0, len(incoming), SYNC_RESPONSE_PAGE_SIZE):
+            message = create_sync_response_message("central-2", incoming[start:start + SYNC_RESPONSE_PAGE_SIZE])
+            await manager.handle_sync_response(message, "central-2")
+
+    commits_before = db.commits
+    started = time.perf_counter()
+    asyncio.run(merge())
+    elapsed = time.perf_counter() - started
+    digest = db.get_sync_digest("day", "")
+    db.close()
+    return elapsed, db.commits - commits_before, digest
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--existing", type=int, default=10000)
+    args = parser.parse_args()
+
+    base_path = os.path.join(tempfile.mkdtemp(prefix="bench_sync_merge_"), "central.db")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        incoming = build(base_path, args.existing, args.events)
+
+    print(f"merge {len(incoming)} events into DB with {args.existing} existing")
+    print(f"{'mode':<10} {'seconds':>9} {'events/s':>10} {'commits':>8}")
+    digests = {}
+    for mode in ("per-event", "batch"):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            elapsed, commits, digests[mode] = run(mode, base_path, incoming)
+        print(f"{mode:<10} {elapsed:>9.2f} {len(incoming) / elapsed:>10.0f} {commits:>8}")
+
+    same = digests["per-event"] == digests["batch"]
+    print(f"same result: {same}")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
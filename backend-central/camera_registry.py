@@ -1,82 +1,271 @@
 """
 Camera Registry - Theo dõi trạng thái của tất cả Edge cameras
+
+Trạng thái camera giữ trong RAM (nạp từ DB lúc khởi động), heartbeat cập nhật trực tiếp.
+Hết hạn heartbeat dùng timer wheel: mỗi tick chỉ xét 1 slot thay vì quét toàn bộ cameras,
+và chỉ khi trạng thái camera thật sự đổi (online ↔ offline, camera mới) mới báo listener.
+
+Heartbeat không ghi DB mỗi lần: camera thay đổi được đánh dấu dirty và ghi gộp 1 transaction
+mỗi flush_interval giây, ngay khi trạng thái đổi, và khi stop() (không mất events_sent / events_failed).
 """
-from datetime import datetime, timedelta
+from concurrent.futures import Future
+from datetime import datetime
+import math
 import threading
 import time
 
 
+class TimerWheel:
+    """
+    Hashed timer wheel - schedule / cancel O(1), advance chỉ xét các slot đã qua
+
+    Key nằm trong slot ứng với deadline; deadline xa hơn 1 vòng thì còn nằm lại slot
+    và được xét lại ở vòng sau.
+    """
+
+    def __init__(self, tick=1.0, slots=64, now=None):
+        self.tick = tick
+        self._slots = [dict() for _ in range(slots)]  # key -> deadline
+        self._slot_of = {}  # key -> slot index
+        self._origin = time.monotonic() if now is None else now
+        self._cursor = 0  # so tick da xu ly
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def schedule(self, key, deadline):
+        """Đặt (hoặc dời) hạn của key"""
+        self.cancel(key)
+        ticks = max(self._cursor + 1, math.ceil((deadline - self._origin) / self.tick))
+        index = ticks % len(self._slots)
+        self._slots[index][key] = deadline
+        self._slot_of[key] = index
+
+    def cancel(self, key):
+        index = self._slot_of.pop(key, None)
+        if index is not None:
+            del self._slots[index][key]
+
+    def advance(self, now):
+        """Xử lý các tick tới now, trả về list key đã hết hạn"""
+        target = int((now - self._origin) / self.tick)
+        expired = []
+        # Qua hon 1 vong thi moi slot chi can xet 1 lan
+        start = max(self._cursor + 1, target - len(self._slots) + 1)
+        for ticks in range(start, target + 1):
+            slot = self._slots[ticks % len(self._slots)]
+            for key, deadline in list(slot.items()):
+                if deadline <= now:
+                    del slot[key]
+                    del self._slot_of[key]
+                    expired.append(key)
+        self._cursor = max(self._cursor, target)
+        return expired
+
+
 class CameraRegistry:
     """Registry để track trạng thái của N cameras"""
 
-    def __init__(self, database, heartbeat_timeout=60):
+    def __init__(self, database, heartbeat_timeout=60, tick=None, flush_interval=None):
+        """
+        heartbeat_timeout: không nhận heartbeat sau N giây → offline
+        tick: độ phân giải timer wheel (giây) - camera bị đánh dấu offline trễ tối đa 1 tick
+        flush_interval: chu kỳ ghi gộp heartbeat xuống DB (giây)
+        """
+        import config
+
         self.db = database
         self.heartbeat_timeout = heartbeat_timeout
+        self.tick = tick if tick is not None else getattr(config, "CAMERA_STATUS_TICK", 1.0)
+        self.flush_interval = flush_interval if flush_interval is not None else \
+            getattr(config, "CAMERA_HEARTBEAT_FLUSH_INTERVAL", 30.0)
+
+        self.lock = threading.Lock()
+        self._cameras = {}  # camera_id -> row (cung cot voi bang cameras)
+        self._wheel = TimerWheel(self.tick, slots=int(math.ceil(heartbeat_timeout / self.tick)) + 1)
+        self._listeners = []
+        self._dirty = set()  # camera_id co thay doi chua ghi DB
+        self._next_flush = time.monotonic() + self.flush_interval
+
+        # Metrics
+        self.heartbeats = 0
+        self.flushes = 0
+        self.rows_flushed = 0
 
         # Thread check camera offline
         self.running = False
+        self._stop_event = threading.Event()
         self.check_thread = None
 
+        self._load_cameras()
+
+    def _load_cameras(self):
+        """Nạp trạng thái từ DB, camera online được giữ tới hết hạn tính từ last_heartbeat"""
+        now = time.monotonic()
+        utc_now = datetime.utcnow()
+        for camera in self.db.get_cameras():
+            self._cameras[camera["id"]] = camera
+            if camera["status"] == "online":
+                remaining = 0
+                if camera.get("last_heartbeat"):
+                    try:
+                        last_heartbeat = datetime.strptime(camera["last_heartbeat"], '%Y-%m-%d %H:%M:%S')
+                        remaining = self.heartbeat_timeout - (utc_now - last_heartbeat).total_seconds()
+                    except ValueError:
+                        pass
+                self._wheel.schedule(camera["id"], now + max(0, remaining))
+
+    def add_listener(self, callback):
+        """
+        callback(camera_ids) được gọi khi trạng thái camera đổi
+
+        Gọi từ thread của heartbeat hoặc thread timer wheel → callback không được block lâu
+        và phải tự chuyển về event loop nếu cần (call_soon_threadsafe).
+        """
+        self._listeners.append(callback)
+
     def start(self):
         """Start monitoring thread"""
         if self.running:
             return
 
         self.running = True
+        self._stop_event.clear()
         self.check_thread = threading.Thread(target=self._check_offline_loop, daemon=True)
         self.check_thread.start()
 
-
     def stop(self):
-        """Stop monitoring"""
+        """Stop monitoring, ghi nốt heartbeat chưa flush (gọi trước database.close())"""
         self.running = False
+        self._stop_event.set()
         if self.check_thread:
             self.check_thread.join(timeout=2)
+        try:
+            self.flush().result()
+        except Exception as e:
+            print(f"Camera registry flush error: {e}")
 
     def update_heartbeat(self, camera_id, name, camera_type, events_sent, events_failed):
-        """Update camera heartbeat"""
-        self.db.upsert_camera(
-            camera_id=camera_id,
-            name=name,
-            camera_type=camera_type,
-            status="online",
-            events_sent=events_sent,
-            events_failed=events_failed
-        )
+        """
+        Update camera heartbeat
+
+        Chỉ cập nhật RAM; ghi DB gộp ở lần flush tiếp theo (ngay lập tức nếu trạng thái đổi)
+        Return: True nếu trạng thái camera đổi (camera mới, offline → online, đổi tên / loại)
+        """
+        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        with self.lock:
+            self.heartbeats += 1
+            camera = self._cameras.get(camera_id)
+            changed = (
+                camera is None or camera["status"] != "online"
+                or camera["name"] != name or camera["type"] != camera_type
+            )
+            if camera is None:
+                camera = self._cameras[camera_id] = {"id": camera_id, "created_at": now}
+            camera.update({
+                "name": name,
+                "type": camera_type,
+                "status": "online",
+                "last_heartbeat": now,
+                "events_sent": events_sent,
+                "events_failed": events_failed,
+                "updated_at": now,
+            })
+            self._wheel.schedule(camera_id, time.monotonic() + self.heartbeat_timeout)
+            self._dirty.add(camera_id)
+
+        if changed:
+            self.flush()
+            self._notify([camera_id])
+        return changed
+
+    def register_camera(self, camera_id, name, camera_type):
+        """
+        Thêm / cập nhật camera từ config (chưa có heartbeat)
+
+        Camera mới → offline; camera đã có giữ nguyên trạng thái + counters, chỉ đổi tên / loại.
+        """
+        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        with self.lock:
+            camera = self._cameras.get(camera_id)
+            if camera is None:
+                camera = self._cameras[camera_id] = {
+                    "id": camera_id, "status": "offline", "last_heartbeat": None,
+                    "events_sent": 0, "events_failed": 0, "created_at": now,
+                }
+            changed = camera.get("name") != name or camera.get("type") != camera_type
+            camera.update({"name": name, "type": camera_type, "updated_at": now})
+            self._dirty.add(camera_id)
+
+        self.flush()
+        if changed:
+            self._notify([camera_id])
 
     def _check_offline_loop(self):
-        """Loop kiểm tra cameras offline"""
-        while self.running:
+        """Loop tick timer wheel + flush heartbeat định kỳ"""
+        while not self._stop_event.wait(self.tick):
             try:
                 self._check_offline_cameras()
-                time.sleep(10)  # Check moi 10 giay
+                if time.monotonic() >= self._next_flush:
+                    self.flush()
             except Exception as e:
                 print(f"Camera registry error: {e}")
 
-    def _check_offline_cameras(self):
-        """Mark cameras as offline if no heartbeat"""
-        cameras = self.db.get_cameras()
-        # Database luu UTC, nen dung utcnow()
-        timeout_threshold = datetime.utcnow() - timedelta(seconds=self.heartbeat_timeout)
-
-        for camera in cameras:
-            if camera['last_heartbeat']:
-                last_heartbeat = datetime.strptime(camera['last_heartbeat'], '%Y-%m-%d %H:%M:%S')
-
-                if last_heartbeat < timeout_threshold and camera['status'] == 'online':
-                    # Mark offline
-                    self.db.upsert_camera(
-                        camera_id=camera['id'],
-                        name=camera['name'],
-                        camera_type=camera['type'],
-                        status='offline',
-                        events_sent=camera['events_sent'],
-                        events_failed=camera['events_failed']
-                    )
+    def _check_offline_cameras(self, now=None):
+        """Mark cameras as offline if no heartbeat (chỉ các camera hết hạn trong các tick vừa qua)"""
+        with self.lock:
+            expired = []
+            for camera_id in self._wheel.advance(time.monotonic() if now is None else now):
+                camera = self._cameras.get(camera_id)
+                if camera and camera["status"] == "online":
+                    camera["status"] = "offline"
+                    self._dirty.add(camera_id)
+                    expired.append(camera_id)
+
+        if expired:
+            self.flush()
+            self._notify(expired)
+        return expired
+
+    def flush(self):
+        """
+        Ghi các camera dirty xuống DB trong 1 transaction (không chờ commit)
+
+        Return: Future của writer thread. Ghi lỗi → camera được đánh dấu dirty lại (lần flush sau ghi tiếp)
+        """
+        with self.lock:
+            self._next_flush = time.monotonic() + self.flush_interval
+            rows = [dict(self._cameras[camera_id]) for camera_id in self._dirty]
+            self._dirty.clear()
+            if not rows:
+                future = Future()
+                future.set_result(None)
+                return future
+            self.flushes += 1
+            self.rows_flushed += len(rows)
+
+        future = self.db.submit_camera_states(rows)
+
+        def on_done(f):
+            if f.exception() is not None:
+                print(f"Camera registry flush error: {f.exception()}")
+                with self.lock:
+                    self._dirty.update(row["id"] for row in rows)
+
+        future.add_done_callback(on_done)
+        return future
+
+    def _notify(self, camera_ids):
+        for callback in list(self._listeners):
+            try:
+                callback(camera_ids)
+            except Exception as e:
+                print(f"Camera registry listener error: {e}")
 
     def get_camera_status(self):
-        """Get status of all cameras"""
-        cameras = self.db.get_cameras()
+        """Get status of all cameras (từ RAM, không đọc DB)"""
+        with self.lock:
+            cameras = [dict(self._cameras[camera_id]) for camera_id in sorted(self._cameras)]
 
         return {
             "total": len(cameras),
@@ -10,10 +10,38 @@ SERVER_PORT = 8000
 # DATABASE
 # SQLite database (tong hop tu tat ca cameras)
 DB_FILE = "data/central.db"
+# Group commit: writer thread commit 1 lan cho tat ca thao tac ghi dang doi trong queue
+# 0 = chi gom cac op don vao trong luc commit truoc dang chay (khong them latency)
+# > 0 = cho them toi da N ms sau op dau tien de gom nhom lon hon (disk fsync cham)
+DB_GROUP_COMMIT_WINDOW_MS = 0
+DB_GROUP_COMMIT_MAX_OPS = 256
+
+# P2P SEND QUEUE
+# Moi peer 1 hang doi gui rieng; day (sau khi gop HEARTBEAT/LOCATION_UPDATE) hoac 1 lan gui qua
+# P2P_SEND_TIMEOUT giay → ngat ket noi peer, peer reconnect se SYNC_REQUEST bu phan thieu
+P2P_SEND_QUEUE_SIZE = 1000
+P2P_SEND_TIMEOUT = 10.0
+
+# P2P DIGEST SYNC
+# Khi reconnect so hash history theo ngay / gio (entry_time trong N ngay gan nhat), chi truyen phan lech
+P2P_SYNC_DIGEST_DAYS = 30
+# Peer khong tra SYNC_DIGEST sau N giay (ban cu) → sync theo timestamp nhu truoc
+P2P_SYNC_DIGEST_TIMEOUT = 10.0
+
+# METRICS
+# Ty le event tu Edge duoc trace (ingest → ghi DB → broadcast frontend), xem o GET /metrics/traces
+# 0 = tat, 0.01 = 1% event
+METRICS_TRACE_SAMPLE_RATE = float(os.getenv("METRICS_TRACE_SAMPLE_RATE", "0"))
 
 # CAMERA REGISTRY
 # Timeout de danh dau camera offline (giay)
 CAMERA_HEARTBEAT_TIMEOUT = 60  # 60s khong nhan heartbeat → offline
+# Do phan giai timer wheel het han heartbeat (giay) - camera bi danh dau offline tre toi da 1 tick
+CAMERA_STATUS_TICK = 1.0
+# Heartbeat chi cap nhat RAM, ghi gop xuong DB moi N giay (va ngay khi trang thai camera doi)
+CAMERA_HEARTBEAT_FLUSH_INTERVAL = 30.0
+# Gom cac thay doi trang thai camera trong N giay thanh 1 lan broadcast cameras_update
+CAMERA_BROADCAST_DEBOUNCE = 0.2
 
 # PARKING
 # Fee calculation - Neu co PARKING_API_URL thi goi API, neu khong thi dung file JSON
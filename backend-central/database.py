@@ -3,22 +3,139 @@ Central Database - Tổng hợp data từ tất cả cameras
 """
 import sqlite3
 import os
+import base64
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import wraps
 from threading import Lock
 from datetime import datetime
 
+from metrics import get_metrics
+
+_metrics = get_metrics()
+DB_CALL_SECONDS = _metrics.histogram("central_db_call_seconds",
+                                     "CentralDatabase call latency incl. lock wait / write queue", ["operation"])
+DB_ERRORS = _metrics.counter("central_db_errors_total", "CentralDatabase calls that raised", ["operation"])
+DB_LOCK_WAIT_SECONDS = _metrics.histogram("central_db_lock_wait_seconds", "Time waiting for the database lock",
+                                          ["operation"])
+DB_EXECUTION_SECONDS = _metrics.histogram("central_db_execution_seconds",
+                                          "Time holding the database lock (query / group commit)", ["operation"])
+DB_WRITE_QUEUE_SECONDS = _metrics.histogram("central_db_write_queue_seconds",
+                                            "Time a write waits for the group-commit writer", ["operation"])
+DB_WRITE_GROUP_SIZE = _metrics.histogram("central_db_write_group_size", "Write ops committed per transaction",
+                                         buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+# Ten operation dang chay tren thread hien tai (label cho lock wait / write queue)
+_operation = threading.local()
+
+
+def _current_operation(default="other"):
+    return getattr(_operation, "name", None) or default
+
+
+def instrumented(method):
+    """
+    Đo 1 method của CentralDatabase: latency tổng + lỗi, label = tên method
+
+    Lock wait / execution / write queue bên trong được gắn cùng label (gọi lồng nhau giữ label ngoài cùng)
+    """
+    name = method.__name__
+    latency = DB_CALL_SECONDS.labels(name)
+    errors = DB_ERRORS.labels(name)
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_operation, "name", None)
+        if outer is None:
+            _operation.name = name
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+            _operation.name = outer
+
+    return wrapper
+
+
+class _TimedLock:
+    """Lock đo thời gian chờ và thời gian giữ (chạy query / commit) theo operation hiện tại"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._acquired_at = 0.0
+        self._operation = None
+
+    def __enter__(self):
+        operation = _current_operation()
+        started = time.perf_counter()
+        self._lock.acquire()
+        # Chi thread dang giu lock ghi 2 field nay
+        self._acquired_at = time.perf_counter()
+        self._operation = operation
+        DB_LOCK_WAIT_SECONDS.labels(operation).observe(self._acquired_at - started)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        held = time.perf_counter() - self._acquired_at
+        operation = self._operation
+        self._lock.release()
+        DB_EXECUTION_SECONDS.labels(operation).observe(held)
+
+
+def encode_history_cursor(row):
+    """
+    Tạo cursor (keyset) từ record cuối của 1 trang history
+    Cursor = base64("created_at|id") - client chỉ cần gửi lại nguyên chuỗi
+    """
+    raw = f"{row['created_at']}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_history_cursor(cursor):
+    """
+    Parse cursor → (created_at, id)
+    Raise ValueError nếu cursor không hợp lệ
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, history_id = raw.rsplit("|", 1)
+        return created_at, int(history_id)
+    except Exception:
+        raise ValueError(f"Invalid history cursor: {cursor}")
+
 
 class CentralDatabase:
     """Central database để tổng hợp data từ Edge servers"""
 
-    def __init__(self, db_file="data/central.db"):
+    def __init__(self, db_file="data/central.db", group_commit_window=0, group_commit_max_ops=256):
+        """
+        group_commit_window: thời gian (giây) writer chờ gom thêm thao tác ghi sau thao tác đầu tiên
+            (0 = chỉ gom các thao tác đã nằm sẵn trong queue, không thêm latency)
+        group_commit_max_ops: số thao tác tối đa trong 1 lần commit
+        """
         self.db_file = db_file
-        self.lock = Lock()
+        self.lock = _TimedLock()
+        self.group_commit_window = group_commit_window
+        self.group_commit_max_ops = group_commit_max_ops
 
         # Create directory if not exists
         os.makedirs(os.path.dirname(db_file), exist_ok=True)
 
         self._init_db()
 
+        # Writer thread duy nhat: moi thao tac ghi di qua queue nay
+        self._write_queue = queue.Queue()
+        self._writer_closed = False
+        self._writer_thread = threading.Thread(target=self._writer_loop, name="central-db-writer", daemon=True)
+        self._writer_thread.start()
+
     def _init_db(self):
         """Initialize database tables"""
         with self.lock:
@@ -74,6 +191,24 @@ class CentralDatabase:
                 ON history(created_at)
             """)
 
+            # Index cho phan trang keyset (created_at, id)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_history_created_at_id
+                ON history(created_at, id)
+            """)
+
+            # Filter status + keyset: SQLite di thang theo index, khong can sort tam
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_history_status_created_at_id
+                ON history(status, created_at, id)
+            """)
+
+            # Xe dang trong bai: keyset (entry_time, created_at, id) cho iter_vehicles_in_parking
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_history_in_parking
+                ON history(status, exit_time, entry_time, created_at, id)
+            """)
+
             # Ensure backward-compatible columns for existing DBs
             self._ensure_history_columns(conn, cursor)
 
@@ -178,6 +313,133 @@ class CentralDatabase:
         add_col("last_location_time", "TEXT")
         add_col("is_anomaly", "INTEGER DEFAULT 0")
 
+    # ===== Group commit writer =====
+
+    def submit_write(self, op, operation="submit_write"):
+        """
+        Đưa 1 thao tác ghi vào queue của writer thread
+
+        op(cursor) chạy trên writer thread, trong transaction chung của cả nhóm
+        (mỗi op có SAVEPOINT riêng: op lỗi chỉ rollback phần của nó).
+        op KHÔNG được gọi lại method ghi của CentralDatabase (sẽ deadlock).
+
+        Return: concurrent.futures.Future - chỉ resolve SAU KHI nhóm đã COMMIT,
+        nên caller nhận kết quả thì dữ liệu đã bền vững như commit từng lệnh trước đây.
+        operation: label metrics khi không gọi từ method đã @instrumented
+        """
+        if self._writer_closed:
+            raise RuntimeError("CentralDatabase writer is closed")
+        if threading.get_ident() == self._writer_thread.ident:
+            raise RuntimeError("submit_write called from writer thread (nested write)")
+
+        future = Future()
+        self._write_queue.put((op, future, time.perf_counter(), _current_operation(operation)))
+        return future
+
+    def run_write(self, op):
+        """Như submit_write nhưng chờ commit xong rồi trả về kết quả của op (raise lỗi của op)"""
+        return self.submit_write(op, "run_write").result()
+
+    def submit_batch(self, fn):
+        """
+        Chạy fn(batch) trên writer thread, batch = CentralWriteBatch (cùng API ghi/đọc với CentralDatabase)
+
+        Toàn bộ fn nằm trong 1 SAVEPOINT → đọc-rồi-ghi trong fn là atomic với các thao tác ghi khác.
+        """
+        return self.submit_write(lambda cursor: fn(CentralWriteBatch(self, cursor)), "submit_batch")
+
+    @instrumented
+    def run_batch(self, fn):
+        """Như submit_batch nhưng chờ commit xong rồi trả về kết quả của fn"""
+        return self.submit_batch(fn).result()
+
+    def close(self):
+        """Dừng writer thread sau khi đã commit hết các thao tác đang chờ"""
+        if self._writer_closed:
+            return
+        self._writer_closed = True
+        self._write_queue.put(None)
+        self._writer_thread.join(timeout=10)
+
+    def _writer_loop(self):
+        """
+        Writer thread: lấy thao tác đầu tiên, gom thêm các thao tác đang chờ / đến trong
+        group_commit_window (tối đa group_commit_max_ops) rồi commit cả nhóm 1 lần.
+        Trong lúc 1 nhóm đang commit, caller khác tiếp tục xếp hàng → nhóm sau tự lớn lên theo tải.
+        """
+        _operation.name = "commit_group"
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                break
+
+            group = [item]
+            stop = False
+            deadline = time.monotonic() + self.group_commit_window
+            while len(group) < self.group_commit_max_ops:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = self._write_queue.get(timeout=remaining)
+                    else:
+                        # Het cua so: van lay not cac op da nam san trong queue
+                        item = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                group.append(item)
+
+            self._commit_group(group)
+            if stop:
+                break
+
+    def _commit_group(self, group):
+        """Chạy 1 nhóm op trong 1 transaction, COMMIT rồi mới resolve future của từng caller"""
+        outcomes = []
+        started = time.perf_counter()
+        for _, _, enqueued_at, operation in group:
+            DB_WRITE_QUEUE_SECONDS.labels(operation).observe(started - enqueued_at)
+        DB_WRITE_GROUP_SIZE.observe(len(group))
+
+        with self.lock:
+            # isolation_level=None: tu quan ly BEGIN/SAVEPOINT/COMMIT
+            conn = sqlite3.connect(self.db_file, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                for op, future, _, _ in group:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    cursor.execute("SAVEPOINT group_op")
+                    try:
+                        result = op(cursor)
+                        cursor.execute("RELEASE group_op")
+                        outcomes.append((future, result, None))
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO group_op")
+                        cursor.execute("RELEASE group_op")
+                        outcomes.append((future, None, e))
+                cursor.execute("COMMIT")
+            except Exception as e:
+                # Commit that bai → khong op nao trong nhom duoc ghi
+                print(f"Error committing write group ({len(group)} ops): {e}")
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                outcomes = [(future, None, e) for _, future, _, _ in group if future.running()]
+            finally:
+                conn.close()
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    @instrumented
     def add_vehicle_entry(
         self,
         plate_id,
@@ -197,77 +459,27 @@ class CentralDatabase:
 
         Trả về history_id của bản ghi vừa tạo.
         """
-        with self.lock:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-
-            try:
-                cursor.execute(
-                    """
-                    INSERT INTO history (
-                        event_id, source_central, edge_id,
-                        plate_id, plate_view, entry_time, entry_camera_id, entry_camera_name,
-                        entry_confidence, entry_source, status, sync_status
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'IN', ?)
-                    """,
-                    (
-                        event_id,
-                        source_central,
-                        edge_id,
-                        plate_id,
-                        plate_view,
-                        entry_time,
-                        camera_id,
-                        camera_name,
-                        confidence,
-                        source,
-                        sync_status,
-                    ),
-                )
-
-                history_id = cursor.lastrowid
-                conn.commit()
-                return history_id
-            except Exception as e:
-                conn.rollback()
-                print(f"Error adding vehicle entry: {e}")
-                raise
-            finally:
-                conn.close()
+        try:
+            return self.run_write(lambda cursor: self._insert_vehicle_entry(
+                cursor, plate_id, plate_view, entry_time, camera_id, camera_name,
+                confidence, source, event_id, source_central, edge_id, sync_status,
+            ))
+        except Exception as e:
+            print(f"Error adding vehicle entry: {e}")
+            raise
 
+    @instrumented
     def update_vehicle_exit(self, plate_id, exit_time, camera_id, camera_name, confidence, source, duration, fee):
         """
         Update vehicle exit - Giờ CHỈ cập nhật bản ghi tương ứng trong history.
 
         Trả về True nếu có bản ghi được cập nhật, ngược lại False.
         """
-        with self.lock:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-
-            cursor.execute(
-                """
-                UPDATE history
-                SET exit_time = ?, exit_camera_id = ?, exit_camera_name = ?,
-                    exit_confidence = ?, exit_source = ?, duration = ?, fee = ?,
-                    status = 'OUT', updated_at = CURRENT_TIMESTAMP
-                WHERE id = (
-                    SELECT id FROM history
-                    WHERE plate_id = ? AND status = 'IN' AND exit_time IS NULL
-                    ORDER BY entry_time DESC, created_at DESC
-                    LIMIT 1
-                )
-                """,
-                (exit_time, camera_id, camera_name, confidence, source, duration, fee, plate_id),
-            )
-
-            rows_updated = cursor.rowcount
-
-            conn.commit()
-            conn.close()
-
-            return rows_updated > 0
+        return self.run_write(lambda cursor: self._update_vehicle_exit(
+            cursor, plate_id, exit_time, camera_id, camera_name, confidence, source, duration, fee
+        ))
 
+    @instrumented
     def find_vehicle_in_parking(self, plate_id):
         """
         Find vehicle currently IN parking, dựa hoàn toàn trên bảng history.
@@ -302,45 +514,156 @@ class CentralDatabase:
                 return dict(result)
             return None
 
+    @instrumented
     def add_event(self, event_type, camera_id, camera_name, camera_type, plate_text, confidence, source, data):
         """Log event from Edge"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
+        self.run_write(lambda cursor: self._insert_event(
+            cursor, event_type, camera_id, camera_name, camera_type, plate_text, confidence, source, data
+        ))
 
-            import json
-            cursor.execute("""
-                INSERT INTO events (
-                    event_type, camera_id, camera_name, camera_type,
-                    plate_text, confidence, source, data
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (event_type, camera_id, camera_name, camera_type, plate_text, confidence, source, json.dumps(data)))
-
-            conn.commit()
-            conn.close()
+    @instrumented
+    def existing_event_ids(self, event_ids):
+        """
+        Dedupe nhiều event_id trong 1 query (batch ingest)
 
-    def upsert_camera(self, camera_id, name, camera_type, status, events_sent, events_failed):
-        """Update or insert camera info"""
+        Return: set các event_id đã có trong history
+        """
         with self.lock:
             conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
+            try:
+                return self._select_existing_event_ids(conn.cursor(), event_ids)
+            finally:
+                conn.close()
 
-            cursor.execute("""
-                INSERT INTO cameras (id, name, type, status, last_heartbeat, events_sent, events_failed, updated_at)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?, CURRENT_TIMESTAMP)
-                ON CONFLICT(id) DO UPDATE SET
-                    name = excluded.name,
-                    type = excluded.type,
-                    status = excluded.status,
-                    last_heartbeat = CURRENT_TIMESTAMP,
-                    events_sent = excluded.events_sent,
-                    events_failed = excluded.events_failed,
-                    updated_at = CURRENT_TIMESTAMP
-            """, (camera_id, name, camera_type, status, events_sent, events_failed))
+    # ===== SQL helpers (dung chung cho method don le va CentralWriteBatch) =====
 
-            conn.commit()
-            conn.close()
+    @staticmethod
+    def _select_existing_event_ids(cursor, event_ids):
+        event_ids = [event_id for event_id in set(event_ids) if event_id]
+        existing = set()
+        # SQLite gioi han so bien trong 1 query → chia chunk
+        for i in range(0, len(event_ids), 500):
+            chunk = event_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT DISTINCT event_id FROM history WHERE event_id IN ({placeholders})",
+                chunk,
+            )
+            existing.update(row[0] for row in cursor.fetchall())
+        return existing
+
+    @staticmethod
+    def _select_event_exists(cursor, event_id):
+        cursor.execute("SELECT 1 FROM history WHERE event_id = ? LIMIT 1", (event_id,))
+        return cursor.fetchone() is not None
+
+    @staticmethod
+    def _insert_event(cursor, event_type, camera_id, camera_name, camera_type, plate_text, confidence, source, data):
+        cursor.execute("""
+            INSERT INTO events (
+                event_type, camera_id, camera_name, camera_type,
+                plate_text, confidence, source, data
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (event_type, camera_id, camera_name, camera_type, plate_text, confidence, source, json.dumps(data)))
+
+    @staticmethod
+    def _insert_vehicle_entry(cursor, plate_id, plate_view, entry_time, camera_id, camera_name,
+                              confidence, source, event_id, source_central, edge_id, sync_status):
+        cursor.execute(
+            """
+            INSERT INTO history (
+                event_id, source_central, edge_id,
+                plate_id, plate_view, entry_time, entry_camera_id, entry_camera_name,
+                entry_confidence, entry_source, status, sync_status
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'IN', ?)
+            """,
+            (
+                event_id,
+                source_central,
+                edge_id,
+                plate_id,
+                plate_view,
+                entry_time,
+                camera_id,
+                camera_name,
+                confidence,
+                source,
+                sync_status,
+            ),
+        )
+        return cursor.lastrowid
+
+    @staticmethod
+    def _update_vehicle_exit(cursor, plate_id, exit_time, camera_id, camera_name, confidence, source, duration, fee):
+        cursor.execute(
+            """
+            UPDATE history
+            SET exit_time = ?, exit_camera_id = ?, exit_camera_name = ?,
+                exit_confidence = ?, exit_source = ?, duration = ?, fee = ?,
+                status = 'OUT', updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM history
+                WHERE plate_id = ? AND status = 'IN' AND exit_time IS NULL
+                ORDER BY entry_time DESC, created_at DESC
+                LIMIT 1
+            )
+            """,
+            (exit_time, camera_id, camera_name, confidence, source, duration, fee, plate_id),
+        )
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _select_vehicle_in_parking(cursor, plate_id):
+        cursor.execute("""
+            SELECT id, plate_id, plate_view, entry_time, status,
+                   last_location, last_location_time, is_anomaly
+            FROM history
+            WHERE plate_id = ? AND status = 'IN'
+            ORDER BY entry_time DESC
+            LIMIT 1
+        """, (plate_id,))
+
+        row = cursor.fetchone()
+        if row:
+            return {
+                "id": row[0],
+                "plate_id": row[1],
+                "plate_view": row[2],
+                "entry_time": row[3],
+                "status": row[4],
+                "last_location": row[5],
+                "last_location_time": row[6],
+                "is_anomaly": row[7]
+            }
+        return None
 
+    def submit_camera_states(self, cameras):
+        """
+        Ghi trạng thái nhiều camera trong 1 transaction (flush từ CameraRegistry), không chờ commit
+
+        cameras: list dict (id, name, type, status, last_heartbeat, events_sent, events_failed)
+        last_heartbeat lấy từ RAM (thời điểm heartbeat thật), không phải lúc flush
+        Return: Future
+        """
+        rows = [
+            (c["id"], c["name"], c["type"], c["status"], c.get("last_heartbeat"),
+             c.get("events_sent", 0), c.get("events_failed", 0))
+            for c in cameras
+        ]
+        return self.submit_write(lambda cursor: cursor.executemany("""
+            INSERT INTO cameras (id, name, type, status, last_heartbeat, events_sent, events_failed, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(id) DO UPDATE SET
+                name = excluded.name,
+                type = excluded.type,
+                status = excluded.status,
+                last_heartbeat = excluded.last_heartbeat,
+                events_sent = excluded.events_sent,
+                events_failed = excluded.events_failed,
+                updated_at = CURRENT_TIMESTAMP
+        """, rows), "submit_camera_states")
+
+    @instrumented
     def get_cameras(self):
         """Get all cameras"""
         with self.lock:
@@ -354,6 +677,7 @@ class CentralDatabase:
 
             return [dict(row) for row in results]
 
+    @instrumented
     def get_vehicles_in_parking(self):
         """
         Get vehicles currently IN parking, dựa trên bảng history.
@@ -361,29 +685,64 @@ class CentralDatabase:
         Điều kiện:
         - status = 'IN'
         - exit_time IS NULL
+
+        Trả về list - với bãi lớn nên dùng iter_vehicles_in_parking() để không giữ hết trong RAM.
         """
-        with self.lock:
-            conn = sqlite3.connect(self.db_file)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+        return list(self.iter_vehicles_in_parking())
 
-            cursor.execute(
-                """
-                SELECT *
-                FROM history
-                WHERE status = 'IN'
-                  AND exit_time IS NULL
-                ORDER BY entry_time DESC, created_at DESC
+    def iter_vehicles_in_parking(self, chunk_size=500):
+        """
+        Generator các xe đang trong bãi (cùng điều kiện / thứ tự với get_vehicles_in_parking)
+
+        Đọc từng chunk chunk_size dòng theo keyset (entry_time, created_at, id) qua index
+        idx_history_in_parking. Mỗi chunk là 1 query ngắn, chỉ giữ lock trong lúc query,
+        nên bộ nhớ không phụ thuộc số xe trong bãi và writer không bị chặn suốt lúc stream.
+        """
+        keyset = None
+        while True:
+            with self.lock:
+                conn = sqlite3.connect(self.db_file)
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+
+                query = """
+                    SELECT *
+                    FROM history
+                    WHERE status = 'IN'
+                      AND exit_time IS NULL
                 """
-            )
+                params = []
+                if keyset:
+                    query += " AND (entry_time, created_at, id) < (?, ?, ?)"
+                    params.extend(keyset)
+                query += " ORDER BY entry_time DESC, created_at DESC, id DESC LIMIT ?"
+                params.append(chunk_size)
+
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                conn.close()
 
-            results = cursor.fetchall()
-            conn.close()
+            for row in rows:
+                yield dict(row)
 
-            return [dict(row) for row in results]
+            if len(rows) < chunk_size:
+                return
+            last = rows[-1]
+            keyset = (last["entry_time"], last["created_at"], last["id"])
+
+    @instrumented
+    def get_history(self, limit=100, offset=0, today_only=False, status=None, search=None, in_parking_only=False, entries_only=False,
+                    page_cursor=None):
+        """
+        Get vehicle history with optional search - Query từ HISTORY table
+
+        page_cursor: keyset cursor (encode_history_cursor của record cuối trang trước).
+        Nếu có thì bỏ qua offset, SQLite đi thẳng tới vị trí cursor qua index (created_at, id)
+        thay vì quét rồi bỏ N record đầu.
+        """
+        # Parse cursor truoc khi lay lock (raise ValueError neu sai)
+        keyset = decode_history_cursor(page_cursor) if page_cursor else None
 
-    def get_history(self, limit=100, offset=0, today_only=False, status=None, search=None, in_parking_only=False, entries_only=False):
-        """Get vehicle history with optional search - Query từ HISTORY table"""
         with self.lock:
             conn = sqlite3.connect(self.db_file)
             conn.row_factory = sqlite3.Row
@@ -420,9 +779,16 @@ class CentralDatabase:
                 params.append(search_pattern)
                 params.append(search_pattern)
 
-            query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-            params.append(limit)
-            params.append(offset)
+            if keyset:
+                # Keyset pagination: record nam sau cursor theo thu tu (created_at DESC, id DESC)
+                query += " AND (created_at, id) < (?, ?)"
+                params.extend(keyset)
+                query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+                params.append(limit)
+            else:
+                query += " ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+                params.append(limit)
+                params.append(offset)
 
             cursor.execute(query, params)
             results = cursor.fetchall()
@@ -430,6 +796,7 @@ class CentralDatabase:
 
             return [dict(row) for row in results]
 
+    @instrumented
     def get_stats(self):
         """
         Get parking statistics.
@@ -485,103 +852,89 @@ class CentralDatabase:
                 "revenue_today": revenue,
             }
 
+    @instrumented
     def update_history_entry(self, history_id, new_plate_id, new_plate_view):
         """Update biển số trong history entry và lưu lịch sử thay đổi"""
-        import json
-        with self.lock:
-            conn = sqlite3.connect(self.db_file)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
-            try:
-                # Lay record cu
-                cursor.execute("SELECT * FROM history WHERE id = ?", (history_id,))
-                old_record = cursor.fetchone()
-                if not old_record:
-                    return False
-
-                old_data = dict(old_record)
-
-                # Update record
-                cursor.execute("""
-                    UPDATE history
-                    SET plate_id = ?, plate_view = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                """, (new_plate_id, new_plate_view, history_id))
-
-                # Lay record moi
-                cursor.execute("SELECT * FROM history WHERE id = ?", (history_id,))
-                new_record = cursor.fetchone()
-                new_data = dict(new_record)
-
-                # Luu lich su thay doi
-                cursor.execute("""
-                    INSERT INTO history_changes (
-                        history_id, change_type, old_plate_id, old_plate_view,
-                        new_plate_id, new_plate_view, old_data, new_data
-                    ) VALUES (?, 'UPDATE', ?, ?, ?, ?, ?, ?)
-                """, (
-                    history_id,
-                    old_data.get('plate_id'),
-                    old_data.get('plate_view'),
-                    new_plate_id,
-                    new_plate_view,
-                    json.dumps(old_data),
-                    json.dumps(new_data)
-                ))
-
-                conn.commit()
-                return True
-            except Exception as e:
-                conn.rollback()
-                print(f"Error updating history entry: {e}")
+        def op(cursor):
+            # Lay record cu
+            cursor.execute("SELECT * FROM history WHERE id = ?", (history_id,))
+            old_record = cursor.fetchone()
+            if not old_record:
                 return False
-            finally:
-                conn.close()
 
+            old_data = dict(old_record)
+
+            # Update record
+            cursor.execute("""
+                UPDATE history
+                SET plate_id = ?, plate_view = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (new_plate_id, new_plate_view, history_id))
+
+            # Lay record moi
+            cursor.execute("SELECT * FROM history WHERE id = ?", (history_id,))
+            new_record = cursor.fetchone()
+            new_data = dict(new_record)
+
+            # Luu lich su thay doi
+            cursor.execute("""
+                INSERT INTO history_changes (
+                    history_id, change_type, old_plate_id, old_plate_view,
+                    new_plate_id, new_plate_view, old_data, new_data
+                ) VALUES (?, 'UPDATE', ?, ?, ?, ?, ?, ?)
+            """, (
+                history_id,
+                old_data.get('plate_id'),
+                old_data.get('plate_view'),
+                new_plate_id,
+                new_plate_view,
+                json.dumps(old_data),
+                json.dumps(new_data)
+            ))
+            return True
+
+        try:
+            return self.run_write(op)
+        except Exception as e:
+            print(f"Error updating history entry: {e}")
+            return False
+
+    @instrumented
     def delete_history_entry(self, history_id):
         """Delete history entry và lưu lịch sử thay đổi"""
-        import json
-        with self.lock:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-
-            try:
-                # Lay record cu
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM history WHERE id = ?", (history_id,))
-                old_record = cursor.fetchone()
-                if not old_record:
-                    return False
-
-                old_data = dict(old_record)
-
-                # Luu lich su thay doi truoc khi xoa
-                cursor.execute("""
-                    INSERT INTO history_changes (
-                        history_id, change_type, old_plate_id, old_plate_view,
-                        old_data
-                    ) VALUES (?, 'DELETE', ?, ?, ?)
-                """, (
-                    history_id,
-                    old_data.get('plate_id'),
-                    old_data.get('plate_view'),
-                    json.dumps(old_data)
-                ))
-
-                # Xoa record trong history
-                cursor.execute("DELETE FROM history WHERE id = ?", (history_id,))
-
-                conn.commit()
-                return True
-            except Exception as e:
-                conn.rollback()
-                print(f"Error deleting history entry: {e}")
+        def op(cursor):
+            # Lay record cu
+            cursor.execute("SELECT * FROM history WHERE id = ?", (history_id,))
+            old_record = cursor.fetchone()
+            if not old_record:
                 return False
-            finally:
-                conn.close()
 
+            old_data = dict(old_record)
+
+            # Luu lich su thay doi truoc khi xoa
+            cursor.execute("""
+                INSERT INTO history_changes (
+                    history_id, change_type, old_plate_id, old_plate_view,
+                    old_data
+                ) VALUES (?, 'DELETE', ?, ?, ?)
+            """, (
+                history_id,
+                old_data.get('plate_id'),
+                old_data.get('plate_view'),
+                json.dumps(old_data)
+            ))
+
+            # Xoa record trong history
+            cursor.execute("DELETE FROM history WHERE id = ?", (history_id,))
+            return True
+
+        try:
+            return self.run_write(op)
+        except Exception as e:
+            print(f"Error deleting history entry: {e}")
+            return False
+
+    @instrumented
     def get_history_entry_by_id(self, history_id):
         """Lấy 1 bản ghi history theo id (kèm event_id)"""
         with self.lock:
@@ -598,6 +951,7 @@ class CentralDatabase:
             finally:
                 conn.close()
 
+    @instrumented
     def find_history_by_event_id(self, event_id):
         """Tìm bản ghi history theo event_id (dùng cho sync từ edge/p2p)"""
         if not event_id:
@@ -616,6 +970,7 @@ class CentralDatabase:
             finally:
                 conn.close()
 
+    @instrumented
     def get_history_changes(self, limit=100, offset=0, history_id=None):
         """Get lịch sử thay đổi"""
         import json
@@ -657,6 +1012,7 @@ class CentralDatabase:
 
             return changes
 
+    @instrumented
     def find_vehicle_in_parking(self, plate_id):
         """
         Find vehicle currently in parking lot (status = IN)
@@ -667,41 +1023,18 @@ class CentralDatabase:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
 
-            cursor.execute("""
-                SELECT id, plate_id, plate_view, entry_time, status,
-                       last_location, last_location_time, is_anomaly
-                FROM history
-                WHERE plate_id = ? AND status = 'IN'
-                ORDER BY entry_time DESC
-                LIMIT 1
-            """, (plate_id,))
-
-            row = cursor.fetchone()
+            vehicle = self._select_vehicle_in_parking(cursor, plate_id)
             conn.close()
 
-            if row:
-                return {
-                    "id": row[0],
-                    "plate_id": row[1],
-                    "plate_view": row[2],
-                    "entry_time": row[3],
-                    "status": row[4],
-                    "last_location": row[5],
-                    "last_location_time": row[6],
-                    "is_anomaly": row[7]
-                }
-            return None
+            return vehicle
 
+    @instrumented
     def update_vehicle_location(self, plate_id, location, location_time):
         """
         Update location for vehicle currently in parking lot
         Returns True if updated, False if vehicle not in parking
         """
-        with self.lock:
-            conn = sqlite3.connect(self.db_file)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
+        def op(cursor):
             cursor.execute("""
                 UPDATE history
                 SET last_location = ?,
@@ -709,13 +1042,11 @@ class CentralDatabase:
                     updated_at = CURRENT_TIMESTAMP
                 WHERE plate_id = ? AND status = 'IN'
             """, (location, location_time, plate_id))
+            return cursor.rowcount > 0
 
-            rows_updated = cursor.rowcount
-            conn.commit()
-            conn.close()
-
-            return rows_updated > 0
+        return self.run_write(op)
 
+    @instrumented
     def get_vehicles_at_location(self, location):
         """
         Get all vehicles currently at a specific parking lot location
@@ -750,31 +1081,25 @@ class CentralDatabase:
                 })
             return vehicles
 
+    @instrumented
     def save_parking_lot_config(self, location_name, capacity, camera_id, camera_type="PARKING_LOT", edge_id=None):
         """
         Save or update parking lot configuration to database
         This allows parking lot config to persist even after camera type changes
         """
-        with self.lock:
-            conn = sqlite3.connect(self.db_file)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                INSERT INTO parking_lots (location_name, capacity, camera_id, camera_type, edge_id, updated_at)
-                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ON CONFLICT(location_name) DO UPDATE SET
-                    capacity = excluded.capacity,
-                    camera_id = excluded.camera_id,
-                    camera_type = excluded.camera_type,
-                    edge_id = excluded.edge_id,
-                    updated_at = CURRENT_TIMESTAMP
-            """, (location_name, capacity, camera_id, camera_type, edge_id))
-
-            conn.commit()
-            conn.close()
-            print(f"[CentralDB] Saved parking lot config: {location_name}, capacity={capacity}")
-
+        self.run_write(lambda cursor: cursor.execute("""
+            INSERT INTO parking_lots (location_name, capacity, camera_id, camera_type, edge_id, updated_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(location_name) DO UPDATE SET
+                capacity = excluded.capacity,
+                camera_id = excluded.camera_id,
+                camera_type = excluded.camera_type,
+                edge_id = excluded.edge_id,
+                updated_at = CURRENT_TIMESTAMP
+        """, (location_name, capacity, camera_id, camera_type, edge_id)))
+        print(f"[CentralDB] Saved parking lot config: {location_name}, capacity={capacity}")
+
+    @instrumented
     def get_all_parking_lots(self):
         """
         Get all parking lot configurations from database
@@ -808,6 +1133,7 @@ class CentralDatabase:
                 })
             return parking_lots
 
+    @instrumented
     def create_entry_from_parking_lot(self, event_id, source_central, edge_id,
                                        plate_id, plate_view, entry_time,
                                        camera_name, location, location_time):
@@ -815,11 +1141,7 @@ class CentralDatabase:
         Auto-create entry when vehicle detected by PARKING_LOT camera but not in DB
         Mark as anomaly (is_anomaly = 1)
         """
-        with self.lock:
-            conn = sqlite3.connect(self.db_file)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
+        def op(cursor):
             cursor.execute("""
                 INSERT INTO history (
                     event_id, source_central, edge_id,
@@ -836,9 +1158,44 @@ class CentralDatabase:
                 location, location_time,
                 "IN", 1, "P2P"  # is_anomaly = 1, sync_status = P2P
             ))
+            return cursor.lastrowid
 
-            entry_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+        return self.run_write(op)
+
+
+class CentralWriteBatch:
+    """
+    Các thao tác ghi chạy trên cursor của writer thread (CentralDatabase.submit_batch / run_batch)
+
+    Cùng tên / tham số với method của CentralDatabase → ParkingStateManager dùng thay
+    thế được. Không tự commit, không lấy lock (writer thread đã giữ lock và commit cả nhóm).
+    """
+
+    def __init__(self, database, cursor):
+        self.database = database
+        self.cursor = cursor
+
+    def add_event(self, event_type, camera_id, camera_name, camera_type, plate_text, confidence, source, data):
+        self.database._insert_event(self.cursor, event_type, camera_id, camera_name, camera_type,
+                                    plate_text, confidence, source, data)
+
+    def add_vehicle_entry(self, plate_id, plate_view, entry_time, camera_id, camera_name, confidence, source,
+                          event_id=None, source_central=None, edge_id=None, sync_status="LOCAL"):
+        return self.database._insert_vehicle_entry(
+            self.cursor, plate_id, plate_view, entry_time, camera_id, camera_name,
+            confidence, source, event_id, source_central, edge_id, sync_status,
+        )
+
+    def update_vehicle_exit(self, plate_id, exit_time, camera_id, camera_name, confidence, source, duration, fee):
+        return self.database._update_vehicle_exit(
+            self.cursor, plate_id, exit_time, camera_id, camera_name, confidence, source, duration, fee
+        )
+
+    def find_vehicle_in_parking(self, plate_id):
+        return self.database._select_vehicle_in_parking(self.cursor, plate_id)
+
+    def event_exists(self, event_id):
+        return self.database._select_event_exists(self.cursor, event_id)
 
-            return entry_id
+    def existing_event_ids(self, event_ids):
+        return self.database._select_existing_event_ids(self.cursor, event_ids)
@@ -0,0 +1,377 @@
+"""
+Metrics - Registry counter / gauge / histogram nhẹ + trace mẫu theo event_id, xuất tại /metrics
+
+Không phụ thuộc prometheus_client (cùng cách làm với metrics.py của Edge):
+- Counter.inc / Gauge.set / Histogram.observe: child theo label được cache, 1 lock + vài phép cộng
+- Gauge theo hàm hoặc làm mới lúc scrape (số client WebSocket, độ sâu hàng đợi P2P)
+- EventTracer: lấy mẫu 1 phần event từ Edge, ghi mốc thời gian ingest → ghi DB → broadcast frontend
+
+Dùng:
+    HTTP_SECONDS = get_metrics().histogram("central_http_request_seconds", "HTTP latency", ["route"])
+    HTTP_SECONDS.labels("/api/edge/event").observe(0.004)
+
+    tracer = get_event_tracer()
+    tracer.begin(event_id, "http")      # sample_rate quyết định có trace hay không
+    tracer.mark(event_id, "db_write")
+    tracer.mark(event_id, "broadcast", final=True)
+"""
+import bisect
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+# Bucket mac dinh (giay): tu 0.5ms toi 10s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """Giá trị tính lúc scrape (không tốn gì ở hot path)"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Phan tu cuoi: +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> "_Timer":
+        """with HISTOGRAM.time(): ... → observe thời gian chạy (giây)"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class _Metric:
+    """Metric có label: labels(...) trả child (cache theo giá trị label)"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def clear(self):
+        """Xóa mọi child (gauge làm mới lúc scrape: peer đã ngắt không còn xuất hiện)"""
+        with self._lock:
+            self._children.clear()
+            if not self.labelnames:
+                self._children[()] = self._default
+
+    def _samples(self):
+        """(suffix, label values, extra label, value) cho render"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, values, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield "", values, "", child.value
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default.set_function(function)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield "", values, "", child.get()
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield "_bucket", values, f'le="{_format_value(bound)}"', cumulative
+            yield "_sum", values, "", total
+            yield "_count", values, "", count
+
+
+class MetricsRegistry:
+    """Tập metric của process - tạo lại cùng tên trả về metric đã có"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} already registered with a different type / labels")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Text exposition format (Content-Type: text/plain; version=0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# Trace theo event_id: so trace dang mo toi da / giu lai sau khi xong / het han (giay)
+TRACE_MAX_ACTIVE = 256
+TRACE_MAX_FINISHED = 100
+TRACE_TTL = 60.0
+
+
+class EventTracer:
+    """
+    Trace mẫu 1 event từ lúc Edge gửi lên tới lúc broadcast cho frontend
+
+    Chỉ event được lấy mẫu (sample_rate) mới được ghi, event khác tốn 1 lần tra dict.
+    Mỗi mốc: thời gian (ms) tính từ begin → histogram central_event_trace_seconds{stage}
+    """
+
+    def __init__(self, sample_rate: float = 0.0, registry: Optional[MetricsRegistry] = None):
+        self.sample_rate = sample_rate
+        self._active: "OrderedDict[str, dict]" = OrderedDict()
+        self._finished = deque(maxlen=TRACE_MAX_FINISHED)
+        self._lock = threading.Lock()
+        self.stage_seconds = (registry or get_metrics()).histogram(
+            "central_event_trace_seconds", "Time from edge ingest to each stage of a sampled event", ["stage"])
+
+    def begin(self, event_id: Optional[str], source: str) -> bool:
+        """Bắt đầu trace event (nếu được lấy mẫu) - return True nếu event đang được trace"""
+        if not event_id or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if event_id in self._active:
+                return True
+            if len(self._active) >= TRACE_MAX_ACTIVE:
+                self._finish(self._active.popitem(last=False)[1], "evicted")
+            self._active[event_id] = {
+                "event_id": event_id,
+                "source": source,
+                "started_at": now,
+                "stages": [{"stage": "ingest", "ms": 0.0}],
+            }
+        return True
+
+    def mark(self, event_id: Optional[str], stage: str, final: bool = False, status: str = "complete"):
+        """Ghi mốc stage cho event đang trace (event không được lấy mẫu → bỏ qua), final → đóng trace"""
+        if not event_id or not self._active:
+            return
+        with self._lock:
+            trace = self._active.get(event_id)
+            if trace is None:
+                return
+            elapsed = time.time() - trace["started_at"]
+            trace["stages"].append({"stage": stage, "ms": round(elapsed * 1000, 2)})
+            if final:
+                del self._active[event_id]
+                self._finish(trace, status)
+        self.stage_seconds.labels(stage).observe(elapsed)
+
+    def is_tracing(self) -> bool:
+        return bool(self._active)
+
+    def _finish(self, trace: dict, status: str):
+        trace["status"] = status
+        self._finished.append(trace)
+
+    def _expire(self, now: float):
+        """Trace không tới được mốc cuối (event lỗi / dedupe / không broadcast) → đóng sau TRACE_TTL"""
+        while self._active:
+            event_id, trace = next(iter(self._active.items()))
+            if now - trace["started_at"] < TRACE_TTL:
+                break
+            del self._active[event_id]
+            self._finish(trace, "expired")
+
+    def get_traces(self) -> dict:
+        """Trace gần nhất (mới nhất trước) + trace đang mở"""
+        with self._lock:
+            self._expire(time.time())
+            return {
+                "sample_rate": self.sample_rate,
+                "active": [dict(trace, stages=list(trace["stages"])) for trace in self._active.values()],
+                "finished": list(reversed(self._finished)),
+            }
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Global instances
+_metrics_registry = None
+_event_tracer = None
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get singleton instance"""
+    global _metrics_registry
+    if _metrics_registry is None:
+        _metrics_registry = MetricsRegistry()
+    return _metrics_registry
+
+
+def get_event_tracer() -> EventTracer:
+    """Get singleton instance (sample rate từ config.METRICS_TRACE_SAMPLE_RATE)"""
+    global _event_tracer
+    if _event_tracer is None:
+        import config
+        _event_tracer = EventTracer(getattr(config, "METRICS_TRACE_SAMPLE_RATE", 0.0))
+    return _event_tracer
@@ -7,6 +7,7 @@ import json
 from typing import Callable, Optional
 from datetime import datetime
 
+from . import codec as wire_codec
 from .protocol import P2PMessage, validate_message
 
 
@@ -36,6 +37,7 @@ class P2PClient:
         self.connected = False
         self.reconnect_delay = 10  # seconds
         self.last_ping_time = None
+        self.codec = wire_codec.CODEC_JSON  # doi khi peer xac nhan codec (message CODEC)
 
     @property
     def uri(self) -> str:
@@ -82,9 +84,11 @@ class P2PClient:
             ) as websocket:
                 self.websocket = websocket
 
-                # Send identification message first
+                # Send identification message first (kem danh sach codec de peer chon)
+                self.codec = wire_codec.CODEC_JSON
                 identification = {
-                    "peer_id": self.this_central_id
+                    "peer_id": self.this_central_id,
+                    "codecs": wire_codec.supported_codecs()
                 }
                 await websocket.send(json.dumps(identification))
                 print(f"Sent identification to {self.peer_id}: {self.this_central_id}")
@@ -109,22 +113,29 @@ class P2PClient:
         finally:
             self.connected = False
             self.websocket = None
+            self.codec = wire_codec.CODEC_JSON
 
             # Call disconnected callback
             if self.on_disconnected:
                 await self.on_disconnected(self.peer_id)
 
-    async def _process_message(self, message: str):
-        """Process incoming message from peer"""
+    async def _process_message(self, message):
+        """Process incoming message from peer (text JSON hoặc binary frame)"""
         try:
-            # Parse JSON
-            data = json.loads(message)
+            data = wire_codec.decode(message)
 
             # Skip error messages
             if data.get("type") == "ERROR":
                 print(f"Error from peer {self.peer_id}: {data.get('error')}")
                 return
 
+            # Peer xac nhan codec → tu gio gui theo codec nay
+            if data.get("type") == "CODEC":
+                if data.get("codec") in wire_codec.supported_codecs():
+                    self.codec = data["codec"]
+                    print(f"P2P peer {self.peer_id} codec: {self.codec}")
+                return
+
             # Validate message
             is_valid, error = validate_message(data)
             if not is_valid:
@@ -142,8 +153,8 @@ class P2PClient:
             if self.on_message:
                 await self.on_message(p2p_msg, self.peer_id)
 
-        except json.JSONDecodeError as e:
-            print(f"Invalid JSON from {self.peer_id}: {e}")
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"Invalid frame from {self.peer_id}: {e}")
 
         except Exception as e:
             print(f"Error processing message from {self.peer_id}: {e}")
@@ -156,8 +167,7 @@ class P2PClient:
             return False
 
         try:
-            json_msg = message.to_json()
-            await self.websocket.send(json_msg)
+            await self.websocket.send(message.to_wire(self.codec))
             return True
 
         except websockets.exceptions.ConnectionClosed:
@@ -180,5 +190,6 @@ class P2PClient:
             "peer_ip": self.peer_ip,
             "peer_port": self.peer_port,
             "connected": self.connected,
+            "codec": self.codec,
             "last_ping_time": self.last_ping_time.isoformat() if self.last_ping_time else None
         }
@@ -4,8 +4,35 @@ Database Extensions for P2P - Thêm methods vào CentralDatabase
 Để không modify file database.py gốc, ta tạo extension functions
 và monkey-patch vào CentralDatabase class
 """
+import hashlib
 import sqlite3
 from threading import Lock
+from typing import Dict, List, Optional
+
+from database import instrumented
+
+# Do dai prefix cua entry_time ('YYYY-MM-DD HH:MM:SS') = key cua bucket digest
+DIGEST_BUCKET_LENGTH = {"day": 10, "hour": 13}
+
+# SQL dung chung cho ghi tung event va merge batch (SYNC_RESPONSE)
+_INSERT_ENTRY_P2P_SQL = """
+    INSERT INTO history (
+        event_id, source_central, edge_id,
+        plate_id, plate_view, entry_time,
+        entry_camera_id, entry_camera_name,
+        entry_confidence, entry_source,
+        status, sync_status
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'IN', 'SYNCED')
+"""
+
+# Chi tac dong dong con IN: exit den sau / trung lap khong ghi de exit da co
+_UPDATE_EXIT_P2P_SQL = """
+    UPDATE history
+    SET exit_time = ?, exit_camera_id = ?, exit_camera_name = ?,
+        exit_confidence = ?, exit_source = ?, duration = ?, fee = ?,
+        status = 'OUT', updated_at = CURRENT_TIMESTAMP
+    WHERE event_id = ? AND status = 'IN'
+"""
 
 
 def add_vehicle_entry_p2p(
@@ -26,39 +53,23 @@ def add_vehicle_entry_p2p(
 
     Similar to add_vehicle_entry nhưng có thêm P2P fields
     """
-    with self.lock:
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute(
-                """
-                INSERT INTO history (
-                    event_id, source_central, edge_id,
-                    plate_id, plate_view, entry_time,
-                    entry_camera_id, entry_camera_name,
-                    entry_confidence, entry_source,
-                    status, sync_status
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'IN', 'SYNCED')
-                """,
-                (
-                    event_id, source_central, edge_id,
-                    plate_id, plate_view, entry_time,
-                    camera_id, camera_name,
-                    confidence, source
-                ),
-            )
-
-            history_id = cursor.lastrowid
-            conn.commit()
-            return history_id
+    def op(cursor):
+        cursor.execute(
+            _INSERT_ENTRY_P2P_SQL,
+            (
+                event_id, source_central, edge_id,
+                plate_id, plate_view, entry_time,
+                camera_id, camera_name,
+                confidence, source
+            ),
+        )
+        return cursor.lastrowid
 
-        except Exception as e:
-            conn.rollback()
-            print(f"Error adding P2P vehicle entry: {e}")
-            raise
-        finally:
-            conn.close()
+    try:
+        return self.run_write(op)
+    except Exception as e:
+        print(f"Error adding P2P vehicle entry: {e}")
+        raise
 
 
 def update_vehicle_exit_p2p(
@@ -77,26 +88,89 @@ def update_vehicle_exit_p2p(
 
     Tìm entry theo event_id thay vì plate_id
     """
-    with self.lock:
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
+    def op(cursor):
         cursor.execute(
-            """
-            UPDATE history
-            SET exit_time = ?, exit_camera_id = ?, exit_camera_name = ?,
-                exit_confidence = ?, exit_source = ?, duration = ?, fee = ?,
-                status = 'OUT', updated_at = CURRENT_TIMESTAMP
-            WHERE event_id = ? AND status = 'IN'
-            """,
+            _UPDATE_EXIT_P2P_SQL,
             (exit_time, camera_id, camera_name, confidence, source, duration, fee, event_id),
         )
+        return cursor.rowcount > 0
 
-        rows_updated = cursor.rowcount
-        conn.commit()
-        conn.close()
+    return self.run_write(op)
 
-        return rows_updated > 0
+
+def merge_sync_events(self, events: List[dict], default_source_central: str):
+    """
+    Merge 1 trang event của SYNC_RESPONSE trong 1 transaction
+
+    Cùng luật với merge từng event:
+    - event chưa có → insert entry (status IN), event OUT → update exit ngay sau đó
+    - event đã có → chỉ update exit nếu mình còn IN và peer đã OUT
+    - event không có event_id → bỏ qua
+
+    Kiểm tra tồn tại của cả trang bằng 1 query (existing_event_ids), insert / update bằng executemany.
+
+    Returns:
+        (merged_count, skipped_count)
+    """
+    def apply(batch):
+        existing = batch.existing_event_ids(event.get("event_id") for event in events)
+
+        entries = []
+        new_exits = []  # exit cua event vua insert (luon ap dung duoc)
+        existing_exits = []  # exit cua event da co (chi ap dung neu dong con IN)
+        inserted = set()
+        skipped = 0
+        for event in events:
+            event_id = event.get("event_id")
+            if not event_id:
+                # Old event without event_id, skip
+                skipped += 1
+                continue
+
+            has_exit = event.get("status") == "OUT" and event.get("exit_time")
+            if event_id not in existing and event_id not in inserted:
+                inserted.add(event_id)
+                entries.append((
+                    event_id,
+                    event.get("source_central", default_source_central),
+                    event.get("edge_id", "unknown"),
+                    event.get("plate_id"),
+                    event.get("plate_view", event.get("plate_id")),
+                    event.get("entry_time"),
+                    event.get("entry_camera_id"),
+                    event.get("entry_camera_name", "unknown"),
+                    event.get("entry_confidence", 0.0),
+                    "sync",
+                ))
+                target = new_exits
+            elif has_exit:
+                target = existing_exits
+            else:
+                skipped += 1
+                continue
+
+            if has_exit:
+                target.append((
+                    event.get("exit_time"),
+                    event.get("exit_camera_id"),
+                    event.get("exit_camera_name", "unknown"),
+                    event.get("exit_confidence", 0.0),
+                    "sync",
+                    event.get("duration", ""),
+                    event.get("fee", 0),
+                    event_id,
+                ))
+
+        cursor = batch.cursor
+        cursor.executemany(_INSERT_ENTRY_P2P_SQL, entries)
+        cursor.executemany(_UPDATE_EXIT_P2P_SQL, new_exits)
+        applied = 0
+        if existing_exits:
+            cursor.executemany(_UPDATE_EXIT_P2P_SQL, existing_exits)
+            applied = cursor.rowcount
+        return len(entries) + applied, skipped + len(existing_exits) - applied
+
+    return self.run_batch(apply)
 
 
 def event_exists(self, event_id: str) -> bool:
@@ -118,27 +192,18 @@ def event_exists(self, event_id: str) -> bool:
 
 def delete_entry_by_event_id(self, event_id: str) -> bool:
     """Delete entry by event_id (dùng cho conflict resolution)"""
-    with self.lock:
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute(
-                "DELETE FROM history WHERE event_id = ?",
-                (event_id,)
-            )
-
-            rows_deleted = cursor.rowcount
-            conn.commit()
-            return rows_deleted > 0
-
-        except Exception as e:
-            conn.rollback()
-            print(f"Error deleting entry by event_id: {e}")
-            return False
+    def op(cursor):
+        cursor.execute(
+            "DELETE FROM history WHERE event_id = ?",
+            (event_id,)
+        )
+        return cursor.rowcount > 0
 
-        finally:
-            conn.close()
+    try:
+        return self.run_write(op)
+    except Exception as e:
+        print(f"Error deleting entry by event_id: {e}")
+        return False
 
 
 def get_events_since(self, timestamp_ms: int, limit: int = 1000):
@@ -177,6 +242,97 @@ def get_events_since(self, timestamp_ms: int, limit: int = 1000):
         return [dict(row) for row in results]
 
 
+def sync_row_hash(event_id: str, status: str, exit_time: Optional[str]) -> int:
+    """Hash 64-bit của 1 dòng history cho digest (đổi khi event có thêm exit)"""
+    key = f"{event_id}|{status}|{exit_time or ''}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+
+
+def _bucket_ranges(buckets):
+    """Bucket 'YYYY-MM-DD' / 'YYYY-MM-DD HH' → khoảng entry_time [bucket, bucket + '~')"""
+    return [(bucket, bucket + "~") for bucket in sorted(buckets)]
+
+
+def _select_sync_rows(cursor, columns: str, since: Optional[str], buckets):
+    """SELECT các dòng có event_id theo cửa sổ since hoặc theo danh sách bucket (dùng index entry_time)"""
+    if buckets is None:
+        cursor.execute(
+            f"SELECT {columns} FROM history WHERE event_id IS NOT NULL AND entry_time >= ?",
+            (since or "",)
+        )
+        yield from cursor
+        return
+
+    for start, end in _bucket_ranges(buckets):
+        cursor.execute(
+            f"SELECT {columns} FROM history WHERE event_id IS NOT NULL AND entry_time >= ? AND entry_time < ?",
+            (start, end)
+        )
+        yield from cursor
+
+
+def get_sync_digest(self, level: str, since: Optional[str] = None, buckets=None) -> Dict[str, list]:
+    """
+    Digest history theo bucket (ngày / giờ của entry_time)
+
+    Args:
+        level: "day" hoặc "hour"
+        since: entry_time nhỏ nhất (khi buckets=None)
+        buckets: chỉ tính trong các bucket này (vd: các ngày bị lệch)
+
+    Returns:
+        {bucket: [count, hash_hex]} - hash = XOR hash các dòng, không phụ thuộc thứ tự
+    """
+    length = DIGEST_BUCKET_LENGTH[level]
+    digest = {}
+    with self.lock:
+        conn = sqlite3.connect(self.db_file)
+        try:
+            cursor = conn.cursor()
+            rows = _select_sync_rows(cursor, "event_id, status, exit_time, entry_time", since, buckets)
+            for event_id, status, exit_time, entry_time in rows:
+                bucket = entry_time[:length]
+                count, value = digest.get(bucket, (0, 0))
+                digest[bucket] = (count + 1, value ^ sync_row_hash(event_id, status, exit_time))
+        finally:
+            conn.close()
+
+    return {bucket: [count, f"{value:016x}"] for bucket, (count, value) in digest.items()}
+
+
+def get_sync_fingerprints(self, buckets) -> Dict[str, str]:
+    """{event_id: hash_hex} của các dòng trong các bucket giờ (gửi kèm SYNC_REQUEST để peer bỏ dòng trùng)"""
+    with self.lock:
+        conn = sqlite3.connect(self.db_file)
+        try:
+            cursor = conn.cursor()
+            rows = _select_sync_rows(cursor, "event_id, status, exit_time", None, buckets)
+            return {
+                event_id: f"{sync_row_hash(event_id, status, exit_time):016x}"
+                for event_id, status, exit_time in rows
+            }
+        finally:
+            conn.close()
+
+
+def get_sync_rows(self, buckets, known: Optional[Dict[str, str]] = None) -> List[dict]:
+    """Các dòng history trong các bucket giờ, bỏ dòng peer đã có đúng trạng thái (known)"""
+    known = known or {}
+    with self.lock:
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            events = []
+            for row in _select_sync_rows(cursor, "*", None, buckets):
+                fingerprint = f"{sync_row_hash(row['event_id'], row['status'], row['exit_time']):016x}"
+                if known.get(row["event_id"]) != fingerprint:
+                    events.append(dict(row))
+            return events
+        finally:
+            conn.close()
+
+
 def get_sync_state(self):
     """Get sync state với tất cả peers"""
     with self.lock:
@@ -210,6 +366,16 @@ def init_p2p_tables(database_instance):
             )
         """)
 
+        # Digest sync quet history theo bucket entry_time, tim dong theo event_id
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_history_entry_time
+            ON history(entry_time)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_history_event_id
+            ON history(event_id)
+        """)
+
         conn.commit()
         conn.close()
         print("P2P tables initialized")
@@ -227,12 +393,19 @@ def patch_database_for_p2p(database_instance):
     # First, initialize P2P tables
     init_p2p_tables(database_instance)
 
-    # Then patch methods
-    database_instance.add_vehicle_entry_p2p = add_vehicle_entry_p2p.__get__(database_instance)
-    database_instance.update_vehicle_exit_p2p = update_vehicle_exit_p2p.__get__(database_instance)
-    database_instance.event_exists = event_exists.__get__(database_instance)
-    database_instance.delete_entry_by_event_id = delete_entry_by_event_id.__get__(database_instance)
-    database_instance.get_events_since = get_events_since.__get__(database_instance)
-    database_instance.get_sync_state = get_sync_state.__get__(database_instance)
+    # Then patch methods (do thoi gian nhu method goc cua CentralDatabase)
+    for method in (
+        add_vehicle_entry_p2p,
+        update_vehicle_exit_p2p,
+        event_exists,
+        merge_sync_events,
+        delete_entry_by_event_id,
+        get_events_since,
+        get_sync_state,
+        get_sync_digest,
+        get_sync_fingerprints,
+        get_sync_rows,
+    ):
+        setattr(database_instance, method.__name__, instrumented(method).__get__(database_instance))
 
     print("Database patched with P2P methods")
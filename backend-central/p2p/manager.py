@@ -1,26 +1,45 @@
 """
-P2P Manager - Orchestrate server + clients + event handling
+P2P Manager - Orchestrate peer connections (/ws/p2p + clients) + event handling
 """
 import asyncio
+import time
 from typing import Dict, List, Optional, Callable
 from datetime import datetime
 
+from metrics import get_metrics
 from .config_loader import P2PConfig
-from .server import P2PServer
 from .client import P2PClient
+from . import codec as wire_codec
+from .peer_outbox import PeerOutbox
 from .protocol import P2PMessage, MessageType, create_heartbeat_message
 
 
+_metrics = get_metrics()
+P2P_BROADCASTS = _metrics.counter("central_p2p_broadcasts_total", "P2P messages broadcast to all peers", ["type"])
+P2P_BROADCAST_SECONDS = _metrics.histogram("central_p2p_broadcast_seconds",
+                                           "Time for P2PManager.broadcast to enqueue / send to every peer")
+P2P_SEND_TO_PEER_SECONDS = _metrics.histogram("central_p2p_send_to_peer_seconds",
+                                              "P2PManager.send_to_peer latency incl. queue wait", ["result"])
+
+
 class P2PManager:
     """Main P2P orchestrator"""
 
-    def __init__(self, config_file: str = "config/p2p_config.json"):
+    def __init__(self, config_file: str = "config/p2p_config.json", send_queue_size: Optional[int] = None,
+                 send_timeout: Optional[float] = None):
+        import config as app_config
         self.config = P2PConfig(config_file)
-        self.server: Optional[P2PServer] = None
         self.clients: Dict[str, P2PClient] = {}
         self.websocket_connections: Dict[str, any] = {}  # WebSocket connections from FastAPI
+        self.websocket_codecs: Dict[str, str] = {}  # codec da thuong luong voi tung peer (incoming)
         self.running = False
 
+        # Hang doi gui rieng cho tung peer (incoming WebSocket / outgoing client)
+        self.send_queue_size = send_queue_size or getattr(app_config, "P2P_SEND_QUEUE_SIZE", 1000)
+        self.send_timeout = send_timeout or getattr(app_config, "P2P_SEND_TIMEOUT", 10.0)
+        self.websocket_outboxes: Dict[str, PeerOutbox] = {}
+        self.client_outboxes: Dict[str, PeerOutbox] = {}
+
         # Callbacks
         self.on_vehicle_entry_pending: Optional[Callable] = None
         self.on_vehicle_entry_confirmed: Optional[Callable] = None
@@ -31,6 +50,7 @@ class P2PManager:
         self.on_history_delete: Optional[Callable] = None
         self.on_sync_request: Optional[Callable] = None
         self.on_sync_response: Optional[Callable] = None
+        self.on_sync_digest: Optional[Callable] = None
         self.on_peer_connected: Optional[Callable] = None
         self.on_peer_disconnected: Optional[Callable] = None
 
@@ -68,9 +88,11 @@ class P2PManager:
         """Stop P2P manager"""
         self.running = False
 
-        # Stop server
-        if self.server:
-            await self.server.stop()
+        # Stop sender tasks
+        for outbox in list(self.websocket_outboxes.values()) + list(self.client_outboxes.values()):
+            await outbox.stop()
+        self.websocket_outboxes.clear()
+        self.client_outboxes.clear()
 
         # Stop all clients
         for client in self.clients.values():
@@ -78,19 +100,6 @@ class P2PManager:
 
         print("P2P Manager stopped")
 
-    async def _start_server(self):
-        """Start P2P server"""
-        host = self.config.get_this_central_ip()
-        port = self.config.get_this_central_p2p_port()
-
-        self.server = P2PServer(
-            host=host,
-            port=port,
-            on_message=self._handle_message
-        )
-
-        await self.server.start()
-
     async def _start_clients(self):
         """Start P2P clients to connect to peers"""
         peers = self.config.get_peer_centrals()
@@ -147,6 +156,11 @@ class P2PManager:
                 if self.on_sync_response:
                     await self.on_sync_response(message, peer_id or message.source_central)
 
+            elif message.type == MessageType.SYNC_DIGEST:
+                # Handle digest (anti-entropy)
+                if self.on_sync_digest:
+                    await self.on_sync_digest(message, peer_id or message.source_central)
+
             elif message.type == MessageType.HISTORY_UPDATE:
                 # Handle history update from P2P peer
                 if self.on_history_update:
@@ -215,51 +229,96 @@ class P2PManager:
                 print(f"Error in heartbeat loop: {e}")
 
     async def broadcast(self, message: P2PMessage):
-        """Broadcast message to all peers"""
+        """
+        Broadcast message to all peers
+
+        Chỉ đưa message vào hàng đợi của từng peer (không chờ gửi) - peer chậm không làm trễ peer khác
+        """
         if self.config.is_standalone():
             return  # No peers to broadcast
 
         self.messages_sent += 1
+        P2P_BROADCASTS.labels(getattr(message.type, "value", message.type)).inc()
+        started = time.perf_counter()
 
         # Send through WebSocket connections (FastAPI endpoint)
-        for peer_id in list(self.websocket_connections.keys()):
-            try:
-                await self.send_websocket_message(peer_id, message)
-            except Exception as e:
-                print(f"Error broadcasting via WebSocket to {peer_id}: {e}")
+        for peer_id, outbox in list(self.websocket_outboxes.items()):
+            outbox.put(message)
 
         # Send to connected clients (backup/legacy)
         for client in self.clients.values():
-            try:
-                if client.is_connected():
-                    await client.send(message)
-            except Exception as e:
-                print(f"Error broadcasting to {client.peer_id}: {e}")
+            if client.is_connected():
+                self._get_client_outbox(client).put(message)
 
-        # Broadcast to server's connected clients (peers that connected to us)
-        if self.server:
-            try:
-                await self.server.broadcast(message)
-            except Exception as e:
-                print(f"Error broadcasting from server: {e}")
+        P2P_BROADCAST_SECONDS.observe(time.perf_counter() - started)
 
     async def send_to_peer(self, peer_id: str, message: P2PMessage) -> bool:
-        """Send message to specific peer"""
+        """Send message to specific peer (qua hàng đợi của peer để giữ thứ tự với broadcast)"""
+        started = time.perf_counter()
+        ok = await self._send_to_peer(peer_id, message)
+        P2P_SEND_TO_PEER_SECONDS.labels("ok" if ok else "failed").observe(time.perf_counter() - started)
+        return ok
+
+    async def _send_to_peer(self, peer_id: str, message: P2PMessage) -> bool:
         # Try WebSocket connection first (incoming connections)
-        if peer_id in self.websocket_connections:
-            try:
-                return await self.send_websocket_message(peer_id, message)
-            except Exception as e:
-                print(f"Error sending via WebSocket to {peer_id}: {e}")
+        outbox = self.websocket_outboxes.get(peer_id)
+        if outbox is not None:
+            future = asyncio.get_running_loop().create_future()
+            outbox.put(message, future)
+            if await future:
+                return True
 
         # Fallback to client connection (outgoing connections)
         client = self.clients.get(peer_id)
         if client and client.is_connected():
-            return await client.send(message)
+            future = asyncio.get_running_loop().create_future()
+            self._get_client_outbox(client).put(message, future)
+            return await future
 
         print(f"Peer {peer_id} not connected")
         return False
 
+    def _get_client_outbox(self, client: P2PClient) -> PeerOutbox:
+        """Outbox cho kết nối outgoing (tạo lại nếu outbox cũ đã đóng do tràn / timeout)"""
+        outbox = self.client_outboxes.get(client.peer_id)
+        if outbox is None or outbox.closed:
+            outbox = PeerOutbox(client.peer_id, client.send, self._disconnect_client,
+                                self.send_queue_size, self.send_timeout)
+            outbox.start()
+            self.client_outboxes[client.peer_id] = outbox
+        return outbox
+
+    async def _disconnect_client(self, peer_id: str):
+        """Outbox outgoing tràn / treo → đóng socket, client tự reconnect và SYNC_REQUEST"""
+        self.client_outboxes.pop(peer_id, None)
+        client = self.clients.get(peer_id)
+        if client and client.websocket:
+            try:
+                await asyncio.wait_for(client.websocket.close(), timeout=self.send_timeout)
+            except Exception as e:
+                print(f"[P2P Manager] Error closing connection to {peer_id}: {e}")
+
+    async def _disconnect_websocket(self, peer_id: str):
+        """Outbox incoming tràn / treo → unregister + đóng WebSocket, peer sẽ reconnect và sync lại"""
+        websocket = self.websocket_connections.get(peer_id)
+        if websocket is None:
+            return
+        self.unregister_websocket_connection(peer_id, websocket)
+        try:
+            await asyncio.wait_for(websocket.close(code=1013, reason="P2P send queue overflow"),
+                                   timeout=self.send_timeout)
+        except Exception as e:
+            print(f"[P2P Manager] Error closing WebSocket of {peer_id}: {e}")
+
+    def get_queue_metrics(self) -> Dict[str, Dict]:
+        """Độ sâu hàng đợi + latency gửi của từng peer"""
+        metrics = {}
+        for peer_id, outbox in self.websocket_outboxes.items():
+            metrics[f"ws:{peer_id}"] = outbox.get_metrics()
+        for peer_id, outbox in self.client_outboxes.items():
+            metrics[f"client:{peer_id}"] = outbox.get_metrics()
+        return metrics
+
     def get_peer_status(self) -> List[Dict]:
         """Get status of all peers"""
         peers_status = []
@@ -271,6 +330,7 @@ class P2PManager:
                 "peer_ip": "N/A",  # Will be filled from config
                 "peer_port": 8000,
                 "status": "connected",
+                "codec": self.websocket_codecs.get(peer_id, wire_codec.CODEC_JSON),
                 "last_ping_time": datetime.now().isoformat()
             })
 
@@ -293,6 +353,7 @@ class P2PManager:
             "connected_peers": connected_peers,
             "messages_sent": self.messages_sent,
             "messages_received": self.messages_received,
+            "send_queues": self.get_queue_metrics(),
             "peers": self.get_peer_status()
         }
 
@@ -322,6 +383,9 @@ class P2PManager:
             print(f"Stopping connection to removed peer: {peer_id}")
             await self.clients[peer_id].stop()
             del self.clients[peer_id]
+            outbox = self.client_outboxes.pop(peer_id, None)
+            if outbox:
+                await outbox.stop()
 
         # Start clients for new peers
         added_peers = new_peer_ids - current_peer_ids
@@ -350,19 +414,44 @@ class P2PManager:
         print(f"P2P config reloaded: {len(self.clients)} clients")
 
     # WebSocket connection management (for FastAPI /ws/p2p endpoint)
-    def register_websocket_connection(self, peer_id: str, websocket):
+    def register_websocket_connection(self, peer_id: str, websocket, codec: str = wire_codec.CODEC_JSON):
         """Register a WebSocket connection from FastAPI endpoint"""
+        old_outbox = self.websocket_outboxes.pop(peer_id, None)
+        if old_outbox:
+            asyncio.create_task(old_outbox.stop())
+
         self.websocket_connections[peer_id] = websocket
-        print(f"[P2P Manager] Registered WebSocket connection for peer: {peer_id}")
+        self.websocket_codecs[peer_id] = codec
+        outbox = PeerOutbox(
+            peer_id,
+            lambda message: self.send_websocket_message(peer_id, message, websocket),
+            self._disconnect_websocket,
+            self.send_queue_size,
+            self.send_timeout
+        )
+        outbox.start()
+        self.websocket_outboxes[peer_id] = outbox
+        print(f"[P2P Manager] Registered WebSocket connection for peer: {peer_id} (codec={codec})")
 
         # Trigger on_peer_connected callback
         if self.on_peer_connected:
             asyncio.create_task(self.on_peer_connected(peer_id))
 
-    def unregister_websocket_connection(self, peer_id: str):
-        """Unregister a WebSocket connection"""
+    def unregister_websocket_connection(self, peer_id: str, websocket=None):
+        """
+        Unregister a WebSocket connection
+
+        websocket: chỉ unregister nếu đúng kết nối này (peer đã reconnect thì giữ kết nối mới)
+        """
+        if websocket is not None and self.websocket_connections.get(peer_id) is not websocket:
+            return
+
         if peer_id in self.websocket_connections:
             del self.websocket_connections[peer_id]
+            self.websocket_codecs.pop(peer_id, None)
+            outbox = self.websocket_outboxes.pop(peer_id, None)
+            if outbox:
+                asyncio.create_task(outbox.stop())
             print(f"[P2P Manager] Unregistered WebSocket connection for peer: {peer_id}")
 
             # Trigger on_peer_disconnected callback
@@ -389,14 +478,19 @@ class P2PManager:
             import traceback
             traceback.print_exc()
 
-    async def send_websocket_message(self, peer_id: str, message: P2PMessage) -> bool:
-        """Send message through WebSocket connection"""
-        if peer_id not in self.websocket_connections:
+    async def send_websocket_message(self, peer_id: str, message: P2PMessage, websocket=None) -> bool:
+        """Send message through WebSocket connection (gọi từ sender task của outbox)"""
+        if websocket is None:
+            websocket = self.websocket_connections.get(peer_id)
+        if websocket is None:
             return False
 
-        websocket = self.websocket_connections[peer_id]
         try:
-            await websocket.send_json(message.to_dict())
+            frame = message.to_wire(self.websocket_codecs.get(peer_id, wire_codec.CODEC_JSON))
+            if isinstance(frame, bytes):
+                await websocket.send_bytes(frame)
+            else:
+                await websocket.send_text(frame)
             return True
         except Exception as e:
             print(f"[P2P Manager] Error sending WebSocket message to {peer_id}: {e}")
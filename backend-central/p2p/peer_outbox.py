@@ -0,0 +1,221 @@
+"""
+Peer Outbox - Hàng đợi gửi riêng cho từng peer P2P
+
+Mỗi peer có 1 hàng đợi giới hạn + 1 sender task. broadcast() chỉ đưa message vào hàng đợi
+(không await send) nên 1 peer chậm / treo không làm trễ ENTRY/EXIT/LOCATION_UPDATE tới các peer khác.
+
+Xử lý khi hàng đợi đầy / peer treo:
+- Coalesce: HEARTBEAT, LOCATION_UPDATE (cùng event_id), PARKING_LOT_CONFIG (cùng camera_id) chưa gửi
+  thì message mới thay message cũ tại chỗ - chỉ trạng thái mới nhất có ý nghĩa
+- Disconnect: hàng đợi vẫn đầy, hoặc 1 lần send quá send_timeout → ngắt kết nối peer.
+  Không bỏ lẻ message ENTRY/EXIT; khi peer kết nối lại, SYNC_REQUEST sẽ bù phần bị thiếu.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from metrics import get_metrics
+from .protocol import P2PMessage, MessageType
+
+_metrics = get_metrics()
+P2P_QUEUE_WAIT_SECONDS = _metrics.histogram("central_p2p_queue_wait_seconds",
+                                            "Time a P2P message waits in the peer send queue", ["peer"])
+P2P_SEND_SECONDS = _metrics.histogram("central_p2p_send_seconds", "Time to write one P2P message to a peer",
+                                      ["peer"])
+P2P_MESSAGES = _metrics.counter("central_p2p_messages_total",
+                                "P2P messages per peer by outcome (sent / failed / coalesced / overflow / timeout)",
+                                ["peer", "result"])
+
+
+def coalesce_key(message: P2PMessage):
+    """Key để gộp message cùng loại chưa gửi (None = không gộp được)"""
+    if message.type == MessageType.HEARTBEAT:
+        return (message.type,)
+    if message.type == MessageType.LOCATION_UPDATE and message.event_id:
+        return (message.type, message.event_id)
+    if message.type == MessageType.PARKING_LOT_CONFIG:
+        return (message.type, (message.data or {}).get("camera_id"))
+    return None
+
+
+class PeerOutbox:
+    """Hàng đợi gửi + sender task cho 1 peer"""
+
+    def __init__(
+        self,
+        peer_id: str,
+        send: Callable[[P2PMessage], Awaitable[bool]],
+        on_disconnect: Callable[[str], Awaitable[None]],
+        maxsize: int = 1000,
+        send_timeout: float = 10.0
+    ):
+        self.peer_id = peer_id
+        self._send = send
+        self._on_disconnect = on_disconnect
+        self.maxsize = maxsize
+        self.send_timeout = send_timeout
+
+        self._pending = deque()  # entry: [message, enqueued_at, future, key]
+        self._by_key = {}  # coalesce key -> entry dang cho gui
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._send_timed_out = False
+        self.closed = False
+
+        # Metrics
+        self.max_depth = 0
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.overflows = 0
+        self.timeouts = 0
+        self.last_send_latency = None  # giay, tu luc vao hang doi toi luc gui xong
+        self.max_send_latency = 0.0
+        self._total_send_latency = 0.0
+        self._queue_wait = P2P_QUEUE_WAIT_SECONDS.labels(peer_id)
+        self._send_seconds = P2P_SEND_SECONDS.labels(peer_id)
+        self._results = {result: P2P_MESSAGES.labels(peer_id, result)
+                         for result in ("sent", "failed", "coalesced", "overflow", "timeout")}
+
+    def start(self):
+        """Start sender task (gọi trong event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._sender_loop())
+
+    async def stop(self):
+        """Stop sender task, message chưa gửi → False"""
+        self.closed = True
+        self._wakeup.set()
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._fail_pending()
+
+    def put(self, message: P2PMessage, future: Optional[asyncio.Future] = None) -> bool:
+        """
+        Đưa message vào hàng đợi, không chờ gửi
+
+        future (tùy chọn) nhận True/False khi message được gửi xong / lỗi (dùng cho send_to_peer)
+        Return: False nếu outbox đã đóng hoặc bị tràn
+        """
+        if self.closed:
+            self._resolve(future, False)
+            return False
+
+        # Gop voi message cung key chua gui (chi message broadcast - khong co future cho ket qua)
+        key = coalesce_key(message) if future is None else None
+        if key is not None:
+            entry = self._by_key.get(key)
+            if entry is not None:
+                entry[0] = message
+                self.coalesced += 1
+                self._results["coalesced"].inc()
+                return True
+
+        if len(self._pending) >= self.maxsize:
+            self.overflows += 1
+            self._results["overflow"].inc()
+            self._resolve(future, False)
+            self._disconnect(f"send queue full ({self.maxsize})")
+            return False
+
+        entry = [message, time.monotonic(), future, key]
+        self._pending.append(entry)
+        if key is not None:
+            self._by_key[key] = entry
+        self.max_depth = max(self.max_depth, len(self._pending))
+        self._wakeup.set()
+        return True
+
+    async def _sender_loop(self):
+        while not self.closed:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            message, enqueued_at, future, key = entry = self._pending.popleft()
+            if key is not None and self._by_key.get(key) is entry:
+                del self._by_key[key]
+
+            # Watchdog bang call_later (re hon wait_for - khong tao task moi cho moi message)
+            watchdog = asyncio.get_running_loop().call_later(self.send_timeout, self._on_send_timeout)
+            send_started = time.monotonic()
+            self._queue_wait.observe(send_started - enqueued_at)
+            result = "failed"
+            try:
+                ok = await self._send(message)
+            except asyncio.CancelledError:
+                if not self._send_timed_out:
+                    self._resolve(future, False)
+                    raise
+                ok = False
+                result = "timeout"
+                self.timeouts += 1
+                self._disconnect(f"send timeout ({self.send_timeout}s)")
+            except Exception as e:
+                print(f"[P2P Outbox] Error sending to {self.peer_id}: {e}")
+                ok = False
+            finally:
+                watchdog.cancel()
+                self._send_seconds.observe(time.monotonic() - send_started)
+
+            if ok:
+                latency = time.monotonic() - enqueued_at
+                self.sent += 1
+                self.last_send_latency = latency
+                self.max_send_latency = max(self.max_send_latency, latency)
+                self._total_send_latency += latency
+                self._results["sent"].inc()
+            else:
+                self.failed += 1
+                # Moi message dung 1 result (timeout khong dem them vao failed)
+                self._results[result].inc()
+            self._resolve(future, ok)
+
+    def _on_send_timeout(self):
+        """1 lần send quá send_timeout (peer không đọc) → hủy send đang chờ"""
+        self._send_timed_out = True
+        if self._task:
+            self._task.cancel()
+
+    def _disconnect(self, reason: str):
+        """Đóng outbox và báo manager ngắt kết nối peer (peer sẽ reconnect + SYNC_REQUEST)"""
+        if self.closed:
+            return
+        print(f"[P2P Outbox] Disconnecting peer {self.peer_id}: {reason}")
+        self.closed = True
+        self._wakeup.set()
+        self._fail_pending()
+        asyncio.create_task(self._on_disconnect(self.peer_id))
+
+    def _fail_pending(self):
+        while self._pending:
+            self._resolve(self._pending.popleft()[2], False)
+        self._by_key.clear()
+
+    @staticmethod
+    def _resolve(future: Optional[asyncio.Future], ok: bool):
+        if future is not None and not future.done():
+            future.set_result(ok)
+
+    def get_metrics(self):
+        """Metrics cho /api/p2p/stats"""
+        return {
+            "queue_depth": len(self._pending),
+            "max_queue_depth": self.max_depth,
+            "queue_size": self.maxsize,
+            "sent": self.sent,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "overflows": self.overflows,
+            "timeouts": self.timeouts,
+            "closed": self.closed,
+            "last_send_latency_ms": round(self.last_send_latency * 1000, 2) if self.last_send_latency is not None else None,
+            "avg_send_latency_ms": round(self._total_send_latency / self.sent * 1000, 2) if self.sent else None,
+            "max_send_latency_ms": round(self.max_send_latency * 1000, 2),
+        }
@@ -6,6 +6,8 @@ from typing import Dict, Any, Optional
 from datetime import datetime
 import json
 
+from . import codec as wire_codec
+
 
 class MessageType(str, Enum):
     """P2P Message types"""
@@ -24,6 +26,7 @@ class MessageType(str, Enum):
     HEARTBEAT = "HEARTBEAT"
     SYNC_REQUEST = "SYNC_REQUEST"
     SYNC_RESPONSE = "SYNC_RESPONSE"
+    SYNC_DIGEST = "SYNC_DIGEST"  # anti-entropy: hash theo bucket ngay / gio
 
     # Config & State
     CONFIG_UPDATE = "CONFIG_UPDATE"
@@ -61,6 +64,10 @@ class P2PMessage:
         """Convert to JSON string"""
         return json.dumps(self.to_dict())
 
+    def to_wire(self, codec: str = wire_codec.CODEC_JSON):
+        """Encode theo codec đã thương lượng với peer → str (text frame) hoặc bytes (binary frame)"""
+        return wire_codec.encode(self.to_dict(), codec)
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'P2PMessage':
         """Create message from dictionary"""
@@ -78,6 +85,11 @@ class P2PMessage:
         data = json.loads(json_str)
         return cls.from_dict(data)
 
+    @classmethod
+    def from_wire(cls, frame) -> 'P2PMessage':
+        """Create message from WebSocket frame (text JSON hoặc binary)"""
+        return cls.from_dict(wire_codec.decode(frame))
+
 
 def create_entry_pending_message(
     source_central: str,
@@ -257,15 +269,46 @@ def create_heartbeat_message(
 def create_sync_request_message(
     source_central: str,
     since_timestamp: int,
-    timestamp: Optional[int] = None
+    timestamp: Optional[int] = None,
+    buckets: Optional[list] = None,
+    known: Optional[Dict[str, str]] = None
 ) -> P2PMessage:
-    """Create SYNC_REQUEST message"""
+    """
+    Create SYNC_REQUEST message
+
+    buckets/known (digest sync): chỉ xin các bucket giờ bị lệch, bỏ các event đã có đúng trạng thái
+    """
+    data = {
+        "since_timestamp": since_timestamp
+    }
+    if buckets is not None:
+        data["buckets"] = buckets
+        data["known"] = known or {}
+
     return P2PMessage(
         msg_type=MessageType.SYNC_REQUEST,
         source_central=source_central,
         timestamp=timestamp,
+        data=data
+    )
+
+
+def create_sync_digest_message(
+    source_central: str,
+    level: str,
+    since: str,
+    buckets: Dict[str, list],
+    timestamp: Optional[int] = None
+) -> P2PMessage:
+    """Create SYNC_DIGEST message ({bucket: [count, hash]} ở mức "day" hoặc "hour")"""
+    return P2PMessage(
+        msg_type=MessageType.SYNC_DIGEST,
+        source_central=source_central,
+        timestamp=timestamp,
         data={
-            "since_timestamp": since_timestamp
+            "level": level,
+            "since": since,
+            "buckets": buckets
         }
     )
 
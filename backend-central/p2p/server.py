@@ -7,6 +7,7 @@ import json
 from typing import Set, Callable
 from datetime import datetime
 
+from . import codec as wire_codec
 from .protocol import P2PMessage, validate_message
 
 
@@ -74,11 +75,10 @@ class P2PServer:
         finally:
             self.clients.discard(websocket)
 
-    async def _process_message(self, message: str, websocket: websockets.WebSocketServerProtocol):
-        """Process incoming message from peer"""
+    async def _process_message(self, message, websocket: websockets.WebSocketServerProtocol):
+        """Process incoming message from peer (text JSON hoặc binary frame)"""
         try:
-            # Parse JSON
-            data = json.loads(message)
+            data = wire_codec.decode(message)
 
             # Validate message
             is_valid, error = validate_message(data)
@@ -94,9 +94,9 @@ class P2PServer:
             if self.on_message:
                 await self.on_message(p2p_msg)
 
-        except json.JSONDecodeError as e:
-            print(f"Invalid JSON from peer: {e}")
-            await self._send_error(websocket, "Invalid JSON")
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"Invalid frame from peer: {e}")
+            await self._send_error(websocket, "Invalid frame")
 
         except Exception as e:
             print(f"Error processing P2P message: {e}")
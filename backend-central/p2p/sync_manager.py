@@ -1,31 +1,48 @@
 """
 P2P Sync Manager - Handle sync on reconnect
 
-Khi peer reconnect sau khi offline:
-1. Track last_sync_time với mỗi peer
-2. Send SYNC_REQUEST với since_timestamp
-3. Peer gửi lại SYNC_RESPONSE với missed events
-4. Merge events vào local DB
+Khi peer reconnect sau khi offline (digest / anti-entropy):
+1. Send SYNC_DIGEST mức ngày: {ngày: [count, hash]} của history trong P2P_SYNC_DIGEST_DAYS ngày
+2. Peer so với digest của mình, trả SYNC_DIGEST mức giờ cho các ngày bị lệch (rỗng = đã khớp)
+3. So các giờ, send SYNC_REQUEST chỉ cho các giờ bị lệch, kèm {event_id: hash} mình đã có
+4. Peer gửi lại SYNC_RESPONSE chỉ với các event mình thiếu / khác trạng thái → merge vào local DB
+
+Chi phí reconnect tỉ lệ với số event bị lệch, không phải với độ dài history.
+Peer cũ không hiểu SYNC_DIGEST → sau P2P_SYNC_DIGEST_TIMEOUT giây fallback SYNC_REQUEST theo timestamp.
 """
+import asyncio
 import sqlite3
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from .protocol import (
     P2PMessage,
     MessageType,
     create_sync_request_message,
-    create_sync_response_message
+    create_sync_response_message,
+    create_sync_digest_message
 )
 
+# So event toi da trong 1 SYNC_RESPONSE (nhu gioi han cua sync theo timestamp)
+SYNC_RESPONSE_PAGE_SIZE = 5000
+# So event merge trong 1 transaction (giu writer thread khong qua lau, edge event van duoc ghi xen ke)
+SYNC_MERGE_PAGE_SIZE = 1000
+
 
 class P2PSyncManager:
     """Manager cho sync logic"""
 
-    def __init__(self, database, p2p_manager, central_id: str):
+    def __init__(self, database, p2p_manager, central_id: str, digest_days: Optional[int] = None,
+                 digest_timeout: Optional[float] = None):
+        import config
         self.db = database
         self.p2p_manager = p2p_manager
         self.central_id = central_id
+        self.digest_days = digest_days or getattr(config, "P2P_SYNC_DIGEST_DAYS", 30)
+        self.digest_timeout = digest_timeout or getattr(config, "P2P_SYNC_DIGEST_TIMEOUT", 10.0)
+
+        # peer_id -> task fallback (cho SYNC_DIGEST muc gio tu peer)
+        self._pending_digests: Dict[str, asyncio.Task] = {}
 
     def get_last_sync_timestamp(self, peer_id: str) -> int:
         """
@@ -63,34 +80,75 @@ class P2PSyncManager:
     def update_last_sync_timestamp(self, peer_id: str, timestamp_ms: int):
         """Update last sync timestamp với peer"""
         try:
-            with self.db.lock:
-                conn = sqlite3.connect(self.db.db_file)
-                cursor = conn.cursor()
-
-                cursor.execute(
-                    """
-                    INSERT INTO p2p_sync_state (peer_central_id, last_sync_timestamp, last_sync_time, updated_at)
-                    VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                    ON CONFLICT(peer_central_id) DO UPDATE SET
-                        last_sync_timestamp = excluded.last_sync_timestamp,
-                        last_sync_time = CURRENT_TIMESTAMP,
-                        updated_at = CURRENT_TIMESTAMP
-                    """,
-                    (peer_id, timestamp_ms)
-                )
-
-                conn.commit()
-                conn.close()
-
-                print(f"Updated last sync timestamp for {peer_id}: {timestamp_ms}")
+            self.db.run_write(lambda cursor: cursor.execute(
+                """
+                INSERT INTO p2p_sync_state (peer_central_id, last_sync_timestamp, last_sync_time, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ON CONFLICT(peer_central_id) DO UPDATE SET
+                    last_sync_timestamp = excluded.last_sync_timestamp,
+                    last_sync_time = CURRENT_TIMESTAMP,
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                (peer_id, timestamp_ms)
+            ))
+
+            print(f"Updated last sync timestamp for {peer_id}: {timestamp_ms}")
 
         except Exception as e:
             print(f"Error updating last sync timestamp: {e}")
 
+    def _digest_since(self) -> str:
+        """entry_time nhỏ nhất nằm trong cửa sổ digest"""
+        return (datetime.now() - timedelta(days=self.digest_days)).strftime('%Y-%m-%d')
+
     async def request_sync_from_peer(self, peer_id: str):
         """
         Request sync từ peer khi reconnect
 
+        Flow:
+        1. Send SYNC_DIGEST mức ngày
+        2. Peer chưa trả digest mức giờ sau digest_timeout giây (peer cũ) → SYNC_REQUEST theo timestamp
+        """
+        try:
+            since = self._digest_since()
+            buckets = await asyncio.to_thread(self.db.get_sync_digest, "day", since)
+
+            message = create_sync_digest_message(
+                source_central=self.central_id,
+                level="day",
+                since=since,
+                buckets=buckets
+            )
+
+            if not await self.p2p_manager.send_to_peer(peer_id, message):
+                print(f"Failed to send SYNC_DIGEST to {peer_id}")
+                return
+
+            print(f"Sent SYNC_DIGEST to {peer_id} ({len(buckets)} days since {since})")
+            self._cancel_digest_fallback(peer_id)
+            self._pending_digests[peer_id] = asyncio.create_task(self._digest_fallback(peer_id))
+
+        except Exception as e:
+            print(f"Error requesting digest sync from {peer_id}: {e}")
+            import traceback
+            traceback.print_exc()
+
+    async def _digest_fallback(self, peer_id: str):
+        await asyncio.sleep(self.digest_timeout)
+        if self._pending_digests.get(peer_id) is asyncio.current_task():
+            del self._pending_digests[peer_id]
+            print(f"No SYNC_DIGEST reply from {peer_id}, falling back to timestamp sync")
+            await self.request_timestamp_sync_from_peer(peer_id)
+
+    def _cancel_digest_fallback(self, peer_id: str):
+        task = self._pending_digests.pop(peer_id, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
+
+    async def request_timestamp_sync_from_peer(self, peer_id: str):
+        """
+        Request sync theo timestamp (peer cũ không hỗ trợ digest)
+
         Flow:
         1. Get last_sync_timestamp
         2. Send SYNC_REQUEST
@@ -118,24 +176,85 @@ class P2PSyncManager:
             import traceback
             traceback.print_exc()
 
+    async def handle_sync_digest(self, message: P2PMessage, from_peer_id: str):
+        """
+        Handle SYNC_DIGEST từ peer
+
+        - Mức "day"  (peer đang xin sync): trả digest mức giờ của các ngày lệch (rỗng = đã khớp)
+        - Mức "hour" (trả lời digest mình gửi): xin các giờ lệch bằng SYNC_REQUEST kèm hash đã có
+        """
+        try:
+            level = message.data.get("level")
+            since = message.data.get("since")
+            remote = message.data.get("buckets") or {}
+
+            if level == "day":
+                local = await asyncio.to_thread(self.db.get_sync_digest, "day", since)
+                days = [day for day in set(local) | set(remote) if local.get(day) != remote.get(day)]
+                hours = await asyncio.to_thread(self.db.get_sync_digest, "hour", None, days) if days else {}
+
+                print(f"SYNC_DIGEST from {from_peer_id}: {len(days)} day(s) differ")
+                await self.p2p_manager.send_to_peer(from_peer_id, create_sync_digest_message(
+                    source_central=self.central_id,
+                    level="hour",
+                    since=since,
+                    buckets=hours
+                ))
+
+            elif level == "hour":
+                self._cancel_digest_fallback(from_peer_id)
+                days = sorted({hour[:10] for hour in remote})
+                local = await asyncio.to_thread(self.db.get_sync_digest, "hour", None, days) if days else {}
+                # Chi xin gio peer co du lieu khac minh (gio chi minh co → peer se tu xin khi sync chieu nguoc lai)
+                hours = sorted(hour for hour, value in remote.items() if local.get(hour) != value)
+
+                if not hours:
+                    print(f"In sync with {from_peer_id} (digest match)")
+                    now_ms = int(datetime.now().timestamp() * 1000)
+                    self.update_last_sync_timestamp(from_peer_id, now_ms)
+                    return
+
+                known = await asyncio.to_thread(self.db.get_sync_fingerprints, hours)
+                print(f"Requesting {len(hours)} hour bucket(s) from {from_peer_id}")
+                await self.p2p_manager.send_to_peer(from_peer_id, create_sync_request_message(
+                    source_central=self.central_id,
+                    since_timestamp=0,
+                    buckets=hours,
+                    known=known
+                ))
+
+            else:
+                print(f"Unknown SYNC_DIGEST level from {from_peer_id}: {level}")
+
+        except Exception as e:
+            print(f"Error handling SYNC_DIGEST: {e}")
+            import traceback
+            traceback.print_exc()
+
     async def handle_sync_request(self, message: P2PMessage, from_peer_id: str):
         """
         Handle SYNC_REQUEST từ peer
 
         Peer hỏi: "Cho tôi tất cả events từ timestamp X"
+        hoặc (digest sync): "Cho tôi các event trong các bucket giờ này, trừ các event tôi đã có"
 
         Flow:
-        1. Get events since timestamp
+        1. Get events since timestamp / trong các bucket
         2. Convert to serializable format
         3. Send SYNC_RESPONSE
         """
         try:
             since_timestamp = message.data.get("since_timestamp", 0)
+            buckets = message.data.get("buckets")
 
-            print(f"Received SYNC_REQUEST from {from_peer_id} (since {since_timestamp})")
+            if buckets is not None:
+                print(f"Received SYNC_REQUEST from {from_peer_id} ({len(buckets)} hour buckets)")
+                events = await asyncio.to_thread(self.db.get_sync_rows, buckets, message.data.get("known"))
+            else:
+                print(f"Received SYNC_REQUEST from {from_peer_id} (since {since_timestamp})")
 
-            # Get events since timestamp
-            events = self.db.get_events_since(since_timestamp, limit=5000)
+                # Get events since timestamp
+                events = self.db.get_events_since(since_timestamp, limit=5000)
 
             # Convert events to serializable format
             serialized_events = []
@@ -150,13 +269,14 @@ class P2PSyncManager:
 
             print(f"Sending {len(serialized_events)} events to {from_peer_id}")
 
-            # Send SYNC_RESPONSE
-            response = create_sync_response_message(
-                source_central=self.central_id,
-                events=serialized_events
-            )
+            # Send SYNC_RESPONSE (chia trang de 1 message khong qua lon)
+            for start in range(0, max(len(serialized_events), 1), SYNC_RESPONSE_PAGE_SIZE):
+                response = create_sync_response_message(
+                    source_central=self.central_id,
+                    events=serialized_events[start:start + SYNC_RESPONSE_PAGE_SIZE]
+                )
 
-            await self.p2p_manager.send_to_peer(from_peer_id, response)
+                await self.p2p_manager.send_to_peer(from_peer_id, response)
 
             print(f"Sent SYNC_RESPONSE to {from_peer_id}")
 
@@ -188,61 +308,20 @@ class P2PSyncManager:
                 self.update_last_sync_timestamp(from_peer_id, now_ms)
                 return
 
-            # Merge events
+            # Merge events: moi trang 1 transaction (1 query kiem tra ton tai cho ca trang)
             merged_count = 0
             skipped_count = 0
 
-            for event in events:
-                event_id = event.get("event_id")
-
-                if not event_id:
-                    # Old event without event_id, skip
-                    skipped_count += 1
-                    continue
-
-                # Check if already exists
-                if self.db.event_exists(event_id):
-                    skipped_count += 1
-                    continue
-
-                # Insert event
+            for start in range(0, len(events), SYNC_MERGE_PAGE_SIZE):
+                page = events[start:start + SYNC_MERGE_PAGE_SIZE]
                 try:
-                    # Determine if it's entry or exit based on status
-                    status = event.get("status", "IN")
-
-                    if status == "IN" or not event.get("exit_time"):
-                        # Entry event
-                        self.db.add_vehicle_entry_p2p(
-                            event_id=event_id,
-                            source_central=event.get("source_central", from_peer_id),
-                            edge_id=event.get("edge_id", "unknown"),
-                            plate_id=event.get("plate_id"),
-                            plate_view=event.get("plate_view", event.get("plate_id")),
-                            entry_time=event.get("entry_time"),
-                            camera_id=event.get("entry_camera_id"),
-                            camera_name=event.get("entry_camera_name", "unknown"),
-                            confidence=event.get("entry_confidence", 0.0),
-                            source="sync"
-                        )
-                        merged_count += 1
-
-                    if status == "OUT" and event.get("exit_time"):
-                        # Has exit info, update
-                        self.db.update_vehicle_exit_p2p(
-                            event_id=event_id,
-                            exit_time=event.get("exit_time"),
-                            camera_id=event.get("exit_camera_id"),
-                            camera_name=event.get("exit_camera_name", "unknown"),
-                            confidence=event.get("exit_confidence", 0.0),
-                            source="sync",
-                            duration=event.get("duration", ""),
-                            fee=event.get("fee", 0)
-                        )
-
+                    merged, skipped = await asyncio.to_thread(self.db.merge_sync_events, page, from_peer_id)
                 except Exception as e:
-                    print(f"Error merging event {event_id}: {e}")
-                    skipped_count += 1
-                    continue
+                    # Trang loi (vd: dong thieu cot bat buoc) → transaction da rollback, merge tung event
+                    print(f"Batch merge failed ({e}), merging {len(page)} events one by one")
+                    merged, skipped = await asyncio.to_thread(self._merge_events_one_by_one, page, from_peer_id)
+                merged_count += merged
+                skipped_count += skipped
 
             print(f"Merged {merged_count} events, skipped {skipped_count}")
 
@@ -255,6 +334,77 @@ class P2PSyncManager:
             import traceback
             traceback.print_exc()
 
+    def _merge_events_one_by_one(self, events: List[Dict], from_peer_id: str):
+        """Merge từng event (mỗi event 1 transaction) - fallback khi batch merge lỗi"""
+        merged_count = 0
+        skipped_count = 0
+
+        for event in events:
+            event_id = event.get("event_id")
+
+            if not event_id:
+                # Old event without event_id, skip
+                skipped_count += 1
+                continue
+
+            # Check if already exists
+            if self.db.event_exists(event_id):
+                # Da co nhung minh con IN, peer da OUT → ap dung exit (update chi tac dong dong IN)
+                if event.get("status") == "OUT" and event.get("exit_time") and self.db.update_vehicle_exit_p2p(
+                    event_id=event_id,
+                    exit_time=event.get("exit_time"),
+                    camera_id=event.get("exit_camera_id"),
+                    camera_name=event.get("exit_camera_name", "unknown"),
+                    confidence=event.get("exit_confidence", 0.0),
+                    source="sync",
+                    duration=event.get("duration", ""),
+                    fee=event.get("fee", 0)
+                ):
+                    merged_count += 1
+                else:
+                    skipped_count += 1
+                continue
+
+            # Insert event
+            try:
+                # Determine if it's entry or exit based on status
+                status = event.get("status", "IN")
+
+                # Entry event (event da OUT ben peer cung insert entry truoc roi moi update exit)
+                self.db.add_vehicle_entry_p2p(
+                    event_id=event_id,
+                    source_central=event.get("source_central", from_peer_id),
+                    edge_id=event.get("edge_id", "unknown"),
+                    plate_id=event.get("plate_id"),
+                    plate_view=event.get("plate_view", event.get("plate_id")),
+                    entry_time=event.get("entry_time"),
+                    camera_id=event.get("entry_camera_id"),
+                    camera_name=event.get("entry_camera_name", "unknown"),
+                    confidence=event.get("entry_confidence", 0.0),
+                    source="sync"
+                )
+                merged_count += 1
+
+                if status == "OUT" and event.get("exit_time"):
+                    # Has exit info, update
+                    self.db.update_vehicle_exit_p2p(
+                        event_id=event_id,
+                        exit_time=event.get("exit_time"),
+                        camera_id=event.get("exit_camera_id"),
+                        camera_name=event.get("exit_camera_name", "unknown"),
+                        confidence=event.get("exit_confidence", 0.0),
+                        source="sync",
+                        duration=event.get("duration", ""),
+                        fee=event.get("fee", 0)
+                    )
+
+            except Exception as e:
+                print(f"Error merging event {event_id}: {e}")
+                skipped_count += 1
+                continue
+
+        return merged_count, skipped_count
+
     async def on_peer_connected(self, peer_id: str):
         """
         Callback khi peer connected
@@ -270,6 +420,7 @@ class P2PSyncManager:
 
         Update last known timestamp
         """
+        self._cancel_digest_fallback(peer_id)
         # Update last sync timestamp to now (de lan sau chi sync tu thoi diem nay)
         now_ms = int(datetime.now().timestamp() * 1000)
         self.update_last_sync_timestamp(peer_id, now_ms)
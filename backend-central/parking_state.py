@@ -5,6 +5,7 @@ from datetime import datetime
 import re
 import json
 import os
+import sqlite3
 import requests
 
 
@@ -58,7 +59,7 @@ class ParkingStateManager:
         self._fees_cache = None
         self._fees_cache_time = None
 
-    def process_edge_event(self, event_type, camera_id, camera_name, camera_type, data, event_id=None):
+    def process_edge_event(self, event_type, camera_id, camera_name, camera_type, data, event_id=None, db=None):
         """
         Process event từ Edge camera
 
@@ -68,7 +69,14 @@ class ParkingStateManager:
             camera_name: Camera name
             camera_type: "ENTRY" | "EXIT"
             data: Event data (plate_text, confidence, source, etc.)
+            db: CentralWriteBatch khi xử lý trong batch. Nếu không truyền thì cả event
+                (log + kiểm tra xe trong bãi + ghi history) chạy atomic trên writer thread
         """
+        if db is None:
+            return self.submit_edge_event(
+                event_type, camera_id, camera_name, camera_type, data, event_id=event_id, dedupe=False
+            ).result()
+
         plate_text = data.get('plate_text', '').strip().upper()
         confidence = data.get('confidence', 0.0)
         source = data.get('source', 'manual')
@@ -82,7 +90,7 @@ class ParkingStateManager:
             }
 
         # Log event to database
-        self.db.add_event(
+        db.add_event(
             event_type=event_type,
             camera_id=camera_id,
             camera_name=camera_name,
@@ -103,6 +111,7 @@ class ParkingStateManager:
                 source,
                 event_id=event_id,
                 edge_id=data.get('edge_id'),
+                db=db,
             )
         elif event_type == "EXIT":
             return self._process_exit(
@@ -112,15 +121,72 @@ class ParkingStateManager:
                 camera_name,
                 confidence,
                 source,
-                event_id=event_id
+                event_id=event_id,
+                db=db,
             )
         else:
             return {"success": False, "error": f"Unknown event type: {event_type}"}
 
-    def _process_entry(self, plate_id, plate_view, camera_id, camera_name, confidence, source, event_id=None, edge_id=None):
+    def process_edge_events_batch(self, events):
+        """
+        Process nhiều event từ Edge theo đúng thứ tự, trong 1 transaction
+
+        Args:
+            events: list dict (event_type, camera_id, camera_name, camera_type, data, event_id)
+
+        Return: list result (cùng format process_edge_event), theo thứ tự events.
+        event_id đã có (kiểm tra ngay trong transaction, như submit_edge_event) hoặc lặp lại
+        trong chính batch → {"success": True, "deduped": True}.
+        Event lỗi nghiệp vụ (xe đã trong bãi, không có record vào...) chỉ trả về
+        success=False cho event đó; lỗi DB (sqlite3.Error) thì rollback cả batch và raise.
+        """
+        # Load fees truoc khi vao writer thread (tranh goi API trong transaction)
+        self._get_fees()
+
+        def apply(batch):
+            existing = batch.existing_event_ids(event.get("event_id") for event in events)
+            results = []
+            for event in events:
+                event_id = event.get("event_id")
+                if event_id and event_id in existing:
+                    results.append({"success": True, "deduped": True, "event_id": event_id})
+                    continue
+                results.append(self.process_edge_event(db=batch, **event))
+                if event_id:
+                    existing.add(event_id)
+            return results
+
+        return self.db.run_batch(apply)
+
+    def submit_edge_event(self, event_type, camera_id, camera_name, camera_type, data, event_id=None, dedupe=True):
+        """
+        Đưa 1 event vào group commit của database, không block caller
+
+        dedupe=True: kiểm tra event_id ngay trong transaction → 2 request trùng event_id
+        đến cùng lúc cũng chỉ ghi 1 lần.
+
+        Return: concurrent.futures.Future của result (cùng format process_edge_event,
+        thêm {"success": True, "deduped": True} nếu event_id đã có). Async handler dùng
+        await asyncio.wrap_future(...) để các edge ghi song song được gom chung 1 commit.
+        """
+        # Load fees truoc khi vao writer thread (tranh goi API trong transaction)
+        self._get_fees()
+
+        def apply(batch):
+            if dedupe and event_id and batch.event_exists(event_id):
+                return {"success": True, "deduped": True, "event_id": event_id}
+            return self.process_edge_event(
+                event_type, camera_id, camera_name, camera_type, data, event_id=event_id, db=batch
+            )
+
+        return self.db.submit_batch(apply)
+
+    def _process_entry(self, plate_id, plate_view, camera_id, camera_name, confidence, source, event_id=None, edge_id=None,
+                       db=None):
         """Process vehicle entry"""
+        db = db or self.db
         # Chống lặp: nếu xe đang IN chưa ra thì không thêm bản ghi mới
-        existing = self.db.find_vehicle_in_parking(plate_id)
+        existing = db.find_vehicle_in_parking(plate_id)
         if existing:
             return {
                 "success": False,
@@ -133,7 +199,7 @@ class ParkingStateManager:
         # Add entry
         entry_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         try:
-            history_id = self.db.add_vehicle_entry(
+            history_id = db.add_vehicle_entry(
                 plate_id=plate_id,
                 plate_view=plate_view,
                 entry_time=entry_time,
@@ -164,15 +230,19 @@ class ParkingStateManager:
                     "error": f"Không thể lưu xe {plate_view} vào database"
                 }
         except Exception as e:
+            # Trong write batch: de loi DB len → writer rollback SAVEPOINT cua ca batch
+            if isinstance(e, sqlite3.Error) and db is not self.db:
+                raise
             return {
                 "success": False,
                 "error": str(e)
             }
 
-    def _process_exit(self, plate_id, plate_view, camera_id, camera_name, confidence, source, event_id=None):
+    def _process_exit(self, plate_id, plate_view, camera_id, camera_name, confidence, source, event_id=None, db=None):
         """Process vehicle exit"""
+        db = db or self.db
         # Find entry record
-        entry = self.db.find_vehicle_in_parking(plate_id)
+        entry = db.find_vehicle_in_parking(plate_id)
         if not entry:
             return {
                 "success": False,
@@ -193,7 +263,7 @@ class ParkingStateManager:
         duration, fee = self._calculate_fee(entry['entry_time'], exit_time)
 
         # Update exit
-        self.db.update_vehicle_exit(
+        db.update_vehicle_exit(
             plate_id=plate_id,
             exit_time=exit_time,
             camera_id=camera_id,
@@ -256,14 +326,7 @@ class ParkingStateManager:
         minutes = int((duration_hours - hours) * 60)
         duration_str = f"{hours} giờ {minutes} phút"
 
-        # Load parking fees tu API/file JSON (cache 60 giay)
-        now = datetime.now()
-        if self._fees_cache is None or \
-           (self._fees_cache_time and (now - self._fees_cache_time).total_seconds() > 60):
-            self._fees_cache = _load_parking_fees()
-            self._fees_cache_time = now
-        
-        fees = self._fees_cache
+        fees = self._get_fees()
         free_hours = fees.get("fee_base", 0.5) or 0
         hourly_fee = fees.get("fee_per_hour", 25000) or 0
 
@@ -276,6 +339,19 @@ class ParkingStateManager:
 
         return duration_str, fee
 
+    def _get_fees(self):
+        """Load parking fees tu API/file JSON (cache 60 giay)"""
+        now = datetime.now()
+        if self._fees_cache is None or \
+           (self._fees_cache_time and (now - self._fees_cache_time).total_seconds() > 60):
+            self._fees_cache = _load_parking_fees()
+            self._fees_cache_time = now
+        return self._fees_cache
+
+    def iter_vehicles_in_parking(self, chunk_size=500):
+        """Generator xe đang trong bãi (stream cho /api/parking/state)"""
+        return self.db.iter_vehicles_in_parking(chunk_size)
+
     def get_parking_state(self):
         """Get current parking state"""
         vehicles = self.db.get_vehicles_in_parking()
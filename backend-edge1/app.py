@@ -4,7 +4,7 @@ Main FastAPI Application
 from typing import Set
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, PlainTextResponse
 from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
 from av import VideoFrame
 import uvicorn
@@ -23,9 +23,11 @@ from detection_service import DetectionService
 from ocr_service import OCRService
 from websocket_manager import WebSocketManager
 from parking_manager import ParkingManager
+from database import encode_history_cursor
 from barrier_controller import BarrierController
 from central_sync import CentralSyncService
 from config_manager import ConfigManager
+import metrics
 
 # FastAPI App
 app = FastAPI(title="License Plate Detection API")
@@ -286,11 +288,14 @@ async def startup():
 
 @app.on_event("shutdown")
 async def shutdown():
-    global camera_manager, detection_service, barrier_controller
+    global camera_manager, detection_service, barrier_controller, parking_manager
 
     if detection_service:
         detection_service.stop()
 
+    if parking_manager:
+        parking_manager.stop()
+
     if camera_manager:
         camera_manager.stop()
 
@@ -327,10 +332,37 @@ async def status():
         "ocr_status": _ocr_state(),
         "model": config.MODEL_PATH.split("/")[-1],
         "active_ws": len(websocket_manager.active_connections),
-        "active_webrtc": len(pcs)
+        "active_webrtc": len(pcs),
+        "central_sync": central_sync.get_status() if central_sync else None
     }
 
 
+# Prometheus metrics - gauge tinh luc scrape (doc global hien tai, service co the chua khoi tao)
+def _queue_size(name):
+    queue = getattr(camera_manager, name, None) if camera_manager else None
+    return queue.qsize() if queue is not None else 0
+
+
+_registry = metrics.get_metrics()
+_camera_queue_size = _registry.gauge("edge_camera_queue_size", "Frames waiting in a camera queue", ["queue"])
+_camera_queue_size.labels("raw").set_function(lambda: _queue_size("raw_frame_queue"))
+_camera_queue_size.labels("detection").set_function(lambda: _queue_size("frame_queue"))
+_camera_queue_size.labels("annotated").set_function(lambda: _queue_size("annotated_frame_queue"))
+_registry.gauge("edge_detection_fps", "Detection loop frames in the last second").set_function(
+    lambda: detection_service.fps if detection_service else 0)
+_registry.gauge("edge_webrtc_peers", "Active WebRTC peer connections").set_function(lambda: len(pcs))
+_ws_channel_clients = _registry.gauge("edge_ws_channel_clients", "Connected WebSocket clients per channel",
+                                      ["channel"])
+_ws_channel_clients.labels("history").set_function(lambda: len(history_websocket_clients))
+_ws_channel_clients.labels("cameras").set_function(lambda: len(camera_websocket_clients))
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Metrics dạng Prometheus text exposition format"""
+    return PlainTextResponse(_registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
 # MJPEG Streaming (for PyQt6 Desktop App)
 
 # Cache de broadcast frames den nhieu clients ma chi encode 1 lan
@@ -635,6 +667,77 @@ async def get_stats():
         }, status_code=500)
 
 
+STREAM_CHUNK_ROWS = 500
+
+
+def iter_json_rows(rows, ndjson=False):
+    """
+    Serialize từng dòng (dict) → các chunk str, gom STREAM_CHUNK_ROWS dòng / chunk
+
+    ndjson=False: các dòng cách nhau bởi dấu phẩy (phần thân của 1 JSON array)
+    ndjson=True: mỗi dòng 1 JSON object + newline
+    """
+    chunk = []
+    first = True
+    for row in rows:
+        chunk.append(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+        if len(chunk) >= STREAM_CHUNK_ROWS:
+            yield _join_json_rows(chunk, first, ndjson)
+            first = False
+            chunk = []
+    if chunk:
+        yield _join_json_rows(chunk, first, ndjson)
+
+
+def _join_json_rows(chunk, first, ndjson):
+    if ndjson:
+        return "\n".join(chunk) + "\n"
+    return ("" if first else ",") + ",".join(chunk)
+
+
+def stream_json_response(head: dict, key: str, rows, ndjson=False):
+    """
+    StreamingResponse cho rows (generator) - bộ nhớ không phụ thuộc số dòng
+
+    JSON (mặc định): {**head, key: [...]}
+    NDJSON (ndjson=True): mỗi dòng 1 object, không có head
+    Generator đồng bộ → Starlette chạy trong threadpool, không chặn event loop khi đọc DB
+    """
+    if ndjson:
+        return StreamingResponse(iter_json_rows(rows, ndjson=True), media_type="application/x-ndjson")
+
+    def body():
+        # Ghi head roi mo array: {"success":true,...,"<key>":[
+        head_json = json.dumps(head or {}, ensure_ascii=False, separators=(",", ":"))[:-1]
+        yield head_json + ("," if head else "") + json.dumps(key) + ":["
+        yield from iter_json_rows(rows)
+        yield "]}"
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
+@app.get("/api/export")
+async def export_entries(format: str = Query(default="json")):
+    """
+    Export toàn bộ entries (stream theo chunk, không dựng cả list trong RAM)
+
+    format=json: {"success": true, "entries": [...]}
+    format=ndjson: mỗi dòng 1 entry (application/x-ndjson)
+    """
+    global parking_manager
+
+    if not parking_manager:
+        return JSONResponse({
+            "success": False,
+            "error": "Parking manager not initialized"
+        }, status_code=503)
+
+    entries = parking_manager.db.iter_export()
+    if format == "ndjson":
+        return stream_json_response(None, "entries", entries, ndjson=True)
+    return stream_json_response({"success": True}, "entries", entries)
+
+
 @app.get("/api/parking/occupancy")
 async def get_parking_occupancy():
     """
@@ -950,19 +1053,21 @@ async def get_parking_history(
     status: str = None,
     search: str = None,
     in_parking_only: bool = False,
-    entries_only: bool = False
+    entries_only: bool = False,
+    cursor: str = None
 ):
     """
     Get parking history (compatible với Central API)
 
     Args:
         limit: Số records
-        offset: Skip N records
+        offset: Skip N records (client cũ; bỏ qua nếu có cursor)
         today_only: Chỉ lấy hôm nay
         status: Filter theo status (IN | OUT)
         search: Search theo plate_id hoặc plate_view
         in_parking_only: Chỉ lấy xe đang trong bãi (status='IN' và exit_time IS NULL)
         entries_only: Lấy tất cả các lần vào (không filter thêm)
+        cursor: Keyset cursor lấy từ next_cursor của trang trước
     """
     global parking_manager
 
@@ -974,7 +1079,8 @@ async def get_parking_history(
             status=status,
             search=search,
             in_parking_only=in_parking_only,
-            entries_only=entries_only
+            entries_only=entries_only,
+            page_cursor=cursor
         )
         stats = parking_manager.db.get_stats()
 
@@ -982,8 +1088,14 @@ async def get_parking_history(
             "success": True,
             "count": len(history),
             "stats": stats,
-            "history": history
+            "history": history,
+            "next_cursor": encode_history_cursor(history[-1]) if history and len(history) == limit else None
         })
+    except ValueError as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=400)
     except Exception as e:
         return JSONResponse({
             "success": False,
@@ -1585,6 +1697,11 @@ async def update_parking_fees(request: Request):
         # Ghi vao file JSON
         with open(json_path, 'w', encoding='utf-8') as f:
             json.dump(fees_dict, f, ensure_ascii=False, indent=2)
+
+        # Bao parking_manager reload fee table (background, khong block request)
+        global parking_manager
+        if parking_manager:
+            parking_manager.request_fee_reload()
         
         return JSONResponse({
             "success": True,
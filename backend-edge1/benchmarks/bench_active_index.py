@@ -0,0 +1,193 @@
+"""
+Benchmark + consistency check: in-memory active vehicles index cua Database
+
+1. Consistency: chay chuoi thao tac ngau nhien (entry, exit, location update,
+   sua/xoa history, sync tu central, clear_old_data) va sau moi buoc so sanh
+   ket qua index voi query SQLite truc tiep. Cuoi cung mo lai DB (rebuild tu disk)
+   va so sanh lan nua.
+2. Latency: find_entry_in / find_vehicle_in_parking / get_vehicles_at_location
+   qua index so voi query SQLite cu.
+
+Usage:
+    python benchmarks/bench_active_index.py [--ops 2000] [--history 50000] [--parked 300]
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+LOCATIONS = ["Bãi A", "Bãi B", "Bãi C"]
+
+
+def sql_find_entry_in(db, plate_id):
+    conn = db._get_connection()
+    row = conn.execute("""
+        SELECT * FROM entries WHERE plate_id = ? AND status = 'IN'
+        ORDER BY entry_time DESC, id DESC LIMIT 1
+    """, (plate_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def sql_vehicle_ids_at_location(db, location):
+    conn = db._get_connection()
+    rows = conn.execute(
+        "SELECT id FROM entries WHERE last_location = ? AND status = 'IN'", (location,)
+    ).fetchall()
+    conn.close()
+    return sorted(row[0] for row in rows)
+
+
+def check_consistent(db, plates):
+    for plate_id in plates:
+        expected = sql_find_entry_in(db, plate_id)
+        actual = db.find_entry_in(plate_id)
+        assert expected == actual, f"find_entry_in({plate_id}): {expected} != {actual}"
+
+        vehicle = db.find_vehicle_in_parking(plate_id)
+        assert (vehicle["id"] if vehicle else None) == (expected["id"] if expected else None)
+
+    for location in LOCATIONS:
+        expected = sql_vehicle_ids_at_location(db, location)
+        actual = sorted(v["id"] for v in db.get_vehicles_at_location(location))
+        assert expected == actual, f"get_vehicles_at_location({location}): {expected} != {actual}"
+
+
+def run_consistency(ops, seed=42):
+    rng = random.Random(seed)
+    db_file = os.path.join(tempfile.mkdtemp(prefix="bench_idx_"), "parking.db")
+    db = Database(db_file)
+    plates = [f"30A{i:05d}" for i in range(40)]
+    now = datetime.now()
+
+    for step in range(ops):
+        op = rng.random()
+        plate_id = rng.choice(plates)
+        ts = (now - timedelta(minutes=rng.randint(0, 60 * 24 * 40))).strftime("%Y-%m-%d %H:%M:%S")
+
+        if op < 0.30:
+            db.add_entry_with_event_id(f"ev_{step}", plate_id, plate_id, ts, 1, "Gate", 0.9, "auto")
+        elif op < 0.40:
+            db.add_entry(plate_id, plate_id, 1, "Gate", 0.9, "manual", event_id=f"ev_{step}")
+        elif op < 0.55:
+            entry = db.find_entry_in(plate_id)
+            if entry:
+                db.update_exit(entry["id"], 2, "Exit", 0.9, "auto", "1 giờ", 25000)
+        elif op < 0.62:
+            entry = db.find_entry_in(plate_id)
+            if entry and entry.get("event_id"):
+                db.update_exit_by_event_id(entry["event_id"], ts, None, "Remote", 0.0, "central_sync", "", 0)
+        elif op < 0.75:
+            if db.find_vehicle_in_parking(plate_id):
+                db.update_vehicle_location(plate_id, rng.choice(LOCATIONS), ts)
+            else:
+                db.create_entry_from_parking_lot(f"ev_{step}", plate_id, plate_id, ts,
+                                                 "Lot", rng.choice(LOCATIONS), ts)
+        elif op < 0.85:
+            entry = db.find_entry_in(plate_id)
+            if entry:
+                new_plate = rng.choice(plates)
+                db.update_history_entry(entry["id"], new_plate, new_plate)
+        elif op < 0.95:
+            entry = db.find_entry_in(plate_id)
+            if entry:
+                db.delete_history_entry(entry["id"])
+        elif op < 0.97:
+            db.clear_old_data(days=rng.randint(5, 35))
+        check_consistent(db, plates)
+
+    # Rebuild tu disk phai cho ket qua giong het
+    reopened = Database(db_file)
+    for plate_id in plates:
+        assert reopened.find_entry_in(plate_id) == db.find_entry_in(plate_id)
+    for location in LOCATIONS:
+        assert reopened.get_vehicles_at_location(location) == db.get_vehicles_at_location(location)
+
+
+def time_per_call(fn, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - start) / len(args_list) * 1e6
+
+
+def run_latency(history, parked, lookups):
+    db_file = os.path.join(tempfile.mkdtemp(prefix="bench_idx_"), "parking.db")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        db = Database(db_file)
+
+    conn = db._get_connection()
+    now = datetime.now()
+    rows = []
+    for i in range(history):
+        ts = (now - timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S")
+        status = "IN" if i < parked else "OUT"
+        rows.append((f"ev_{i}", f"30A{i % (parked * 4):05d}", "X", ts, status,
+                     LOCATIONS[i % len(LOCATIONS)], ts))
+    conn.executemany("""
+        INSERT INTO entries (event_id, plate_id, plate_view, entry_time, status,
+                             last_location, last_location_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.close()
+
+    db = Database(db_file)  # rebuild index tu disk
+    plates = [(f"30A{random.randrange(parked * 4):05d}",) for _ in range(lookups)]
+    locs = [(random.choice(LOCATIONS),) for _ in range(lookups // 10)]
+
+    def sql_find_vehicle(plate_id):
+        conn = db._get_connection()
+        conn.execute("""
+            SELECT id, plate_id, plate_view, entry_time, status,
+                   last_location, last_location_time, is_anomaly
+            FROM entries WHERE plate_id = ? AND status = 'IN'
+            ORDER BY entry_time DESC LIMIT 1
+        """, (plate_id,)).fetchone()
+        conn.close()
+
+    def sql_at_location(location):
+        conn = db._get_connection()
+        conn.execute("""
+            SELECT id, plate_id, plate_view, entry_time,
+                   last_location, last_location_time, is_anomaly
+            FROM entries WHERE last_location = ? AND status = 'IN'
+            ORDER BY last_location_time DESC
+        """, (location,)).fetchall()
+        conn.close()
+
+    print(f"history={history} parked={parked} lookups={lookups}")
+    print(f"{'lookup':<26} {'sqlite (us)':>12} {'index (us)':>12}")
+    for name, sql_fn, idx_fn, args in (
+        ("find_entry_in", lambda p: sql_find_entry_in(db, p), db.find_entry_in, plates),
+        ("find_vehicle_in_parking", sql_find_vehicle, db.find_vehicle_in_parking, plates),
+        ("get_vehicles_at_location", sql_at_location, db.get_vehicles_at_location, locs),
+    ):
+        print(f"{name:<26} {time_per_call(sql_fn, args):12.1f} {time_per_call(idx_fn, args):12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--history", type=int, default=50000)
+    parser.add_argument("--parked", type=int, default=300)
+    parser.add_argument("--lookups", type=int, default=5000)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        run_consistency(args.ops)
+    print(f"Consistency OK ({args.ops} random ops)")
+
+    run_latency(args.history, args.parked, args.lookups)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: peak RSS khi export toàn bộ entries - export_to_json (list) vs iter_export (stream)
+
+DB tạm có --rows entries (gần hết đã OUT, ghi bằng SQL trực tiếp). Mỗi mode chạy trong 1 process
+riêng, serialize từng dòng ra JSON và ghi vào /dev/null (giống body /api/export), đo ru_maxrss
+so với RSS ngay trước khi export:
+- list  : json.dumps(export_to_json()) - dựng cả list dict + cả chuỗi JSON (như trước)
+- stream: iter_export() - từng chunk, mỗi dòng json.dumps rồi ghi ngay
+
+Usage:
+    python benchmarks/bench_export_memory.py [--rows 1000000]
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+
+def build(path, rows):
+    Database(path)
+
+    start = datetime.now() - timedelta(days=30)
+
+    def generate():
+        for i in range(rows):
+            entry = start + timedelta(seconds=i * 2)
+            # 1/1000 xe con trong bai (index active nho)
+            out = i % 1000 != 0
+            yield (
+                f"30A{i:07d}", f"30A-{i:07d}", entry.strftime('%Y-%m-%d %H:%M:%S'), 1, "Cổng vào A", 0.93, "auto",
+                (entry + timedelta(hours=2)).strftime('%Y-%m-%d %H:%M:%S') if out else None,
+                2 if out else None, "Cổng ra A" if out else None, 0.91 if out else None, "auto" if out else None,
+                "2 giờ 0 phút" if out else None, 25000 if out else 0, "OUT" if out else "IN",
+            )
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        """
+        INSERT INTO entries (
+            plate_id, plate_view, entry_time, entry_camera_id, entry_camera_name, entry_confidence, entry_source,
+            exit_time, exit_camera_id, exit_camera_name, exit_confidence, exit_source, duration, fee, status
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        generate(),
+    )
+    conn.commit()
+    conn.close()
+
+
+def rss_mb():
+    """RSS hien tai (MB) doc tu /proc"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def measure(mode, path, results):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        db = Database(path)
+    baseline = rss_mb()
+    started = time.perf_counter()
+    rows = 0
+    size = 0
+    with open(os.devnull, "w", encoding="utf-8") as out:
+        if mode == "list":
+            entries = db.export_to_json()
+            rows = len(entries)
+            body = json.dumps({"success": True, "entries": entries}, ensure_ascii=False)
+            size = len(body)
+            out.write(body)
+        else:
+            for row in db.iter_export():
+                line = json.dumps(row, ensure_ascii=False) + "\n"
+                size += len(line)
+                rows += 1
+                out.write(line)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put((mode, baseline, peak, elapsed, size, rows))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_export_"), "parking.db")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        build(path, args.rows)
+
+    print(f"export {args.rows} entries")
+    print(f"{'mode':<7} {'base MB':>8} {'peak MB':>8} {'delta MB':>9} {'seconds':>8} {'body MB':>8} {'rows':>9}")
+    failures = []
+    for mode in ("list", "stream"):
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure, args=(mode, path, results))
+        process.start()
+        mode, baseline, peak, elapsed, size, rows = results.get()
+        process.join()
+        print(f"{mode:<7} {baseline:>8.0f} {peak:>8.0f} {peak - baseline:>9.0f} {elapsed:>8.1f} "
+              f"{size / 1024 / 1024:>8.0f} {rows:>9}")
+        if rows != args.rows:
+            failures.append(f"{mode} exported {rows}/{args.rows} entries")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark: latency _process_exit khi fee server chậm
+
+Chạy 1 fee server local cố tình trả lời chậm (mặc định 2s/request),
+trỏ PARKING_API_URL vào đó rồi đo phân bố latency của _process_exit.
+
+So sánh 2 chế độ:
+- inline: mô phỏng code cũ - cache 60s hết hạn thì load fees ngay trong request
+- table : fee table precomputed, background thread refresh
+
+Usage:
+    python benchmarks/bench_fee_latency.py [--exits 300] [--delay 2.0] [--expire-every 50]
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import parking_manager as pm_module  # noqa: E402
+from parking_manager import ParkingManager  # noqa: E402
+
+
+def start_slow_fee_server(delay):
+    """Fee server local, moi request sleep `delay` giay"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = json.dumps({"fee_base": 0.5, "fee_per_hour": 25000}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def seed_entries(manager, count):
+    """Tao `count` xe dang IN, vao 3 tieng truoc"""
+    entry_time = (datetime.now() - timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S")
+    plates = []
+    for i in range(count):
+        plate_id = f"30A{i:05d}"
+        manager.db.add_entry_with_event_id(
+            event_id=f"bench_{i}", plate_id=plate_id, plate_view=plate_id,
+            entry_time=entry_time, camera_id=1, camera_name="Bench",
+            confidence=0.9, source="bench"
+        )
+        plates.append(plate_id)
+    return plates
+
+
+def percentile(values, p):
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+def run(mode, exits, expire_every):
+    tmp_dir = tempfile.mkdtemp(prefix="bench_fee_")
+    manager = ParkingManager(db_file=os.path.join(tmp_dir, "parking.db"))
+    manager.check_subscription = lambda plate_id: {"is_subscriber": False}
+
+    if mode == "inline":
+        # Mo phong code cu: moi `expire_every` exits thi cache het han → load fees inline
+        manager.stop()
+        original = manager.calculate_fee
+        counter = {"n": 0}
+
+        def inline_calculate_fee(entry_time, exit_time):
+            counter["n"] += 1
+            if counter["n"] % expire_every == 1:
+                fees, source = pm_module._load_parking_fees()
+                manager._fee_table = pm_module.FeeTable.from_fees(fees, source)
+            return original(entry_time, exit_time)
+
+        manager.calculate_fee = inline_calculate_fee
+
+    plates = seed_entries(manager, exits)
+    latencies = []
+    for plate_id in plates:
+        start = time.perf_counter()
+        result = manager._process_exit(plate_id, plate_id, 2, "Exit", 0.9, "bench")
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert result["success"], result
+
+    manager.stop()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exits", type=int, default=300)
+    parser.add_argument("--delay", type=float, default=2.0, help="Do tre fee server (giay)")
+    parser.add_argument("--expire-every", type=int, default=50, help="inline mode: cache het han moi N exits")
+    args = parser.parse_args()
+
+    server = start_slow_fee_server(args.delay)
+    config.PARKING_API_URL = f"http://127.0.0.1:{server.server_address[1]}/fees"
+    config.FEE_REFRESH_INTERVAL = 1
+    # Khong ghi de file fees that cua repo
+    config.PARKING_JSON_FILE = os.path.join(tempfile.mkdtemp(prefix="bench_fee_json_"), "parking_fees.json")
+
+    print(f"Fee server delay: {args.delay}s, exits: {args.exits}")
+    print(f"{'mode':<8} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+    for mode in ("inline", "table"):
+        # Tat log print cua ParkingManager/Database trong luc do
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            lat = run(mode, args.exits, args.expire_every)
+        print(f"{mode:<8} {percentile(lat, 50):9.2f} {percentile(lat, 95):9.2f} "
+              f"{percentile(lat, 99):9.2f} {max(lat):9.2f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
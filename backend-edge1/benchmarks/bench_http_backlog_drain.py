@@ -0,0 +1,165 @@
+"""
+Benchmark: thời gian xả backlog qua HTTP (WebSocket mất) - requests.post từng event vs session pool + batch
+
+Fake Central local (FastAPI/uvicorn, không có /ws/edge → edge chạy HTTP-only):
+- /api/edge/event, /api/edge/events/batch, /api/edge/heartbeat
+- mỗi request chờ thêm --latency-ms (giả lập RTT / xử lý phía central)
+- kiểm tra thứ tự: EXIT của 1 biển số phải tới sau ENTRY
+
+Backlog --events event (nửa ENTRY, nửa EXIT) nằm sẵn trong queue rồi mới start, đo thời gian tới khi gửi hết:
+- legacy      : requests.post mới cho từng event (TCP mới mỗi request, như trước)
+- pooled      : CentralSyncService, session keep-alive, từng event
+- batch c=1   : CentralSyncService, /api/edge/events/batch, 1 lane
+- batch c=N   : CentralSyncService, /api/edge/events/batch, N lane song song
+
+Usage:
+    python benchmarks/bench_http_backlog_drain.py [--events 2000] [--latency-ms 2] [--concurrency 4]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import threading
+import time
+
+import requests
+import uvicorn
+from fastapi import FastAPI, Request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from central_sync import CentralSyncService  # noqa: E402
+
+
+class FakeCentral:
+    def __init__(self, port, latency):
+        self.port = port
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.reset()
+
+        app = FastAPI()
+
+        @app.post("/api/edge/event")
+        async def edge_event(request: Request):
+            event = await request.json()
+            await asyncio.sleep(self.latency)
+            self.record([event], "single")
+            return {"success": True}
+
+        @app.post("/api/edge/events/batch")
+        async def edge_events_batch(request: Request):
+            body = await request.json()
+            await asyncio.sleep(self.latency)
+            self.record(body["events"], "batch")
+            return {"success": True, "count": len(body["events"]),
+                    "results": [{"success": True} for _ in body["events"]]}
+
+        @app.post("/api/edge/heartbeat")
+        async def heartbeat(request: Request):
+            await request.body()
+            return {"success": True}
+
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="critical"))
+        threading.Thread(target=self.server.run, daemon=True).start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+    def reset(self):
+        with self.lock:
+            self.received = 0
+            self.requests = 0
+            self.inside = set()
+            self.order_violations = 0
+
+    def record(self, events, kind):
+        with self.lock:
+            self.requests += 1
+            for event in events:
+                self.received += 1
+                plate = event["data"]["plate_id"]
+                if event["type"] == "ENTRY":
+                    self.inside.add(plate)
+                elif plate in self.inside:
+                    self.inside.discard(plate)
+                else:
+                    self.order_violations += 1
+
+
+def make_backlog(count):
+    events = []
+    for i in range(count // 2):
+        events.append(("ENTRY", {"plate_text": f"30A{i:05d}", "confidence": 0.9, "source": "auto"}))
+        # EXIT cua xe truoc do vai xe → cac lane xen ke nhau
+        if i >= 5:
+            events.append(("EXIT", {"plate_text": f"30A{i - 5:05d}", "confidence": 0.9, "source": "auto"}))
+    for i in range(max(0, count // 2 - 5), count // 2):
+        events.append(("EXIT", {"plate_text": f"30A{i:05d}", "confidence": 0.9, "source": "auto"}))
+    return events
+
+
+def wait_drained(central, total, timeout=300):
+    deadline = time.monotonic() + timeout
+    while central.received < total and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def run_legacy(central, backlog):
+    """Hanh vi cu: requests.post (khong session) cho tung event"""
+    edge = CentralSyncService(f"http://127.0.0.1:{central.port}", 1, "Edge", "ENTRY")
+    for event_type, data in backlog:
+        edge.send_event(event_type, data)
+
+    started = time.perf_counter()
+    while not edge.event_queue.empty():
+        event = edge.event_queue.get_nowait()
+        requests.post(f"http://127.0.0.1:{central.port}/api/edge/event", json=event, timeout=5.0)
+    return time.perf_counter() - started
+
+
+def run_service(central, backlog, concurrency, batch):
+    edge = CentralSyncService(f"http://127.0.0.1:{central.port}", 1, "Edge", "ENTRY",
+                              http_max_concurrency=concurrency)
+    edge._batch_supported = batch
+    for event_type, data in backlog:
+        edge.send_event(event_type, data)
+
+    started = time.perf_counter()
+    edge.start()
+    wait_drained(central, len(backlog))
+    elapsed = time.perf_counter() - started
+    edge.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--port", type=int, default=18351)
+    args = parser.parse_args()
+
+    central = FakeCentral(args.port, args.latency_ms / 1000)
+    backlog = make_backlog(args.events)
+
+    modes = [
+        ("legacy", lambda: run_legacy(central, backlog)),
+        ("pooled", lambda: run_service(central, backlog, 1, False)),
+        ("batch c=1", lambda: run_service(central, backlog, 1, True)),
+        (f"batch c={args.concurrency}", lambda: run_service(central, backlog, args.concurrency, True)),
+    ]
+
+    print(f"backlog={len(backlog)} events, central latency={args.latency_ms}ms/request")
+    print(f"{'mode':<12} {'drain s':>9} {'events/s':>10} {'requests':>9} {'order err':>10}")
+    for name, runner in modes:
+        central.reset()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            elapsed = runner()
+        print(f"{name:<12} {elapsed:>9.2f} {len(backlog) / elapsed:>10.0f} {central.requests:>9} "
+              f"{central.order_violations:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Benchmark: chi phí của metrics (metrics.py) trên hot path của Edge
+
+1. Micro: ns / lần gọi Counter.inc, Histogram.observe (child cache sẵn và qua labels())
+2. Detection loop: chạy DetectionService._detection_loop thật với camera / IMX500 giả lập
+   (outputs có sẵn bbox, không OCR), đo thời gian / frame khi bật và tắt metrics
+3. Database: add_entry + find_entry_in + update_exit (decorator _timed + lock đo thời gian chờ)
+4. Scrape: thời gian render /metrics
+
+Tắt metrics = thay inc / observe bằng hàm rỗng → chênh lệch là toàn bộ chi phí đo.
+Mục tiêu: < 1% thời gian loop.
+
+Usage:
+    python benchmarks/bench_metrics_overhead.py [--frames 20000] [--entries 2000] [--rounds 10]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import metrics  # noqa: E402
+from database import Database  # noqa: E402
+from detection_service import DetectionService  # noqa: E402
+
+_ORIGINAL = {
+    (metrics._CounterChild, "inc"): metrics._CounterChild.inc,
+    (metrics._GaugeChild, "inc"): metrics._GaugeChild.inc,
+    (metrics._HistogramChild, "observe"): metrics._HistogramChild.observe,
+}
+
+
+def set_metrics_enabled(enabled):
+    for (cls, name), method in _ORIGINAL.items():
+        setattr(cls, name, method if enabled else (lambda self, value=1.0: None))
+
+
+class FakeIMX500:
+    def convert_inference_coords(self, coords, metadata, picam2):
+        y0, x0, y1, x1 = np.concatenate(coords).tolist()
+        return int(x0 * 640), int(y0 * 480), int((x1 - x0) * 640), int((y1 - y0) * 480)
+
+    def get_input_size(self):
+        return 320, 320
+
+
+class FakeCameraManager:
+    """Trả lần lượt frames đã chuẩn bị, hết frames → dừng service"""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+        self.service = None
+        self.intrinsics = SimpleNamespace(postprocess=None, bbox_normalization=False, bbox_order="yx",
+                                          labels=["license_plate"], ignore_dash_labels=False)
+
+    def get_frame_for_detection(self):
+        if self.index >= len(self.frames):
+            self.service.running = False
+            return None
+        frame_data = self.frames[self.index]
+        self.index += 1
+        return frame_data
+
+    def get_intrinsics(self):
+        return self.intrinsics
+
+    def get_imx500(self):
+        return FakeIMX500()
+
+    def get_picam2(self):
+        return None
+
+
+class FakeWebSocketManager:
+    def broadcast_detections(self, detections):
+        pass
+
+
+def make_frames(count, plates=2):
+    """Outputs IMX500 giả: `plates` biển số nằm ngang (qua filter aspect ratio) + box điểm thấp"""
+    boxes = np.zeros((1, 10, 4), dtype=np.float32)
+    scores = np.zeros((1, 10), dtype=np.float32)
+    classes = np.zeros((1, 10), dtype=np.float32)
+    for i in range(plates):
+        boxes[0, i] = (0.1 + 0.2 * i, 0.1, 0.18 + 0.2 * i, 0.4)  # y0, x0, y1, x1
+        scores[0, i] = 0.9
+    outputs = [boxes, scores, classes]
+    return [{'frame': None, 'metadata': {}, 'outputs': outputs, 'timestamp': time.time(), 'frame_id': i}
+            for i in range(count)]
+
+
+def run_detection(frame_count):
+    camera = FakeCameraManager(make_frames(frame_count))
+    service = DetectionService(camera, FakeWebSocketManager())
+    camera.service = service
+    service.running = True
+    started = time.perf_counter()
+    service._detection_loop()
+    return (time.perf_counter() - started) / frame_count
+
+
+def run_database(entries):
+    # tmpfs (neu co) → fsync khong lam nhieu ket qua
+    tmp_root = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    with tempfile.TemporaryDirectory(prefix="bench_metrics_", dir=tmp_root) as tmp:
+        db = Database(os.path.join(tmp, "parking.db"))
+        started = time.perf_counter()
+        for i in range(entries):
+            plate = f"30A{i:05d}"
+            entry_id = db.add_entry(plate, plate, 1, "Cam 1", 0.9, "auto", event_id=f"edge-1_{i}_{plate}")
+            db.find_entry_in(plate)
+            db.update_exit(entry_id, 1, "Cam 1", 0.9, "auto", 60, 5000)
+        return (time.perf_counter() - started) / entries
+
+
+def micro(iterations):
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("bench_total", "bench")
+    histogram = registry.histogram("bench_seconds", "bench", ["op"])
+    child = histogram.labels("a")
+
+    results = {}
+    for name, fn in (
+        ("Counter.inc", counter.inc),
+        ("Histogram.observe (child)", lambda: child.observe(0.003)),
+        ("Histogram.labels().observe", lambda: histogram.labels("a").observe(0.003)),
+    ):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        results[name] = (time.perf_counter() - started) / iterations * 1e9
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    print("micro (ns/call):")
+    for name, ns in micro(200000).items():
+        print(f"  {name:<28} {ns:>8.0f}")
+
+    frame_interval = 1.0 / config.DETECTION_FPS
+    print(f"\n{'path':<16} {'off us':>9} {'on us':>9} {'overhead':>9} {'of cpu':>8} {'of frame':>9}")
+    for path, fn, size in (("detection loop", run_detection, args.frames),
+                           ("database", run_database, args.entries)):
+        timings = {False: float("inf"), True: float("inf")}
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for _ in range(args.rounds):  # bat / tat xen ke tung vong, lay min → giam nhieu
+                for enabled in (False, True):
+                    set_metrics_enabled(enabled)
+                    timings[enabled] = min(timings[enabled], fn(size))
+        set_metrics_enabled(True)
+        off, on = timings[False], timings[True]
+        overhead = on - off
+        print(f"{path:<16} {off * 1e6:>9.1f} {on * 1e6:>9.1f} {overhead * 1e6:>8.2f}u "
+              f"{overhead / off * 100:>7.2f}% {overhead / frame_interval * 100:>8.3f}%")
+
+    started = time.perf_counter()
+    body = metrics.get_metrics().render()
+    print(f"\nrender /metrics: {(time.perf_counter() - started) * 1000:.2f} ms, "
+          f"{len(body.splitlines())} lines, {len(body)} bytes")
+    print(f"('of cpu' = overhead / CPU time per iteration without metrics; 'of frame' = overhead / "
+          f"detection frame interval {frame_interval * 1000:.0f} ms at DETECTION_FPS={config.DETECTION_FPS})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Benchmark: thundering herd khi Central restart - retry cố định vs backoff + full jitter
+
+Chạy 1 fake Central (FastAPI/uvicorn: /ws/edge, /api/edge/event, /api/edge/heartbeat) đếm mọi
+request nhận được, và --edges CentralSyncService trong cùng process (mỗi edge gửi 1 event / giây).
+Fake Central chạy --up giây, tắt --down giây (flapping) --cycles lần. Sau mỗi lần bật lại, đo
+trong --window giây đầu:
+- peak rate (cửa sổ 100ms) của kết nối mới (WebSocket connect + HTTP heartbeat) - chính là herd
+- peak rate của tất cả request (kể cả event tồn đọng được đẩy lên)
+- số kết nối mới trong 1 giây đầu
+và time-to-recover WebSocket trung bình / max của các edge
+
+So sánh 2 chế độ:
+- fixed  : reconnect WebSocket cố định 5s, retry HTTP cố định 1s (như trước)
+- backoff: ConnectionSupervisor (exponential backoff + full jitter + circuit breaker)
+
+Usage:
+    python benchmarks/bench_reconnect_storm.py [--edges 50] [--cycles 2] [--up 8] [--down 6]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from central_sync import CentralSyncService  # noqa: E402
+from connection_supervisor import ConnectionSupervisor  # noqa: E402
+
+
+class FixedDelaySupervisor(ConnectionSupervisor):
+    """Hành vi cũ: luôn chờ đúng delay cố định, không bao giờ mở circuit"""
+
+    def __init__(self, name, delay):
+        super().__init__(name, base_delay=delay, max_delay=delay, failure_threshold=10 ** 9)
+        self.delay = delay
+
+    def next_delay(self, attempt):
+        return self.delay
+
+
+class RequestLog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.times = []  # (timestamp, kind): kind = "connect" | "event"
+
+    def hit(self, kind):
+        with self.lock:
+            self.times.append((time.monotonic(), kind))
+
+    def between(self, start, end, kind=None):
+        with self.lock:
+            return [t for t, k in self.times if start <= t < end and (kind is None or k == kind)]
+
+
+def peak_per_second(hits, window=0.1):
+    """So request lon nhat trong 1 cua so truot `window` giay, quy ra req/s"""
+    peak = 0
+    start = 0
+    for end in range(len(hits)):
+        while hits[end] - hits[start] >= window:
+            start += 1
+        peak = max(peak, end - start + 1)
+    return int(peak / window)
+
+
+def build_fake_central(log):
+    app = FastAPI()
+
+    @app.websocket("/ws/edge")
+    async def ws_edge(websocket: WebSocket):
+        log.hit("connect")
+        await websocket.accept()
+        try:
+            while True:
+                await websocket.receive_text()
+                log.hit("event")
+        except WebSocketDisconnect:
+            pass
+
+    @app.post("/api/edge/event")
+    async def edge_event(request: Request):
+        log.hit("event")
+        await request.body()
+        return {"success": True}
+
+    @app.post("/api/edge/heartbeat")
+    async def heartbeat(request: Request):
+        log.hit("connect")
+        await request.body()
+        return {"success": True}
+
+    return app
+
+
+class FlappingCentral:
+    def __init__(self, port, log):
+        self.port = port
+        self.app = build_fake_central(log)
+        self.server = None
+        self.thread = None
+
+    def up(self):
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port,
+                                                    log_level="critical", timeout_graceful_shutdown=1))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+    def down(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def event_pump(edges, stop):
+    """Moi edge gui 1 event / giay (xe vao)"""
+    i = 0
+    while not stop.is_set():
+        for edge in edges:
+            edge.send_event("ENTRY", {"plate_text": f"30A{i:05d}", "confidence": 0.9, "source": "auto"})
+        i += 1
+        stop.wait(1.0)
+
+
+def run(mode, args, port):
+    log = RequestLog()
+    central = FlappingCentral(port, log)
+    central.up()
+
+    edges = []
+    for index in range(args.edges):
+        edge = CentralSyncService(f"http://127.0.0.1:{port}", 1000 + index, f"Edge {index}", "ENTRY")
+        if mode == "fixed":
+            edge.ws_supervisor = FixedDelaySupervisor("websocket", 5.0)
+            edge.http_supervisor = FixedDelaySupervisor("http", 1.0)
+        edges.append(edge)
+
+    stop = threading.Event()
+    restarts = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for edge in edges:
+            edge.start()
+        pump = threading.Thread(target=event_pump, args=(edges, stop), daemon=True)
+        pump.start()
+
+        time.sleep(args.up)
+        for _ in range(args.cycles):
+            central.down()
+            time.sleep(args.down)
+            central.up()
+            restarts.append(time.monotonic())
+            time.sleep(args.up)
+
+        stop.set()
+        stoppers = [threading.Thread(target=edge.stop) for edge in edges]
+        for stopper in stoppers:
+            stopper.start()
+        for stopper in stoppers:
+            stopper.join()
+        central.down()
+
+    for cycle, restarted in enumerate(restarts, 1):
+        window_end = restarted + args.window
+        connects = log.between(restarted, window_end, "connect")
+        everything = log.between(restarted, window_end)
+        first_second = sum(1 for t in connects if t < restarted + 1.0)
+        print(f"{mode:<8} {cycle:>5} {peak_per_second(connects):>12} {peak_per_second(everything):>12} "
+              f"{first_second:>10}")
+
+    recover = [edge.ws_supervisor.get_metrics() for edge in edges]
+    avg = [m["avg_time_to_recover"] for m in recover if m["avg_time_to_recover"] is not None]
+    worst = max((m["max_time_to_recover"] for m in recover), default=0)
+    reconnects = sum(m["reconnects"] for m in recover)
+    if avg:
+        print(f"{mode:<8} reconnects={reconnects} time-to-recover avg={sum(avg) / len(avg):.2f}s max={worst:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--edges", type=int, default=50)
+    parser.add_argument("--cycles", type=int, default=2)
+    parser.add_argument("--up", type=float, default=8.0)
+    parser.add_argument("--down", type=float, default=6.0)
+    parser.add_argument("--window", type=float, default=5.0, help="so giay sau restart de tinh peak")
+    parser.add_argument("--port", type=int, default=18341)
+    args = parser.parse_args()
+
+    print(f"{args.edges} edges, {args.cycles} restarts (down {args.down}s / up {args.up}s)")
+    print(f"{'mode':<8} {'cycle':>5} {'conn/s peak':>12} {'req/s peak':>12} {'conn 1st s':>10}")
+    run("fixed", args, args.port)
+    run("backoff", args, args.port + 1)
+
+
+if __name__ == "__main__":
+    main()
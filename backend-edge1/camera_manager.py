@@ -11,6 +11,18 @@ from picamera2.devices import IMX500
 from picamera2.devices.imx500 import NetworkIntrinsics
 
 import config
+from metrics import get_metrics
+
+_metrics = get_metrics()
+FRAMES_CAPTURED = _metrics.counter("edge_camera_frames_captured_total", "Frames captured from the camera")
+FRAMES_DROPPED = _metrics.counter("edge_camera_frames_dropped_total",
+                                  "Old frames dropped because the consumer queue was full", ["queue"])
+CAPTURE_SECONDS = _metrics.histogram("edge_camera_frame_seconds",
+                                     "Time to dispatch one captured frame to the queues (excl. waiting for the sensor)")
+CAPTURE_ERRORS = _metrics.counter("edge_camera_capture_errors_total", "Exceptions in the capture loop")
+_DROPPED_RAW = FRAMES_DROPPED.labels("raw")
+_DROPPED_DETECTION = FRAMES_DROPPED.labels("detection")
+_DROPPED_ANNOTATED = FRAMES_DROPPED.labels("annotated")
 
 
 class CameraManager:
@@ -110,6 +122,7 @@ class CameraManager:
                 # === OPTIMIZATION 1: Capture metadata + frame cung luc ===
                 # IMX500 da run inference, metadata co san bbox
                 request = self.picam2.capture_request()
+                capture_started = time.perf_counter()
 
                 try:
                     # Lay frame tu request (zero-copy neu possible)
@@ -118,6 +131,7 @@ class CameraManager:
 
                     if frame is None:
                         continue
+                    FRAMES_CAPTURED.inc()
 
                     # === OPTIMIZATION 2: Raw frame cho WebRTC (NO COPY neu duoc) ===
                     # Chi copy khi queue day can drop
@@ -127,6 +141,7 @@ class CameraManager:
                         # Drop old frame
                         try:
                             self.raw_frame_queue.get_nowait()
+                            _DROPPED_RAW.inc()
                             self.raw_frame_queue.put_nowait(frame)
                         except:
                             pass
@@ -161,6 +176,7 @@ class CameraManager:
                             # Drop old detection
                             try:
                                 self.frame_queue.get_nowait()
+                                _DROPPED_DETECTION.inc()
                                 self.frame_queue.put_nowait(frame_data)
                             except:
                                 pass
@@ -174,6 +190,7 @@ class CameraManager:
                             # Drop old frame
                             try:
                                 self.annotated_frame_queue.get_nowait()
+                                _DROPPED_ANNOTATED.inc()
                                 self.annotated_frame_queue.put_nowait(annotated_frame)
                             except:
                                 pass
@@ -181,8 +198,10 @@ class CameraManager:
                 finally:
                     # Release request de free memory
                     request.release()
+                    CAPTURE_SECONDS.observe(time.perf_counter() - capture_started)
 
             except Exception as e:
+                CAPTURE_ERRORS.inc()
                 print(f"Capture error: {e}")
                 import traceback
                 traceback.print_exc()
@@ -5,20 +5,46 @@ Dùng WebSocket cho real-time sync, fallback to HTTP nếu WebSocket fail
 import requests
 import threading
 import time
-from queue import Queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
 from typing import Dict, Any, Optional, Callable
 import uuid
 import json
 import websocket  # websocket-client library
 import asyncio
 
+from connection_supervisor import ConnectionSupervisor
+import message_codec
+from metrics import get_metrics
+from requests.adapters import HTTPAdapter
+
+# Cac loai event central nhan qua /api/edge/events/batch
+BATCH_EVENT_TYPES = ("ENTRY", "EXIT", "DETECTION")
+
+_metrics = get_metrics()
+SYNC_EVENTS = _metrics.counter("edge_sync_events_total", "Events synced to central, by result", ["result"])
+SYNC_SEND_SECONDS = _metrics.histogram("edge_sync_send_seconds", "Time to send to central, by channel",
+                                       ["channel"])
+SYNC_QUEUE_SIZE = _metrics.gauge("edge_sync_queue_size", "Events waiting to be sent to central", ["queue"])
+SYNC_WS_CONNECTED = _metrics.gauge("edge_sync_websocket_connected", "1 if the WebSocket to central is up")
+_SENT = SYNC_EVENTS.labels("sent")
+_FAILED = SYNC_EVENTS.labels("failed")
+_SEND_WS = SYNC_SEND_SECONDS.labels("websocket")
+_SEND_HTTP_BATCH = SYNC_SEND_SECONDS.labels("http_batch")
+_SEND_HTTP = SYNC_SEND_SECONDS.labels("http")
+
 
 class CentralSyncService:
     """Service sync events lên central server"""
 
     def __init__(self, central_url: str, camera_id: int, camera_name: str, camera_type: str, parking_manager=None,
                  event_loop: Optional[asyncio.AbstractEventLoop] = None,
-                 history_broadcaster: Optional[Callable[[dict], Any]] = None):
+                 history_broadcaster: Optional[Callable[[dict], Any]] = None,
+                 reconnect_base_delay: Optional[float] = None, reconnect_max_delay: Optional[float] = None,
+                 failure_threshold: Optional[int] = None,
+                 http_max_concurrency: Optional[int] = None, http_batch_size: Optional[int] = None):
+        import config
         self.central_url = central_url
         self.camera_id = camera_id
         self.camera_name = camera_name
@@ -30,16 +56,40 @@ class CentralSyncService:
         self.event_queue = Queue()
         self.running = False
         self.sync_thread = None
+        self._stop_event = threading.Event()
+        self.heartbeat_interval = 30
+
+        # Backoff + circuit breaker cho tung kenh (tranh ca fleet reconnect dong loat khi Central restart)
+        base_delay = reconnect_base_delay or getattr(config, "CENTRAL_RECONNECT_BASE_DELAY", 1.0)
+        max_delay = reconnect_max_delay or getattr(config, "CENTRAL_RECONNECT_MAX_DELAY", 30.0)
+        threshold = failure_threshold or getattr(config, "CENTRAL_CIRCUIT_FAILURE_THRESHOLD", 3)
+        self.ws_supervisor = ConnectionSupervisor("websocket", base_delay, max_delay, threshold)
+        self.http_supervisor = ConnectionSupervisor("http", base_delay, max_delay, threshold)
+
+        # HTTP fallback: 1 session keep-alive dung chung (event + heartbeat), toi da N request dong thoi
+        self.http_max_concurrency = http_max_concurrency or getattr(config, "CENTRAL_HTTP_MAX_CONCURRENCY", 4)
+        self.http_batch_size = http_batch_size or getattr(config, "CENTRAL_HTTP_BATCH_SIZE", 100)
+        self.http = self._create_http_session()
+        self._http_pool = None
+        self._batch_supported = True  # False neu central cu chua co /api/edge/events/batch
+        self._retry_events = deque()  # event gui loi, gui lai TRUOC event moi trong queue
 
         # WebSocket
         self.ws: Optional[websocket.WebSocketApp] = None
         self.ws_connected = False
         self.ws_thread = None
+        self.ws_codec = message_codec.CODEC_JSON  # doi khi Central bao codec trong message "connected"
 
         # Stats
         self.events_sent = 0
         self.events_failed = 0
         self.last_sync_time = None
+        self._stats_lock = threading.Lock()  # lane HTTP cap nhat stats tu nhieu thread
+
+        # Gauge tinh luc scrape /metrics
+        SYNC_QUEUE_SIZE.labels("pending").set_function(self.event_queue.qsize)
+        SYNC_QUEUE_SIZE.labels("retry").set_function(lambda: len(self._retry_events))
+        SYNC_WS_CONNECTED.set_function(lambda: 1 if self.ws_connected else 0)
 
     def start(self):
         """Start sync service"""
@@ -47,6 +97,9 @@ class CentralSyncService:
             return
 
         self.running = True
+        self._stop_event.clear()
+        self._http_pool = ThreadPoolExecutor(max_workers=self.http_max_concurrency,
+                                             thread_name_prefix="central-http")
 
         # Start WebSocket connection thread
         self.ws_thread = threading.Thread(target=self._websocket_loop, daemon=True)
@@ -64,10 +117,22 @@ class CentralSyncService:
     def stop(self):
         """Stop sync service"""
         self.running = False
+        self._stop_event.set()
         if self.ws:
             self.ws.close()
         if self.sync_thread:
             self.sync_thread.join(timeout=2)
+        if self._http_pool:
+            self._http_pool.shutdown(wait=False)
+        self.http.close()
+
+    def _create_http_session(self) -> requests.Session:
+        """Session keep-alive, pool đủ cho http_max_concurrency request song song (không tự retry)"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.http_max_concurrency, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
 
     def send_event(self, event_type: str, data: Dict[str, Any]):
         """
@@ -103,8 +168,15 @@ class CentralSyncService:
         self.event_queue.put(event)
 
     def _websocket_loop(self):
-        """WebSocket connection loop with auto-reconnect"""
+        """WebSocket connection loop with auto-reconnect (exponential backoff + jitter)"""
         while self.running:
+            wait = self.ws_supervisor.wait_time()
+            if wait > 0:
+                self._stop_event.wait(wait)
+                continue
+            if not self.ws_supervisor.allow_request():
+                continue
+
             try:
                 # Build WebSocket URL from HTTP URL
                 ws_url = self.central_url.replace("http://", "ws://").replace("https://", "wss://")
@@ -123,24 +195,30 @@ class CentralSyncService:
 
                 # Run forever (blocking until connection closes)
                 self.ws.run_forever()
+                if not self.running:
+                    break
 
-                # Connection closed - wait before reconnect
-                print("[Edge Sync] WebSocket disconnected, reconnecting in 5s...")
-                time.sleep(5)
+                # Connection closed (hoac khong ket noi duoc) - backoff truoc khi reconnect
+                delay = self.ws_supervisor.record_failure()
+                print(f"[Edge Sync] WebSocket disconnected, reconnecting in {delay:.1f}s "
+                      f"(circuit={self.ws_supervisor.state})")
 
             except Exception as e:
-                print(f"[Edge Sync] WebSocket error: {e}")
-                time.sleep(5)
+                delay = self.ws_supervisor.record_failure()
+                print(f"[Edge Sync] WebSocket error: {e}, retry in {delay:.1f}s")
 
     def _on_ws_open(self, ws):
         """WebSocket connection opened"""
         print(f"[Edge Sync] WebSocket connected to Central")
         self.ws_connected = True
+        self.ws_supervisor.record_success()
 
-        # Send identification message
+        # Send identification message (kem danh sach codec de Central chon)
+        self.ws_codec = message_codec.CODEC_JSON
         try:
             ws.send(json.dumps({
-                "edge_id": self.camera_id
+                "edge_id": self.camera_id,
+                "codecs": message_codec.supported_codecs()
             }))
         except Exception as e:
             print(f"[Edge Sync] Failed to send identification: {e}")
@@ -148,11 +226,13 @@ class CentralSyncService:
     def _on_ws_message(self, ws, message):
         """Received message from Central via WebSocket"""
         try:
-            data = json.loads(message)
+            data = message_codec.decode(message)
             msg_type = data.get("type")
 
             if msg_type == "connected":
-                print(f"[Edge Sync] {data.get('message')}")
+                if data.get("codec") in message_codec.supported_codecs():
+                    self.ws_codec = data["codec"]
+                print(f"[Edge Sync] {data.get('message')} (codec={self.ws_codec})")
 
             elif msg_type == "pong":
                 # Pong response
@@ -178,6 +258,7 @@ class CentralSyncService:
         """WebSocket connection closed"""
         print(f"[Edge Sync] WebSocket closed (code={close_status_code}, msg={close_msg})")
         self.ws_connected = False
+        self.ws_codec = message_codec.CODEC_JSON
 
     def _handle_incoming_event(self, event: Dict[str, Any]):
         """
@@ -293,27 +374,170 @@ class CentralSyncService:
             traceback.print_exc()
 
     def _sync_loop(self):
-        """Loop gửi events lên central"""
+        """
+        Loop gửi events lên central
+
+        - WebSocket connected: gửi từng event qua WebSocket
+        - HTTP fallback: lấy tối đa http_batch_size event tồn đọng, gửi theo batch (_send_batch_via_http)
+        """
         while self.running:
-            try:
-                # Get event from queue (block voi timeout)
-                event = self.event_queue.get(timeout=1.0)
+            # Chua co WebSocket va HTTP dang backoff → cho (toi da 1s de kip thay WS ket noi lai)
+            if not self.ws_connected:
+                wait = self.http_supervisor.wait_time()
+                if wait > 0:
+                    self._stop_event.wait(min(wait, 1.0))
+                    continue
+
+            # HTTP: moi lane 1 batch day du → lay batch_size * concurrency event moi vong
+            limit = self.http_batch_size if self.ws_connected else self.http_batch_size * self.http_max_concurrency
+            events = self._next_events(limit)
+            if not events:
+                continue
 
-                # Send to central
-                success = self._send_to_central(event)
+            if self.ws_connected and self.ws:
+                for index, event in enumerate(events):
+                    if not self._send_via_websocket(event):
+                        # WebSocket vua rot → phan con lai gui lai qua HTTP o vong sau
+                        self._retry_events.extendleft(reversed(events[index:]))
+                        break
+                    self._record_sent()
+            else:
+                try:
+                    self._send_batch_via_http(events)
+                except Exception as e:
+                    print(f"[Edge Sync] Error sending events: {e}")
+                    self._retry_events.extendleft(reversed(events))
+
+    def _next_events(self, limit):
+        """Lấy tối đa limit event cần gửi: event retry trước, rồi queue (block tối đa 1s cho event đầu tiên)"""
+        events = []
+        while self._retry_events and len(events) < limit:
+            events.append(self._retry_events.popleft())
+
+        if not events:
+            try:
+                events.append(self.event_queue.get(timeout=1.0))
+            except Empty:
+                return events
 
-                if success:
-                    self.events_sent += 1
-                    self.last_sync_time = time.time()
+        while len(events) < limit:
+            try:
+                events.append(self.event_queue.get_nowait())
+            except Empty:
+                break
+        return events
+
+    def _record_sent(self, count: int = 1):
+        with self._stats_lock:
+            self.events_sent += count
+            self.last_sync_time = time.time()
+        _SENT.inc(count)
+
+    def _record_failed(self, count: int = 1):
+        with self._stats_lock:
+            self.events_failed += count
+        _FAILED.inc(count)
+
+    def _send_via_websocket(self, event: Dict[str, Any]) -> bool:
+        try:
+            with _SEND_WS.time():
+                frame = message_codec.encode(event, self.ws_codec)
+                if isinstance(frame, bytes):
+                    self.ws.send(frame, opcode=websocket.ABNF.OPCODE_BINARY)
                 else:
-                    self.events_failed += 1
-                    # Requeue with slight delay for retry
-                    time.sleep(1.0)
-                    self.event_queue.put(event)
+                    self.ws.send(frame)
+            return True
+        except Exception as e:
+            print(f"[Edge Sync] WebSocket send failed, falling back to HTTP: {e}")
+            return False
 
-            except Exception as e:
-                # Queue empty - continue
-                continue
+    def _send_batch_via_http(self, events):
+        """
+        Gửi backlog qua HTTP khi không có WebSocket
+
+        ENTRY/EXIT/DETECTION chia thành tối đa http_max_concurrency lane theo biển số
+        (cùng biển số → cùng lane → giữ đúng thứ tự VÀO/RA), mỗi lane 1 POST /api/edge/events/batch,
+        các lane gửi song song trên session keep-alive. Event loại khác gửi từng cái qua /api/edge/event.
+        Lane lỗi kết nối / 5xx → đưa lại đầu hàng đợi retry theo đúng thứ tự cũ.
+        """
+        if not self.http_supervisor.allow_request():
+            self._retry_events.extendleft(reversed(events))
+            return
+
+        batchable = [
+            (index, event) for index, event in enumerate(events)
+            if self._batch_supported and event.get("type") in BATCH_EVENT_TYPES
+        ]
+        singles = [
+            event for event in events
+            if not (self._batch_supported and event.get("type") in BATCH_EVENT_TYPES)
+        ]
+
+        lanes = [[] for _ in range(self.http_max_concurrency)]
+        for index, event in batchable:
+            plate_id = str(event.get("data", {}).get("plate_id") or "")
+            lanes[hash(plate_id) % len(lanes)].append((index, event))
+
+        futures = [self._http_pool.submit(self._post_batch, lane) for lane in lanes if lane]
+        failed = []
+        for future in futures:
+            failed.extend(future.result())
+
+        if failed:
+            failed.sort(key=lambda item: item[0])
+            self._retry_events.extendleft(reversed([event for _, event in failed]))
+
+        for event in singles:
+            if self._send_to_central(event):
+                self._record_sent()
+            else:
+                self._record_failed()
+                # Requeue - lan gui sau cho theo backoff cua http_supervisor
+                self.event_queue.put(event)
+
+    def _post_batch(self, lane):
+        """
+        POST 1 lane lên /api/edge/events/batch
+
+        Return: list (index, event) cần gửi lại (lỗi kết nối / 5xx / central chưa hỗ trợ batch)
+        """
+        try:
+            with _SEND_HTTP_BATCH.time():
+                response = self.http.post(
+                    f"{self.central_url}/api/edge/events/batch",
+                    json={"events": [event for _, event in lane]},
+                    timeout=10.0
+                )
+        except requests.RequestException as e:
+            delay = self.http_supervisor.record_failure()
+            print(f"Central sync error: {e} (retry in {delay:.1f}s)")
+            return lane
+
+        if response.status_code in (404, 405):
+            # Central ban cu: gui lai tung event qua /api/edge/event
+            print("[Edge Sync] Central has no batch endpoint, falling back to single events")
+            self._batch_supported = False
+            return lane
+
+        if response.status_code >= 500:
+            self.http_supervisor.record_failure()
+            print(f"Central batch sync failed: {response.status_code} - {response.text}")
+            return lane
+
+        self.http_supervisor.record_success()
+        if response.status_code != 200:
+            # Loi request (4xx) → retry cung khong khac, tinh la failed
+            print(f"Central batch sync rejected: {response.status_code} - {response.text}")
+            self._record_failed(len(lane))
+            return []
+
+        # Batch da duoc central xu ly: event bi tu choi nghiep vu (xe da trong bai...) khong gui lai,
+        # giong duong WebSocket
+        results = response.json().get("results", [])
+        rejected = sum(1 for result in results if not result.get("success"))
+        self._record_sent(len(lane) - rejected)
+        self._record_failed(rejected)
+        return []
 
     def _broadcast_history_update(self, payload: dict):
         """
@@ -332,32 +556,36 @@ class CentralSyncService:
         Prefer WebSocket, fallback to HTTP POST
         """
         # Try WebSocket first if connected
-        if self.ws_connected and self.ws:
-            try:
-                self.ws.send(json.dumps(event))
-                return True
-            except Exception as e:
-                print(f"[Edge Sync] WebSocket send failed, falling back to HTTP: {e}")
-                # Fall through to HTTP
-
-        # Fallback to HTTP POST
-        try:
-            response = requests.post(
-                f"{self.central_url}/api/edge/event",
-                json=event,
-                timeout=5.0
-            )
+        if self.ws_connected and self.ws and self._send_via_websocket(event):
+            return True
 
-            if response.status_code == 200:
-                return True
-            else:
-                print(f"Central sync failed: {response.status_code} - {response.text}")
-                return False
+        # Fallback to HTTP POST (circuit OPEN → khong goi, cho backoff)
+        if not self.http_supervisor.allow_request():
+            return False
 
+        try:
+            with _SEND_HTTP.time():
+                response = self.http.post(
+                    f"{self.central_url}/api/edge/event",
+                    json=event,
+                    timeout=5.0
+                )
         except requests.RequestException as e:
-            print(f"Central sync error: {e}")
+            delay = self.http_supervisor.record_failure()
+            print(f"Central sync error: {e} (retry in {delay:.1f}s)")
             return False
 
+        if response.status_code >= 500:
+            self.http_supervisor.record_failure()
+        else:
+            # Central van tra loi (ke ca loi nghiep vu 4xx) → ket noi khoe
+            self.http_supervisor.record_success()
+
+        if response.status_code == 200:
+            return True
+        print(f"Central sync failed: {response.status_code} - {response.text}")
+        return False
+
     def _generate_event_id(self, plate_id: str) -> str:
         """
         Generate stable-ish event_id để central dedupe:
@@ -368,18 +596,19 @@ class CentralSyncService:
         return f"edge-{self.camera_id}_{ms}_{clean_plate}"
 
     def _heartbeat_loop(self):
-        """Send heartbeat every 30s"""
+        """Send heartbeat every 30s (bỏ qua khi circuit HTTP đang OPEN)"""
         while self.running:
             try:
-                self._send_heartbeat()
-                time.sleep(30)
+                if self.http_supervisor.allow_request():
+                    self._send_heartbeat()
             except Exception as e:
                 print(f"Heartbeat error: {e}")
+            self._stop_event.wait(self.heartbeat_interval)
 
     def _send_heartbeat(self):
         """Send heartbeat to central"""
         try:
-            response = requests.post(
+            response = self.http.post(
                 f"{self.central_url}/api/edge/heartbeat",
                 json={
                     "camera_id": self.camera_id,
@@ -393,10 +622,16 @@ class CentralSyncService:
                 timeout=5.0
             )
 
+            if response.status_code >= 500:
+                self.http_supervisor.record_failure()
+            else:
+                self.http_supervisor.record_success()
+
             if response.status_code != 200:
                 print(f" Heartbeat failed: {response.status_code}")
 
         except requests.RequestException as e:
+            self.http_supervisor.record_failure()
             print(f" Heartbeat error: {e}")
 
     def get_status(self):
@@ -407,5 +642,13 @@ class CentralSyncService:
             "events_sent": self.events_sent,
             "events_failed": self.events_failed,
             "last_sync_time": self.last_sync_time,
-            "queue_size": self.event_queue.qsize()
+            "queue_size": self.event_queue.qsize(),
+            "retry_queue_size": len(self._retry_events),
+            "http_batch_supported": self._batch_supported,
+            "connection": {
+                "websocket_connected": self.ws_connected,
+                "websocket_codec": self.ws_codec,
+                "websocket": self.ws_supervisor.get_metrics(),
+                "http": self.http_supervisor.get_metrics(),
+            },
         }
@@ -93,6 +93,14 @@ PARKING_LOT_CAPACITY = 0  # Tổng số chỗ đỗ xe mà camera PARKING_LOT n
 # De trong neu muon su dung Edge standalone, hoac nhap URL Central Server
 CENTRAL_SERVER_URL = "http://192.168.0.144:8000"  # Ví dụ: "http://192.168.0.144:8000" hoặc để trống cho standalone
 CENTRAL_SYNC_ENABLED = True  # Bat sync len central server (tu dong bat neu co CENTRAL_SERVER_URL)
+# Reconnect / retry len Central: exponential backoff + full jitter (giay)
+CENTRAL_RECONNECT_BASE_DELAY = 1.0
+CENTRAL_RECONNECT_MAX_DELAY = 30.0
+# So lan loi lien tiep de mo circuit breaker (ngung goi cho toi het backoff)
+CENTRAL_CIRCUIT_FAILURE_THRESHOLD = 3
+# HTTP fallback (khi WebSocket mat): so request dong thoi toi da + so event moi batch
+CENTRAL_HTTP_MAX_CONCURRENCY = 4
+CENTRAL_HTTP_BATCH_SIZE = 100
 
 # PARKING FEE MANAGEMENT
 # Fee calculation - Neu co PARKING_API_URL thi goi API, neu khong thi dung file JSON
@@ -102,6 +110,7 @@ PARKING_JSON_FILE = "data/parking_fees.json"  # File JSON local mặc định
 # Gia tri mac dinh (fallback neu khong co API/file)
 FEE_BASE = 0.5  # 0.5 gio = 30 phut mien phi
 FEE_PER_HOUR = 25000  # 25k / gio sau thoi gian mien phi
+FEE_REFRESH_INTERVAL = 60  # Giay - background thread reload bang phi (API/file), khong lam tren request path
 
 # STAFF MANAGEMENT
 # API endpoint de lay danh sach nguoi truc (de trong se dung file JSON local)
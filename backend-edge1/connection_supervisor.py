@@ -0,0 +1,139 @@
+"""
+Connection Supervisor - Backoff + circuit breaker cho kết nối Edge → Central
+
+Khi Central restart, cả fleet Edge mất kết nối cùng lúc. Nếu retry theo chu kỳ cố định
+thì tất cả reconnect đồng loạt (thundering herd) đúng lúc Central vừa lên.
+Supervisor tính thời điểm retry bằng exponential backoff + full jitter
+(delay = random(0, min(max_delay, base_delay * 2^n))) để trải đều các lần retry,
+và giữ trạng thái circuit breaker:
+
+- CLOSED   : kết nối bình thường (lỗi lẻ tẻ vẫn retry theo backoff)
+- OPEN     : lỗi liên tiếp >= failure_threshold → không gửi request cho tới hết backoff
+- HALF_OPEN: hết backoff → cho đúng 1 request thăm dò; thành công → CLOSED, lỗi → OPEN
+"""
+import random
+import threading
+import time
+
+
+class ConnectionSupervisor:
+    """Theo dõi sức khỏe 1 kênh kết nối (WebSocket / HTTP) lên Central"""
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(self, name: str, base_delay: float = 1.0, max_delay: float = 30.0, failure_threshold: int = 3,
+                 rng: random.Random = None):
+        self.name = name
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._retry_at = 0.0
+        self._probe_in_flight = False
+        self._outage_started = None  # thoi diem loi dau tien cua dot mat ket noi hien tai
+
+        # Metrics
+        self.total_failures = 0
+        self.total_successes = 0
+        self.reconnects = 0  # so lan phuc hoi sau mat ket noi
+        self.circuit_opens = 0
+        self.last_time_to_recover = None
+        self.max_time_to_recover = 0.0
+        self._total_time_to_recover = 0.0
+
+    def next_delay(self, attempt: int) -> float:
+        """Full jitter: random trong [0, min(max_delay, base_delay * 2^attempt)]"""
+        cap = min(self.max_delay, self.base_delay * (2 ** min(attempt, 32)))
+        return self._rng.uniform(0, cap)
+
+    def wait_time(self) -> float:
+        """Số giây phải chờ trước khi được thử request tiếp theo (0 = được thử ngay)"""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probe_in_flight:
+                # Dang co 1 request tham do, cac request khac cho ket qua
+                return min(self.base_delay, self.max_delay)
+            return max(0.0, self._retry_at - time.monotonic())
+
+    def allow_request(self) -> bool:
+        """
+        Có được gửi request bây giờ không
+
+        OPEN + hết backoff → chuyển HALF_OPEN và chỉ cho 1 request thăm dò
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._retry_at:
+                return False
+            if self.state == self.OPEN:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = True
+                return True
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        """Request / kết nối thành công → CLOSED, ghi nhận time-to-recover nếu vừa hết mất kết nối"""
+        with self._lock:
+            self.total_successes += 1
+            if self._outage_started is not None:
+                recover = time.monotonic() - self._outage_started
+                self.reconnects += 1
+                self.last_time_to_recover = recover
+                self.max_time_to_recover = max(self.max_time_to_recover, recover)
+                self._total_time_to_recover += recover
+                self._outage_started = None
+
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._retry_at = 0.0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> float:
+        """
+        Request / kết nối lỗi → tăng backoff, mở circuit nếu lỗi liên tiếp vượt ngưỡng
+
+        Return: delay (giây) trước lần thử tiếp theo
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.total_failures += 1
+            if self._outage_started is None:
+                self._outage_started = now
+
+            delay = self.next_delay(self.consecutive_failures)
+            self.consecutive_failures += 1
+            self._retry_at = now + delay
+            self._probe_in_flight = False
+
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.circuit_opens += 1
+                self.state = self.OPEN
+            return delay
+
+    def get_metrics(self):
+        """Metrics cho /api/status"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_in": round(max(0.0, self._retry_at - time.monotonic()), 3),
+                "total_failures": self.total_failures,
+                "total_successes": self.total_successes,
+                "reconnects": self.reconnects,
+                "circuit_opens": self.circuit_opens,
+                "last_time_to_recover": self.last_time_to_recover,
+                "max_time_to_recover": self.max_time_to_recover,
+                "avg_time_to_recover": (self._total_time_to_recover / self.reconnects) if self.reconnects else None,
+                "down_for": (time.monotonic() - self._outage_started) if self._outage_started is not None else 0.0,
+            }
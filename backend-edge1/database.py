@@ -4,15 +4,90 @@ Mỗi camera có DB local riêng, sync về server tổng cuối ngày
 """
 import sqlite3
 import os
+import base64
+import time
 from datetime import datetime
+from functools import wraps
 from threading import Lock
 
+from metrics import get_metrics
+
+_metrics = get_metrics()
+DB_SECONDS = _metrics.histogram("edge_db_seconds", "Database call latency incl. lock wait", ["operation"])
+DB_LOCK_WAIT_SECONDS = _metrics.histogram("edge_db_lock_wait_seconds", "Time spent waiting for the database lock")
+DB_ERRORS = _metrics.counter("edge_db_errors_total", "Database calls that raised", ["operation"])
+
+
+def _timed(method):
+    """Đo thời gian 1 method public của Database (label = tên method)"""
+    latency = DB_SECONDS.labels(method.__name__)
+    errors = DB_ERRORS.labels(method.__name__)
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+class _TimedLock:
+    """Lock đo thời gian chờ (detection thread vs API / sync tranh nhau DB)"""
+
+    def __init__(self):
+        self._lock = Lock()
+
+    def __enter__(self):
+        started = time.perf_counter()
+        self._lock.acquire()
+        DB_LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._lock.release()
+
+
+def encode_history_cursor(row):
+    """
+    Tạo cursor (keyset) từ record cuối của 1 trang history
+    Cursor = base64("created_at|id") - client chỉ cần gửi lại nguyên chuỗi
+    """
+    raw = f"{row['created_at']}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_history_cursor(cursor):
+    """
+    Parse cursor → (created_at, id)
+    Raise ValueError nếu cursor không hợp lệ
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, entry_id = raw.rsplit("|", 1)
+        return created_at, int(entry_id)
+    except Exception:
+        raise ValueError(f"Invalid history cursor: {cursor}")
+
+
 class Database:
     """SQLite Database Manager - Thread-safe"""
 
     def __init__(self, db_file="data/parking.db"):
         self.db_file = db_file
-        self.lock = Lock()
+        self.lock = _TimedLock()
+
+        # In-memory index cac entry dang IN (xe dang trong bai) - write-through
+        # Detection hot path (find_entry_in, find_vehicle_in_parking, get_vehicles_at_location)
+        # doc tu day, khong cham disk
+        self._active_by_id = {}         # entry_id -> row dict
+        self._active_by_plate = {}      # plate_id -> set(entry_id) (khop chinh xac nhu WHERE plate_id = ?)
+        self._active_by_location = {}   # last_location -> set(entry_id)
 
         # Tao thu muc neu chua co
         os.makedirs(os.path.dirname(db_file), exist_ok=True)
@@ -26,6 +101,67 @@ class Database:
         conn.row_factory = sqlite3.Row  # De query tra ve dict
         return conn
 
+    # ===== Active vehicles index (goi khi dang giu self.lock) =====
+
+    def _index_remove(self, entry_id):
+        """Bo entry khoi index (neu co)"""
+        row = self._active_by_id.pop(entry_id, None)
+        if not row:
+            return
+
+        plate_key = row.get('plate_id')
+        ids = self._active_by_plate.get(plate_key)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._active_by_plate[plate_key]
+
+        location = row.get('last_location')
+        ids = self._active_by_location.get(location)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._active_by_location[location]
+
+    def _index_put(self, row):
+        """Them/cap nhat entry trong index theo row moi nhat tu DB"""
+        entry_id = row['id']
+        self._index_remove(entry_id)
+
+        if row.get('status') != 'IN':
+            return
+
+        self._active_by_id[entry_id] = row
+        self._active_by_plate.setdefault(row.get('plate_id'), set()).add(entry_id)
+        if row.get('last_location') is not None:
+            self._active_by_location.setdefault(row['last_location'], set()).add(entry_id)
+
+    def _index_refresh(self, cursor, where, params):
+        """Doc lai cac row bi anh huong boi 1 write (cung connection) va cap nhat index"""
+        cursor.execute(f"SELECT * FROM entries WHERE {where}", params)
+        for row in cursor.fetchall():
+            self._index_put(dict(row))
+
+    def _rebuild_active_index(self, cursor):
+        """Build lai toan bo index tu DB (startup hoac sau bulk delete)"""
+        self._active_by_id = {}
+        self._active_by_plate = {}
+        self._active_by_location = {}
+
+        cursor.execute("SELECT * FROM entries WHERE status = 'IN'")
+        for row in cursor.fetchall():
+            self._index_put(dict(row))
+
+    def _latest_active_for_plate(self, plate_id):
+        """Entry IN moi nhat cua xe (giong ORDER BY entry_time DESC LIMIT 1)"""
+        ids = self._active_by_plate.get(plate_id)
+        if not ids:
+            return None
+        return max(
+            (self._active_by_id[entry_id] for entry_id in ids),
+            key=lambda row: (row.get('entry_time') or '', row['id'])
+        )
+
     def _init_db(self):
         """Tạo bảng nếu chưa có"""
         with self.lock:
@@ -108,6 +244,18 @@ class Database:
                 ON entries(entry_time)
             """)
 
+            # Index cho phan trang history theo keyset (created_at, id)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_entries_created_at_id
+                ON entries(created_at, id)
+            """)
+
+            # Filter status + keyset: SQLite di thang theo index, khong can sort tam
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_entries_status_created_at_id
+                ON entries(status, created_at, id)
+            """)
+
             # Migration: Add event_id column for sync deduplication
             try:
                 cursor.execute("ALTER TABLE entries ADD COLUMN event_id TEXT")
@@ -160,9 +308,13 @@ class Database:
             """)
 
             conn.commit()
+
+            # Load cac xe dang trong bai vao index
+            self._rebuild_active_index(cursor)
             conn.close()
 
 
+    @_timed
     def add_entry(self, plate_id, plate_view, camera_id, camera_name,
                   confidence, source, status="IN", event_id=None):
         """
@@ -194,10 +346,12 @@ class Database:
 
             entry_id = cursor.lastrowid
             conn.commit()
+            self._index_refresh(cursor, "id = ?", (entry_id,))
             conn.close()
 
             return entry_id
 
+    @_timed
     def update_exit(self, entry_id, camera_id, camera_name,
                     confidence, source, duration, fee):
         """
@@ -229,8 +383,10 @@ class Database:
             ))
 
             conn.commit()
+            self._index_remove(entry_id)
             conn.close()
 
+    @_timed
     def find_entry_in(self, plate_id):
         """
         Tìm entry IN gần nhất của xe
@@ -238,38 +394,31 @@ class Database:
         Return: dict hoặc None
         """
         with self.lock:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            row = self._latest_active_for_plate(plate_id)
+            return dict(row) if row else None
 
-            cursor.execute("""
-                SELECT * FROM entries
-                WHERE plate_id = ? AND status = 'IN'
-                ORDER BY entry_time DESC
-                LIMIT 1
-            """, (plate_id,))
-
-            row = cursor.fetchone()
-            conn.close()
-
-            if row:
-                return dict(row)
-            return None
-
-    def get_history(self, limit=100, offset=0, today_only=False, status=None, search=None, in_parking_only=False, entries_only=False):
+    @_timed
+    def get_history(self, limit=100, offset=0, today_only=False, status=None, search=None, in_parking_only=False, entries_only=False,
+                    page_cursor=None):
         """
         Lấy lịch sử
 
         Args:
             limit: Số lượng records
-            offset: Skip N records đầu
+            offset: Skip N records đầu (bỏ qua nếu có page_cursor)
             today_only: Chỉ lấy hôm nay
             status: Filter theo status (IN | OUT)
             search: Search theo plate_id hoặc plate_view
             in_parking_only: Chỉ lấy xe đang trong bãi (status='IN' và exit_time IS NULL)
             entries_only: Lấy tất cả các lần vào (không filter thêm)
+            page_cursor: Keyset cursor (encode_history_cursor của record cuối trang trước)
+                         → lấy các record cũ hơn, không phải quét lại N record đầu như OFFSET
 
         Return: list of dict
         """
+        # Parse cursor truoc khi lay lock (raise ValueError neu sai)
+        keyset = decode_history_cursor(page_cursor) if page_cursor else None
+
         with self.lock:
             conn = self._get_connection()
             cursor = conn.cursor()
@@ -298,8 +447,15 @@ class Database:
                 query += " AND (plate_id LIKE ? OR plate_view LIKE ?)"
                 params.extend([f"%{search}%", f"%{search}%"])
 
-            query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+            if keyset:
+                # Keyset pagination: record nam sau cursor theo thu tu (created_at DESC, id DESC)
+                query += " AND (created_at, id) < (?, ?)"
+                params.extend(keyset)
+                query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+                params.append(limit)
+            else:
+                query += " ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+                params.extend([limit, offset])
 
             cursor.execute(query, params)
             rows = cursor.fetchall()
@@ -307,6 +463,7 @@ class Database:
 
             return [dict(row) for row in rows]
 
+    @_timed
     def get_stats(self):
         """
         Thống kê
@@ -368,22 +525,43 @@ class Database:
                 "vehicles_inside": vehicles_inside
             }
 
+    @_timed
     def export_to_json(self):
         """
         Export toàn bộ DB ra JSON (để sync lên server)
 
-        Return: list of dict
+        Return: list of dict (DB lớn nên dùng iter_export() để không giữ hết trong RAM)
         """
-        with self.lock:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+        return list(self.iter_export())
 
-            cursor.execute("SELECT * FROM entries ORDER BY id")
-            rows = cursor.fetchall()
-            conn.close()
+    def iter_export(self, chunk_size=1000):
+        """
+        Generator toàn bộ entries theo thứ tự id (cùng nội dung với export_to_json)
 
-            return [dict(row) for row in rows]
+        Đọc từng chunk theo keyset id > last_id, mỗi chunk 1 query ngắn và chỉ giữ lock
+        trong lúc query → bộ nhớ không đổi theo số dòng, detection không bị chặn khi export.
+        """
+        last_id = 0
+        while True:
+            with self.lock:
+                conn = self._get_connection()
+                cursor = conn.cursor()
 
+                cursor.execute(
+                    "SELECT * FROM entries WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, chunk_size)
+                )
+                rows = cursor.fetchall()
+                conn.close()
+
+            for row in rows:
+                yield dict(row)
+
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1]["id"]
+
+    @_timed
     def clear_old_data(self, days=30):
         """
         Xóa data cũ hơn N ngày
@@ -401,11 +579,14 @@ class Database:
 
             deleted = cursor.rowcount
             conn.commit()
+            if deleted:
+                self._rebuild_active_index(cursor)
             conn.close()
 
             print(f" Deleted {deleted} old entries")
             return deleted
 
+    @_timed
     def update_history_entry(self, history_id, new_plate_id, new_plate_view):
         """Update biển số trong history entry và lưu lịch sử thay đổi (giống central)"""
         import json
@@ -451,6 +632,7 @@ class Database:
                 ))
 
                 conn.commit()
+                self._index_put(new_data)
                 return True
             except Exception as e:
                 conn.rollback()
@@ -459,6 +641,7 @@ class Database:
             finally:
                 conn.close()
 
+    @_timed
     def delete_history_entry(self, history_id):
         """Delete history entry và lưu lịch sử thay đổi (giống central)"""
         import json
@@ -492,6 +675,7 @@ class Database:
                 cursor.execute("DELETE FROM entries WHERE id = ?", (history_id,))
 
                 conn.commit()
+                self._index_remove(history_id)
                 return True
             except Exception as e:
                 conn.rollback()
@@ -500,6 +684,7 @@ class Database:
             finally:
                 conn.close()
 
+    @_timed
     def get_entry_event_info(self, history_id):
         """Lấy event_id và plate info của entry (phục vụ sync)"""
         with self.lock:
@@ -525,6 +710,7 @@ class Database:
             finally:
                 conn.close()
 
+    @_timed
     def find_entry_by_event_id(self, event_id):
         """Tìm entry theo event_id để map update/delete từ central"""
         if not event_id:
@@ -546,6 +732,7 @@ class Database:
             finally:
                 conn.close()
 
+    @_timed
     def get_history_changes(self, limit=100, offset=0, history_id=None):
         """Get lịch sử thay đổi (giống central)"""
         import json
@@ -589,6 +776,7 @@ class Database:
 
     # ===== Methods for Central Sync =====
 
+    @_timed
     def event_exists(self, event_id: str) -> bool:
         """Check if event_id already exists in database"""
         with self.lock:
@@ -605,6 +793,7 @@ class Database:
 
             return result is not None
 
+    @_timed
     def add_entry_with_event_id(self, event_id, plate_id, plate_view, entry_time, camera_id, camera_name,
                                   confidence, source, status="IN"):
         """Add entry with event_id for deduplication"""
@@ -626,10 +815,12 @@ class Database:
 
             entry_id = cursor.lastrowid
             conn.commit()
+            self._index_refresh(cursor, "id = ?", (entry_id,))
             conn.close()
 
             return entry_id
 
+    @_timed
     def update_exit_by_event_id(self, event_id, exit_time, camera_id, camera_name,
                                   confidence, source, duration, fee):
         """Update exit info by event_id (for sync)"""
@@ -651,44 +842,35 @@ class Database:
 
             rows_updated = cursor.rowcount
             conn.commit()
+            if rows_updated:
+                self._index_refresh(cursor, "event_id = ?", (event_id,))
             conn.close()
 
             return rows_updated > 0
 
+    @_timed
     def find_vehicle_in_parking(self, plate_id):
         """
         Find vehicle currently in parking lot (status = IN)
         Returns entry dict or None
         """
         with self.lock:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT id, plate_id, plate_view, entry_time, status,
-                       last_location, last_location_time, is_anomaly
-                FROM entries
-                WHERE plate_id = ? AND status = 'IN'
-                ORDER BY entry_time DESC
-                LIMIT 1
-            """, (plate_id,))
-
-            row = cursor.fetchone()
-            conn.close()
+            row = self._latest_active_for_plate(plate_id)
 
             if row:
                 return {
-                    "id": row[0],
-                    "plate_id": row[1],
-                    "plate_view": row[2],
-                    "entry_time": row[3],
-                    "status": row[4],
-                    "last_location": row[5],
-                    "last_location_time": row[6],
-                    "is_anomaly": row[7]
+                    "id": row["id"],
+                    "plate_id": row["plate_id"],
+                    "plate_view": row["plate_view"],
+                    "entry_time": row["entry_time"],
+                    "status": row["status"],
+                    "last_location": row["last_location"],
+                    "last_location_time": row["last_location_time"],
+                    "is_anomaly": row["is_anomaly"]
                 }
             return None
 
+    @_timed
     def update_vehicle_location(self, plate_id, location, location_time):
         """
         Update location for vehicle currently in parking lot
@@ -708,10 +890,13 @@ class Database:
 
             rows_updated = cursor.rowcount
             conn.commit()
+            if rows_updated:
+                self._index_refresh(cursor, "plate_id = ? AND status = 'IN'", (plate_id,))
             conn.close()
 
             return rows_updated > 0
 
+    @_timed
     def create_entry_from_parking_lot(self, event_id, plate_id, plate_view,
                                        entry_time, camera_name, location, location_time):
         """
@@ -739,43 +924,39 @@ class Database:
 
             entry_id = cursor.lastrowid
             conn.commit()
+            self._index_refresh(cursor, "id = ?", (entry_id,))
             conn.close()
 
             return entry_id
 
+    @_timed
     def get_vehicles_at_location(self, location):
         """
         Get all vehicles currently at a specific parking lot location
         Returns list of vehicle dicts
         """
         with self.lock:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT id, plate_id, plate_view, entry_time,
-                       last_location, last_location_time, is_anomaly
-                FROM entries
-                WHERE last_location = ? AND status = 'IN'
-                ORDER BY last_location_time DESC
-            """, (location,))
-
-            rows = cursor.fetchall()
-            conn.close()
+            ids = self._active_by_location.get(location, ())
+            rows = sorted(
+                (self._active_by_id[entry_id] for entry_id in ids),
+                key=lambda row: (row.get('last_location_time') or '', row['id']),
+                reverse=True
+            )
 
             vehicles = []
             for row in rows:
                 vehicles.append({
-                    "id": row[0],
-                    "plate_id": row[1],
-                    "plate_view": row[2],
-                    "entry_time": row[3],
-                    "location": row[4],
-                    "location_time": row[5],
-                    "is_anomaly": row[6]
+                    "id": row["id"],
+                    "plate_id": row["plate_id"],
+                    "plate_view": row["plate_view"],
+                    "entry_time": row["entry_time"],
+                    "location": row["last_location"],
+                    "location_time": row["last_location_time"],
+                    "is_anomaly": row["is_anomaly"]
                 })
             return vehicles
 
+    @_timed
     def save_parking_lot_config(self, location_name, capacity, camera_id, camera_type="PARKING_LOT"):
         """
         Save or update parking lot configuration to database
@@ -799,6 +980,7 @@ class Database:
             conn.close()
             print(f"[Database] Saved parking lot config: {location_name}, capacity={capacity}")
 
+    @_timed
     def get_all_parking_lots(self):
         """
         Get all parking lot configurations from database
@@ -7,8 +7,20 @@ import numpy as np
 from functools import lru_cache
 
 import config
+from metrics import get_metrics
 from plate_tracker import get_plate_tracker
 
+_metrics = get_metrics()
+# _count cua histogram = so frame da xu ly (khong can counter rieng)
+DETECTION_LOOP_SECONDS = _metrics.histogram("edge_detection_loop_seconds",
+                                            "Detection loop iteration time (parse + capture + OCR + broadcast)")
+DETECTION_FRAME_AGE = _metrics.histogram("edge_detection_frame_age_seconds",
+                                         "Age of a frame when the detection loop picks it up")
+DETECTIONS = _metrics.counter("edge_detections_total", "Plates detected by the IMX500")
+DETECTION_ERRORS = _metrics.counter("edge_detection_errors_total", "Exceptions in the detection loop")
+PLATES_RECOGNIZED = _metrics.counter("edge_plates_recognized_total",
+                                     "Plates with a valid OCR result, by gate validation status", ["status"])
+
 
 class Detection:
     """Detection object - Giống demo code"""
@@ -113,11 +125,13 @@ class DetectionService:
 
                 if frame_data is None:
                     continue
+                loop_started = time.perf_counter()
 
                 # OPTIMIZATION: Khong can frame - IMX500 da co bbox trong metadata
                 metadata = frame_data['metadata']
                 timestamp = frame_data['timestamp']
                 frame_id = frame_data['frame_id']
+                DETECTION_FRAME_AGE.observe(time.time() - timestamp)
                 cached_outputs = frame_data.get('outputs')  # Get cached outputs (nếu có)
 
                 # Parse detections tu IMX500 metadata (da co bbox san)
@@ -273,6 +287,7 @@ class DetectionService:
 
                                 # BUOC 1: CHECK BIEN SO CO TRONG GARA CHUA
                                 validation_result = self._validate_plate_for_gate(text)
+                                PLATES_RECOGNIZED.labels(validation_result['status']).inc()
 
                                 # Deduplication - Da process plate nay trong 15s gan day chua?
                                 import re
@@ -395,11 +410,15 @@ class DetectionService:
 
                 if len(detection_results) > 0:
                     self.total_detections += len(detection_results)
+                    DETECTIONS.inc(len(detection_results))
 
                     # GUI MOI FRAME CO DETECTION (de boxes hien thi lien tuc)
                     self.websocket_manager.broadcast_detections(detection_results)
 
+                DETECTION_LOOP_SECONDS.observe(time.perf_counter() - loop_started)
+
             except Exception as e:
+                DETECTION_ERRORS.inc()
                 time.sleep(0.1)
 
     def _parse_detections(self, metadata, cached_outputs=None):
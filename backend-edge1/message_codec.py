@@ -0,0 +1,83 @@
+"""
+Message Codec - Mã hóa frame WebSocket Edge ↔ Central (bản sao của backend-central/p2p/codec.py)
+
+Edge gửi danh sách "codecs" trong message định danh, Central chọn codec và báo lại trong
+message "connected". Central cũ không trả "codec" → Edge giữ JSON.
+
+- json         : text frame JSON (như cũ)
+- msgpack      : binary frame = 0x01 + MessagePack
+- msgpack+zlib : như msgpack, payload > COMPRESS_THRESHOLD byte thì 0x02 + zlib(MessagePack)
+
+Bên nhận decode theo loại frame (text → JSON, binary → xem byte đầu) nên không cần đồng bộ
+thời điểm chuyển codec giữa 2 bên.
+"""
+import json
+import zlib
+from typing import Any, List, Optional, Union
+
+try:
+    import msgpack
+except ImportError:  # msgpack la optional - thieu thi chi dung JSON
+    msgpack = None
+
+
+CODEC_JSON = "json"
+CODEC_MSGPACK = "msgpack"
+CODEC_MSGPACK_ZLIB = "msgpack+zlib"
+
+# Header byte cua binary frame
+_FRAME_MSGPACK = 0x01
+_FRAME_MSGPACK_ZLIB = 0x02
+
+# Chi nen payload lon (SYNC_RESPONSE, batch) - frame nho nen ton CPU ma khong giam bao nhieu byte
+COMPRESS_THRESHOLD = 1024
+COMPRESS_LEVEL = 1
+
+
+def supported_codecs() -> List[str]:
+    """Codec hỗ trợ, theo thứ tự ưu tiên"""
+    if msgpack is None:
+        return [CODEC_JSON]
+    return [CODEC_MSGPACK_ZLIB, CODEC_MSGPACK, CODEC_JSON]
+
+
+def negotiate(offered: Optional[List[str]]) -> str:
+    """Chọn codec từ danh sách bên kia đề nghị (None / rỗng = peer cũ → JSON)"""
+    if not offered:
+        return CODEC_JSON
+    for codec in supported_codecs():
+        if codec in offered:
+            return codec
+    return CODEC_JSON
+
+
+def encode(obj: Any, codec: str = CODEC_JSON) -> Union[str, bytes]:
+    """Encode 1 message → str (text frame) hoặc bytes (binary frame)"""
+    if codec == CODEC_JSON or msgpack is None:
+        return json.dumps(obj)
+
+    packed = msgpack.packb(obj, use_bin_type=True)
+    if codec == CODEC_MSGPACK_ZLIB and len(packed) > COMPRESS_THRESHOLD:
+        return bytes([_FRAME_MSGPACK_ZLIB]) + zlib.compress(packed, COMPRESS_LEVEL)
+    return bytes([_FRAME_MSGPACK]) + packed
+
+
+def decode(frame: Union[str, bytes]) -> Any:
+    """Decode 1 frame (text JSON hoặc binary có header) → dict"""
+    if isinstance(frame, str):
+        return json.loads(frame)
+
+    if not frame:
+        raise ValueError("Empty frame")
+
+    header = frame[0]
+    if header == _FRAME_MSGPACK or header == _FRAME_MSGPACK_ZLIB:
+        if msgpack is None:
+            raise ValueError("Received MessagePack frame but msgpack is not installed")
+        payload = frame[1:]
+        if header == _FRAME_MSGPACK_ZLIB:
+            payload = zlib.decompress(payload)
+        return msgpack.unpackb(payload, raw=False)
+
+    # Binary frame khong co header → JSON gui dang bytes
+    return json.loads(frame)
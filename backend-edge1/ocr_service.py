@@ -5,8 +5,15 @@ CHỈ DÙNG YOLO (Ultralytics) hoặc ONNX Runtime
 import cv2
 import numpy as np
 import os
+import time
 
 import config
+from metrics import get_metrics
+
+_metrics = get_metrics()
+OCR_SECONDS = _metrics.histogram("edge_ocr_seconds", "OCR latency per plate crop", ["backend"])
+OCR_RESULTS = _metrics.counter("edge_ocr_results_total", "OCR calls by outcome (text / empty / error)",
+                               ["backend", "result"])
 
 
 class OCRService:
@@ -466,16 +473,23 @@ class OCRService:
         if not self.is_ready():
             return None
 
+        started = time.perf_counter()
         try:
             if self.ocr_type == 'yolo':
-                return self._read_yolo(plate_img)
+                text = self._read_yolo(plate_img)
             elif self.ocr_type == 'onnx':
                 result = self._read_onnx(plate_img)
-                return result['text'] if result else None
+                text = result['text'] if result else None
             else:
                 return None
 
+            OCR_SECONDS.labels(self.ocr_type).observe(time.perf_counter() - started)
+            OCR_RESULTS.labels(self.ocr_type, "text" if text else "empty").inc()
+            return text
+
         except Exception as e:
+            OCR_SECONDS.labels(self.ocr_type).observe(time.perf_counter() - started)
+            OCR_RESULTS.labels(self.ocr_type, "error").inc()
             print(f"OCR recognize error: {e}")
             import traceback
             traceback.print_exc()
@@ -3,24 +3,30 @@ Parking Manager - Sử dụng SQLite
 """
 import re
 import json
+import math
 import os
+import threading
 import httpx
 import requests
+from dataclasses import dataclass
 from datetime import datetime
 from database import Database
 
-def _load_parking_fees():
+def _load_parking_fees(use_api=True):
     """
     Helper function để load parking fees từ API hoặc file JSON
-    Returns: dict với keys: fee_base, fee_per_hour
+    Args:
+        use_api: False = chỉ đọc file JSON local (không gọi mạng, dùng lúc khởi động)
+    Returns: (dict với keys: fee_base, fee_per_hour, source)
     """
     import config
     
     parking_api_url = getattr(config, "PARKING_API_URL", "")
     parking_json_file = getattr(config, "PARKING_JSON_FILE", "data/parking_fees.json")
+    json_path = os.path.join(os.path.dirname(__file__), parking_json_file)
     
-    try:
-        if parking_api_url and parking_api_url.strip():
+    if use_api and parking_api_url and parking_api_url.strip():
+        try:
             # Goi API external
             response = requests.get(parking_api_url, timeout=5)
             if response.status_code == 200:
@@ -28,18 +34,20 @@ def _load_parking_fees():
                 fees_dict = fees_data if isinstance(fees_data, dict) else fees_data.get("fees", {})
                 
                 # Luu vao file JSON de dung lam cache/fallback
-                json_path = os.path.join(os.path.dirname(__file__), parking_json_file)
                 os.makedirs(os.path.dirname(json_path), exist_ok=True)
                 with open(json_path, 'w', encoding='utf-8') as f:
                     json.dump(fees_dict, f, ensure_ascii=False, indent=2)
                 
-                return fees_dict
-        else:
-            # Doc tu file JSON
-            json_path = os.path.join(os.path.dirname(__file__), parking_json_file)
-            if os.path.exists(json_path):
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return fees_dict, "api"
+            print(f"Failed to load parking fees: API returned status {response.status_code}")
+        except Exception as e:
+            print(f"Failed to load parking fees: {e}")
+
+    # Doc tu file JSON (hoac cache cua lan goi API truoc)
+    try:
+        if os.path.exists(json_path):
+            with open(json_path, 'r', encoding='utf-8') as f:
+                return json.load(f), "file"
     except Exception as e:
         print(f"Failed to load parking fees: {e}")
     
@@ -47,18 +55,99 @@ def _load_parking_fees():
     return {
         "fee_base": getattr(config, "FEE_BASE", 0.5),
         "fee_per_hour": getattr(config, "FEE_PER_HOUR", 25000)
-    }
+    }, "default"
+
+
+@dataclass(frozen=True)
+class FeeTable:
+    """
+    Bảng phí đã tính sẵn (immutable)
+
+    Được build 1 lần mỗi khi reload config, sau đó swap nguyên object
+    → calculate_fee chỉ đọc 1 reference, không I/O, không lock
+    """
+    free_seconds: float
+    hourly_fee: int
+    source: str = "default"
+
+    @classmethod
+    def from_fees(cls, fees, source="default"):
+        free_hours = fees.get("fee_base", 0.5) or 0
+        hourly_fee = fees.get("fee_per_hour", 25000) or 0
+        return cls(
+            free_seconds=float(free_hours) * 3600,
+            hourly_fee=int(hourly_fee),
+            source=source
+        )
+
+    def fee_for(self, duration_seconds):
+        """Tính phí theo số giây gửi xe (làm tròn lên theo từng giờ)"""
+        if duration_seconds <= self.free_seconds:
+            return 0
+        billable_seconds = duration_seconds - self.free_seconds
+        return math.ceil(billable_seconds / 3600) * self.hourly_fee
 
 
 class ParkingManager:
     """Quản lý parking với SQLite"""
 
-    def __init__(self, db_file="data/parking.db"):
+    def __init__(self, db_file="data/parking.db", fee_refresh_interval=None):
         self.db = Database(db_file)
         self._subscription_cache = None
         self._subscription_cache_time = None
-        self._fees_cache = None
-        self._fees_cache_time = None
+
+        # Fee table: load tu file local (khong goi API), background thread se refresh tu API
+        fees, source = _load_parking_fees(use_api=False)
+        self._fee_table = FeeTable.from_fees(fees, source)
+
+        import config
+        self.fee_refresh_interval = fee_refresh_interval or getattr(config, "FEE_REFRESH_INTERVAL", 60)
+        self._fee_refresh_running = False
+        self._fee_refresh_wakeup = threading.Event()
+        self._fee_refresh_thread = None
+        self.start_fee_refresh()
+
+    def start_fee_refresh(self):
+        """Start background thread reload fee table (API/file) moi fee_refresh_interval giay"""
+        if self._fee_refresh_running:
+            return
+
+        self._fee_refresh_running = True
+        self._fee_refresh_thread = threading.Thread(target=self._fee_refresh_loop, daemon=True)
+        self._fee_refresh_thread.start()
+
+    def stop(self):
+        """Stop background fee refresh"""
+        self._fee_refresh_running = False
+        self._fee_refresh_wakeup.set()
+        if self._fee_refresh_thread:
+            self._fee_refresh_thread.join(timeout=2)
+
+    def request_fee_reload(self):
+        """Yeu cau reload fee table ngay (vd: sau khi PUT /api/parking/fees) - khong block"""
+        self._fee_refresh_wakeup.set()
+
+    def reload_fees(self):
+        """Load fees (co the cham - goi API) roi swap fee table"""
+        fees, source = _load_parking_fees()
+        self._fee_table = FeeTable.from_fees(fees, source)
+        return self._fee_table
+
+    def _fee_refresh_loop(self):
+        """Loop reload fee table - chay ngoai request path"""
+        while self._fee_refresh_running:
+            try:
+                self.reload_fees()
+            except Exception as e:
+                print(f"Fee refresh error: {e}")
+
+            self._fee_refresh_wakeup.wait(self.fee_refresh_interval)
+            self._fee_refresh_wakeup.clear()
+
+    @property
+    def fee_table(self):
+        """Fee table hien tai (snapshot immutable)"""
+        return self._fee_table
 
     def check_subscription(self, plate_id):
         """
@@ -505,7 +594,7 @@ class ParkingManager:
     def calculate_fee(self, entry_time, exit_time):
         """
         Tính phí gửi xe
-        Load fees từ API/file JSON thay vì hardcode
+        Dùng fee table đã load sẵn (background refresh) - không I/O trên request path
         """
         try:
             if isinstance(entry_time, str):
@@ -514,28 +603,7 @@ class ParkingManager:
                 exit_time = datetime.strptime(exit_time, "%Y-%m-%d %H:%M:%S")
 
             delta = exit_time - entry_time
-            duration_hours = delta.total_seconds() / 3600
-
-            # Load parking fees tu API/file JSON (cache 60 giay)
-            now = datetime.now()
-            if self._fees_cache is None or \
-               (self._fees_cache_time and (now - self._fees_cache_time).total_seconds() > 60):
-                self._fees_cache = _load_parking_fees()
-                self._fees_cache_time = now
-            
-            fees = self._fees_cache
-            free_hours = fees.get("fee_base", 0.5) or 0
-            hourly_fee = fees.get("fee_per_hour", 25000) or 0
-
-            if duration_hours <= free_hours:
-                fee = 0
-            else:
-                billable_hours = duration_hours - free_hours
-                # Lam tron len de tinh theo tung gio
-                import math
-                fee = math.ceil(billable_hours) * hourly_fee
-
-            return fee
+            return self._fee_table.fee_for(delta.total_seconds())
         except Exception as e:
             print(f"Error calculating fee: {e}")
             return 0
@@ -6,6 +6,17 @@ from typing import List
 import json
 import asyncio
 import threading
+import time
+
+from metrics import get_metrics
+
+_metrics = get_metrics()
+WS_CLIENTS = _metrics.gauge("edge_ws_clients", "Connected detection WebSocket clients")
+WS_MESSAGES = _metrics.counter("edge_ws_broadcasts_total", "Messages broadcast to WebSocket clients", ["type"])
+WS_DISPATCH_LAG = _metrics.histogram("edge_ws_dispatch_lag_seconds",
+                                     "Delay between a broadcast call and the event loop starting the fan-out")
+WS_FANOUT_SECONDS = _metrics.histogram("edge_ws_fanout_seconds", "Time to send one message to every client")
+WS_SEND_FAILURES = _metrics.counter("edge_ws_send_failures_total", "Sends that failed and dropped the client")
 
 
 class WebSocketManager:
@@ -14,6 +25,7 @@ class WebSocketManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
         self.loop = None  # Store event loop reference
+        WS_CLIENTS.set_function(lambda: len(self.active_connections))
     
     def set_event_loop(self, loop):
         """Set event loop from FastAPI"""
@@ -52,18 +64,24 @@ class WebSocketManager:
         json_text = json.dumps(message)
 
         # Schedule coroutine in event loop from another thread
+        WS_MESSAGES.labels(message['type']).inc()
         asyncio.run_coroutine_threadsafe(
-            self._send_to_all(json_text),
+            self._send_to_all(json_text, time.perf_counter()),
             self.loop
         )
 
-    async def _send_to_all(self, json_text):
+    async def _send_to_all(self, json_text, scheduled_at=None):
         """
         Send message tới tất cả connections ĐỒNG THỜI (concurrent)
 
         Args:
             json_text: Already serialized JSON string (tránh serialize nhiều lần)
+            scheduled_at: perf_counter lúc thread gọi broadcast (đo độ trễ event loop)
         """
+        started = time.perf_counter()
+        if scheduled_at is not None:
+            WS_DISPATCH_LAG.observe(started - scheduled_at)
+
         if not self.active_connections:
             return
 
@@ -75,6 +93,7 @@ class WebSocketManager:
 
         # Gửi song song, không đợi nhau
         await asyncio.gather(*tasks, return_exceptions=True)
+        WS_FANOUT_SECONDS.observe(time.perf_counter() - started)
 
     async def _send_to_one(self, connection, json_text):
         """
@@ -87,6 +106,7 @@ class WebSocketManager:
             await connection.send_text(json_text)  # Gửi text thay vì send_json
         except Exception:
             # Connection failed - remove it
+            WS_SEND_FAILURES.inc()
             self.disconnect(connection)
 
     def broadcast_barrier_status(self, status):
@@ -111,7 +131,8 @@ class WebSocketManager:
         json_text = json.dumps(message)
 
         # Schedule coroutine in event loop from another thread
+        WS_MESSAGES.labels(message['type']).inc()
         asyncio.run_coroutine_threadsafe(
-            self._send_to_all(json_text),
+            self._send_to_all(json_text, time.perf_counter()),
             self.loop
         )
\ No newline at end of file
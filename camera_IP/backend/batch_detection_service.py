@@ -2,7 +2,7 @@
 GPU Batch Detection Service - Tối ưu cho xử lý nhiều camera với 1 GPU
 
 Kiến trúc:
-1. Camera Threads: Mỗi camera 1 thread riêng để đọc frame (I/O bound)
+1. Camera Threads: Mỗi camera 1 thread riêng lấy frame từ decode service (decode 1 lần / camera)
 2. Frame Queue: Queue chứa frames từ tất cả cameras
 3. GPU Worker Thread: Lấy batch frames, inference GPU, trả kết quả
 4. Results Queue: Broadcast qua WebSocket
@@ -22,6 +22,9 @@ import numpy as np
 from typing import Optional, Dict, List
 from dataclasses import dataclass
 from license_plate_detector import get_detector
+from decode_service import get_decode_service
+from gpu_config import GPUConfig, GPUConfigError, load_gpu_config
+from motion_detector import MotionGate
 from websocket_manager import WebSocketManager
 
 
@@ -34,6 +37,7 @@ class FrameJob:
     timestamp: float
     conf_threshold: float
     iou_threshold: float
+    scale: float = 1.0  # frame da resize theo input_size, bbox chia lai de ve toa do goc
 
 
 @dataclass
@@ -53,11 +57,15 @@ class GPUBatchDetectionService:
     - Tự động detect GPU memory
     - Tự động điều chỉnh batch size
     - Tự động giảm batch size nếu GPU OOM
+
+    Cấu hình từ gpu_config.yaml (batch_size, input_size, fp16, frame_skip, batch_timeout_ms, motion, ...)
+    - reload_config() áp dụng lại lúc runtime không cần restart
     """
 
-    def __init__(self, websocket_manager: WebSocketManager):
+    def __init__(self, websocket_manager: WebSocketManager, config_path: Optional[str] = None):
         self.websocket_manager = websocket_manager
         self.detector = None
+        self.config_path = config_path
 
         # Threading control
         self.running = False
@@ -75,11 +83,6 @@ class GPUBatchDetectionService:
         self.gpu_worker_thread: Optional[threading.Thread] = None
         self.result_worker_thread: Optional[threading.Thread] = None
 
-        # GPU settings (auto-detect và auto-tune)
-        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        self.batch_size = self._auto_detect_batch_size()
-        self.target_size = 640  # YOLO standard input size
-
         # Statistics
         self.stats = {
             'total_frames': 0,
@@ -89,16 +92,80 @@ class GPUBatchDetectionService:
             'gpu_utilization': 0
         }
 
+        # GPU settings tu gpu_config.yaml (batch_size auto → auto-detect theo GPU memory)
+        self.config = None
+        self._apply_config(load_gpu_config(config_path))
+
         print(f"[GPU BATCH] Initialized with device={self.device}, batch_size={self.batch_size}")
 
-    def _auto_detect_batch_size(self) -> int:
+    def _apply_config(self, config: GPUConfig):
+        """
+        Áp dụng config (validate phần phụ thuộc phần cứng trước khi đổi bất kỳ giá trị nào)
+
+        Raises:
+            GPUConfigError: device=cuda nhưng không có GPU
+        """
+        cuda_available = torch.cuda.is_available()
+        if config.gpu.device == 'cuda' and not cuda_available:
+            raise GPUConfigError("gpu.device: cuda requested but no CUDA device is available")
+        device = 'cuda' if config.gpu.device == 'cuda' or (config.gpu.device == 'auto' and cuda_available) else 'cpu'
+
+        if config.gpu.batch_size == 'auto':
+            batch_size = self._auto_detect_batch_size(device)
+        else:
+            batch_size = config.gpu.batch_size
+
+        if config.gpu.fp16 and device != 'cuda':
+            print("[GPU BATCH] fp16 is only supported on CUDA, using fp32")
+
+        self.config = config
+        self.device = device
+        self.batch_size = batch_size
+        self.target_size = config.gpu.input_size
+        self.half = config.gpu.fp16 and device == 'cuda'
+        self.frame_skip = config.camera.frame_skip
+        self.batch_timeout = config.camera.batch_timeout_ms / 1000
+        self.frame_queue.maxsize = config.camera.max_queue_size
+
+        # Gate motion moi theo config (camera tat motion_gate luc start van giu tat)
+        for camera_info in self.active_cameras.values():
+            camera_info['motion_gate'] = self._create_motion_gate() if camera_info['motion_gate_enabled'] else None
+
+    def _create_motion_gate(self) -> Optional[MotionGate]:
+        motion = self.config.motion
+        if not motion.enabled:
+            return None
+        return MotionGate(
+            method=motion.method,
+            frame_width=motion.frame_width,
+            open_frames=motion.open_frames,
+            hold_seconds=motion.hold_seconds,
+            keepalive_seconds=motion.keepalive_seconds
+        )
+
+    def reload_config(self) -> dict:
+        """
+        Đọc lại gpu_config.yaml và áp dụng cho cameras đang chạy
+
+        Raises:
+            GPUConfigError: file lỗi - config đang chạy giữ nguyên
+        """
+        config = load_gpu_config(self.config_path)
+        with self.lock:
+            self._apply_config(config)
+        print(f"[GPU BATCH] Config reloaded: device={self.device}, batch_size={self.batch_size}, "
+              f"input_size={self.target_size}, frame_skip={self.frame_skip}, "
+              f"batch_timeout={self.batch_timeout * 1000:.0f}ms")
+        return self.config.to_dict()
+
+    def _auto_detect_batch_size(self, device: str) -> int:
         """
         Tự động detect batch size tối ưu dựa trên GPU memory
 
         Returns:
             Optimal batch size
         """
-        if not torch.cuda.is_available():
+        if device != 'cuda':
             return 1  # CPU mode
 
         try:
@@ -129,8 +196,9 @@ class GPUBatchDetectionService:
         self,
         camera_id: str,
         rtsp_url: str,
-        conf_threshold: float = 0.25,
-        iou_threshold: float = 0.45
+        conf_threshold: Optional[float] = None,
+        iou_threshold: Optional[float] = None,
+        motion_gate: bool = True
     ) -> bool:
         """
         Start detection cho 1 camera
@@ -138,8 +206,9 @@ class GPUBatchDetectionService:
         Args:
             camera_id: Camera ID
             rtsp_url: RTSP URL hoặc camera index
-            conf_threshold: Confidence threshold
-            iou_threshold: IOU threshold
+            conf_threshold: Confidence threshold (None = detection.conf_threshold trong gpu_config.yaml)
+            iou_threshold: IOU threshold (None = detection.iou_threshold trong gpu_config.yaml)
+            motion_gate: Chỉ đưa frame vào GPU khi có chuyển động (+ keep-alive, bật / tắt chung ở motion.enabled)
 
         Returns:
             True if success
@@ -154,28 +223,14 @@ class GPUBatchDetectionService:
             try:
                 print(f"[GPU BATCH] Opening camera {camera_id}: {rtsp_url}")
 
-                # Clean RTSP URL (remove go2rtc params)
-                clean_url = rtsp_url.split('#')[0] if '#' in rtsp_url else rtsp_url
-
-                # Open camera
-                if clean_url.isdigit():
-                    cap = cv2.VideoCapture(int(clean_url))
-                else:
-                    cap = cv2.VideoCapture(clean_url, cv2.CAP_FFMPEG)
-                    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Reduce latency
-
-                if not cap.isOpened():
+                # Subscribe decoder (1 capture / camera, dùng chung với stream MJPEG)
+                try:
+                    subscription = get_decode_service().subscribe(rtsp_url)
+                except RuntimeError:
                     print(f"[GPU BATCH] Failed to open camera {camera_id}")
                     return False
 
-                # Test read frame
-                ret, frame = cap.read()
-                if not ret or frame is None:
-                    print(f"[GPU BATCH] Failed to read frame from {camera_id}")
-                    cap.release()
-                    return False
-
-                print(f"[GPU BATCH] Camera {camera_id} opened, frame size: {frame.shape}")
+                print(f"[GPU BATCH] Camera {camera_id} opened")
 
                 # Load detector nếu chưa có
                 if self.detector is None:
@@ -184,14 +239,17 @@ class GPUBatchDetectionService:
                     print("[GPU BATCH] Detector loaded")
 
                 # Lưu camera info
+                detection = self.config.detection
                 self.active_cameras[camera_id] = {
-                    'cap': cap,
+                    'subscription': subscription,
                     'url': rtsp_url,
-                    'conf_threshold': conf_threshold,
-                    'iou_threshold': iou_threshold,
+                    'conf_threshold': detection.conf_threshold if conf_threshold is None else conf_threshold,
+                    'iou_threshold': detection.iou_threshold if iou_threshold is None else iou_threshold,
                     'frame_count': 0,
                     'detection_count': 0,
-                    'fps': cap.get(cv2.CAP_PROP_FPS) or 30
+                    'skip_remaining': 0,
+                    'motion_gate_enabled': motion_gate,
+                    'motion_gate': self._create_motion_gate() if motion_gate else None
                 }
 
                 # Start camera thread
@@ -238,7 +296,7 @@ class GPUBatchDetectionService:
 
             # Release camera
             camera_info = self.active_cameras[camera_id]
-            camera_info['cap'].release()
+            camera_info['subscription'].close()
 
             # Remove from active cameras
             del self.active_cameras[camera_id]
@@ -269,8 +327,8 @@ class GPUBatchDetectionService:
 
     def _camera_reader_loop(self, camera_id: str):
         """
-        Camera reader thread - đọc frame từ camera và đưa vào queue
-        Mỗi camera 1 thread riêng để tránh blocking
+        Camera reader thread - lấy frame từ decoder và đưa vào queue
+        Mỗi camera 1 thread riêng, chờ frame mới từ decoder (nhịp theo FPS camera)
         """
         print(f"[GPU BATCH] Camera reader thread started for {camera_id}")
 
@@ -281,14 +339,28 @@ class GPUBatchDetectionService:
                         break  # Camera đã bị stop
 
                     camera_info = self.active_cameras[camera_id]
-                    cap = camera_info['cap']
+                    subscription = camera_info['subscription']
 
-                # Read frame (I/O operation - có thể mất vài ms)
-                ret, frame = cap.read()
+                # Chờ frame mới (decoder decode 1 lần cho mọi consumer)
+                frame = subscription.read(timeout=1.0)
 
-                if not ret or frame is None:
-                    print(f"[GPU BATCH] Failed to read frame from {camera_id}")
-                    time.sleep(0.1)
+                if frame is None:
+                    continue
+
+                # Update frame count
+                with self.lock:
+                    camera_info['frame_count'] += 1
+                    frame_id = camera_info['frame_count']
+
+                    # Frame skip - xử lý 1 frame rồi bỏ frame_skip frame tiếp theo
+                    if camera_info['skip_remaining'] > 0:
+                        camera_info['skip_remaining'] -= 1
+                        continue
+                    camera_info['skip_remaining'] = self.frame_skip
+
+                # Motion gate - cảnh tĩnh thì không tốn GPU (vẫn detect định kỳ theo keep-alive)
+                gate = camera_info['motion_gate']
+                if gate is not None and not gate.should_detect(frame, time.monotonic()):
                     continue
 
                 # Preprocess frame (resize) để giảm GPU workload
@@ -302,11 +374,6 @@ class GPUBatchDetectionService:
                     resized_frame = frame
                     scale = 1.0
 
-                # Update frame count
-                with self.lock:
-                    camera_info['frame_count'] += 1
-                    frame_id = camera_info['frame_count']
-
                 # Create frame job
                 job = FrameJob(
                     camera_id=camera_id,
@@ -314,7 +381,8 @@ class GPUBatchDetectionService:
                     frame_id=frame_id,
                     timestamp=time.time(),
                     conf_threshold=camera_info['conf_threshold'],
-                    iou_threshold=camera_info['iou_threshold']
+                    iou_threshold=camera_info['iou_threshold'],
+                    scale=scale
                 )
 
                 # Push to queue (non-blocking)
@@ -324,10 +392,6 @@ class GPUBatchDetectionService:
                     # Queue full - skip frame (giảm latency)
                     print(f"[GPU BATCH] Frame queue full, skipping frame from {camera_id}")
 
-                # Control frame rate (tránh overwhelm GPU)
-                # Đọc frame theo FPS của camera
-                time.sleep(1.0 / camera_info['fps'])
-
             except Exception as e:
                 print(f"[GPU BATCH] Error in camera reader {camera_id}: {e}")
                 time.sleep(0.1)
@@ -343,29 +407,33 @@ class GPUBatchDetectionService:
 
         batch_buffer = []
         last_inference_time = time.time()
-        max_wait_time = 0.05  # 50ms timeout để tạo batch
+        # Thong ke theo chu ky performance.stats_interval
+        window_started = time.monotonic()
+        window_frames = 0
+        window_batches = 0
+        window_inference_ms = 0.0
 
         while self.running:
             try:
-                # Collect frames into batch
-                timeout_start = time.time()
+                # Chờ frame đầu tiên của batch
+                try:
+                    batch_buffer.append(self.frame_queue.get(timeout=0.1))
+                except queue.Empty:
+                    continue
 
+                # Gom thêm frame tới batch_size hoặc hết batch_timeout_ms
+                # (timeout ngắn → latency thấp, dài → batch đầy hơn, throughput cao hơn)
+                deadline = time.monotonic() + self.batch_timeout
                 while len(batch_buffer) < self.batch_size:
-                    # Timeout nếu chờ quá lâu (tránh latency cao khi có ít camera)
-                    if time.time() - timeout_start > max_wait_time:
-                        break
-
+                    remaining = deadline - time.monotonic()
                     try:
-                        job = self.frame_queue.get(timeout=0.01)
-                        batch_buffer.append(job)
+                        if remaining > 0:
+                            batch_buffer.append(self.frame_queue.get(timeout=remaining))
+                        else:
+                            batch_buffer.append(self.frame_queue.get(block=False))
                     except queue.Empty:
                         break
 
-                # Nếu không có frame nào, chờ tiếp
-                if len(batch_buffer) == 0:
-                    time.sleep(0.001)
-                    continue
-
                 # Run batch inference
                 start_time = time.time()
                 results = self._batch_inference(batch_buffer)
@@ -383,11 +451,24 @@ class GPUBatchDetectionService:
                     except queue.Full:
                         print("[GPU BATCH] Result queue full, dropping result")
 
-                # Log performance
-                fps = len(batch_buffer) / (inference_time / 1000)
-                print(f"[GPU BATCH] Processed batch={len(batch_buffer)}, "
-                      f"inference={inference_time:.1f}ms, "
-                      f"throughput={fps:.1f} FPS")
+                # Log performance (moi stats_interval giay thay vi moi batch)
+                window_frames += len(batch_buffer)
+                window_batches += 1
+                window_inference_ms += inference_time
+                performance = self.config.performance
+                elapsed = time.monotonic() - window_started
+                if elapsed >= performance.stats_interval:
+                    if performance.enable_stats:
+                        message = (f"[GPU BATCH] {window_frames / elapsed:.1f} FPS, "
+                                   f"avg batch={window_frames / window_batches:.1f}, "
+                                   f"avg inference={window_inference_ms / window_batches:.1f}ms, "
+                                   f"queue={self.frame_queue.qsize()}")
+                        if performance.monitor_gpu_memory and self.device == 'cuda':
+                            message += f", GPU mem={torch.cuda.memory_allocated() / 1024**2:.0f}MB"
+                        print(message)
+                    window_started = time.monotonic()
+                    window_frames = window_batches = 0
+                    window_inference_ms = 0.0
 
                 # Clear batch buffer
                 batch_buffer.clear()
@@ -424,6 +505,8 @@ class GPUBatchDetectionService:
                 conf=jobs[0].conf_threshold,
                 iou=jobs[0].iou_threshold,
                 device=self.device,
+                imgsz=self.target_size,
+                half=self.half,
                 verbose=False
             )
 
@@ -436,7 +519,8 @@ class GPUBatchDetectionService:
                 # Parse YOLO results
                 boxes = result.boxes
                 for box in boxes:
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+                    # Toa do tren frame da resize → frame goc
+                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy() / job.scale
                     confidence = float(box.conf[0].cpu().numpy())
                     class_id = int(box.cls[0].cpu().numpy())
 
@@ -519,7 +603,8 @@ class GPUBatchDetectionService:
                     'frame_count': camera_info['frame_count'],
                     'detection_count': camera_info['detection_count'],
                     'conf_threshold': camera_info['conf_threshold'],
-                    'iou_threshold': camera_info['iou_threshold']
+                    'iou_threshold': camera_info['iou_threshold'],
+                    'motion_gate': camera_info['motion_gate'].get_stats() if camera_info['motion_gate'] else None
                 }
 
             return {
@@ -527,6 +612,10 @@ class GPUBatchDetectionService:
                 'global': {
                     'device': self.device,
                     'batch_size': self.batch_size,
+                    'input_size': self.target_size,
+                    'fp16': self.half,
+                    'frame_skip': self.frame_skip,
+                    'batch_timeout_ms': self.batch_timeout * 1000,
                     'total_frames': self.stats['total_frames'],
                     'total_detections': self.stats['total_detections'],
                     'avg_batch_size': self.stats['avg_batch_size'],
@@ -0,0 +1,249 @@
+"""
+Batch Upload Service - Detect nhiều ảnh trong 1 request (multi-file / zip / NDJSON)
+
+Pipeline:
+1. Decode: cv2.imdecode chạy trong thread pool (nhiều ảnh cùng lúc, không chặn event loop)
+2. Inference: gom ảnh đã decode thành batch → detector.detect_from_frames, chạy qua
+   InferenceExecutor dùng chung (model chỉ có 1 chủ, không predict song song với endpoint khác)
+3. Kết quả: mỗi ảnh 1 dòng NDJSON, gửi ngay khi batch chứa ảnh đó xong (đúng thứ tự upload)
+
+Ảnh lỗi (không decode được, entry zip / dòng NDJSON hỏng, hàng đợi inference đầy) trả về
+dòng có "error", không làm hỏng cả request. Số ảnh đang chờ bị giới hạn (max_pending)
+→ archive lớn không decode hết vào RAM trước khi inference kịp chạy.
+"""
+import asyncio
+import base64
+import io
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from inference_executor import get_inference_executor
+from license_plate_detector import get_detector
+
+# So anh toi da trong 1 lan goi YOLO
+BATCH_SIZE = 8
+# Thread decode JPEG / PNG (cv2.imdecode nha GIL)
+DECODE_WORKERS = min(4, os.cpu_count() or 1)
+# Anh da nhan nhung chua co ket qua (decode + cho inference)
+MAX_PENDING_IMAGES = 32
+
+# (name, bytes anh, loi) - loi != None → anh khong detect duoc
+UploadItem = Tuple[str, Optional[bytes], Optional[str]]
+
+
+def _decode_image(data: bytes) -> Optional[np.ndarray]:
+    nparr = np.frombuffer(data, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def _is_zip(filename: str, data: bytes) -> bool:
+    return filename.lower().endswith('.zip') or data[:4] == b'PK\x03\x04'
+
+
+async def iter_upload_files(uploads: Iterable[Tuple[str, bytes]]) -> AsyncIterator[UploadItem]:
+    """
+    Ảnh từ multipart upload: mỗi file 1 ảnh, file .zip → mỗi entry 1 ảnh
+
+    Args:
+        uploads: (filename, nội dung file)
+    """
+    for filename, data in uploads:
+        filename = filename or "upload"
+        if not _is_zip(filename, data):
+            yield filename, data, None
+            continue
+
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(data))
+        except zipfile.BadZipFile as e:
+            yield filename, None, f"Invalid zip file: {e}"
+            continue
+
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                name = f"{filename}/{info.filename}"
+                try:
+                    # Giai nen ngoai event loop
+                    yield name, await asyncio.to_thread(archive.read, info), None
+                except Exception as e:
+                    yield name, None, f"Failed to read zip entry: {e}"
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[UploadItem]:
+    """
+    Ảnh từ body NDJSON: mỗi dòng {"name": "...", "image": "<base64>"} ("name" không bắt buộc)
+
+    Tách dòng theo chunk → không phải ghép cả body thành 1 bytes lớn
+    """
+    buffer = b''
+    line_number = 0
+
+    async def parse(line: bytes):
+        nonlocal line_number
+        line_number += 1
+        name = f"line{line_number}"
+        try:
+            item = json.loads(line)
+            name = str(item.get('name') or name)
+            return name, base64.b64decode(item['image'], validate=True), None
+        except Exception as e:
+            return name, None, f"Invalid NDJSON line: {e}"
+
+    async for chunk in chunks:
+        buffer += chunk
+        while b'\n' in buffer:
+            line, buffer = buffer.split(b'\n', 1)
+            if line.strip():
+                yield await parse(line)
+
+    if buffer.strip():
+        yield await parse(buffer)
+
+
+class BatchUploadService:
+    """Decode song song + batch inference cho upload nhiều ảnh"""
+
+    def __init__(self, batch_size: int = BATCH_SIZE, decode_workers: int = DECODE_WORKERS,
+                 max_pending: int = MAX_PENDING_IMAGES):
+        self.batch_size = batch_size
+        self.max_pending = max(max_pending, batch_size)
+        self.decode_executor = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="upload-decode")
+        self.detector = None
+
+        # Statistics
+        self.stats = {
+            'requests': 0,
+            'images': 0,
+            'failed': 0,
+            'batches': 0,
+        }
+
+    async def detect_stream(self, items: AsyncIterator[UploadItem], conf_threshold: float = 0.25,
+                            iou_threshold: float = 0.45) -> AsyncIterator[str]:
+        """
+        Detect mọi ảnh từ items, yield từng dòng NDJSON
+
+        Mỗi ảnh: {"index", "name", "detections", "count"} hoặc {"index", "name", "error"}
+        Dòng cuối: {"done": true, "images", "failed", "batches", "processing_time_ms"}
+        """
+        if self.detector is None:
+            self.detector = await get_inference_executor().run(get_detector)
+
+        started = time.time()
+        self.stats['requests'] += 1
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending)
+        producer = asyncio.ensure_future(self._produce(items, queue))
+        images = failed = batches = 0
+
+        try:
+            done = False
+            while not done:
+                # Cho anh dau tien, lay them anh da co san cho du batch (khong cho them)
+                batch = [await queue.get()]
+                while len(batch) < self.batch_size and not queue.empty():
+                    batch.append(queue.get_nowait())
+                if batch[-1] is None:
+                    batch.pop()
+                    done = True
+
+                results, inferred = await self._process_batch(batch, conf_threshold, iou_threshold)
+                batches += inferred
+                for result in results:
+                    images += 1
+                    failed += 'error' in result
+                    yield json.dumps(result) + '\n'
+        finally:
+            producer.cancel()
+            self.stats['images'] += images
+            self.stats['failed'] += failed
+            self.stats['batches'] += batches
+
+        yield json.dumps({
+            'done': True,
+            'images': images,
+            'failed': failed,
+            'batches': batches,
+            'processing_time_ms': round((time.time() - started) * 1000, 2)
+        }) + '\n'
+
+    async def _produce(self, items: AsyncIterator[UploadItem], queue: asyncio.Queue):
+        """Đọc input, submit decode vào thread pool (queue đầy → chờ, giới hạn RAM)"""
+        loop = asyncio.get_running_loop()
+        index = 0
+        try:
+            async for name, data, error in items:
+                future = None
+                if error is None:
+                    future = loop.run_in_executor(self.decode_executor, _decode_image, data)
+                await queue.put((index, name, future, error))
+                index += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Body / multipart hong giua chung → bao loi nhu 1 anh, van tra ket qua cac anh truoc
+            await queue.put((index, "input", None, f"Failed to read input: {e}"))
+        await queue.put(None)
+
+    async def _process_batch(self, batch: List[tuple], conf_threshold: float,
+                             iou_threshold: float) -> Tuple[List[dict], bool]:
+        """Chờ decode cả batch, chạy 1 lần YOLO cho các ảnh hợp lệ → (kết quả theo thứ tự, có inference)"""
+        results = []
+        frames = []
+        for index, name, future, error in batch:
+            frame = None
+            if future is not None:
+                try:
+                    frame = await future
+                except Exception as e:
+                    error = f"Decode failed: {e}"
+                if frame is None and error is None:
+                    error = "Invalid image file"
+            results.append({'index': index, 'name': name, 'error': error} if error else
+                           {'index': index, 'name': name})
+            if frame is not None:
+                frames.append((results[-1], frame))
+
+        if frames:
+            try:
+                # Executor day → InferenceOverloaded, cac anh cua batch tra ve "error" nhu loi khac
+                detections = await get_inference_executor().run(
+                    self.detector.detect_from_frames,
+                    [frame for _, frame in frames],
+                    conf_threshold,
+                    iou_threshold
+                )
+                for (result, _), frame_detections in zip(frames, detections):
+                    result['detections'] = frame_detections
+                    result['count'] = len(frame_detections)
+            except Exception as e:
+                for result, _ in frames:
+                    result['error'] = f"Detection failed: {e}"
+
+        return results, bool(frames)
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, batch_size=self.batch_size, max_pending=self.max_pending)
+
+    def shutdown(self):
+        self.decode_executor.shutdown(wait=False)
+
+
+# Global batch upload service instance (singleton)
+_batch_upload_service_instance: Optional[BatchUploadService] = None
+
+
+def get_batch_upload_service() -> BatchUploadService:
+    """Get or create the global batch upload service instance"""
+    global _batch_upload_service_instance
+    if _batch_upload_service_instance is None:
+        _batch_upload_service_instance = BatchUploadService()
+    return _batch_upload_service_instance
@@ -0,0 +1,156 @@
+"""
+Benchmark: detect --images ảnh qua HTTP - /api/detect/upload (1 ảnh / request) vs endpoint batch
+
+Chạy app FastAPI thật (uvicorn, localhost) trong process, ảnh JPEG lấy từ video giả lập 720p.
+
+- single      : --concurrency client gửi /api/detect/upload song song, mỗi request 1 ảnh
+- batch       : 1 request /api/detect/batch (multipart, mọi ảnh)
+- batch-zip   : 1 request /api/detect/batch với 1 file .zip chứa mọi ảnh
+- batch-ndjson: 1 request /api/detect/batch/ndjson (ảnh base64, mỗi dòng 1 ảnh)
+
+In ra ảnh / giây, thời gian tới kết quả đầu tiên và CPU của process (giây CPU / giây).
+
+Cần ultralytics + model:
+    python benchmarks/bench_batch_upload.py --model models/license_plate.pt [--images 200] [--concurrency 4]
+"""
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import license_plate_detector  # noqa: E402
+from bench_shared_decode import make_video  # noqa: E402
+
+
+def make_images(count):
+    """count ảnh JPEG 1280x720 từ video giả lập (xe chạy qua)"""
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_batch_upload_"), "camera.mp4")
+    make_video(path, 1280, 720, 25, max(1, count / 25), 0)
+    cap = cv2.VideoCapture(path)
+    images = []
+    while len(images) < count:
+        ret, frame = cap.read()
+        if not ret:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        images.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    cap.release()
+    return images
+
+
+def start_server():
+    """uvicorn chạy main.app trong thread, trả về base URL"""
+    import uvicorn
+    import main
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
+
+
+def run_single(base_url, images, concurrency):
+    first = []
+    started = time.monotonic()
+
+    def send(chunk):
+        with httpx.Client(base_url=base_url, timeout=120) as client:
+            for index in chunk:
+                response = client.post("/api/detect/upload", files={"file": (f"{index}.jpg", images[index], "image/jpeg")})
+                response.raise_for_status()
+                if not first:
+                    first.append(time.monotonic() - started)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, [range(i, len(images), concurrency) for i in range(concurrency)]))
+    return time.monotonic() - started, first[0]
+
+
+def run_batch(base_url, images, mode):
+    if mode == "batch":
+        request = {"url": "/api/detect/batch",
+                   "files": [("files", (f"{i}.jpg", data, "image/jpeg")) for i, data in enumerate(images)]}
+    elif mode == "batch-zip":
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+            for i, data in enumerate(images):
+                archive.writestr(f"{i}.jpg", data)
+        request = {"url": "/api/detect/batch", "files": [("files", ("images.zip", buffer.getvalue(), "application/zip"))]}
+    else:
+        body = "".join(json.dumps({"name": f"{i}.jpg", "image": base64.b64encode(data).decode()}) + "\n"
+                       for i, data in enumerate(images))
+        request = {"url": "/api/detect/batch/ndjson", "content": body}
+
+    first = None
+    count = 0
+    started = time.monotonic()
+    with httpx.Client(base_url=base_url, timeout=600) as client:
+        with client.stream("POST", **request) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                if result.get("done"):
+                    break
+                if "error" in result:
+                    raise RuntimeError(f"{result['name']}: {result['error']}")
+                count += 1
+                if first is None:
+                    first = time.monotonic() - started
+    if count != len(images):
+        raise RuntimeError(f"{mode}: got {count} results for {len(images)} images")
+    return time.monotonic() - started, first
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4, help="so client song song cho endpoint 1 anh")
+    args = parser.parse_args()
+
+    images = make_images(args.images)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        license_plate_detector._detector_instance = license_plate_detector.LicensePlateDetector(args.model)
+        base_url, server = start_server()
+        # Warm-up (model + thread pool)
+        run_batch(base_url, images[:8], "batch")
+
+    size = sum(len(data) for data in images) / len(images) / 1024
+    print(f"{args.images} images (1280x720 JPEG, {size:.0f} KB avg), {os.cpu_count()} CPU(s)")
+    print(f"{'mode':<16} {'images/s':>9} {'first result':>13} {'cpu':>5}")
+    runs = [("single", 1), ("single", args.concurrency), ("batch", None), ("batch-zip", None), ("batch-ndjson", None)]
+    for mode, concurrency in runs:
+        cpu_started = time.process_time()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if mode == "single":
+                elapsed, first = run_single(base_url, images, concurrency)
+            else:
+                elapsed, first = run_batch(base_url, images, mode)
+        cpu = (time.process_time() - cpu_started) / elapsed
+        label = f"single x{concurrency}" if mode == "single" else mode
+        print(f"{label:<16} {len(images) / elapsed:>9.1f} {first * 1000:>11.0f}ms {cpu:>5.2f}")
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark: DetectionStreamService với 1 → 16 camera (file video local, phát theo FPS qua DecodeService)
+
+- legacy : vòng lặp round-robin 1 thread như trước (đọc lần lượt từng camera → detect → sleep 0.05 mỗi vòng)
+- workers: DetectionStreamService hiện tại (reader thread / camera + inference worker chia lượt công bằng)
+
+Motion gate tắt để mọi frame đều cần detect. In ra mỗi số camera: FPS detect đạt được theo camera
+(trung bình / thấp nhất / cao nhất), tổng số lần detect / giây và latency trung bình (frame → kết quả).
+
+Cần ultralytics + model:
+    python benchmarks/bench_detection_scaling.py --model models/license_plate.pt [--cameras 1 --cameras 4 --cameras 16]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import license_plate_detector  # noqa: E402
+from bench_shared_decode import make_video  # noqa: E402
+from decode_service import get_decode_service  # noqa: E402
+from detection_stream import DetectionStreamService  # noqa: E402
+from websocket_manager import WebSocketManager  # noqa: E402
+
+
+class MeasuredService(DetectionStreamService):
+    """DetectionStreamService + đếm số lần detect / latency theo camera"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.detected = {}
+        self.latencies = []
+
+    def _detect_and_broadcast(self, camera_id, camera_info, frame_id, resized_frame, scale, captured_at):
+        super()._detect_and_broadcast(camera_id, camera_info, frame_id, resized_frame, scale, captured_at)
+        self.detected[camera_id] = self.detected.get(camera_id, 0) + 1
+        self.latencies.append(time.time() - captured_at)
+
+
+def legacy_loop(subscriptions, detector, detected, latencies, stop_event):
+    """_detection_loop trước đây: 1 thread đọc lần lượt từng camera, detect ngay trong vòng lặp"""
+    while not stop_event.is_set():
+        for camera_id, subscription in subscriptions.items():
+            frame = subscription.read(timeout=0)
+            if frame is None:
+                continue
+            captured_at = time.time()
+            h, w = frame.shape[:2]
+            if max(h, w) > 640:
+                scale = 640 / max(h, w)
+                frame = cv2.resize(frame, (int(w * scale), int(h * scale)))
+            detector.detect_from_frame(frame, conf_threshold=0.25, iou_threshold=0.45)
+            detected[camera_id] = detected.get(camera_id, 0) + 1
+            latencies.append(time.time() - captured_at)
+        time.sleep(0.05)
+
+
+def run(mode, videos, args):
+    camera_ids = [f"camera{i}" for i in range(len(videos))]
+    stop_event = threading.Event()
+
+    if mode == "legacy":
+        detected, latencies = {}, []
+        decode_service = get_decode_service()
+        subscriptions = {cid: decode_service.subscribe(path) for cid, path in zip(camera_ids, videos)}
+        thread = threading.Thread(
+            target=legacy_loop,
+            args=(subscriptions, license_plate_detector.get_detector(), detected, latencies, stop_event),
+            daemon=True
+        )
+        thread.start()
+    else:
+        service = MeasuredService(WebSocketManager(), inference_workers=args.workers)
+        for cid, path in zip(camera_ids, videos):
+            if not service.start_detection(cid, path, motion_gate=False):
+                raise RuntimeError(f"Failed to start camera {path}")
+        detected, latencies = service.detected, service.latencies
+
+    time.sleep(3)  # warm-up
+    started_counts = {cid: detected.get(cid, 0) for cid in camera_ids}
+    latencies.clear()
+    started = time.monotonic()
+    time.sleep(args.duration)
+    elapsed = time.monotonic() - started
+    fps = [(detected.get(cid, 0) - started_counts[cid]) / elapsed for cid in camera_ids]
+    latency = sum(latencies) / len(latencies) if latencies else 0.0
+
+    if mode == "legacy":
+        stop_event.set()
+        thread.join(timeout=5)
+        for subscription in subscriptions.values():
+            subscription.close()
+    else:
+        service.stop_all()
+    time.sleep(0.5)
+    return {
+        "avg_fps": sum(fps) / len(fps),
+        "min_fps": min(fps),
+        "max_fps": max(fps),
+        "total": sum(fps),
+        "latency": latency,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--cameras", type=int, action="append")
+    parser.add_argument("--workers", type=int, default=1, help="so inference worker")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--fps", type=float, default=15.0)
+    args = parser.parse_args()
+
+    counts = args.cameras or [1, 2, 4, 8, 16]
+    directory = tempfile.mkdtemp(prefix="bench_detection_scaling_")
+    videos = []
+    for cam in range(max(counts)):
+        path = os.path.join(directory, f"camera{cam}.mp4")
+        make_video(path, 1280, 720, args.fps, 10, cam)
+        videos.append(path)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        license_plate_detector._detector_instance = license_plate_detector.LicensePlateDetector(args.model)
+
+    print(f"cameras @ {args.fps:.0f} fps, {args.duration:.0f}s per run, {args.workers} worker(s), "
+          f"{os.cpu_count()} CPU(s)")
+    print(f"{'mode':<8} {'cameras':>7} {'avg fps':>8} {'min fps':>8} {'max fps':>8} {'total/s':>8} {'latency':>9}")
+    for cameras in counts:
+        for mode in ("legacy", "workers"):
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                r = run(mode, videos[:cameras], args)
+            print(f"{mode:<8} {cameras:>7} {r['avg_fps']:>8.1f} {r['min_fps']:>8.1f} {r['max_fps']:>8.1f} "
+                  f"{r['total']:>8.1f} {r['latency'] * 1000:>7.0f}ms")
+    get_decode_service().stop_all()
+
+
+if __name__ == "__main__":
+    main()
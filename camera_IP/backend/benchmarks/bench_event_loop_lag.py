@@ -0,0 +1,171 @@
+"""
+Benchmark: event loop lag khi nhiều client upload ảnh cùng lúc - inference trên event loop vs InferenceExecutor
+
+Chạy app FastAPI thật (uvicorn, localhost) trong process, --concurrency client gửi liên tục 1 ảnh 720p:
+- legacy : bản sao handler /api/detect/upload trước đây (imdecode + YOLO ngay trong async def)
+- offloop: /api/detect/upload hiện tại (inference worker, hàng đợi giới hạn, 503 khi đầy)
+
+Đồng thời đo:
+- loop lag: task trên event loop của server sleep 10ms, ghi lại độ trễ thức dậy
+- /health: 1 client khác gọi /health mỗi 50ms (như health check / WebSocket push bị chặn)
+
+In ra upload / giây, số request bị 503, loop lag và latency /health (p50 / p99 / max).
+
+Cần ultralytics + model:
+    python benchmarks/bench_event_loop_lag.py --model models/license_plate.pt [--concurrency 4 --concurrency 16]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import license_plate_detector  # noqa: E402
+from bench_shared_decode import make_video  # noqa: E402
+
+LAG_INTERVAL = 0.01
+loop_lags = []
+
+
+def add_legacy_route(app):
+    """Handler /api/detect/upload trước đây - mọi bước chạy trên event loop"""
+    from fastapi import File, UploadFile
+
+    @app.post("/bench/legacy/upload")
+    async def legacy_upload(file: UploadFile = File(...), conf_threshold: float = 0.25, iou_threshold: float = 0.45):
+        contents = await file.read()
+        frame = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+        detections = license_plate_detector.get_detector().detect_from_frame(frame, conf_threshold, iou_threshold)
+        return {"count": len(detections)}
+
+
+async def measure_loop_lag():
+    """Chạy trên event loop của server: độ trễ thức dậy so với sleep LAG_INTERVAL"""
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(LAG_INTERVAL)
+        loop_lags.append(time.monotonic() - started - LAG_INTERVAL)
+
+
+def start_server():
+    import uvicorn
+    import main
+
+    add_legacy_route(main.app)
+
+    async def start_probe():
+        asyncio.ensure_future(measure_loop_lag())
+
+    main.app.router.on_startup.append(start_probe)
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
+
+
+def make_image():
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_event_loop_lag_"), "camera.mp4")
+    make_video(path, 1280, 720, 25, 1, 0)
+    cap = cv2.VideoCapture(path)
+    ret, frame = cap.read()
+    cap.release()
+    return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def run(base_url, path, image, concurrency, duration):
+    stop_event = threading.Event()
+    ok = [0] * concurrency
+    rejected = [0] * concurrency
+    health = []
+
+    def uploader(index):
+        with httpx.Client(base_url=base_url, timeout=120) as client:
+            while not stop_event.is_set():
+                response = client.post(path, files={"file": ("car.jpg", image, "image/jpeg")})
+                if response.status_code == 503:
+                    rejected[index] += 1
+                    stop_event.wait(float(response.headers.get("Retry-After", 1)) / 10)
+                    continue
+                response.raise_for_status()
+                ok[index] += 1
+
+    def health_checker():
+        with httpx.Client(base_url=base_url, timeout=120) as client:
+            while not stop_event.is_set():
+                started = time.monotonic()
+                client.get("/health").raise_for_status()
+                health.append(time.monotonic() - started)
+                stop_event.wait(0.05)
+
+    threads = [threading.Thread(target=uploader, args=(i,), daemon=True) for i in range(concurrency)]
+    threads.append(threading.Thread(target=health_checker, daemon=True))
+    for thread in threads:
+        thread.start()
+    time.sleep(2)  # warm-up
+    ok_started, rejected_started = sum(ok), sum(rejected)
+    health.clear()
+    loop_lags.clear()
+    started = time.monotonic()
+    time.sleep(duration)
+    elapsed = time.monotonic() - started
+    lags, health_latencies = list(loop_lags), list(health)
+    uploads, shed = sum(ok) - ok_started, sum(rejected) - rejected_started
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=30)
+    return {
+        "uploads": uploads / elapsed,
+        "rejected": shed,
+        "lag": lags,
+        "health": health_latencies,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--concurrency", type=int, action="append")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    image = make_image()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        license_plate_detector._detector_instance = license_plate_detector.LicensePlateDetector(args.model)
+        base_url, server = start_server()
+
+    print(f"1280x720 JPEG uploads, {args.duration:.0f}s per run, {os.cpu_count()} CPU(s)")
+    print(f"{'mode':<8} {'clients':>7} {'upload/s':>8} {'503':>5} {'lag p50':>8} {'lag p99':>8} {'lag max':>8} "
+          f"{'health p50':>10} {'health p99':>10}")
+    for concurrency in args.concurrency or [1, 4, 16]:
+        for mode, path in (("legacy", "/bench/legacy/upload"), ("offloop", "/api/detect/upload")):
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                r = run(base_url, path, image, concurrency, args.duration)
+            print(f"{mode:<8} {concurrency:>7} {r['uploads']:>8.1f} {r['rejected']:>5} "
+                  f"{percentile(r['lag'], 0.5) * 1000:>6.1f}ms {percentile(r['lag'], 0.99) * 1000:>6.1f}ms "
+                  f"{max(r['lag'] or [0]) * 1000:>6.1f}ms {percentile(r['health'], 0.5) * 1000:>8.1f}ms "
+                  f"{percentile(r['health'], 0.99) * 1000:>8.1f}ms")
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
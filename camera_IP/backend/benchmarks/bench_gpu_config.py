@@ -0,0 +1,162 @@
+"""
+Benchmark: ma trận cấu hình gpu_config.yaml cho GPUBatchDetectionService (CPU)
+
+Chạy GPUBatchDetectionService thật (YOLO, device=cpu) với --cameras camera đọc từ file video local
+(DecodeService, phát theo FPS), lần lượt với từng cấu hình batch_size / input_size / frame_skip /
+batch_timeout_ms. Motion gate tắt để đo riêng batching (--motion để bật).
+
+In ra mỗi cấu hình: frame đã inference / giây, batch trung bình, latency từ lúc lấy frame tới lúc
+có kết quả (p50 / p99), số frame bị bỏ vì queue đầy và CPU của process (giây CPU / giây).
+
+Cần torch + ultralytics + model:
+    python benchmarks/bench_gpu_config.py --model models/license_plate.pt [--cameras 4] [--duration 20] [--video file.mp4]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import license_plate_detector  # noqa: E402
+from batch_detection_service import GPUBatchDetectionService  # noqa: E402
+from bench_shared_decode import make_video  # noqa: E402
+from decode_service import get_decode_service  # noqa: E402
+from websocket_manager import WebSocketManager  # noqa: E402
+
+# (ten, batch_size, input_size, frame_skip, batch_timeout_ms)
+MATRIX = [
+    ("baseline", 1, 640, 0, 50),
+    ("batch4", 4, 640, 0, 50),
+    ("batch4-10ms", 4, 640, 0, 10),
+    ("batch4-480", 4, 480, 0, 50),
+    ("batch4-320", 4, 320, 0, 50),
+    ("batch4-skip2", 4, 640, 2, 50),
+    ("batch8-100ms", 8, 640, 0, 100),
+]
+
+
+class MeasuredService(GPUBatchDetectionService):
+    """GPUBatchDetectionService + đo latency / số frame bị bỏ"""
+
+    def __init__(self, *args, **kwargs):
+        self.latencies = []
+        self.batches = 0
+        self.dropped = 0
+        super().__init__(*args, **kwargs)
+
+    def _batch_inference(self, jobs):
+        results = super()._batch_inference(jobs)
+        now = time.time()
+        self.latencies.extend(now - job.timestamp for job in jobs)
+        self.batches += 1
+        return results
+
+
+class CountingQueue:
+    """Bọc frame_queue: đếm put bị từ chối vì đầy"""
+
+    def __init__(self, service):
+        self.service = service
+        self.queue = service.frame_queue
+
+    def put(self, item, block=True, timeout=None):
+        try:
+            self.queue.put(item, block, timeout)
+        except Exception:
+            self.service.dropped += 1
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self.queue, name)
+
+
+def write_config(directory, name, batch_size, input_size, frame_skip, batch_timeout_ms, motion):
+    path = os.path.join(directory, f"{name}.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump({
+            "gpu": {"batch_size": batch_size, "input_size": input_size, "device": "cpu", "fp16": False},
+            "camera": {"max_queue_size": 100, "frame_skip": frame_skip, "batch_timeout_ms": batch_timeout_ms},
+            "motion": {"enabled": motion},
+            "performance": {"enable_stats": False},
+        }, f)
+    return path
+
+
+def run(config_path, videos, args):
+    service = MeasuredService(WebSocketManager(), config_path=config_path)
+    service.frame_queue = CountingQueue(service)
+    for index, path in enumerate(videos):
+        if not service.start_detection(f"camera{index}", path):
+            raise RuntimeError(f"Failed to start camera {path}")
+
+    # Warm-up (model + decoder)
+    time.sleep(3)
+    service.latencies.clear()
+    frames_started = service.stats['total_frames']
+    batches_started = service.batches
+    dropped_started = service.dropped
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    time.sleep(args.duration)
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    frames = service.stats['total_frames'] - frames_started
+    batches = service.batches - batches_started
+    latencies = sorted(service.latencies)
+    dropped = service.dropped - dropped_started
+    service.stop_all()
+    time.sleep(0.5)
+    return {
+        "fps": frames / elapsed,
+        "avg_batch": frames / max(1, batches),
+        "p50": latencies[len(latencies) // 2] if latencies else 0.0,
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0,
+        "dropped": dropped,
+        "cpu": cpu / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--video", action="append", help="file video that (lap lai cho du so camera)")
+    parser.add_argument("--fps", type=float, default=15.0)
+    parser.add_argument("--motion", action="store_true", help="bat motion gate")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_gpu_config_")
+    if args.video:
+        videos = [args.video[i % len(args.video)] for i in range(args.cameras)]
+    else:
+        videos = []
+        for cam in range(args.cameras):
+            path = os.path.join(directory, f"camera{cam}.mp4")
+            make_video(path, 1280, 720, args.fps, 10, cam)
+            videos.append(path)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        license_plate_detector._detector_instance = license_plate_detector.LicensePlateDetector(args.model)
+
+    print(f"{args.cameras} cameras @ {args.fps:.0f} fps, {args.duration:.0f}s per config, device=cpu, "
+          f"motion gate {'on' if args.motion else 'off'}")
+    print(f"{'config':<13} {'batch':>5} {'input':>5} {'skip':>4} {'timeout':>7} {'inferred/s':>10} {'avg batch':>9} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'dropped':>7} {'cpu':>5}")
+    for name, batch_size, input_size, frame_skip, batch_timeout_ms in MATRIX:
+        config_path = write_config(directory, name, batch_size, input_size, frame_skip, batch_timeout_ms, args.motion)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            r = run(config_path, videos, args)
+        print(f"{name:<13} {batch_size:>5} {input_size:>5} {frame_skip:>4} {batch_timeout_ms:>5}ms "
+              f"{r['fps']:>10.1f} {r['avg_batch']:>9.2f} {r['p50'] * 1000:>8.0f} {r['p99'] * 1000:>8.0f} "
+              f"{r['dropped']:>7} {r['cpu']:>5.2f}")
+    get_decode_service().stop_all()
+
+
+if __name__ == "__main__":
+    main()
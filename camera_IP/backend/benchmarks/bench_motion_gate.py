@@ -0,0 +1,215 @@
+"""
+Benchmark: motion gate - số lần gọi YOLO tiết kiệm được và số xe bị bỏ sót, footage ngày / đêm
+
+Mỗi clip được đọc tuần tự (thời gian theo FPS của video). Tham chiếu = detect trên mọi frame:
+- Footage giả lập (mặc định): tạo clip ngày + đêm (xe chạy vào, dừng trước barrier, chạy ra;
+  đêm tối + nhiễu cảm biến + đèn pha + nhấp nháy độ sáng) - biết sẵn frame nào thấy biển số
+- Footage thật: --day / --night file.mp4 + --model models/license_plate.pt (YOLO chạy mọi frame làm tham chiếu)
+
+Xe = chuỗi frame liên tiếp có biển số (gộp khoảng hở <= 0.5 giây). Xe bị bỏ sót = gate không cho
+frame nào của xe đó vào YOLO. Độ trễ = từ frame đầu tiên thấy biển số tới lần detect đầu tiên trên xe.
+
+Usage:
+    python benchmarks/bench_motion_gate.py [--seconds 180] [--method diff --method mog2]
+    python benchmarks/bench_motion_gate.py --day day.mp4 --night night.mp4 --model models/license_plate.pt
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motion_detector import MotionGate  # noqa: E402
+
+
+def make_clip(path, night, seconds, fps, width, height, seed):
+    """
+    Clip giả lập cổng bãi xe, trả về list bool: frame nào thấy biển số
+
+    Xe vào từ trái, dừng trước barrier 3-8 giây, chạy ra bên phải; giữa các xe là khoảng trống dài.
+    """
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError("VideoWriter mp4v not available")
+
+    background = np.zeros((height, width, 3), np.uint8)
+    if night:
+        background[:] = 18
+        cv2.circle(background, (width // 2, 40), 60, (60, 60, 70), -1)  # den duong
+    else:
+        background[:] = np.linspace(90, 170, width, dtype=np.uint8)[None, :, None]
+        cv2.rectangle(background, (0, height * 2 // 3), (width, height), (80, 80, 80), -1)
+
+    total = int(seconds * fps)
+    # Lich xe: (frame bat dau, frame dung, so frame dung, toc do px/frame)
+    cars = []
+    frame_index = int(rng.uniform(5, 15) * fps)
+    while frame_index < total:
+        speed = int(rng.integers(10, 25))
+        stop_x = width // 2 - 160
+        stop_frames = int(rng.uniform(3, 8) * fps)
+        cars.append((frame_index, speed, stop_x, stop_frames))
+        frame_index += int(rng.uniform(15, 40) * fps)
+
+    car_w, car_h = 320, 170
+    y = height // 2
+    visible = []
+    for index in range(total):
+        frame = background.copy()
+        plate_visible = False
+        for start, speed, stop_x, stop_frames in cars:
+            t = index - start
+            if t < 0:
+                continue
+            arrive = (stop_x + car_w) // speed
+            if t < arrive:
+                x = -car_w + t * speed
+            elif t < arrive + stop_frames:
+                x = stop_x
+            else:
+                x = stop_x + (t - arrive - stop_frames) * speed
+            if x > width:
+                continue
+            body = (40, 40, 150) if night else (30, 90, 160)
+            cv2.rectangle(frame, (x, y), (x + car_w, y + car_h), body, -1)
+            if night:
+                for hx in (x + car_w - 40, x + car_w - 10):
+                    cv2.circle(frame, (hx, y + 60), 18, (230, 240, 255), -1)
+            cv2.rectangle(frame, (x + 110, y + 110), (x + 230, y + 145), (235, 235, 235), -1)
+            cv2.putText(frame, "30A-123", (x + 115, y + 137), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
+            plate_visible = plate_visible or (x + 110 >= 0 and x + 230 <= width)
+
+        if night:
+            # Nhieu cam bien + thinh thoang nhay do sang (camera IR tu chinh exposure)
+            noise = rng.normal(0, 6, frame.shape)
+            frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+            if rng.random() < 0.01:
+                frame = cv2.convertScaleAbs(frame, alpha=1.3, beta=10)
+        writer.write(frame)
+        visible.append(plate_visible)
+    writer.release()
+    return visible
+
+
+def reference_with_model(path, model_path):
+    """Tham chiếu từ YOLO: frame nào có detection"""
+    from license_plate_detector import LicensePlateDetector
+    detector = LicensePlateDetector(model_path)
+    cap = cv2.VideoCapture(path)
+    visible = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        visible.append(len(detector.detect_from_frame(frame)) > 0)
+    cap.release()
+    return visible
+
+
+def vehicles(visible, max_gap):
+    """Gộp các frame thấy biển số thành từng xe: list (frame đầu, frame cuối)"""
+    events = []
+    for index, value in enumerate(visible):
+        if not value:
+            continue
+        if events and index - events[-1][1] <= max_gap:
+            events[-1][1] = index
+        else:
+            events.append([index, index])
+    return events
+
+
+def run_gate(path, visible, method, args):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    gate = MotionGate(method=method, keepalive_seconds=args.keepalive, hold_seconds=args.hold,
+                      open_frames=args.open_frames)
+    detected = []
+    gate_seconds = 0.0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        started = time.perf_counter()
+        detected.append(gate.should_detect(frame, len(detected) / fps))
+        gate_seconds += time.perf_counter() - started
+    cap.release()
+
+    frames = min(len(detected), len(visible))
+    events = vehicles(visible[:frames], int(fps / 2))
+    missed = 0
+    delays = []
+    for first, last in events:
+        hits = [i for i in range(first, last + 1) if detected[i] and visible[i]]
+        if not hits:
+            missed += 1
+        else:
+            delays.append((hits[0] - first) / fps)
+    return {
+        "frames": frames,
+        "inferences": sum(detected[:frames]),
+        "vehicles": len(events),
+        "missed": missed,
+        "plate_frames": sum(visible[:frames]),
+        "plate_frames_detected": sum(1 for i in range(frames) if detected[i] and visible[i]),
+        "delay_p50": float(np.median(delays)) if delays else 0.0,
+        "delay_max": max(delays) if delays else 0.0,
+        "gate_ms": gate_seconds / max(1, frames) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--day", help="clip ban ngay (mac dinh: gia lap)")
+    parser.add_argument("--night", help="clip ban dem (mac dinh: gia lap)")
+    parser.add_argument("--model", help="YOLO model de tao tham chieu cho clip that")
+    parser.add_argument("--seconds", type=float, default=180.0, help="do dai clip gia lap")
+    parser.add_argument("--fps", type=float, default=15.0)
+    parser.add_argument("--method", action="append", choices=["diff", "mog2"])
+    parser.add_argument("--keepalive", type=float, default=5.0)
+    parser.add_argument("--hold", type=float, default=2.0)
+    parser.add_argument("--open-frames", type=int, default=2)
+    args = parser.parse_args()
+    methods = args.method or ["diff", "mog2"]
+
+    directory = tempfile.mkdtemp(prefix="bench_motion_gate_")
+    clips = []
+    for name, path, night, seed in (("day", args.day, False, 1), ("night", args.night, True, 2)):
+        if path:
+            if not args.model:
+                parser.error("--model is required with real footage")
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                visible = reference_with_model(path, args.model)
+        else:
+            path = os.path.join(directory, f"{name}.mp4")
+            visible = make_clip(path, night, args.seconds, args.fps, 1280, 720, seed)
+        clips.append((name, path, visible))
+
+    print(f"keep-alive {args.keepalive}s, hold {args.hold}s, open after {args.open_frames} frames")
+    print(f"{'clip':<6} {'method':<6} {'frames':>7} {'yolo calls':>11} {'saved':>7} {'vehicles':>9} {'missed':>7} "
+          f"{'plate frames':>13} {'delay p50 s':>12} {'delay max s':>12} {'gate ms':>8}")
+    failures = []
+    for name, path, visible in clips:
+        for method in methods:
+            r = run_gate(path, visible, method, args)
+            saved = 1 - r["inferences"] / max(1, r["frames"])
+            print(f"{name:<6} {method:<6} {r['frames']:>7} {r['inferences']:>11} {saved:>7.1%} {r['vehicles']:>9} "
+                  f"{r['missed']:>7} {r['plate_frames_detected']:>6}/{r['plate_frames']:<6} "
+                  f"{r['delay_p50']:>12.2f} {r['delay_max']:>12.2f} {r['gate_ms']:>8.2f}")
+            if r["missed"]:
+                failures.append(f"{name}/{method}: {r['missed']} vehicles missed")
+
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: latency lấy 1 frame cho /api/detect/rtsp - mở capture mỗi request vs CapturePool
+
+- legacy: như trước - cv2.VideoCapture(url) → read 1 frame → release mỗi request
+- pool  : get_capture_pool().get_frame(url) - capture giữ ấm, lấy frame mới nhất trong slot
+
+Client hỏi --requests lần, cách nhau --interval giây (như frontend / script poll camera).
+Mặc định dùng file video local 720p thay RTSP (mở file nhanh hơn nhiều so với kết nối RTSP +
+chờ keyframe, nên chênh lệch với camera thật còn lớn hơn); --url để đo với camera RTSP thật.
+
+Chỉ đo lấy frame (không detect) → không cần model:
+    python benchmarks/bench_rtsp_capture.py [--url rtsp://...] [--requests 50] [--interval 0.2]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_shared_decode import make_video  # noqa: E402
+from decode_service import CapturePool, DecodeService  # noqa: E402
+
+
+def legacy_get_frame(url):
+    """/api/detect/rtsp trước đây"""
+    cap = cv2.VideoCapture(url)
+    if not cap.isOpened():
+        raise RuntimeError("Failed to open RTSP stream")
+    ret, frame = cap.read()
+    cap.release()
+    if not ret or frame is None:
+        raise RuntimeError("Failed to read frame from RTSP stream")
+    return frame
+
+
+def run(get_frame, url, requests, interval):
+    latencies = []
+    for _ in range(requests):
+        started = time.monotonic()
+        get_frame(url)
+        latencies.append(time.monotonic() - started)
+        time.sleep(interval)
+    return latencies
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="RTSP URL / file video (mac dinh: video gia lap 720p)")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.2, help="giay giua 2 request")
+    args = parser.parse_args()
+
+    url = args.url
+    if not url:
+        url = os.path.join(tempfile.mkdtemp(prefix="bench_rtsp_capture_"), "camera.mp4")
+        make_video(url, 1280, 720, 25, 10, 0)
+
+    print(f"{args.requests} requests every {args.interval:.2f}s: {url}")
+    print(f"{'mode':<7} {'first':>8} {'p50':>8} {'p99':>8} {'max':>8}")
+    service = DecodeService()
+    pool = CapturePool(service)
+    for mode, get_frame in (("legacy", legacy_get_frame), ("pool", pool.get_frame)):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            latencies = run(get_frame, url, args.requests, args.interval)
+        rest = latencies[1:] or latencies
+        print(f"{mode:<7} {latencies[0] * 1000:>6.1f}ms {percentile(rest, 0.5) * 1000:>6.1f}ms "
+              f"{percentile(rest, 0.99) * 1000:>6.1f}ms {max(rest) * 1000:>6.1f}ms")
+
+    decoders = list(service.decoders.values())
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        pool.close_all()
+        for decoder in decoders:
+            decoder.join(timeout=2)
+    print(f"pool: {pool.misses} connect(s), {pool.hits} warm hit(s)")
+
+
+if __name__ == "__main__":
+    main()
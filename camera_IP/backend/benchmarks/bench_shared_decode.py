@@ -0,0 +1,152 @@
+"""
+Benchmark: CPU decode cho --cameras camera x --consumers consumer - mỗi consumer 1 VideoCapture vs decode dùng chung
+
+File video local thay cho RTSP (phát theo FPS của file, hết file thì lặp lại). Mặc định tạo video
+giả lập 720p (--width x --height, --fps) trong thư mục tạm; dùng --video để chạy với file thật.
+
+- legacy: mỗi consumer tự mở cv2.VideoCapture và đọc theo FPS (như stream MJPEG + detection loop
+          + GPU batch reader cùng xem 1 camera trước đây)
+- shared: DecodeService - 1 CameraDecoder / camera, consumer subscribe nhận frame mới nhất
+
+Consumer chỉ đọc frame (không detect) để đo riêng chi phí decode.
+In ra CPU của process (mọi thread) tính theo giây CPU / giây cho mỗi camera, và số frame / giây
+mỗi consumer nhận được (phải ~ bằng FPS của video ở cả 2 chế độ).
+
+Usage:
+    python benchmarks/bench_shared_decode.py [--cameras 4] [--consumers 3] [--duration 15] [--video file.mp4]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decode_service import DecodeService  # noqa: E402
+
+
+def make_video(path, width, height, fps, seconds, seed):
+    """Video giả lập: nền tĩnh + vài khối chữ nhật chạy ngang (như xe qua cổng)"""
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError("VideoWriter mp4v not available")
+    background = np.zeros((height, width, 3), np.uint8)
+    background[:] = np.linspace(40, 160, width, dtype=np.uint8)[None, :, None]
+    cars = [(int(rng.integers(0, height - 120)), int(rng.integers(4, 16)), tuple(int(c) for c in rng.integers(0, 255, 3)))
+            for _ in range(3)]
+    for index in range(int(fps * seconds)):
+        frame = background.copy()
+        for y, speed, color in cars:
+            x = (index * speed) % (width + 200) - 200
+            cv2.rectangle(frame, (x, y), (x + 200, y + 110), color, -1)
+            cv2.putText(frame, "30A-12345", (x + 10, y + 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        writer.write(frame)
+    writer.release()
+
+
+def legacy_consumer(path, stop_event, counter, index):
+    """Như trước: consumer tự mở capture và đọc theo FPS"""
+    cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+    interval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30)
+    next_frame_at = time.monotonic()
+    while not stop_event.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            continue
+        counter[index] += 1
+        next_frame_at += interval
+        delay = next_frame_at - time.monotonic()
+        if delay > 0:
+            stop_event.wait(delay)
+        else:
+            next_frame_at = time.monotonic()
+    cap.release()
+
+
+def shared_consumer(subscription, stop_event, counter, index):
+    while not stop_event.is_set():
+        if subscription.read(timeout=0.5) is not None:
+            counter[index] += 1
+    subscription.close()
+
+
+def run(mode, videos, args):
+    stop_event = threading.Event()
+    counter = [0] * (len(videos) * args.consumers)
+    service = DecodeService()
+    threads = []
+    for cam, path in enumerate(videos):
+        for k in range(args.consumers):
+            index = cam * args.consumers + k
+            if mode == "legacy":
+                target, target_args = legacy_consumer, (path, stop_event, counter, index)
+            else:
+                target, target_args = shared_consumer, (service.subscribe(path), stop_event, counter, index)
+            threads.append(threading.Thread(target=target, args=target_args, daemon=True))
+    for thread in threads:
+        thread.start()
+
+    # Bo qua giai doan mo capture
+    time.sleep(1.0)
+    counter_started = list(counter)
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    time.sleep(args.duration)
+    cpu = time.process_time() - cpu_started
+    elapsed = time.monotonic() - started
+    frames = sum(counter) - sum(counter_started)
+
+    decoders = list(service.decoders.values())
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    service.stop_all()
+    for decoder in decoders:
+        decoder.join(timeout=5)
+    return {
+        "cpu_per_camera": cpu / elapsed / len(videos),
+        "fps_per_consumer": frames / elapsed / len(counter),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--consumers", type=int, default=3, help="so consumer / camera (stream, detection, GPU reader)")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--video", action="append", help="file video that (lap lai cho du so camera)")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=float, default=25.0)
+    args = parser.parse_args()
+
+    if args.video:
+        videos = [args.video[i % len(args.video)] for i in range(args.cameras)]
+    else:
+        directory = tempfile.mkdtemp(prefix="bench_shared_decode_")
+        videos = []
+        for cam in range(args.cameras):
+            path = os.path.join(directory, f"camera{cam}.mp4")
+            make_video(path, args.width, args.height, args.fps, 10, cam)
+            videos.append(path)
+
+    print(f"{args.cameras} cameras x {args.consumers} consumers, {args.duration:.0f}s, {os.cpu_count()} CPU(s)")
+    print(f"{'mode':<7} {'cpu s/s per camera':>19} {'frames/s per consumer':>22}")
+    results = {}
+    for mode in ("legacy", "shared"):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results[mode] = run(mode, videos, args)
+        print(f"{mode:<7} {results[mode]['cpu_per_camera']:>19.3f} {results[mode]['fps_per_consumer']:>22.1f}")
+    print(f"CPU per camera: {results['legacy']['cpu_per_camera'] / results['shared']['cpu_per_camera']:.1f}x lower")
+
+
+if __name__ == "__main__":
+    main()
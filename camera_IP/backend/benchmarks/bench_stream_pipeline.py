@@ -0,0 +1,143 @@
+"""
+Benchmark: stream MJPEG có detection với --viewers viewer cùng xem 1 camera (file video local)
+
+- legacy  : mỗi viewer 1 generator tuần tự như trước (capture riêng → detect → vẽ → encode → sleep 0.033)
+- pipeline: VideoStreamWithDetection hiện tại (detect / render+encode 1 lần theo camera, viewer chỉ gửi)
+
+Viewer là thread đọc generator như StreamingResponse (không qua HTTP). In ra FPS trung bình / thấp nhất
+mỗi viewer nhận được, số lần YOLO / giây và CPU của process (giây CPU / giây).
+
+Cần ultralytics + model:
+    python benchmarks/bench_stream_pipeline.py --model models/license_plate.pt [--viewers 1 --viewers 4 --viewers 8]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import license_plate_detector  # noqa: E402
+from bench_shared_decode import make_video  # noqa: E402
+from video_stream import VideoStreamWithDetection  # noqa: E402
+
+
+class CountingDetector:
+    """Bọc detector: đếm số lần gọi YOLO"""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.calls = 0
+
+    def detect_from_frame(self, *args, **kwargs):
+        self.calls += 1
+        return self.detector.detect_from_frame(*args, **kwargs)
+
+    def detect_and_draw(self, *args, **kwargs):
+        self.calls += 1
+        return self.detector.detect_and_draw(*args, **kwargs)
+
+    def draw_detections(self, *args, **kwargs):
+        return self.detector.draw_detections(*args, **kwargs)
+
+
+def legacy_generate_frames(path, detector):
+    """generate_frames trước đây: mọi bước tuần tự trong generator của từng viewer"""
+    cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+    frame_count = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            frame_count += 1
+            detections, output_frame = detector.detect_and_draw(frame, 0.25, 0.45, (0, 255, 0), 3)
+            cv2.putText(output_frame, f"Frame: {frame_count} | Detections: {len(detections)}", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+            ret, buffer = cv2.imencode('.jpg', output_frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            if ret:
+                yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n'
+            time.sleep(0.033)
+    finally:
+        cap.release()
+
+
+def run(mode, path, viewers, detector, duration):
+    stop_event = threading.Event()
+    counts = [0] * viewers
+
+    def viewer(index):
+        if mode == "legacy":
+            frames = legacy_generate_frames(path, detector)
+        else:
+            frames = VideoStreamWithDetection(path, motion_gate=False).open().generate_frames()
+        for _ in frames:
+            counts[index] += 1
+            if stop_event.is_set():
+                break
+        frames.close()
+
+    threads = [threading.Thread(target=viewer, args=(i,), daemon=True) for i in range(viewers)]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(3)  # warm-up
+    counts_started = list(counts)
+    calls_started = detector.calls
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    time.sleep(duration)
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    fps = [(counts[i] - counts_started[i]) / elapsed for i in range(viewers)]
+    calls = detector.calls - calls_started
+
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=10)
+    return {
+        "avg_fps": sum(fps) / viewers,
+        "min_fps": min(fps),
+        "yolo_per_s": calls / elapsed,
+        "cpu": cpu / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--viewers", type=int, action="append")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--video", help="file video that (mac dinh: video gia lap 720p)")
+    parser.add_argument("--fps", type=float, default=25.0)
+    args = parser.parse_args()
+
+    path = args.video
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(prefix="bench_stream_pipeline_"), "camera.mp4")
+        make_video(path, 1280, 720, args.fps, 10, 0)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        detector = CountingDetector(license_plate_detector.LicensePlateDetector(args.model))
+    # VideoStreamWithDetection dung get_detector() → tra ve detector dem so lan goi
+    license_plate_detector._detector_instance = detector
+
+    source_fps = cv2.VideoCapture(path).get(cv2.CAP_PROP_FPS)
+    print(f"video {source_fps:.0f} fps, {args.duration:.0f}s per run, {os.cpu_count()} CPU(s)")
+    print(f"{'mode':<9} {'viewers':>7} {'avg fps':>8} {'min fps':>8} {'yolo/s':>7} {'cpu':>6}")
+    for viewers in args.viewers or [1, 4, 8]:
+        for mode in ("legacy", "pipeline"):
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                r = run(mode, path, viewers, detector, args.duration)
+            print(f"{mode:<9} {viewers:>7} {r['avg_fps']:>8.1f} {r['min_fps']:>8.1f} {r['yolo_per_s']:>7.1f} "
+                  f"{r['cpu']:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
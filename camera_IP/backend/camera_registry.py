@@ -0,0 +1,215 @@
+"""
+Camera Registry - Danh sách camera trong RAM là nguồn chính, go2rtc.yaml chỉ để lưu
+
+- Đọc (GET /api/cameras, stream theo camera_id) lấy từ RAM, danh sách camera được cache
+  tới khi có thay đổi
+- Ghi: thay đổi áp dụng vào RAM ngay, file được ghi gộp - mọi thay đổi đến trong lúc đang ghi
+  (và trong WRITE_COALESCE_DELAY nếu đặt > 0) chung 1 lần ghi tiếp theo, request chờ tới khi
+  thay đổi của nó đã nằm trên đĩa
+- Ghi atomic: file tạm cùng thư mục + fsync + os.replace → go2rtc / lần start sau không bao giờ
+  đọc phải file ghi dở
+- 1 aiohttp.ClientSession dùng chung cho API go2rtc
+
+Chỉ dùng trên event loop của FastAPI (không có lock giữa các thread).
+"""
+import asyncio
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+import yaml
+
+# Cho them truoc moi lan ghi de gom thay doi (giay) - 0: ghi ngay, thay doi den luc dang ghi
+# tu gom vao lan ghi sau
+WRITE_COALESCE_DELAY = 0.0
+GO2RTC_API_URL = "http://localhost:1984"
+
+
+def low_latency_url(url: str, cam_type: Optional[str]) -> str:
+    """Thêm tham số go2rtc low-latency cho RTSP stream"""
+    if cam_type == "rtsp" and url.startswith("rtsp://") and "#" not in url:
+        return f"{url}#video=copy#audio=copy"
+    return url
+
+
+class CameraRegistry:
+    """Camera (streams + metadata của go2rtc.yaml) trong RAM, ghi file gộp + atomic"""
+
+    def __init__(self, config_path: Path, coalesce_delay: float = WRITE_COALESCE_DELAY,
+                 go2rtc_url: str = GO2RTC_API_URL):
+        self.config_path = Path(config_path)
+        self.coalesce_delay = coalesce_delay
+        self.go2rtc_url = go2rtc_url
+        self.config: Optional[dict] = None
+
+        self._cameras: Optional[List[dict]] = None  # Cache cho list_cameras
+        self._waiters: List[asyncio.Future] = []  # Thay doi chua ghi xuong file
+        self._flush_task: Optional[asyncio.Task] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # Statistics
+        self.changes = 0
+        self.writes = 0
+
+    def load(self) -> dict:
+        """Đọc go2rtc.yaml vào RAM (lúc startup)"""
+        try:
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                self.config = yaml.safe_load(f) or {}
+            print("[OK] Config loaded into memory")
+        except Exception as e:
+            print(f"Error reading config: {e}")
+            self.config = {}
+        self.config.setdefault("streams", {})
+        self.config.setdefault("metadata", {})
+        self._cameras = None
+        return self.config
+
+    @property
+    def streams(self) -> Dict[str, str]:
+        if self.config is None:
+            self.load()
+        return self.config["streams"]
+
+    @property
+    def metadata(self) -> Dict[str, dict]:
+        if self.config is None:
+            self.load()
+        return self.config["metadata"]
+
+    def list_cameras(self) -> List[dict]:
+        """Danh sách camera (id, name, type, url) - build lại chỉ khi có thay đổi"""
+        if self._cameras is None:
+            cameras = []
+            for camera_id, url in self.streams.items():
+                if camera_id.startswith("#"):  # Ignore comments
+                    continue
+
+                meta = self.metadata.get(camera_id, {})
+                name = meta.get("name") or camera_id.replace("_", " ").title()
+                cam_type = meta.get("type") or ("rtsp" if url.startswith("rtsp://") else "public")
+                cameras.append({"id": camera_id, "name": name, "type": cam_type, "url": url})
+            self._cameras = cameras
+        return self._cameras
+
+    def get_stream(self, camera_id: str) -> Optional[str]:
+        return self.streams.get(camera_id)
+
+    def __contains__(self, camera_id: str) -> bool:
+        return camera_id in self.streams
+
+    async def add_camera(self, camera_id: str, url: str, name: Optional[str] = None, cam_type: str = "rtsp"):
+        """Thêm / ghi đè camera, chờ tới khi đã ghi xuống file"""
+        self.streams[camera_id] = low_latency_url(url, cam_type)
+        self.metadata[camera_id] = {
+            "name": name or camera_id,
+            "type": cam_type
+        }
+        await self._changed()
+
+    async def update_camera(self, camera_id: str, url: Optional[str] = None, name: Optional[str] = None,
+                            cam_type: Optional[str] = None):
+        """
+        Cập nhật camera đã có, chờ tới khi đã ghi xuống file
+
+        Raises:
+            KeyError: camera không tồn tại
+        """
+        if camera_id not in self.streams:
+            raise KeyError(camera_id)
+
+        if url:
+            self.streams[camera_id] = low_latency_url(url, cam_type)
+
+        meta = self.metadata.setdefault(camera_id, {})
+        if name is not None:
+            meta["name"] = name
+        if cam_type is not None:
+            meta["type"] = cam_type
+        await self._changed()
+
+    async def remove_camera(self, camera_id: str):
+        """
+        Xóa camera, chờ tới khi đã ghi xuống file
+
+        Raises:
+            KeyError: camera không tồn tại
+        """
+        if camera_id not in self.streams:
+            raise KeyError(camera_id)
+
+        del self.streams[camera_id]
+        self.metadata.pop(camera_id, None)
+        await self._changed()
+
+    async def _changed(self):
+        """Đánh dấu thay đổi, chờ lần ghi gộp chứa thay đổi này"""
+        self._cameras = None
+        self.changes += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_loop())
+        await future
+
+    async def _flush_loop(self):
+        """Ghi file tới khi không còn thay đổi chờ (thay đổi đến lúc đang ghi → lần ghi tiếp theo)"""
+        while self._waiters:
+            await asyncio.sleep(self.coalesce_delay)
+            waiters, self._waiters = self._waiters, []
+
+            # Snapshot tren event loop (khong bi thay doi giua chung), dump + ghi trong thread
+            snapshot = dict(self.config)
+            snapshot["streams"] = dict(self.streams)
+            snapshot["metadata"] = {camera_id: dict(meta) for camera_id, meta in self.metadata.items()}
+            try:
+                await asyncio.to_thread(self._write_file, snapshot)
+                self.writes += 1
+                error = None
+            except Exception as e:
+                print(f"Error writing config: {e}")
+                error = e
+
+            for future in waiters:
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(True)
+                else:
+                    future.set_exception(error)
+
+    def _write_file(self, config: dict):
+        """Ghi atomic: file tạm + fsync + os.replace"""
+        yaml_str = yaml.dump(config, allow_unicode=True, sort_keys=False, default_flow_style=False)
+        tmp_path = self.config_path.with_name(f".{self.config_path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(yaml_str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.config_path)
+
+    async def flush(self):
+        """Chờ mọi thay đổi đã ghi xong (shutdown)"""
+        if self._flush_task is not None:
+            await asyncio.shield(self._flush_task)
+
+    async def session(self) -> aiohttp.ClientSession:
+        """aiohttp session dùng chung cho API go2rtc (giữ kết nối keep-alive)"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(base_url=self.go2rtc_url)
+        return self._session
+
+    async def close(self):
+        await self.flush()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def get_stats(self) -> dict:
+        return {
+            'cameras': len(self.list_cameras()),
+            'changes': self.changes,
+            'writes': self.writes,
+            'pending': len(self._waiters),
+        }
@@ -0,0 +1,430 @@
+"""
+Decode Service - Mỗi camera chỉ decode 1 lần, chia frame cho mọi consumer
+
+Kiến trúc:
+1. CameraDecoder: 1 cv2.VideoCapture + 1 thread decode cho mỗi URL (sau khi bỏ tham số go2rtc)
+2. FrameSlot: chỉ giữ frame mới nhất (seq tăng dần) - consumer chậm bỏ qua frame cũ, không có queue dồn
+3. FrameSubscription: mỗi consumer (stream MJPEG, detection loop, GPU batch reader) 1 subscription
+4. CapturePool: subscription giữ ấm theo URL cho request lấy 1 frame, tự đóng khi idle
+
+Decoder mở capture khi có subscriber đầu tiên và đóng khi subscriber cuối cùng rời đi.
+Frame publish ra là read-only (dùng chung giữa các consumer) → muốn vẽ lên frame phải copy trước.
+
+File video local (không phải RTSP / webcam) được phát theo FPS của file và lặp lại khi hết,
+dùng để giả lập camera khi test / benchmark.
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Doc frame loi lien tiep N lan → dong capture va mo lai
+MAX_READ_FAILURES = 50
+# Cho truoc khi mo lai capture (giay)
+RECONNECT_DELAY = 1.0
+# Cho frame dau tien khi subscribe (giay)
+FIRST_FRAME_TIMEOUT = 10.0
+# CapturePool: giu capture sau request cuoi (giay)
+CAPTURE_IDLE_TIMEOUT = 60.0
+# CapturePool: frame cu hon → cho frame tiep theo (giay)
+CAPTURE_MAX_FRAME_AGE = 1.0
+
+
+def clean_source_url(url: str) -> str:
+    """Strip go2rtc params (#video=copy#audio=copy) - OpenCV không hiểu cú pháp này"""
+    return url.split('#')[0] if '#' in url else url
+
+
+def open_capture(url: str) -> cv2.VideoCapture:
+    """Mở VideoCapture: số → camera index, còn lại → FFMPEG (RTSP / file)"""
+    if url.isdigit():
+        return cv2.VideoCapture(int(url))
+
+    cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Reduce latency
+    return cap
+
+
+class FrameSlot:
+    """
+    Slot giữ frame mới nhất - publish ghi đè, consumer chờ seq lớn hơn seq đã đọc
+
+    Dùng cho frame decode (np.ndarray) và cả frame đã encode (bytes) của stream MJPEG
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.timestamp = 0.0
+
+    def publish(self, frame):
+        if isinstance(frame, np.ndarray):
+            frame.flags.writeable = False  # Dung chung giua cac consumer
+        with self.cond:
+            self.frame = frame
+            self.seq += 1
+            self.timestamp = time.time()
+            self.cond.notify_all()
+
+    def get(self) -> Tuple[int, object, float]:
+        with self.cond:
+            return self.seq, self.frame, self.timestamp
+
+    def wait(self, after_seq: int, timeout: Optional[float] = None) -> Tuple[int, object]:
+        """Chờ frame có seq > after_seq, hết timeout → (after_seq, None)"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > after_seq, timeout):
+                return after_seq, None
+            return self.seq, self.frame
+
+
+class CameraDecoder:
+    """1 capture + 1 thread decode cho 1 camera, publish vào FrameSlot"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.slot = FrameSlot()
+        self.fps = 0.0
+        self.subscribers = 0
+        self.is_file = os.path.isfile(url)
+
+        # Statistics
+        self.frames_decoded = 0
+        self.reconnects = 0
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self._thread.start()
+        print(f"[DECODE] Decoder started: {self.url}")
+
+    def stop(self):
+        """Dừng thread decode (capture được release trong thread)"""
+        self._stop_event.set()
+        with self.slot.cond:
+            self.slot.cond.notify_all()  # Danh thuc consumer dang cho frame
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def _decode_loop(self):
+        cap = None
+        failures = 0
+        frame_interval = 0.0
+        next_frame_at = 0.0
+
+        try:
+            while not self._stop_event.is_set():
+                if cap is None:
+                    cap = open_capture(self.url)
+                    if not cap.isOpened():
+                        print(f"[DECODE] Failed to open {self.url}, retrying in {RECONNECT_DELAY}s")
+                        cap.release()
+                        cap = None
+                        self._stop_event.wait(RECONNECT_DELAY)
+                        continue
+                    self.fps = cap.get(cv2.CAP_PROP_FPS) or 30
+                    frame_interval = 1.0 / self.fps if self.is_file else 0.0
+                    next_frame_at = time.monotonic()
+                    failures = 0
+
+                ret, frame = cap.read()
+                if not ret or frame is None:
+                    if self.is_file:
+                        # Het file → phat lai tu dau
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    failures += 1
+                    if failures >= MAX_READ_FAILURES:
+                        print(f"[DECODE] {self.url}: {failures} failed reads, reconnecting")
+                        cap.release()
+                        cap = None
+                        self.reconnects += 1
+                        self._stop_event.wait(RECONNECT_DELAY)
+                    else:
+                        self._stop_event.wait(0.1)
+                    continue
+
+                failures = 0
+                self.frames_decoded += 1
+                self.slot.publish(frame)
+
+                if frame_interval:
+                    # File local: phat theo FPS nhu camera that
+                    next_frame_at += frame_interval
+                    delay = next_frame_at - time.monotonic()
+                    if delay > 0:
+                        self._stop_event.wait(delay)
+                    else:
+                        next_frame_at = time.monotonic()
+        finally:
+            if cap is not None:
+                cap.release()
+            print(f"[DECODE] Decoder stopped: {self.url}")
+
+
+class FrameSubscription:
+    """Consumer của 1 CameraDecoder - read() trả frame mới hơn frame đã đọc lần trước"""
+
+    def __init__(self, service: "DecodeService", decoder: CameraDecoder):
+        self.service = service
+        self.decoder = decoder
+        self.last_seq = 0
+        self.frames_read = 0
+        self.frames_skipped = 0  # Frame bi ghi de truoc khi consumer kip doc
+        self.closed = False
+
+    @property
+    def url(self) -> str:
+        return self.decoder.url
+
+    @property
+    def fps(self) -> float:
+        return self.decoder.fps
+
+    def read(self, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Chờ frame mới (seq > seq đã đọc)
+
+        Args:
+            timeout: giây, 0 = không chờ, None = chờ tới khi có frame / subscription đóng
+
+        Returns:
+            Frame (read-only) hoặc None nếu hết timeout / subscription đã đóng
+        """
+        slot = self.decoder.slot
+        with slot.cond:
+            slot.cond.wait_for(
+                lambda: slot.seq > self.last_seq or self.closed or self.decoder.stopped,
+                timeout
+            )
+            if self.closed or slot.seq <= self.last_seq:
+                return None
+            if self.last_seq:
+                self.frames_skipped += slot.seq - self.last_seq - 1
+            self.last_seq = slot.seq
+            self.frames_read += 1
+            return slot.frame
+
+    def close(self):
+        """Rời decoder - decoder dừng khi không còn subscriber"""
+        if self.closed:
+            return
+        self.closed = True
+        with self.decoder.slot.cond:
+            self.decoder.slot.cond.notify_all()
+        self.service._release(self.decoder)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class DecodeService:
+    """Quản lý CameraDecoder theo URL, đếm subscriber để start / stop decoder"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.decoders: Dict[str, CameraDecoder] = {}
+
+    def subscribe(self, url: str, first_frame_timeout: Optional[float] = FIRST_FRAME_TIMEOUT) -> FrameSubscription:
+        """
+        Đăng ký nhận frame từ camera (mở decoder nếu chưa có)
+
+        Args:
+            url: RTSP URL, camera index ("0") hoặc đường dẫn file video
+            first_frame_timeout: chờ frame đầu tiên (giây), None = không chờ
+
+        Raises:
+            RuntimeError: không nhận được frame nào trong first_frame_timeout
+        """
+        clean_url = clean_source_url(url)
+        with self.lock:
+            decoder = self.decoders.get(clean_url)
+            if decoder is None:
+                decoder = CameraDecoder(clean_url)
+                self.decoders[clean_url] = decoder
+                decoder.start()
+            decoder.subscribers += 1
+
+        subscription = FrameSubscription(self, decoder)
+        if first_frame_timeout is not None:
+            slot = decoder.slot
+            with slot.cond:
+                slot.cond.wait_for(lambda: slot.seq > 0, first_frame_timeout)
+                has_frame = slot.seq > 0
+            if not has_frame:
+                subscription.close()
+                raise RuntimeError(f"Failed to open camera: {url}")
+        return subscription
+
+    def _release(self, decoder: CameraDecoder):
+        with self.lock:
+            decoder.subscribers -= 1
+            if decoder.subscribers > 0:
+                return
+            if self.decoders.get(decoder.url) is decoder:
+                del self.decoders[decoder.url]
+        decoder.stop()
+
+    def stop_all(self):
+        """Dừng mọi decoder (shutdown)"""
+        with self.lock:
+            decoders = list(self.decoders.values())
+            self.decoders.clear()
+        for decoder in decoders:
+            decoder.stop()
+        for decoder in decoders:
+            decoder.join(timeout=2)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                url: {
+                    'subscribers': decoder.subscribers,
+                    'fps': decoder.fps,
+                    'frames_decoded': decoder.frames_decoded,
+                    'reconnects': decoder.reconnects,
+                }
+                for url, decoder in self.decoders.items()
+            }
+
+
+class CapturePool:
+    """
+    Giữ ấm subscription theo URL cho request lấy 1 frame (/api/detect/rtsp)
+
+    Request đầu tiên mở decoder (kết nối RTSP + chờ keyframe), các request sau lấy ngay frame
+    mới nhất trong slot. Không có request nào trong idle_timeout → đóng subscription
+    (decoder dừng nếu không còn consumer khác như stream / detection).
+    """
+
+    def __init__(self, service: DecodeService, idle_timeout: float = CAPTURE_IDLE_TIMEOUT,
+                 max_frame_age: float = CAPTURE_MAX_FRAME_AGE):
+        self.service = service
+        self.idle_timeout = idle_timeout
+        self.max_frame_age = max_frame_age
+        self.lock = threading.Lock()
+        self.entries: Dict[str, list] = {}  # {url: [subscription, last_used]}
+        self._stop_event = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get_frame(self, url: str, timeout: float = FIRST_FRAME_TIMEOUT) -> np.ndarray:
+        """
+        Frame mới nhất của camera (read-only), không cũ hơn max_frame_age
+
+        Raises:
+            RuntimeError: không mở được camera / không có frame mới trong timeout
+        """
+        clean_url = clean_source_url(url)
+        with self.lock:
+            entry = self.entries.get(clean_url)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                self.hits += 1
+
+        if entry is None:
+            # Subscribe ngoai lock - ket noi RTSP mat vai giay, khong chan camera khac
+            subscription = self.service.subscribe(url, first_frame_timeout=timeout)
+            with self.lock:
+                entry = self.entries.get(clean_url)
+                if entry is None:
+                    entry = self.entries[clean_url] = [subscription, time.monotonic()]
+                    subscription = None
+                    self.misses += 1
+                else:
+                    entry[1] = time.monotonic()
+                    self.hits += 1
+                self._start_reaper()
+            if subscription is not None:
+                subscription.close()  # Request khac da tao entry cung luc
+
+        slot = entry[0].decoder.slot
+        seq, frame, timestamp = slot.get()
+        if frame is None or time.time() - timestamp > self.max_frame_age:
+            # Frame cu (camera cham / vua reconnect) → cho frame tiep theo
+            seq, frame = slot.wait(seq, timeout)
+            if frame is None:
+                raise RuntimeError(f"No fresh frame from camera: {url}")
+        return frame
+
+    def _start_reaper(self):
+        if self._reaper is None or not self._reaper.is_alive():
+            self._stop_event.clear()
+            self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        """Đóng subscription không được dùng trong idle_timeout"""
+        while not self._stop_event.wait(min(self.idle_timeout / 4, 5.0)):
+            now = time.monotonic()
+            with self.lock:
+                expired = [url for url, (_, last_used) in self.entries.items() if now - last_used > self.idle_timeout]
+                subscriptions = [self.entries.pop(url)[0] for url in expired]
+                self.expired += len(expired)
+            for subscription in subscriptions:
+                print(f"[DECODE] Capture pool: closing idle {subscription.url}")
+                subscription.close()
+
+    def close_all(self):
+        """Đóng mọi subscription (shutdown)"""
+        self._stop_event.set()
+        with self.lock:
+            subscriptions = [subscription for subscription, _ in self.entries.values()]
+            self.entries.clear()
+        for subscription in subscriptions:
+            subscription.close()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            now = time.monotonic()
+            return {
+                'cameras': {url: {'idle_seconds': round(now - last_used, 1)}
+                            for url, (_, last_used) in self.entries.items()},
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+            }
+
+
+# Global decode service instance (singleton)
+_decode_service_instance: Optional[DecodeService] = None
+
+
+def get_decode_service() -> DecodeService:
+    """Get or create the global decode service instance"""
+    global _decode_service_instance
+    if _decode_service_instance is None:
+        _decode_service_instance = DecodeService()
+    return _decode_service_instance
+
+
+# Global capture pool instance (singleton)
+_capture_pool_instance: Optional[CapturePool] = None
+
+
+def get_capture_pool() -> CapturePool:
+    """Get or create the global capture pool (dùng decode service chung)"""
+    global _capture_pool_instance
+    if _capture_pool_instance is None:
+        _capture_pool_instance = CapturePool(get_decode_service())
+    return _capture_pool_instance
@@ -1,72 +1,109 @@
 """
 Detection Stream Service - Real-time license plate detection với WebSocket broadcast
+
+Kiến trúc:
+1. Reader threads: mỗi camera 1 thread chờ frame mới từ decoder, motion gate + resize,
+   đặt frame vào slot "pending" của camera (chỉ giữ frame mới nhất, frame cũ chưa detect bị thay)
+2. Inference workers: lấy camera theo thứ tự round-robin (camera có frame mới xếp hàng FIFO,
+   mỗi lượt 1 frame / camera) → camera nhiều frame không chiếm hết detector của camera khác
+3. 1 camera đọc chậm / mất kết nối chỉ làm chậm reader của chính nó
+
+Metrics theo camera: source_fps (frame nhận từ decoder), detect_fps (frame đã detect),
+dropped_frames (bị frame mới hơn thay trước khi detect), latency_ms (frame → kết quả)
 """
 import cv2
 import threading
 import time
+from collections import deque
 from typing import Optional
 from license_plate_detector import get_detector
+from decode_service import get_decode_service
+from motion_detector import MotionGate
 from websocket_manager import WebSocketManager
 
 
+class RateMeter:
+    """Đếm sự kiện / giây trong cửa sổ trượt window giây (mark từ reader / worker, rate từ get_stats)"""
+
+    def __init__(self, window: float = 5.0):
+        self.window = window
+        self.events = deque()
+        self.lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self.events and self.events[0] < now - self.window:
+            self.events.popleft()
+
+    def mark(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.events.append(now)
+            self._trim(now)
+
+    def rate(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._trim(now)
+            return len(self.events) / self.window
+
+
 class DetectionStreamService:
     """Service để chạy detection loop và broadcast qua WebSocket"""
 
-    def __init__(self, websocket_manager: WebSocketManager):
+    def __init__(self, websocket_manager: WebSocketManager, inference_workers: int = 1):
+        """
+        Args:
+            inference_workers: số thread chạy detect song song (1 cho GPU / model dùng chung)
+        """
         self.websocket_manager = websocket_manager
         self.detector = None
         self.running = False
-        self.thread: Optional[threading.Thread] = None
-        self.active_cameras = {}  # {camera_id: VideoCapture}
+        self.inference_workers = inference_workers
+        self.workers = []
+        # Tang moi lan dung workers - worker dang detect do (chua thay running = False) tu thoat
+        # khi xong frame, khong chay chung voi bo worker moi
+        self.generation = 0
+        self.active_cameras = {}  # {camera_id: camera_info}
         self.lock = threading.Lock()
 
-    def start_detection(self, camera_id: str, rtsp_url: str, conf_threshold: float = 0.25, iou_threshold: float = 0.45):
+        # Camera co frame cho detect (FIFO, moi camera toi da 1 lan trong hang)
+        self.ready = threading.Condition()
+        self.ready_cameras = deque()
+
+    def start_detection(self, camera_id: str, rtsp_url: str, conf_threshold: Optional[float] = None,
+                        iou_threshold: Optional[float] = None, motion_gate: bool = True):
         """
         Start detection cho 1 camera
 
         Args:
             camera_id: ID của camera
             rtsp_url: RTSP URL hoặc camera index (0, 1, 2)
-            conf_threshold: Confidence threshold
-            iou_threshold: IOU threshold
+            conf_threshold: Confidence threshold (None = 0.25)
+            iou_threshold: IOU threshold (None = 0.45)
+            motion_gate: Chỉ chạy YOLO khi có chuyển động (+ keep-alive)
         """
+        conf_threshold = 0.25 if conf_threshold is None else conf_threshold
+        iou_threshold = 0.45 if iou_threshold is None else iou_threshold
+
         with self.lock:
             # Kiểm tra camera đã active chưa
             if camera_id in self.active_cameras:
                 print(f"[DETECTION] Camera {camera_id} already running")
                 return False
 
-            # Mở camera
+            # Mở camera (decoder dùng chung với stream / consumer khác cùng URL)
             try:
-                # Nếu là số thì dùng camera index, không thì dùng RTSP URL
                 print(f"[DEBUG] Attempting to open camera: {rtsp_url}")
 
-                # Strip go2rtc params (#video=copy#audio=copy) - OpenCV không hiểu cú pháp này
-                clean_rtsp_url = rtsp_url.split('#')[0] if '#' in rtsp_url else rtsp_url
-                if clean_rtsp_url != rtsp_url:
-                    print(f"[DEBUG] Cleaned RTSP URL: {clean_rtsp_url}")
-
-                if clean_rtsp_url.isdigit():
-                    cap = cv2.VideoCapture(int(clean_rtsp_url))
-                else:
-                    # Set RTSP options for better compatibility
-                    cap = cv2.VideoCapture(clean_rtsp_url, cv2.CAP_FFMPEG)
-                    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-
-                if not cap.isOpened():
+                try:
+                    subscription = get_decode_service().subscribe(rtsp_url)
+                except RuntimeError:
                     print(f"[ERROR] Failed to open camera {camera_id}")
                     print(f"[ERROR] RTSP URL: {rtsp_url}")
                     print(f"[ERROR] Check if camera is accessible and credentials are correct")
                     return False
 
-                # Test read a frame
-                ret, frame = cap.read()
-                if not ret or frame is None:
-                    print(f"[ERROR] Failed to read frame from camera {camera_id}")
-                    cap.release()
-                    return False
-
-                print(f"[SUCCESS] Camera {camera_id} opened successfully, frame size: {frame.shape}")
+                print(f"[SUCCESS] Camera {camera_id} opened successfully")
 
                 # Load detector nếu chưa có
                 if self.detector is None:
@@ -75,21 +112,36 @@ class DetectionStreamService:
                     print("[DETECTION] Detector loaded!")
 
                 # Lưu camera
-                self.active_cameras[camera_id] = {
-                    'cap': cap,
+                camera_info = {
+                    'subscription': subscription,
                     'url': rtsp_url,
                     'conf_threshold': conf_threshold,
                     'iou_threshold': iou_threshold,
                     'frame_count': 0,
-                    'detection_count': 0
+                    'detection_count': 0,
+                    'motion_gate': MotionGate() if motion_gate else None,
+                    'pending': None,  # (frame_id, frame, scale, captured_at) cho detect
+                    'stopped': False,
+                    'source_fps': RateMeter(),
+                    'detect_fps': RateMeter(),
+                    'dropped_frames': 0,
+                    'latency_ms': 0.0
                 }
+                self.active_cameras[camera_id] = camera_info
 
-                # Start detection thread nếu chưa chạy
+                # Start inference workers nếu chưa chạy
                 if not self.running:
                     self.running = True
-                    self.thread = threading.Thread(target=self._detection_loop, daemon=True)
-                    self.thread.start()
-                    print("[DETECTION] Detection loop started")
+                    self.workers = [
+                        threading.Thread(target=self._inference_loop, args=(self.generation,), daemon=True)
+                        for _ in range(self.inference_workers)
+                    ]
+                    for worker in self.workers:
+                        worker.start()
+                    print(f"[DETECTION] {self.inference_workers} inference worker(s) started")
+
+                # Reader thread rieng cho camera
+                threading.Thread(target=self._camera_reader_loop, args=(camera_id, camera_info), daemon=True).start()
 
                 print(f"[DETECTION] Camera {camera_id} started: {rtsp_url}")
                 return True
@@ -104,16 +156,24 @@ class DetectionStreamService:
             if camera_id not in self.active_cameras:
                 return False
 
-            # Release camera
+            # Release camera (reader thread tu thoat khi subscription dong)
             camera_info = self.active_cameras[camera_id]
-            camera_info['cap'].release()
+            camera_info['stopped'] = True
+            camera_info['subscription'].close()
             del self.active_cameras[camera_id]
+            with self.ready:
+                if camera_id in self.ready_cameras:
+                    self.ready_cameras.remove(camera_id)
+                camera_info['pending'] = None
 
             print(f"[DETECTION] Camera {camera_id} stopped")
 
-            # Stop thread nếu không còn camera nào
+            # Stop workers nếu không còn camera nào
             if len(self.active_cameras) == 0:
                 self.running = False
+                with self.ready:
+                    self.generation += 1
+                    self.ready.notify_all()
                 print("[DETECTION] Detection loop stopped")
 
             return True
@@ -122,106 +182,146 @@ class DetectionStreamService:
         """Stop tất cả cameras"""
         with self.lock:
             camera_ids = list(self.active_cameras.keys())
-            for camera_id in camera_ids:
-                self.stop_detection(camera_id)
 
-            self.running = False
+        # stop_detection tu lay lock (threading.Lock khong re-entrant)
+        for camera_id in camera_ids:
+            self.stop_detection(camera_id)
 
-    def _detection_loop(self):
-        """Main detection loop - chạy trong thread riêng"""
-        print("[DETECTION] Detection loop running...")
+        self.running = False
 
-        while self.running:
-            # Process từng camera
-            camera_ids = list(self.active_cameras.keys())
+    def _camera_reader_loop(self, camera_id: str, camera_info: dict):
+        """
+        Reader thread - chờ frame mới của 1 camera, motion gate + resize, đặt vào slot pending
+        Detect chậm hơn FPS camera → frame pending bị thay bằng frame mới hơn (không dồn queue)
+        """
+        subscription = camera_info['subscription']
 
-            for camera_id in camera_ids:
-                try:
-                    with self.lock:
-                        if camera_id not in self.active_cameras:
-                            continue
-
-                        camera_info = self.active_cameras[camera_id]
-                        cap = camera_info['cap']
-
-                    # Read frame - lấy frame hiện tại
-                    ret, frame = cap.read()
-
-                    if not ret:
-                        print(f"[WARNING] Failed to read frame from {camera_id}")
-                        continue
-
-                    # Update frame count
-                    with self.lock:
-                        camera_info['frame_count'] += 1
-
-                    # Resize frame nhỏ hơn để tăng tốc inference (giữ nguyên aspect ratio)
-                    # Detection vẫn chính xác nhưng nhanh hơn 3-4 lần
-                    original_h, original_w = frame.shape[:2]
-                    target_size = 640  # YOLO standard size
-
-                    if max(original_h, original_w) > target_size:
-                        scale = target_size / max(original_h, original_w)
-                        new_w = int(original_w * scale)
-                        new_h = int(original_h * scale)
-                        resized_frame = cv2.resize(frame, (new_w, new_h))
+        while self.running and not camera_info['stopped']:
+            try:
+                frame = subscription.read(timeout=1.0)
+                if frame is None:
+                    continue
+
+                # Update frame count
+                with self.lock:
+                    camera_info['frame_count'] += 1
+                    frame_id = camera_info['frame_count']
+                camera_info['source_fps'].mark()
+
+                # Motion gate - cảnh tĩnh thì bỏ qua YOLO, không broadcast (frontend giữ box cũ)
+                gate = camera_info['motion_gate']
+                if gate is not None and not gate.should_detect(frame, time.monotonic()):
+                    continue
+
+                # Resize frame nhỏ hơn để tăng tốc inference (giữ nguyên aspect ratio)
+                # Detection vẫn chính xác nhưng nhanh hơn 3-4 lần
+                original_h, original_w = frame.shape[:2]
+                target_size = 640  # YOLO standard size
+
+                if max(original_h, original_w) > target_size:
+                    scale = target_size / max(original_h, original_w)
+                    new_w = int(original_w * scale)
+                    new_h = int(original_h * scale)
+                    resized_frame = cv2.resize(frame, (new_w, new_h))
+                else:
+                    resized_frame = frame
+                    scale = 1.0
+
+                with self.ready:
+                    if camera_info['stopped']:
+                        break
+                    if camera_info['pending'] is not None:
+                        camera_info['dropped_frames'] += 1
                     else:
-                        resized_frame = frame
-                        scale = 1.0
-
-                    # CHỈ DETECT - không vẽ box, không encode frame
-                    # Frontend sẽ tự vẽ box lên canvas (nhanh hơn nhiều!)
-                    detections = self.detector.detect_from_frame(
-                        resized_frame,
-                        conf_threshold=camera_info['conf_threshold'],
-                        iou_threshold=camera_info['iou_threshold']
-                    )
-
-                    # Scale bbox coordinates back to original size
-                    for det in detections:
-                        det['bbox'] = [int(coord / scale) for coord in det['bbox']]
-
-                    # Convert bbox format: [x1, y1, x2, y2] -> [x, y, w, h]
-                    formatted_detections = []
-                    for det in detections:
-                        x1, y1, x2, y2 = det['bbox']
-                        w = x2 - x1
-                        h = y2 - y1
-
-                        formatted_detections.append({
-                            'class': det['class_name'],
-                            'confidence': det['confidence'],
-                            'bbox': [int(x1), int(y1), int(w), int(h)],  # [x, y, width, height]
-                            'camera_id': camera_id,
-                            'frame_id': camera_info['frame_count'],
-                            'timestamp': time.time()
-                        })
-
-                    # Update detection count
-                    if len(formatted_detections) > 0:
-                        with self.lock:
-                            camera_info['detection_count'] += len(formatted_detections)
-
-                    # CHỈ GỬI DETECTIONS - không gửi frame
-                    # Giảm bandwidth từ ~5MB/s xuống ~5KB/s !!!
-                    message = {
-                        'detections': formatted_detections,
-                        'camera_id': camera_id,
-                        'frame_id': camera_info['frame_count']
-                    }
-
-                    self.websocket_manager.broadcast_detections(message)
-
-                    if len(formatted_detections) > 0:
-                        print(f"[DETECTION] Camera {camera_id} - Frame {camera_info['frame_count']}: {len(formatted_detections)} detection(s)")
-
-                except Exception as e:
-                    print(f"[ERROR] Detection error for camera {camera_id}: {e}")
-
-            # Sleep ngắn để giảm CPU load nhưng vẫn giữ FPS cao
-            time.sleep(0.05)  # ~20 FPS (tốt cho real-time detection)
-
-        print("[DETECTION] Detection loop stopped")
+                        self.ready_cameras.append(camera_id)
+                    camera_info['pending'] = (frame_id, resized_frame, scale, time.time())
+                    self.ready.notify()
+
+            except Exception as e:
+                print(f"[ERROR] Reader error for camera {camera_id}: {e}")
+                time.sleep(0.1)
+
+    def _inference_loop(self, generation: int):
+        """
+        Inference worker - detect frame pending của camera kế tiếp theo round-robin
+
+        Args:
+            generation: thế hệ worker lúc start - khác self.generation (đã stop, có thể đã start lại) → thoát
+        """
+        print("[DETECTION] Inference worker running...")
+
+        while True:
+            with self.ready:
+                if generation != self.generation:
+                    break
+                if not self.ready_cameras:
+                    self.ready.wait(timeout=0.5)
+                    continue
+                camera_id = self.ready_cameras.popleft()
+                camera_info = self.active_cameras.get(camera_id)
+                if camera_info is None or camera_info['pending'] is None:
+                    continue
+                job = camera_info['pending']
+                camera_info['pending'] = None
+
+            try:
+                self._detect_and_broadcast(camera_id, camera_info, *job)
+            except Exception as e:
+                print(f"[ERROR] Detection error for camera {camera_id}: {e}")
+
+        print("[DETECTION] Inference worker stopped")
+
+    def _detect_and_broadcast(self, camera_id: str, camera_info: dict, frame_id: int, resized_frame, scale: float,
+                              captured_at: float):
+        # CHỈ DETECT - không vẽ box, không encode frame
+        # Frontend sẽ tự vẽ box lên canvas (nhanh hơn nhiều!)
+        detections = self.detector.detect_from_frame(
+            resized_frame,
+            conf_threshold=camera_info['conf_threshold'],
+            iou_threshold=camera_info['iou_threshold']
+        )
+
+        # Scale bbox coordinates back to original size
+        for det in detections:
+            det['bbox'] = [int(coord / scale) for coord in det['bbox']]
+
+        # Convert bbox format: [x1, y1, x2, y2] -> [x, y, w, h]
+        formatted_detections = []
+        for det in detections:
+            x1, y1, x2, y2 = det['bbox']
+            w = x2 - x1
+            h = y2 - y1
+
+            formatted_detections.append({
+                'class': det['class_name'],
+                'confidence': det['confidence'],
+                'bbox': [int(x1), int(y1), int(w), int(h)],  # [x, y, width, height]
+                'camera_id': camera_id,
+                'frame_id': frame_id,
+                'timestamp': time.time()
+            })
+
+        # Update detection count + metrics
+        camera_info['detect_fps'].mark()
+        latency_ms = (time.time() - captured_at) * 1000
+        with self.lock:
+            camera_info['detection_count'] += len(formatted_detections)
+            # EWMA de latency khong nhay theo tung frame
+            camera_info['latency_ms'] = latency_ms if not camera_info['latency_ms'] else \
+                camera_info['latency_ms'] * 0.9 + latency_ms * 0.1
+
+        # CHỈ GỬI DETECTIONS - không gửi frame
+        # Giảm bandwidth từ ~5MB/s xuống ~5KB/s !!!
+        message = {
+            'detections': formatted_detections,
+            'camera_id': camera_id,
+            'frame_id': frame_id
+        }
+
+        self.websocket_manager.broadcast_detections(message)
+
+        if len(formatted_detections) > 0:
+            print(f"[DETECTION] Camera {camera_id} - Frame {frame_id}: {len(formatted_detections)} detection(s)")
 
     def get_stats(self):
         """Lấy thống kê detection"""
@@ -233,6 +333,11 @@ class DetectionStreamService:
                     'frame_count': camera_info['frame_count'],
                     'detection_count': camera_info['detection_count'],
                     'conf_threshold': camera_info['conf_threshold'],
-                    'iou_threshold': camera_info['iou_threshold']
+                    'iou_threshold': camera_info['iou_threshold'],
+                    'motion_gate': camera_info['motion_gate'].get_stats() if camera_info['motion_gate'] else None,
+                    'source_fps': round(camera_info['source_fps'].rate(), 1),
+                    'detect_fps': round(camera_info['detect_fps'].rate(), 1),
+                    'dropped_frames': camera_info['dropped_frames'],
+                    'latency_ms': round(camera_info['latency_ms'], 1)
                 }
             return stats
@@ -0,0 +1,206 @@
+"""
+GPU Config - Đọc + validate gpu_config.yaml cho GPUBatchDetectionService
+
+Mỗi section của file là 1 dataclass; giá trị sai kiểu / ngoài khoảng / key lạ → GPUConfigError
+(kèm tên key) thay vì lỗi khó hiểu lúc inference. Section / key không có trong file → giá trị mặc định.
+
+Reload lúc runtime: GPUBatchDetectionService.reload_config() (POST /api/detection/config/reload)
+- file lỗi thì giữ nguyên config đang chạy.
+"""
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import Optional, Union
+
+import yaml
+
+DEFAULT_CONFIG_PATH = Path(__file__).parent / "gpu_config.yaml"
+
+
+class GPUConfigError(ValueError):
+    """gpu_config.yaml không hợp lệ"""
+
+
+def _number(section: str, key: str, value, kind, minimum=None, maximum=None):
+    # bool la subclass cua int - "batch_size: true" khong hop le
+    if isinstance(value, bool) or not isinstance(value, (int, float) if kind is float else int):
+        raise GPUConfigError(f"{section}.{key}: expected {kind.__name__}, got {value!r}")
+    if minimum is not None and value < minimum or maximum is not None and value > maximum:
+        raise GPUConfigError(f"{section}.{key}: {value} out of range [{minimum}, {maximum}]")
+    return kind(value)
+
+
+def _bool(section: str, key: str, value) -> bool:
+    if not isinstance(value, bool):
+        raise GPUConfigError(f"{section}.{key}: expected true/false, got {value!r}")
+    return value
+
+
+def _choice(section: str, key: str, value, choices) -> str:
+    if value not in choices:
+        raise GPUConfigError(f"{section}.{key}: expected one of {', '.join(choices)}, got {value!r}")
+    return value
+
+
+@dataclass
+class GPUSettings:
+    batch_size: Union[int, str] = "auto"  # 1-16 hoac "auto"
+    input_size: int = 640
+    device: str = "auto"  # auto / cuda / cpu
+    fp16: bool = False
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GPUSettings":
+        s = "gpu"
+        settings = cls()
+        if "batch_size" in data:
+            value = data["batch_size"]
+            settings.batch_size = value if value == "auto" else _number(s, "batch_size", value, int, 1, 16)
+        if "input_size" in data:
+            settings.input_size = _number(s, "input_size", data["input_size"], int, 160, 1920)
+            if settings.input_size % 32:
+                raise GPUConfigError(f"{s}.input_size: must be a multiple of 32, got {settings.input_size}")
+        if "device" in data:
+            settings.device = _choice(s, "device", data["device"], ("auto", "cuda", "cpu"))
+        if "fp16" in data:
+            settings.fp16 = _bool(s, "fp16", data["fp16"])
+        return settings
+
+
+@dataclass
+class CameraSettings:
+    max_queue_size: int = 100
+    frame_skip: int = 0  # bo N frame sau moi frame xu ly
+    batch_timeout_ms: float = 50
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CameraSettings":
+        s = "camera"
+        settings = cls()
+        if "max_queue_size" in data:
+            settings.max_queue_size = _number(s, "max_queue_size", data["max_queue_size"], int, 1, 10000)
+        if "frame_skip" in data:
+            settings.frame_skip = _number(s, "frame_skip", data["frame_skip"], int, 0, 100)
+        if "batch_timeout_ms" in data:
+            settings.batch_timeout_ms = _number(s, "batch_timeout_ms", data["batch_timeout_ms"], float, 0, 5000)
+        return settings
+
+
+@dataclass
+class DetectionSettings:
+    conf_threshold: float = 0.25
+    iou_threshold: float = 0.45
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DetectionSettings":
+        s = "detection"
+        settings = cls()
+        if "conf_threshold" in data:
+            settings.conf_threshold = _number(s, "conf_threshold", data["conf_threshold"], float, 0, 1)
+        if "iou_threshold" in data:
+            settings.iou_threshold = _number(s, "iou_threshold", data["iou_threshold"], float, 0, 1)
+        return settings
+
+
+@dataclass
+class MotionSettings:
+    enabled: bool = True
+    method: str = "diff"  # diff / mog2
+    frame_width: int = 320
+    keepalive_seconds: float = 5.0
+    hold_seconds: float = 2.0
+    open_frames: int = 2
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MotionSettings":
+        s = "motion"
+        settings = cls()
+        if "enabled" in data:
+            settings.enabled = _bool(s, "enabled", data["enabled"])
+        if "method" in data:
+            settings.method = _choice(s, "method", data["method"], ("diff", "mog2"))
+        if "frame_width" in data:
+            settings.frame_width = _number(s, "frame_width", data["frame_width"], int, 64, 1920)
+        if "keepalive_seconds" in data:
+            settings.keepalive_seconds = _number(s, "keepalive_seconds", data["keepalive_seconds"], float, 0, 3600)
+        if "hold_seconds" in data:
+            settings.hold_seconds = _number(s, "hold_seconds", data["hold_seconds"], float, 0, 3600)
+        if "open_frames" in data:
+            settings.open_frames = _number(s, "open_frames", data["open_frames"], int, 1, 100)
+        return settings
+
+
+@dataclass
+class PerformanceSettings:
+    enable_stats: bool = True
+    stats_interval: float = 10
+    monitor_gpu_memory: bool = True
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PerformanceSettings":
+        s = "performance"
+        settings = cls()
+        if "enable_stats" in data:
+            settings.enable_stats = _bool(s, "enable_stats", data["enable_stats"])
+        if "stats_interval" in data:
+            settings.stats_interval = _number(s, "stats_interval", data["stats_interval"], float, 1, 3600)
+        if "monitor_gpu_memory" in data:
+            settings.monitor_gpu_memory = _bool(s, "monitor_gpu_memory", data["monitor_gpu_memory"])
+        return settings
+
+
+@dataclass
+class GPUConfig:
+    gpu: GPUSettings = field(default_factory=GPUSettings)
+    camera: CameraSettings = field(default_factory=CameraSettings)
+    detection: DetectionSettings = field(default_factory=DetectionSettings)
+    motion: MotionSettings = field(default_factory=MotionSettings)
+    performance: PerformanceSettings = field(default_factory=PerformanceSettings)
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "GPUConfig":
+        data = data or {}
+        if not isinstance(data, dict):
+            raise GPUConfigError("gpu_config.yaml: expected a mapping at top level")
+
+        sections = [f.name for f in fields(cls)]
+        unknown = set(data) - set(sections)
+        if unknown:
+            raise GPUConfigError(f"Unknown section(s): {', '.join(sorted(unknown))}")
+
+        config = cls()
+        for name in sections:
+            section = data.get(name) or {}
+            if not isinstance(section, dict):
+                raise GPUConfigError(f"{name}: expected a mapping, got {section!r}")
+            settings_cls = type(getattr(config, name))
+            known = {f.name for f in fields(settings_cls)}
+            unknown = set(section) - known
+            if unknown:
+                raise GPUConfigError(f"{name}: unknown key(s) {', '.join(sorted(unknown))}")
+            setattr(config, name, settings_cls.from_dict(section))
+        return config
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def load_gpu_config(path: Optional[Union[str, Path]] = None) -> GPUConfig:
+    """
+    Đọc + validate gpu_config.yaml
+
+    Args:
+        path: đường dẫn file (mặc định gpu_config.yaml cạnh file này)
+
+    Raises:
+        GPUConfigError: file không đọc được / YAML lỗi / giá trị không hợp lệ
+    """
+    path = Path(path) if path else DEFAULT_CONFIG_PATH
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f)
+    except FileNotFoundError:
+        print(f"[GPU CONFIG] {path} not found, using defaults")
+        return GPUConfig()
+    except (OSError, yaml.YAMLError) as e:
+        raise GPUConfigError(f"Failed to read {path}: {e}")
+    return GPUConfig.from_dict(data)
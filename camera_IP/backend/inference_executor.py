@@ -0,0 +1,158 @@
+"""
+Inference Executor - Chạy decode / YOLO / encode của HTTP endpoint ngoài event loop
+
+- Worker thread riêng (mặc định 1 - model YOLO dùng chung), event loop chỉ await kết quả
+  → WebSocket push, health check, stream MJPEG không bị đứng khi đang detect ảnh upload
+- Hàng đợi giới hạn: quá max_queue request đang chờ → InferenceOverloaded (endpoint trả 503)
+  thay vì để request dồn lại và timeout hết
+- Metrics: queue time (chờ worker) và service time (chạy thật) - p50 / p95 / p99 / max
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# So thread inference
+INFERENCE_WORKERS = 1
+# So request toi da dang cho worker (khong tinh request dang chay)
+INFERENCE_MAX_QUEUE = 8
+# So mau gan nhat de tinh percentile
+LATENCY_WINDOW = 1000
+
+
+class InferenceOverloaded(RuntimeError):
+    """Hàng đợi inference đầy - request bị từ chối (load shedding)"""
+
+
+class LatencyStats:
+    """Thống kê latency: count / avg / max tổng + percentile trên LATENCY_WINDOW mẫu gần nhất"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self) -> dict:
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 2) if samples else 0.0
+
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(self.max * 1000, 2),
+        }
+
+
+class InferenceExecutor:
+    """Thread pool giới hạn hàng đợi cho inference của HTTP endpoint"""
+
+    def __init__(self, workers: int = INFERENCE_WORKERS, max_queue: int = INFERENCE_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self.lock = threading.Lock()
+        self.pending = 0  # Dang cho + dang chay
+        self.running = 0
+
+        # Statistics
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.queue_time = LatencyStats()
+        self.service_time = LatencyStats()
+
+    async def run(self, fn: Callable, *args):
+        """
+        Chạy fn(*args) trên worker thread, await kết quả
+
+        Slot trong hàng đợi giữ tới khi job chạy xong (hoặc bị hủy trước khi chạy), không phải tới
+        khi coroutine await xong → client ngắt kết nối không làm executor nhận quá giới hạn
+
+        Raises:
+            InferenceOverloaded: đã có max_queue request chờ worker
+        """
+        with self.lock:
+            if self.pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise InferenceOverloaded(f"Inference queue full ({self.max_queue} waiting)")
+            self.pending += 1
+
+        enqueued_at = time.monotonic()
+
+        def job():
+            started_at = time.monotonic()
+            with self.lock:
+                self.running += 1
+                self.queue_time.add(started_at - enqueued_at)
+            ok = False
+            try:
+                result = fn(*args)
+                ok = True
+                return result
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.pending -= 1
+                    self.service_time.add(time.monotonic() - started_at)
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+
+        def release_if_cancelled(future):
+            # Job bi huy khi con trong hang (request bi cancel) → job() khong chay, tra slot tai day
+            if future.cancelled():
+                with self.lock:
+                    self.pending -= 1
+
+        try:
+            future = self.executor.submit(job)
+        except Exception:
+            with self.lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(release_if_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'queued': self.pending - self.running,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'queue_time': self.queue_time.to_dict(),
+                'service_time': self.service_time.to_dict(),
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+# Global inference executor instance (singleton)
+_inference_executor_instance: Optional[InferenceExecutor] = None
+
+
+def get_inference_executor() -> InferenceExecutor:
+    """Get or create the global inference executor"""
+    global _inference_executor_instance
+    if _inference_executor_instance is None:
+        _inference_executor_instance = InferenceExecutor()
+    return _inference_executor_instance
@@ -69,27 +69,63 @@ class LicensePlateDetector:
         )
 
         detections = []
-
-        # Process results
         for result in results:
-            boxes = result.boxes
+            detections.extend(self._parse_result(result))
+
+        return detections
+
+    def detect_from_frames(
+        self,
+        frames: List[np.ndarray],
+        conf_threshold: float = 0.25,
+        iou_threshold: float = 0.45
+    ) -> List[List[dict]]:
+        """
+        Detect license plates in nhiều frame với 1 lần gọi YOLO (batch)
+
+        Args:
+            frames: List ảnh BGR (kích thước có thể khác nhau)
+            conf_threshold: Confidence threshold for detection
+            iou_threshold: IOU threshold for NMS
+
+        Returns:
+            List detections cho từng frame (cùng thứ tự, format như detect_from_frame)
+        """
+        if len(frames) == 0:
+            return []
+
+        # YOLO tu batch khi truyen list frames
+        results = self.model.predict(
+            frames,
+            conf=conf_threshold,
+            iou=iou_threshold,
+            device=self.device,
+            verbose=False
+        )
+
+        return [self._parse_result(result) for result in results]
+
+    def _parse_result(self, result) -> List[dict]:
+        """Chuyển 1 YOLO result thành list detection dict"""
+        detections = []
+        boxes = result.boxes
 
-            for box in boxes:
-                # Get box coordinates
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+        for box in boxes:
+            # Get box coordinates
+            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
 
-                # Get confidence and class
-                confidence = float(box.conf[0].cpu().numpy())
-                class_id = int(box.cls[0].cpu().numpy())
+            # Get confidence and class
+            confidence = float(box.conf[0].cpu().numpy())
+            class_id = int(box.cls[0].cpu().numpy())
 
-                detection = {
-                    "bbox": [int(x1), int(y1), int(x2), int(y2)],
-                    "confidence": confidence,
-                    "class_id": class_id,
-                    "class_name": "license_plate"
-                }
+            detection = {
+                "bbox": [int(x1), int(y1), int(x2), int(y2)],
+                "confidence": confidence,
+                "class_id": class_id,
+                "class_name": "license_plate"
+            }
 
-                detections.append(detection)
+            detections.append(detection)
 
         return detections
 
@@ -1,11 +1,10 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, File, UploadFile, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Optional, List
-import yaml
 import asyncio
-import aiohttp
+import time
 from pathlib import Path
 import os
 import cv2
@@ -16,6 +15,11 @@ from websocket_manager import WebSocketManager
 from detection_stream import DetectionStreamService
 from batch_detection_service import GPUBatchDetectionService
 from video_stream import VideoStreamWithDetection
+from decode_service import get_capture_pool, get_decode_service
+from gpu_config import GPUConfigError
+from batch_upload_service import get_batch_upload_service, iter_ndjson, iter_upload_files
+from inference_executor import InferenceOverloaded, get_inference_executor
+from camera_registry import CameraRegistry
 
 app = FastAPI(title="Camera Stream API", version="1.0.0")
 
@@ -32,10 +36,8 @@ app.add_middleware(
 CONFIG_PATH = Path(__file__).parent / "go2rtc.yaml"
 PORT = 5000
 
-# In-memory cache
-config_cache = None
-is_writing = False
-write_queue = []
+# Camera registry - go2rtc.yaml trong RAM, ghi file gop + atomic
+camera_registry = CameraRegistry(CONFIG_PATH)
 
 # WebSocket Manager
 websocket_manager = WebSocketManager()
@@ -93,87 +95,21 @@ class DetectionResponse(BaseModel):
     processing_time_ms: float
 
 
-# Config management functions
-def load_config_sync():
-    """Load config into memory at startup"""
-    global config_cache
-    try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            config_cache = yaml.safe_load(f) or {}
-        if "streams" not in config_cache:
-            config_cache["streams"] = {}
-        if "metadata" not in config_cache:
-            config_cache["metadata"] = {}
-        print("[OK] Config loaded into memory")
-        return config_cache
-    except Exception as e:
-        print(f"Error reading config: {e}")
-        config_cache = {"streams": {}, "metadata": {}}
-        return config_cache
-
-
-def read_config() -> dict:
-    """Read config from memory (fast!)"""
-    global config_cache
-    if config_cache is None:
-        load_config_sync()
-    return config_cache
-
-
-async def write_config(config: dict):
-    """Write config to file (async with queue to prevent race conditions)"""
-    global config_cache, is_writing, write_queue
-
-    # Update cache immediately
-    config_cache = config
-
-    # Queue the write operation
-    future = asyncio.Future()
-    write_queue.append((config, future))
-
-    # Process queue if not already processing
-    if not is_writing:
-        asyncio.create_task(process_write_queue())
-
-    return await future
-
-
-async def process_write_queue():
-    """Process write queue sequentially"""
-    global is_writing, write_queue
-
-    if is_writing or len(write_queue) == 0:
-        return
-
-    is_writing = True
-
-    while write_queue:
-        config, future = write_queue.pop(0)
-
-        try:
-            yaml_str = yaml.dump(config, allow_unicode=True, sort_keys=False, default_flow_style=False)
-            with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-                f.write(yaml_str)
-            future.set_result(True)
-        except Exception as e:
-            print(f"Error writing config: {e}")
-            future.set_exception(HTTPException(status_code=500, detail="Failed to write config file"))
-
-    is_writing = False
-
-
+# go2rtc runtime (session dung chung cua camera_registry)
 async def add_stream_to_runtime(stream_id: str, url: str):
     """Add stream to go2rtc runtime"""
     try:
-        async with aiohttp.ClientSession() as session:
-            data = {"streams": {stream_id: url}}
-            async with session.patch(
-                "http://localhost:1984/api/config",
-                json=data,
-                headers={"Content-Type": "application/json"}
-            ) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=500, detail=f"go2rtc API returned {response.status}")
+        session = await camera_registry.session()
+        data = {"streams": {stream_id: url}}
+        async with session.patch(
+            "/api/config",
+            json=data,
+            headers={"Content-Type": "application/json"}
+        ) as response:
+            if response.status != 200:
+                raise HTTPException(status_code=500, detail=f"go2rtc API returned {response.status}")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -181,10 +117,12 @@ async def add_stream_to_runtime(stream_id: str, url: str):
 async def remove_stream_from_runtime(stream_id: str):
     """Remove stream from go2rtc runtime"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(f"http://localhost:1984/api/streams/{stream_id}") as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=500, detail=f"go2rtc API returned {response.status}")
+        session = await camera_registry.session()
+        async with session.delete(f"/api/streams/{stream_id}") as response:
+            if response.status != 200:
+                raise HTTPException(status_code=500, detail=f"go2rtc API returned {response.status}")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -192,29 +130,9 @@ async def remove_stream_from_runtime(stream_id: str):
 # API Endpoints
 @app.get("/api/cameras", response_model=List[Camera])
 async def get_cameras():
-    """Get all cameras"""
+    """Get all cameras (từ RAM, không đọc file)"""
     try:
-        config = read_config()
-        streams = config.get("streams", {})
-        metadata = config.get("metadata", {})
-
-        cameras = []
-        for camera_id, url in streams.items():
-            if camera_id.startswith("#"):  # Ignore comments
-                continue
-
-            meta = metadata.get(camera_id, {})
-            name = meta.get("name") or camera_id.replace("_", " ").title()
-            cam_type = meta.get("type") or ("rtsp" if url.startswith("rtsp://") else "public")
-
-            cameras.append(Camera(
-                id=camera_id,
-                name=name,
-                type=cam_type,
-                url=url
-            ))
-
-        return cameras
+        return camera_registry.list_cameras()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -226,34 +144,36 @@ async def create_camera(camera: CameraCreate):
         if not camera.id or not camera.url:
             raise HTTPException(status_code=400, detail="Missing id or url")
 
-        config = read_config()
-
-        # Initialize streams and metadata if not exists
-        if "streams" not in config:
-            config["streams"] = {}
-        if "metadata" not in config:
-            config["metadata"] = {}
+        # Cap nhat RAM + cho ghi file (gop voi cac thay doi cung luc)
+        await camera_registry.add_camera(camera.id, camera.url, camera.name, camera.type)
 
-        # Add low-latency params for RTSP streams
-        final_url = camera.url
-        if camera.type == "rtsp" and camera.url.startswith("rtsp://") and "#" not in camera.url:
-            final_url = f"{camera.url}#video=copy#audio=copy"
+        return {"success": True, "message": "Camera added successfully"}
+    except HTTPException:
+        raise
+    except OSError:
+        raise HTTPException(status_code=500, detail="Failed to write config file")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Add new camera stream
-        config["streams"][camera.id] = final_url
 
-        # Add camera metadata
-        config["metadata"][camera.id] = {
-            "name": camera.name or camera.id,
-            "type": camera.type
-        }
+@app.post("/api/cameras/bulk")
+async def create_cameras_bulk(cameras: List[CameraCreate]):
+    """Add many cameras - 1 lần ghi go2rtc.yaml cho cả danh sách"""
+    try:
+        for camera in cameras:
+            if not camera.id or not camera.url:
+                raise HTTPException(status_code=400, detail=f"Missing id or url: {camera.id or camera.url}")
 
-        # Write to file
-        await write_config(config)
+        await asyncio.gather(*[
+            camera_registry.add_camera(camera.id, camera.url, camera.name, camera.type)
+            for camera in cameras
+        ])
 
-        return {"success": True, "message": "Camera added successfully"}
+        return {"success": True, "message": f"{len(cameras)} camera(s) added successfully"}
     except HTTPException:
         raise
+    except OSError:
+        raise HTTPException(status_code=500, detail="Failed to write config file")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -262,36 +182,15 @@ async def create_camera(camera: CameraCreate):
 async def update_camera(camera_id: str, camera: CameraUpdate):
     """Update a camera"""
     try:
-        config = read_config()
-
-        if "streams" not in config or camera_id not in config["streams"]:
-            raise HTTPException(status_code=404, detail="Camera not found")
-
-        # Update camera stream if URL changed
-        if camera.url:
-            final_url = camera.url
-            # Add low-latency params for RTSP streams
-            if camera.type == "rtsp" and camera.url.startswith("rtsp://") and "#" not in camera.url:
-                final_url = f"{camera.url}#video=copy#audio=copy"
-            config["streams"][camera_id] = final_url
-
-        # Update camera metadata
-        if "metadata" not in config:
-            config["metadata"] = {}
-        if camera_id not in config["metadata"]:
-            config["metadata"][camera_id] = {}
-
-        if camera.name is not None:
-            config["metadata"][camera_id]["name"] = camera.name
-        if camera.type is not None:
-            config["metadata"][camera_id]["type"] = camera.type
-
-        # Write to file
-        await write_config(config)
+        await camera_registry.update_camera(camera_id, camera.url, camera.name, camera.type)
 
         return {"success": True, "message": "Camera updated successfully"}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Camera not found")
     except HTTPException:
         raise
+    except OSError:
+        raise HTTPException(status_code=500, detail="Failed to write config file")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -300,24 +199,15 @@ async def update_camera(camera_id: str, camera: CameraUpdate):
 async def delete_camera(camera_id: str):
     """Remove a camera"""
     try:
-        config = read_config()
-
-        if "streams" not in config or camera_id not in config["streams"]:
-            raise HTTPException(status_code=404, detail="Camera not found")
-
-        # Remove camera stream
-        del config["streams"][camera_id]
-
-        # Remove camera metadata
-        if "metadata" in config and camera_id in config["metadata"]:
-            del config["metadata"][camera_id]
-
-        # Write to file
-        await write_config(config)
+        await camera_registry.remove_camera(camera_id)
 
         return {"success": True, "message": "Camera removed successfully"}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Camera not found")
     except HTTPException:
         raise
+    except OSError:
+        raise HTTPException(status_code=500, detail="Failed to write config file")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -332,7 +222,8 @@ async def health_check():
 async def stream_video_with_detection(
     camera_id: str,
     conf_threshold: float = 0.25,
-    iou_threshold: float = 0.45
+    iou_threshold: float = 0.45,
+    motion_gate: bool = True
 ):
     """
     Stream video với license plate detection overlay (vẽ trực tiếp lên frame)
@@ -343,23 +234,23 @@ async def stream_video_with_detection(
     Example:
         http://localhost:5000/api/stream/camera1
         http://localhost:5000/api/stream/camera1?conf_threshold=0.2
+        http://localhost:5000/api/stream/camera1?motion_gate=false  (detect mọi frame)
     """
     try:
-        # Lấy RTSP URL từ config
-        config = read_config()
-        streams = config.get("streams", {})
+        # Lấy RTSP URL từ camera registry
+        rtsp_url = camera_registry.get_stream(camera_id)
 
-        if camera_id not in streams:
+        if rtsp_url is None:
             raise HTTPException(status_code=404, detail=f"Camera {camera_id} not found")
 
-        rtsp_url = streams[camera_id]
-
         # Tạo video stream với detection
-        with VideoStreamWithDetection(rtsp_url, conf_threshold, iou_threshold) as stream:
-            return StreamingResponse(
-                stream.generate_frames(),
-                media_type="multipart/x-mixed-replace; boundary=frame"
-            )
+        # Khong dung "with": capture phai song toi khi client ngat (generate_frames tu close)
+        stream = VideoStreamWithDetection(rtsp_url, conf_threshold, iou_threshold, motion_gate)
+        await asyncio.to_thread(stream.open)
+        return StreamingResponse(
+            stream.generate_frames(),
+            media_type="multipart/x-mixed-replace; boundary=frame"
+        )
 
     except HTTPException:
         raise
@@ -371,7 +262,8 @@ async def stream_video_with_detection(
 async def stream_rtsp_with_detection(
     rtsp_url: str,
     conf_threshold: float = 0.25,
-    iou_threshold: float = 0.45
+    iou_threshold: float = 0.45,
+    motion_gate: bool = True
 ):
     """
     Stream video trực tiếp từ RTSP URL với detection overlay
@@ -381,15 +273,61 @@ async def stream_rtsp_with_detection(
         http://localhost:5000/api/stream/rtsp?rtsp_url=rtsp://...
     """
     try:
-        with VideoStreamWithDetection(rtsp_url, conf_threshold, iou_threshold) as stream:
-            return StreamingResponse(
-                stream.generate_frames(),
-                media_type="multipart/x-mixed-replace; boundary=frame"
-            )
+        stream = VideoStreamWithDetection(rtsp_url, conf_threshold, iou_threshold, motion_gate)
+        await asyncio.to_thread(stream.open)
+        return StreamingResponse(
+            stream.generate_frames(),
+            media_type="multipart/x-mixed-replace; boundary=frame"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Stream failed: {str(e)}")
 
 
+# Inference helpers - chay tren worker cua InferenceExecutor, khong goi truc tiep tu event loop
+def _decode_upload(contents: bytes) -> Optional[np.ndarray]:
+    nparr = np.frombuffer(contents, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def _run_detection(frame: np.ndarray, conf_threshold: float, iou_threshold: float):
+    """Detect 1 frame → (detections, processing_time_ms)"""
+    detector = get_detector()
+    start_time = time.time()
+    detections = detector.detect_from_frame(frame, conf_threshold, iou_threshold)
+    processing_time = (time.time() - start_time) * 1000  # Convert to ms
+    return detections, processing_time
+
+
+def _detect_upload(contents: bytes, conf_threshold: float, iou_threshold: float):
+    """Decode + detect ảnh upload → (detections, processing_time_ms), None nếu ảnh không hợp lệ"""
+    frame = _decode_upload(contents)
+    if frame is None:
+        return None
+    return _run_detection(frame, conf_threshold, iou_threshold)
+
+
+def _visualize_upload(contents: bytes, conf_threshold: float, iou_threshold: float, color: tuple, thickness: int):
+    """
+    Decode + detect + vẽ + encode JPEG → (detections, jpeg bytes)
+
+    None nếu ảnh không hợp lệ, jpeg bytes = None nếu encode lỗi
+    """
+    frame = _decode_upload(contents)
+    if frame is None:
+        return None
+    detector = get_detector()
+    detections, output_frame = detector.detect_and_draw(
+        frame, conf_threshold, iou_threshold, color, thickness
+    )
+    success, encoded_image = cv2.imencode('.jpg', output_frame)
+    return detections, encoded_image.tobytes() if success else None
+
+
+def _overloaded(e: InferenceOverloaded) -> HTTPException:
+    """Load shedding - client thử lại sau thay vì chờ trong hàng đợi dài"""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
 # License Plate Detection Endpoints
 @app.post("/api/detect/upload", response_model=DetectionResponse)
 async def detect_license_plate_upload(
@@ -400,6 +338,9 @@ async def detect_license_plate_upload(
     """
     Detect license plates from uploaded image file
 
+    Decode + detect chạy trên inference worker (không chặn event loop),
+    trả 503 khi hàng đợi inference đầy
+
     Args:
         file: Image file (jpg, png, etc.)
         conf_threshold: Confidence threshold (0.0 - 1.0)
@@ -408,24 +349,15 @@ async def detect_license_plate_upload(
     Returns:
         Detection results with bounding boxes and confidence scores
     """
-    import time
-
     try:
         # Read uploaded file
         contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
-        if frame is None:
+        # Decode + detect tren inference worker
+        result = await get_inference_executor().run(_detect_upload, contents, conf_threshold, iou_threshold)
+        if result is None:
             raise HTTPException(status_code=400, detail="Invalid image file")
-
-        # Get detector
-        detector = get_detector()
-
-        # Perform detection
-        start_time = time.time()
-        detections = detector.detect_from_frame(frame, conf_threshold, iou_threshold)
-        processing_time = (time.time() - start_time) * 1000  # Convert to ms
+        detections, processing_time = result
 
         return DetectionResponse(
             detections=detections,
@@ -435,6 +367,8 @@ async def detect_license_plate_upload(
 
     except HTTPException:
         raise
+    except InferenceOverloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
 
@@ -452,6 +386,8 @@ async def detect_and_visualize_upload(
     """
     Detect license plates and return image with drawn bounding boxes
 
+    Decode + detect + encode chạy trên inference worker, trả 503 khi hàng đợi đầy
+
     Args:
         file: Image file (jpg, png, etc.)
         conf_threshold: Confidence threshold (0.0 - 1.0)
@@ -467,39 +403,89 @@ async def detect_and_visualize_upload(
     try:
         # Read uploaded file
         contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        if frame is None:
-            raise HTTPException(status_code=400, detail="Invalid image file")
-
-        # Get detector
-        detector = get_detector()
 
         # Detect and draw
         color = (color_b, color_g, color_r)  # BGR format
-        detections, output_frame = detector.detect_and_draw(
-            frame, conf_threshold, iou_threshold, color, thickness
+        result = await get_inference_executor().run(
+            _visualize_upload, contents, conf_threshold, iou_threshold, color, thickness
         )
-
-        # Encode image to JPEG
-        success, encoded_image = cv2.imencode('.jpg', output_frame)
-        if not success:
+        if result is None:
+            raise HTTPException(status_code=400, detail="Invalid image file")
+        detections, encoded_image = result
+        if encoded_image is None:
             raise HTTPException(status_code=500, detail="Failed to encode image")
 
         # Return as streaming response
         return StreamingResponse(
-            BytesIO(encoded_image.tobytes()),
+            BytesIO(encoded_image),
             media_type="image/jpeg",
             headers={"X-Detection-Count": str(len(detections))}
         )
 
     except HTTPException:
         raise
+    except InferenceOverloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
 
 
+@app.post("/api/detect/batch")
+async def detect_license_plate_batch(
+    files: List[UploadFile] = File(...),
+    conf_threshold: float = 0.25,
+    iou_threshold: float = 0.45
+):
+    """
+    Detect license plates from many uploaded images (file .zip → mỗi entry 1 ảnh)
+
+    Ảnh được decode song song và detect theo batch; kết quả stream về dạng NDJSON,
+    mỗi ảnh 1 dòng ngay khi batch chứa ảnh đó xong, dòng cuối {"done": true, ...}
+
+    Args:
+        files: Image files (jpg, png, etc.) and/or zip archives
+        conf_threshold: Confidence threshold (0.0 - 1.0)
+        iou_threshold: IOU threshold for NMS (0.0 - 1.0)
+    """
+    # Doc file truoc khi tra response - UploadFile bi dong khi handler return
+    uploads = [(file.filename, await file.read()) for file in files]
+
+    return StreamingResponse(
+        get_batch_upload_service().detect_stream(iter_upload_files(uploads), conf_threshold, iou_threshold),
+        media_type="application/x-ndjson"
+    )
+
+
+@app.post("/api/detect/batch/ndjson")
+async def detect_license_plate_batch_ndjson(
+    request: Request,
+    conf_threshold: float = 0.25,
+    iou_threshold: float = 0.45
+):
+    """
+    Detect license plates from an NDJSON body: mỗi dòng {"name": "...", "image": "<base64>"}
+
+    Kết quả NDJSON giống /api/detect/batch
+
+    Args:
+        conf_threshold: Confidence threshold (0.0 - 1.0)
+        iou_threshold: IOU threshold for NMS (0.0 - 1.0)
+    """
+    # Doc body truoc khi tra response - StreamingResponse cung nghe receive() (disconnect)
+    chunks = []
+    async for chunk in request.stream():
+        chunks.append(chunk)
+
+    async def body():
+        for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(
+        get_batch_upload_service().detect_stream(iter_ndjson(body()), conf_threshold, iou_threshold),
+        media_type="application/x-ndjson"
+    )
+
+
 @app.post("/api/detect/rtsp", response_model=DetectionResponse)
 async def detect_license_plate_rtsp(
     rtsp_url: str,
@@ -509,6 +495,10 @@ async def detect_license_plate_rtsp(
     """
     Detect license plates from RTSP stream (single frame)
 
+    Capture được giữ ấm theo URL (CapturePool): request đầu tiên kết nối camera,
+    các request sau lấy ngay frame mới nhất, capture tự đóng khi không dùng 60s
+    Detect chạy trên inference worker, trả 503 khi hàng đợi inference đầy
+
     Args:
         rtsp_url: RTSP URL
         conf_threshold: Confidence threshold (0.0 - 1.0)
@@ -517,29 +507,17 @@ async def detect_license_plate_rtsp(
     Returns:
         Detection results from single frame
     """
-    import time
-
     try:
-        # Open RTSP stream
-        cap = cv2.VideoCapture(rtsp_url)
-
-        if not cap.isOpened():
-            raise HTTPException(status_code=400, detail="Failed to open RTSP stream")
-
-        # Read one frame
-        ret, frame = cap.read()
-        cap.release()
-
-        if not ret or frame is None:
+        # Frame moi nhat tu capture dang mo (ket noi ngoai event loop neu chua co)
+        try:
+            frame = await asyncio.to_thread(get_capture_pool().get_frame, rtsp_url)
+        except RuntimeError:
             raise HTTPException(status_code=400, detail="Failed to read frame from RTSP stream")
 
-        # Get detector
-        detector = get_detector()
-
-        # Perform detection
-        start_time = time.time()
-        detections = detector.detect_from_frame(frame, conf_threshold, iou_threshold)
-        processing_time = (time.time() - start_time) * 1000
+        # Perform detection tren inference worker
+        detections, processing_time = await get_inference_executor().run(
+            _run_detection, frame, conf_threshold, iou_threshold
+        )
 
         return DetectionResponse(
             detections=detections,
@@ -549,6 +527,8 @@ async def detect_license_plate_rtsp(
 
     except HTTPException:
         raise
+    except InferenceOverloaded as e:
+        raise _overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Detection failed: {str(e)}")
 
@@ -592,8 +572,9 @@ async def websocket_detections(websocket: WebSocket):
 async def start_camera_detection(
     camera_id: str,
     rtsp_url: Optional[str] = None,
-    conf_threshold: float = 0.25,
-    iou_threshold: float = 0.45
+    conf_threshold: Optional[float] = None,
+    iou_threshold: Optional[float] = None,
+    motion_gate: bool = True
 ):
     """
     Start real-time detection for a camera
@@ -601,23 +582,23 @@ async def start_camera_detection(
     Args:
         camera_id: Unique camera identifier
         rtsp_url: RTSP URL or camera index (0, 1, 2...). If not provided, will lookup from config
-        conf_threshold: Confidence threshold (0.0-1.0)
-        iou_threshold: IOU threshold for NMS (0.0-1.0)
+        conf_threshold: Confidence threshold (0.0-1.0), default from gpu_config.yaml
+        iou_threshold: IOU threshold for NMS (0.0-1.0), default from gpu_config.yaml
+        motion_gate: Only run YOLO on frames with motion (plus periodic keep-alive)
 
     Returns:
         Success status
     """
     try:
-        # If no RTSP URL provided, lookup from config
+        # If no RTSP URL provided, lookup from camera registry
         if not rtsp_url:
-            config = load_config_sync()
-            if camera_id not in config.get("streams", {}):
+            rtsp_url = camera_registry.get_stream(camera_id)
+            if rtsp_url is None:
                 raise HTTPException(status_code=404, detail=f"Camera {camera_id} not found in config")
-            rtsp_url = config["streams"][camera_id]
             print(f"[DETECTION] Resolved RTSP URL for {camera_id}: {rtsp_url}")
 
         success = detection_service.start_detection(
-            camera_id, rtsp_url, conf_threshold, iou_threshold
+            camera_id, rtsp_url, conf_threshold, iou_threshold, motion_gate
         )
         if success:
             return {"success": True, "message": f"Detection started for camera {camera_id}"}
@@ -661,6 +642,43 @@ async def get_detection_stats():
     return detection_service.get_stats()
 
 
+@app.get("/api/detect/metrics")
+async def get_inference_metrics():
+    """
+    Metrics của inference worker cho /api/detect/upload, /upload/visualize, /rtsp
+
+    Returns:
+        Queue depth, completed / failed / rejected (503) và queue time / service time (p50 / p95 / p99)
+    """
+    return get_inference_executor().get_stats()
+
+
+@app.get("/api/detection/config")
+async def get_detection_config():
+    """
+    Get the active GPU batch config (gpu_config.yaml after validation)
+    """
+    if not USE_GPU_BATCH:
+        raise HTTPException(status_code=400, detail="GPU batch service is not enabled")
+    return detection_service.config.to_dict()
+
+
+@app.post("/api/detection/config/reload")
+async def reload_detection_config():
+    """
+    Reload gpu_config.yaml and apply it to running cameras
+
+    Returns 400 with the validation error if the file is invalid (the running config is kept)
+    """
+    if not USE_GPU_BATCH:
+        raise HTTPException(status_code=400, detail="GPU batch service is not enabled")
+    try:
+        config = detection_service.reload_config()
+    except GPUConfigError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "config": config}
+
+
 @app.on_event("startup")
 async def startup_event():
     """Load config into memory at startup"""
@@ -668,7 +686,7 @@ async def startup_event():
     loop = asyncio.get_event_loop()
     websocket_manager.set_event_loop(loop)
 
-    config = load_config_sync()
+    config = camera_registry.load()
     stream_count = len(config.get("streams", {}))
     print(f"[STARTED] Backend API running on http://localhost:{PORT}")
     print(f"[CONFIG] Config file: {CONFIG_PATH}")
@@ -680,6 +698,11 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     detection_service.stop_all()
+    get_capture_pool().close_all()
+    get_decode_service().stop_all()
+    get_batch_upload_service().shutdown()
+    get_inference_executor().shutdown()
+    await camera_registry.close()
     print("[SHUTDOWN] Detection service stopped")
 
 
@@ -92,3 +92,116 @@ class MotionDetector:
 
         # Consider motion if > 1% of frame changed
         return motion_ratio > 0.01
+
+
+# Kich thuoc frame dung de check motion (downscale → re hon nhieu so voi YOLO)
+MOTION_FRAME_WIDTH = 320
+# Chua thay motion van chay detect it nhat 1 lan moi N giay (xe dung yen truoc barrier)
+MOTION_KEEPALIVE_SECONDS = 5.0
+# Hysteresis: mo gate khi motion N frame lien tiep, dong gate sau N giay khong con motion
+MOTION_OPEN_FRAMES = 2
+MOTION_HOLD_SECONDS = 2.0
+
+
+class MotionGate:
+    """
+    Quyết định frame nào được đưa vào YOLO (1 gate / camera)
+
+    - Check motion trên frame đã downscale (MotionDetector, frame-diff hoặc MOG2)
+    - Hysteresis: gate mở khi có motion open_frames frame liên tiếp (lọc nhiễu 1 frame),
+      giữ mở hold_seconds sau lần motion cuối (xe chạy chậm / dừng lại vẫn được detect)
+    - Keep-alive: gate đóng vẫn cho 1 frame đi qua mỗi keepalive_seconds
+    """
+
+    def __init__(
+        self,
+        method: str = "diff",
+        frame_width: int = MOTION_FRAME_WIDTH,
+        threshold: int = 25,
+        min_area: int = 100,
+        open_frames: int = MOTION_OPEN_FRAMES,
+        hold_seconds: float = MOTION_HOLD_SECONDS,
+        keepalive_seconds: float = MOTION_KEEPALIVE_SECONDS
+    ):
+        """
+        Args:
+            method: "diff" (frame-diff, rẻ) hoặc "mog2" (background subtraction, tốt cho outdoor)
+            frame_width: chiều rộng frame sau downscale
+            threshold: ngưỡng diff (0-255)
+            min_area: diện tích motion tối thiểu (pixels, tính trên frame đã downscale)
+            open_frames: số frame motion liên tiếp để mở gate
+            hold_seconds: giữ gate mở N giây sau lần motion cuối
+            keepalive_seconds: chạy detect ít nhất 1 lần mỗi N giây (0 = tắt)
+        """
+        if method not in ("diff", "mog2"):
+            raise ValueError(f"Unknown motion method: {method}")
+
+        self.method = method
+        self.frame_width = frame_width
+        self.open_frames = open_frames
+        self.hold_seconds = hold_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self.motion_detector = MotionDetector(threshold=threshold, min_area=min_area)
+
+        self.is_open = False
+        self.motion_frames = 0  # so frame motion lien tiep
+        self.last_motion_at = None
+        self.last_detect_at = None
+
+        # Statistics
+        self.frames = 0
+        self.detections_run = 0
+        self.keepalives = 0
+
+    def _has_motion(self, frame) -> bool:
+        h, w = frame.shape[:2]
+        if w > self.frame_width:
+            small = cv2.resize(frame, (self.frame_width, int(h * self.frame_width / w)),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            small = frame
+        if self.method == "mog2":
+            return self.motion_detector.detect_advanced(small)
+        return self.motion_detector.detect(small)
+
+    def should_detect(self, frame, now: float) -> bool:
+        """
+        Args:
+            frame: BGR frame (không bị sửa)
+            now: thời điểm của frame (giây, monotonic hoặc thời gian trong video)
+
+        Returns:
+            bool: True nếu nên chạy detect trên frame này
+        """
+        self.frames += 1
+
+        if self._has_motion(frame):
+            self.motion_frames += 1
+            self.last_motion_at = now
+            if self.motion_frames >= self.open_frames:
+                self.is_open = True
+        else:
+            self.motion_frames = 0
+            if self.is_open and now - self.last_motion_at >= self.hold_seconds:
+                self.is_open = False
+
+        detect = self.is_open
+        if not detect and self.keepalive_seconds and (
+                self.last_detect_at is None or now - self.last_detect_at >= self.keepalive_seconds):
+            detect = True
+            self.keepalives += 1
+
+        if detect:
+            self.detections_run += 1
+            self.last_detect_at = now
+        return detect
+
+    def get_stats(self) -> dict:
+        return {
+            'method': self.method,
+            'open': self.is_open,
+            'frames': self.frames,
+            'detections_run': self.detections_run,
+            'detections_skipped': self.frames - self.detections_run,
+            'keepalives': self.keepalives
+        }
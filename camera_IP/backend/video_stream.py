@@ -1,89 +1,122 @@
 """
 Video Stream với License Plate Detection - Giống backend-edge1
 Vẽ bounding boxes trực tiếp lên stream
+
+Pipeline dùng chung theo camera (+ conf / iou / motion gate), không lặp lại theo từng viewer:
+- Detect thread: luôn lấy frame mới nhất từ decoder, detect theo tốc độ riêng (frame cũ bị bỏ qua)
+- Render thread: mỗi frame decode → vẽ detections gần nhất + encode JPEG đúng 1 lần
+- Viewer: chỉ chờ JPEG mới trong slot và gửi đi (mọi viewer dùng chung 1 bytes)
+
+FPS stream = FPS camera (không còn bị giới hạn bởi tổng detect + vẽ + encode + sleep).
+Pipeline start khi có viewer đầu tiên, stop khi viewer cuối cùng ngắt kết nối.
 """
 import cv2
+import threading
 import time
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from license_plate_detector import get_detector
+from decode_service import FrameSlot, FrameSubscription, clean_source_url, get_decode_service
+from motion_detector import MotionGate
 
+JPEG_QUALITY = 85
 
-class VideoStreamWithDetection:
-    """Stream video với detection overlay (vẽ trực tiếp lên frame)"""
 
-    def __init__(self, rtsp_url: str, conf_threshold: float = 0.25, iou_threshold: float = 0.45):
+class StreamPipeline:
+    """Detect + render/encode cho 1 camera, JPEG dùng chung cho mọi viewer"""
+
+    def __init__(self, rtsp_url: str, conf_threshold: float, iou_threshold: float, motion_gate: bool):
         self.rtsp_url = rtsp_url
         self.conf_threshold = conf_threshold
         self.iou_threshold = iou_threshold
+        # Canh tinh → khong chay YOLO, ve lai box cua lan detect gan nhat
+        self.motion_gate = MotionGate() if motion_gate else None
         self.detector = None
-        self.cap = None
 
-    def __enter__(self):
-        """Context manager entry - mở camera"""
-        # Load detector
+        self.output = FrameSlot()  # multipart part (bytes) da encode
+        self.viewers = 0
+        self.ready = threading.Event()
+        self.error: Optional[Exception] = None
+
+        self.detections = []  # ket qua detect gan nhat (ve len moi frame tiep theo)
+        self.detect_subscription: Optional[FrameSubscription] = None
+        self.render_subscription: Optional[FrameSubscription] = None
+        self._stop_event = threading.Event()
+        self._threads = []
+
+        # Statistics
+        self.frames_rendered = 0
+        self.detections_run = 0
+        self.detection_count = 0
+
+    def start(self):
+        """Load detector + subscribe decoder + start threads (raise RuntimeError nếu không mở được camera)"""
         print("[STREAM] Loading detector...")
         self.detector = get_detector()
         print("[STREAM] Detector loaded!")
 
-        # Mở camera
         print(f"[STREAM] Opening camera: {self.rtsp_url}")
-
-        # Strip go2rtc params (#video=copy#audio=copy) - OpenCV không hiểu cú pháp này
-        clean_rtsp_url = self.rtsp_url.split('#')[0] if '#' in self.rtsp_url else self.rtsp_url
-        if clean_rtsp_url != self.rtsp_url:
-            print(f"[STREAM] Cleaned RTSP URL: {clean_rtsp_url}")
-
-        if clean_rtsp_url.isdigit():
-            self.cap = cv2.VideoCapture(int(clean_rtsp_url))
-        else:
-            self.cap = cv2.VideoCapture(clean_rtsp_url, cv2.CAP_FFMPEG)
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-
-        if not self.cap.isOpened():
-            raise RuntimeError(f"Failed to open camera: {self.rtsp_url}")
-
+        decode_service = get_decode_service()
+        self.detect_subscription = decode_service.subscribe(self.rtsp_url)
+        self.render_subscription = decode_service.subscribe(self.rtsp_url, first_frame_timeout=None)
         print("[STREAM] Camera opened successfully")
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        """Context manager exit - đóng camera"""
-        if self.cap:
-            self.cap.release()
-            print("[STREAM] Camera released")
-
-    def generate_frames(self):
-        """
-        Generator để stream frames với detection overlay
-        Yields JPEG frames với bounding boxes đã vẽ sẵn
-        """
-        frame_count = 0
-        detection_count = 0
 
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:
-                print("[WARNING] Failed to read frame, retrying...")
-                time.sleep(0.1)
+        for target in (self._detect_loop, self._render_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop_event.set()
+        for subscription in (self.detect_subscription, self.render_subscription):
+            if subscription:
+                subscription.close()  # Danh thuc thread dang cho frame
+        print("[STREAM] Camera released")
+
+    def wait_frame(self, after_seq: int, timeout: float) -> Tuple[int, Optional[bytes]]:
+        """Chờ multipart part mới hơn after_seq"""
+        return self.output.wait(after_seq, timeout)
+
+    def _detect_loop(self):
+        """Detect frame mới nhất - chậm hơn FPS camera thì tự bỏ qua frame ở giữa"""
+        while not self._stop_event.is_set():
+            frame = self.detect_subscription.read(timeout=1.0)
+            if frame is None:
+                continue
+            if self.motion_gate is not None and not self.motion_gate.should_detect(frame, time.monotonic()):
                 continue
-
-            frame_count += 1
 
             try:
-                # Detect license plates
-                detections, output_frame = self.detector.detect_and_draw(
+                detections = self.detector.detect_from_frame(
                     frame,
                     conf_threshold=self.conf_threshold,
-                    iou_threshold=self.iou_threshold,
-                    color=(0, 255, 0),  # Green
-                    thickness=3
+                    iou_threshold=self.iou_threshold
                 )
+            except Exception as e:
+                print(f"[ERROR] Detection error: {e}")
+                continue
+
+            self.detections = detections
+            self.detections_run += 1
+            if len(detections) > 0:
+                self.detection_count += len(detections)
+                print(f"[STREAM] Detection {self.detections_run}: Detected {len(detections)} plate(s)")
+
+    def _render_loop(self):
+        """Mỗi frame decode: vẽ detections gần nhất + encode 1 lần cho mọi viewer"""
+        while not self._stop_event.is_set():
+            frame = self.render_subscription.read(timeout=1.0)
+            if frame is None:
+                continue
 
-                if len(detections) > 0:
-                    detection_count += len(detections)
-                    print(f"[STREAM] Frame {frame_count}: Detected {len(detections)} plate(s)")
+            self.frames_rendered += 1
+            detections = self.detections
+
+            try:
+                # Frame tu decoder la read-only - draw_detections ve len ban copy
+                output_frame = self.detector.draw_detections(frame, detections, (0, 255, 0), 3)
 
                 # Vẽ thông tin lên frame
-                info_text = f"Frame: {frame_count} | Detections: {len(detections)}"
+                info_text = f"Frame: {self.frames_rendered} | Detections: {len(detections)}"
                 cv2.putText(
                     output_frame,
                     info_text,
@@ -93,23 +126,128 @@ class VideoStreamWithDetection:
                     (0, 255, 255),  # Yellow
                     2
                 )
+            except Exception as e:
+                print(f"[ERROR] Draw error: {e}")
+                # Nếu lỗi vẽ, vẫn stream frame gốc
+                output_frame = frame
+
+            # Encode frame thành JPEG
+            ret, buffer = cv2.imencode('.jpg', output_frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            if not ret:
+                continue
+
+            # Multipart/x-mixed-replace part - moi viewer gui cung 1 bytes
+            self.output.publish(b'--frame\r\n'
+                                b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+
+
+# Pipeline dang chay: (url, conf, iou, motion_gate) -> StreamPipeline
+_pipelines: Dict[tuple, StreamPipeline] = {}
+_pipelines_lock = threading.Lock()
+
+
+def _pipeline_key(rtsp_url: str, conf_threshold: float, iou_threshold: float, motion_gate: bool) -> tuple:
+    return clean_source_url(rtsp_url), conf_threshold, iou_threshold, motion_gate
+
+
+def open_pipeline(rtsp_url: str, conf_threshold: float, iou_threshold: float, motion_gate: bool) -> StreamPipeline:
+    """
+    Lấy pipeline đang chạy cho camera hoặc tạo mới (viewer đầu tiên start pipeline)
+
+    Raises:
+        RuntimeError: không mở được camera
+    """
+    key = _pipeline_key(rtsp_url, conf_threshold, iou_threshold, motion_gate)
+    with _pipelines_lock:
+        pipeline = _pipelines.get(key)
+        creator = pipeline is None
+        if creator:
+            pipeline = _pipelines[key] = StreamPipeline(rtsp_url, conf_threshold, iou_threshold, motion_gate)
+        pipeline.viewers += 1
+
+    if creator:
+        # Start ngoai lock - mo camera co the mat vai giay, khong chan camera khac
+        try:
+            pipeline.start()
+        except Exception as e:
+            pipeline.error = e
+            with _pipelines_lock:
+                if _pipelines.get(key) is pipeline:
+                    del _pipelines[key]
+                pipeline.viewers -= 1
+            pipeline.stop()
+            raise
+        finally:
+            pipeline.ready.set()
+    else:
+        pipeline.ready.wait()
+        if pipeline.error is not None:
+            with _pipelines_lock:
+                pipeline.viewers -= 1
+            raise RuntimeError(f"Failed to open camera: {rtsp_url}")
+    return pipeline
+
+
+def close_pipeline(pipeline: StreamPipeline):
+    """Viewer rời đi - viewer cuối cùng stop pipeline"""
+    key = _pipeline_key(pipeline.rtsp_url, pipeline.conf_threshold, pipeline.iou_threshold,
+                        pipeline.motion_gate is not None)
+    with _pipelines_lock:
+        pipeline.viewers -= 1
+        if pipeline.viewers > 0:
+            return
+        if _pipelines.get(key) is pipeline:
+            del _pipelines[key]
+    pipeline.stop()
+
+
+class VideoStreamWithDetection:
+    """Stream video với detection overlay (vẽ trực tiếp lên frame) - 1 viewer"""
+
+    def __init__(self, rtsp_url: str, conf_threshold: float = 0.25, iou_threshold: float = 0.45,
+                 motion_gate: bool = True):
+        self.rtsp_url = rtsp_url
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.motion_gate = motion_gate
+        self.pipeline: Optional[StreamPipeline] = None
+
+    def open(self):
+        """Gắn vào pipeline của camera (tạo mới nếu chưa có viewer nào)"""
+        self.pipeline = open_pipeline(self.rtsp_url, self.conf_threshold, self.iou_threshold, self.motion_gate)
+        return self
+
+    def close(self):
+        """Rời pipeline - pipeline dừng (và decoder đóng capture) khi không còn viewer"""
+        if self.pipeline:
+            close_pipeline(self.pipeline)
+            self.pipeline = None
 
-                # Encode frame thành JPEG
-                ret, buffer = cv2.imencode('.jpg', output_frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                if not ret:
+    def __enter__(self):
+        """Context manager entry - mở camera"""
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit - đóng camera"""
+        self.close()
+
+    def generate_frames(self):
+        """
+        Generator để stream frames với detection overlay
+        Yields JPEG frames với bounding boxes đã vẽ sẵn
+
+        Gọi sau open(); generator tự close() khi kết thúc (client ngắt kết nối)
+        Viewer chậm chỉ nhận frame mới nhất, không làm chậm pipeline / viewer khác
+        """
+        last_seq = 0
+        try:
+            while self.pipeline is not None:
+                last_seq, part = self.pipeline.wait_frame(last_seq, timeout=1.0)
+                if part is None:
+                    print("[WARNING] No new frame from camera, waiting...")
                     continue
 
                 # Yield frame dưới dạng multipart/x-mixed-replace
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-
-            except Exception as e:
-                print(f"[ERROR] Detection error: {e}")
-                # Nếu lỗi detection, vẫn stream frame gốc
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                if ret:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-
-            # Throttle để tránh CPU quá tải
-            time.sleep(0.033)  # ~30 FPS
+                yield part
+        finally:
+            self.close()
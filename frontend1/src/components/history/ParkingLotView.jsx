@@ -68,6 +68,7 @@ const ParkingLotView = ({ backendUrl }) => {
               if (
                 eventType === "ENTRY" ||
                 eventType === "EXIT" ||
+                eventType === "BATCH" ||
                 eventType === "LOCATION_UPDATE" ||
                 eventType === "PARKING_LOT_CONFIG_UPDATE"
               ) {